@@ -155,6 +155,7 @@ def delete_comments(comment_ids: List[str]) -> int:
     batch_size = 100
     for index in range(0, len(comment_ids), batch_size):
         batch = comment_ids[index:index + batch_size]
+        # comment_count 由 feed_comments 触发器扣减（含级联删除的回复）
         supabase.table("feed_comments").delete().in_("id", batch).execute()
         deleted += len(batch)
     return deleted
@@ -2,19 +2,30 @@
 数据库操作模块
 使用 Supabase 进行数据操作
 """
-from supabase import create_client
+from supabase import AsyncClient, AsyncClientOptions, create_client
+import asyncio
+import httpx
 import os
+import socket
+import weakref
 import base64
 import uuid
 import re
 import logging
+import heapq
+import math
 import json
+import threading
+import time
 from datetime import date, datetime, timedelta, timezone
 from difflib import SequenceMatcher
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Set, Tuple
 from collections import Counter
 from otel_compat import Status, StatusCode, trace
 from metabolic import calculate_bmr, calculate_tdee
+from memory_cache import get_cache
+from shared_cache import get_shared_cache
+from request_scope import invalidate_request_memo, memoized
 
 # 中国时区（UTC+8），用于按本地自然日统计
 CHINA_TZ = timezone(timedelta(hours=8))
@@ -51,6 +62,12 @@ SHARE_POSTER_DAILY_MAX_EVENTS = 3
 
 # 延迟初始化 Supabase 客户端
 _supabase_client = None
+# 异步 Supabase 客户端：按事件循环缓存（httpx.AsyncClient 的连接池绑定在创建它的事件循环上）
+_async_supabase_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncClient]" = weakref.WeakKeyDictionary()
+# 异步连接池上限：同一 API 进程内可并发进行的 PostgREST 请求数
+SUPABASE_ASYNC_MAX_CONNECTIONS = int(os.getenv("SUPABASE_ASYNC_MAX_CONNECTIONS", "50"))
+SUPABASE_ASYNC_MAX_KEEPALIVE = int(os.getenv("SUPABASE_ASYNC_MAX_KEEPALIVE", "20"))
+SUPABASE_ASYNC_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_ASYNC_TIMEOUT_SECONDS", "30"))
 _tracer = trace.get_tracer("food_link.backend.database")
 _logger = logging.getLogger(__name__)
 
@@ -83,28 +100,23 @@ def _record_db_exception(op_name: str, err: Exception, **attrs: Any) -> None:
         span.set_status(Status(StatusCode.ERROR, f"{op_name}:{err_type}"))
     _logger.warning("[database.%s] %s: %s", op_name, err_type, err_msg)
 
-# ---- 社区接口内存缓存 ----
+# ---- 社区接口缓存（shared_cache：进程内 LRU + 跨进程共享层，失效广播到所有进程） ----
+COMMUNITY_CACHE_MAXSIZE = int(os.getenv("COMMUNITY_CACHE_MAXSIZE", "4096"))
+
 # 好友排名缓存：key = "checkin_leaderboard:{user_id}:{week_start_iso}", TTL = 5 分钟
-_checkin_leaderboard_cache: Dict[str, Any] = {}
+_checkin_leaderboard_cache = get_shared_cache("checkin_leaderboard", maxsize=COMMUNITY_CACHE_MAXSIZE, ttl_seconds=300)
 
 # 好友ID列表缓存：key = "friend_ids:{user_id}", TTL = 5 分钟
-_friend_ids_cache: Dict[str, Any] = {}
-
-
-def _cache_get(cache_dict: Dict, key: str, ttl_seconds: int = 300):
-    """从内存缓存获取，若过期返回 None。"""
-    entry = cache_dict.get(key)
-    if entry is None:
-        return None
-    if datetime.now(timezone.utc).timestamp() - entry["ts"] > ttl_seconds:
-        cache_dict.pop(key, None)
-        return None
-    return entry["value"]
+_friend_ids_cache = get_shared_cache("friend_ids", maxsize=COMMUNITY_CACHE_MAXSIZE, ttl_seconds=300)
 
 
-def _cache_set(cache_dict: Dict, key: str, value: Any):
-    """写入内存缓存。"""
-    cache_dict[key] = {"value": value, "ts": datetime.now(timezone.utc).timestamp()}
+def _invalidate_friend_caches(*user_ids: str) -> None:
+    """好友关系变化后清掉双方的好友 ID 列表与本周打卡排行缓存（所有进程）。"""
+    for uid in user_ids:
+        if not uid:
+            continue
+        _friend_ids_cache.invalidate(f"friend_ids:{uid}")
+        _checkin_leaderboard_cache.invalidate_prefix(f"checkin_leaderboard:{uid}:")
 
 
 def _food_row_to_unit_nutrition(food: Dict[str, Any]) -> Dict[str, float]:
@@ -159,6 +171,49 @@ def get_supabase_client():
     return _supabase_client
 
 
+def get_async_supabase_client() -> AsyncClient:
+    """
+    获取当前事件循环对应的异步 Supabase 客户端（延迟初始化）。
+    async 数据访问函数统一使用此客户端并 await execute()，避免同步 HTTP 调用阻塞 uvicorn 事件循环；
+    底层为带连接池与 keep-alive 的 httpx.AsyncClient，多个请求可并发复用连接。
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_supabase_clients.get(loop)
+    if client is not None:
+        return client
+
+    SUPABASE_URL = os.getenv("SUPABASE_URL")
+    SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    configured = bool(SUPABASE_URL and SUPABASE_SERVICE_KEY)
+    _safe_add_span_event("db.supabase_async_client.init", {"db.supabase.configured": configured})
+    if not configured:
+        err = Exception("Supabase 未配置，请设置 SUPABASE_URL 和 SUPABASE_SERVICE_ROLE_KEY 环境变量")
+        _record_db_exception("get_async_supabase_client", err, **{"db.supabase.configured": configured})
+        raise err
+
+    http_client = httpx.AsyncClient(
+        timeout=SUPABASE_ASYNC_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=max(1, SUPABASE_ASYNC_MAX_CONNECTIONS),
+            max_keepalive_connections=max(0, SUPABASE_ASYNC_MAX_KEEPALIVE),
+        ),
+    )
+    client = AsyncClient(SUPABASE_URL, SUPABASE_SERVICE_KEY, AsyncClientOptions(httpx_client=http_client))
+    _async_supabase_clients[loop] = client
+    return client
+
+
+async def close_async_supabase_client() -> None:
+    """关闭当前事件循环的异步 Supabase 客户端连接池（应用 shutdown 时调用）。"""
+    loop = asyncio.get_running_loop()
+    client = _async_supabase_clients.pop(loop, None)
+    if client is None:
+        return
+    http_client = client.options.httpx_client
+    if http_client is not None:
+        await http_client.aclose()
+
+
 def check_supabase_configured():
     """检查 Supabase 是否已配置"""
     try:
@@ -254,10 +309,10 @@ async def get_user_by_openid(openid: str) -> Optional[Dict[str, Any]]:
         用户信息字典，如果不存在则返回 None
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     
     try:
-        result = supabase.table("weapp_user")\
+        result = await supabase.table("weapp_user")\
             .select("*")\
             .eq("openid", openid)\
             .execute()
@@ -272,7 +327,7 @@ async def get_user_by_openid(openid: str) -> Optional[Dict[str, Any]]:
 
 async def get_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
     """
-    通过 user_id 查询用户
+    通过 user_id 查询用户（同一请求内只查询一次，见 request_scope）
     
     Args:
         user_id: 用户 ID (UUID)
@@ -280,11 +335,15 @@ async def get_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
     Returns:
         用户信息字典，如果不存在则返回 None
     """
+    return await memoized("user", user_id, lambda: _fetch_user_by_id(user_id))
+
+
+async def _fetch_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     
     try:
-        result = supabase.table("weapp_user")\
+        result = await supabase.table("weapp_user")\
             .select("*")\
             .eq("id", user_id)\
             .execute()
@@ -303,13 +362,77 @@ async def is_user_in_first_membership_trial_batch(user_id: str, limit: int = 100
     return rank is not None
 
 
+# 创始用户名次缓存：key = user_id，值为 {"registration": 名次, "paid": 名次}。
+# 名次一经分配不再变化；尚无名次的用户之后付费可能获得付费名次，写入 paid 支付记录时失效
+_early_user_rank_cache = get_shared_cache("early_user_ranks", maxsize=COMMUNITY_CACHE_MAXSIZE, ttl_seconds=600)
+
+
+def _invalidate_early_user_rank_cache(rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        if row.get("status") == "paid" and row.get("user_id"):
+            _early_user_rank_cache.invalidate(str(row["user_id"]))
+
+
+async def get_membership_early_user_ranks(user_id: str) -> Optional[Dict[str, Optional[int]]]:
+    """
+    读取用户的创始名次：{"registration": 首批注册名次, "paid": 首批付费会员名次}，不在名额内为 None。
+    名次由数据库在注册 / 支付时分配并持久化，见 sql/add_membership_early_user_ranks.sql；
+    名次表未就绪时返回 None，由调用方回退为扫描。
+    """
+    return await memoized("early_user_ranks", user_id, lambda: _load_membership_early_user_ranks(user_id))
+
+
+async def _load_membership_early_user_ranks(user_id: str) -> Optional[Dict[str, Optional[int]]]:
+    cached = _early_user_rank_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    check_supabase_configured()
+    supabase = get_async_supabase_client()
+    try:
+        result = await supabase.table("membership_early_user_ranks")\
+            .select("kind, rank")\
+            .eq("user_id", user_id)\
+            .execute()
+        ranks: Dict[str, Optional[int]] = {"registration": None, "paid": None}
+        for row in result.data or []:
+            if row.get("kind") in ranks and row.get("rank"):
+                ranks[row["kind"]] = int(row["rank"])
+        _early_user_rank_cache.set(user_id, ranks)
+        return ranks
+    except Exception as e:
+        if _is_table_not_ready_error(e, ["membership_early_user_ranks"]):
+            print(f"[get_membership_early_user_ranks] 名次表未就绪，回退为扫描: {e}")
+            return None
+        print(f"[get_membership_early_user_ranks] 错误: {e}")
+        raise
+
+
 async def get_first_membership_trial_batch_rank(user_id: str, limit: int = 1000) -> Optional[int]:
     """返回用户在首批会员创始用户中的名次（1-based）；若不在前 N 名则返回 None。"""
+    ranks = await get_membership_early_user_ranks(user_id)
+    if ranks is None:
+        return await _scan_first_membership_trial_batch_rank(user_id, limit)
+    rank = ranks.get("registration")
+    return rank if rank is not None and rank <= limit else None
+
+
+async def get_first_paid_membership_user_rank(user_id: str, limit: int = 100) -> Optional[int]:
+    """返回用户在首批付费会员中的名次（1-based）；若不在前 N 名则返回 None。"""
+    ranks = await get_membership_early_user_ranks(user_id)
+    if ranks is None:
+        return await _scan_first_paid_membership_user_rank(user_id, limit)
+    rank = ranks.get("paid")
+    return rank if rank is not None and rank <= limit else None
+
+
+async def _scan_first_membership_trial_batch_rank(user_id: str, limit: int) -> Optional[int]:
+    """名次表未就绪时的回退：取前 N 个用户按注册时间排序。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
 
     try:
-        result = supabase.table("weapp_user")\
+        result = await supabase.table("weapp_user")\
             .select("*")\
             .limit(limit)\
             .execute()
@@ -331,13 +454,13 @@ async def get_first_membership_trial_batch_rank(user_id: str, limit: int = 1000)
         raise
 
 
-async def get_first_paid_membership_user_rank(user_id: str, limit: int = 100) -> Optional[int]:
-    """返回用户在首批付费会员中的名次（1-based）；若不在前 N 名则返回 None。"""
+async def _scan_first_paid_membership_user_rank(user_id: str, limit: int) -> Optional[int]:
+    """名次表未就绪时的回退：取已支付会员订单按首付时间排序。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
 
     try:
-        result = supabase.table("pro_membership_payment_records")\
+        result = await supabase.table("pro_membership_payment_records")\
             .select("id, user_id, plan_code, paid_at, created_at")\
             .eq("status", "paid")\
             .limit(5000)\
@@ -405,10 +528,10 @@ async def create_user(user_data: Dict[str, Any]) -> Dict[str, Any]:
         Exception: 如果创建失败
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     
     try:
-        result = supabase.table("weapp_user")\
+        result = await supabase.table("weapp_user")\
             .insert(user_data)\
             .execute()
         
@@ -441,10 +564,11 @@ async def update_user(user_id: str, update_data: Dict[str, Any]) -> Dict[str, An
         Exception: 如果更新失败
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
 
+    invalidate_request_memo("user", user_id)
     try:
-        result = supabase.table("weapp_user")\
+        result = await supabase.table("weapp_user")\
             .update(update_data)\
             .eq("id", user_id)\
             .execute()
@@ -462,6 +586,7 @@ def update_user_sync(user_id: str, update_data: Dict[str, Any]) -> Dict[str, Any
     """同步版：更新用户信息，供 Worker 子进程使用。"""
     check_supabase_configured()
     supabase = get_supabase_client()
+    invalidate_request_memo("user", user_id)
     try:
         result = supabase.table("weapp_user").update(update_data).eq("id", user_id).execute()
         if result.data and len(result.data) > 0:
@@ -520,7 +645,7 @@ async def insert_health_document(
         插入的记录字典
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
 
     row = {
         "user_id": user_id,
@@ -529,7 +654,7 @@ async def insert_health_document(
         "extracted_content": extracted_content or {},
     }
     try:
-        result = supabase.table("user_health_documents").insert(row).execute()
+        result = await supabase.table("user_health_documents").insert(row).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         raise Exception("插入健康报告记录失败：返回数据为空")
@@ -606,7 +731,7 @@ async def insert_food_record(
         插入的记录字典
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     row = {
         "user_id": user_id,
         "meal_type": meal_type,
@@ -638,11 +763,20 @@ async def insert_food_record(
     if record_time is not None:
         row["record_time"] = record_time
     try:
-        result = supabase.table("user_food_records").insert(row).execute()
+        result = await supabase.table("user_food_records").insert(row).execute()
         if result.data and len(result.data) > 0:
             created = result.data[0]
+            record_day = _china_record_date(created.get("record_time"))
+            try:
+                await _advance_user_streak(supabase, user_id, record_day)
+            except Exception as streak_err:
+                print(f"[insert_food_record] 连续记录天数更新失败（已忽略）: {streak_err}")
             try:
-                activate_pending_invite_referral_on_first_valid_use_sync(user_id, "food_record")
+                await _refresh_user_daily_nutrition(supabase, user_id, [record_day])
+            except Exception as rollup_err:
+                print(f"[insert_food_record] 每日营养汇总更新失败（已忽略）: {rollup_err}")
+            try:
+                await asyncio.to_thread(activate_pending_invite_referral_on_first_valid_use_sync, user_id, "food_record")
             except Exception as reward_err:
                 print(f"[insert_food_record] 邀请奖励激活失败（已忽略）: {reward_err}")
             return created
@@ -669,7 +803,7 @@ async def list_food_records(
         记录列表，按 record_time 倒序（最新的记录排在前面）
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.list_food_records") as span:
         span.set_attribute("db.table", "user_food_records")
         span.set_attribute("db.user_id", user_id)
@@ -684,7 +818,7 @@ async def list_food_records(
                 end_ts = end_local.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
                 q = q.gte("record_time", start_ts).lt("record_time", end_ts)
             q = q.order("record_time", desc=True).limit(limit)
-            result = q.execute()
+            result = await q.execute()
             rows = list(result.data or [])
             _safe_add_span_event("db.query.success", {"db.rows": len(rows), "db.operation": "list_food_records"})
             return rows
@@ -703,7 +837,7 @@ async def list_food_records_by_range(
     start_date/end_date: YYYY-MM-DD（按中国时区自然日，含首含尾）。
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.list_food_records_by_range") as span:
         span.set_attribute("db.table", "user_food_records")
         span.set_attribute("db.user_id", user_id)
@@ -716,7 +850,7 @@ async def list_food_records_by_range(
             start_ts = start_local.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
             end_ts = end_local.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
             q = supabase.table("user_food_records").select("*").eq("user_id", user_id).gte("record_time", start_ts).lt("record_time", end_ts).order("record_time", desc=False)
-            result = q.execute()
+            result = await q.execute()
             rows = list(result.data or [])
             _safe_add_span_event("db.query.success", {"db.rows": len(rows), "db.operation": "list_food_records_by_range"})
             return rows
@@ -725,43 +859,171 @@ async def list_food_records_by_range(
             raise
 
 
+def _china_record_date(record_time: Any) -> Optional[date]:
+    """记录时间 → 中国时区自然日。"""
+    dt = _parse_iso_datetime(record_time)
+    return dt.astimezone(CHINA_TZ).date() if dt else None
+
+
+def _parse_date_value(value: Any) -> Optional[date]:
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _effective_streak_days(current_streak: Any, last_record_date: Any, today: date) -> int:
+    """
+    物化的连续天数只在最后记录日为今天或昨天时有效；
+    今天尚无记录时从昨天起算，避免当天未记录导致 streak 归零。
+    """
+    last_day = _parse_date_value(last_record_date)
+    if not last_day or (today - last_day).days > 1:
+        return 0
+    return max(0, int(current_streak or 0))
+
+
+async def _recompute_user_streak(supabase: Any, user_id: str) -> Dict[str, Any]:
+    """
+    一次查询（按中国时区去重的记录日期上做 gaps-and-islands）得到最近一段连续记录，
+    并写回 weapp_user.current_streak / last_record_date（同时写入已物化标记 streak_computed_at）。
+    """
+    r = await supabase.rpc("get_user_food_record_streak", {"p_user_id": user_id}).execute()
+    rows = r.data if isinstance(r.data, list) else [r.data] if r.data else []
+    row = rows[0] if rows else {}
+    state = {
+        "current_streak": int(row.get("current_streak") or 0),
+        "last_record_date": row.get("last_record_date"),
+    }
+    await supabase.table("weapp_user").update({
+        **state,
+        "streak_computed_at": datetime.now(timezone.utc).isoformat(),
+    }).eq("id", user_id).execute()
+    invalidate_request_memo("user", user_id)
+    return state
+
+
+async def _advance_user_streak(supabase: Any, user_id: str, record_day: Optional[date]) -> None:
+    """
+    新增饮食记录后增量维护物化 streak：同一天不变、次日 +1、中断后重置为 1（已物化且此前无记录时同样为 1）；
+    补录更早日期（可能连接两段）或尚未物化时整体重算。
+    """
+    r = await supabase.table("weapp_user").select(
+        "current_streak, last_record_date, streak_computed_at"
+    ).eq("id", user_id).limit(1).execute()
+    row = (r.data or [{}])[0]
+    last_day = _parse_date_value(row.get("last_record_date"))
+    materialized = last_day is not None or row.get("streak_computed_at") is not None
+    if record_day is None or not materialized or (last_day is not None and record_day < last_day):
+        await _recompute_user_streak(supabase, user_id)
+        return
+    if record_day == last_day:
+        return
+    if last_day is not None and (record_day - last_day).days == 1:
+        streak = int(row.get("current_streak") or 0) + 1
+    else:
+        streak = 1
+    await supabase.table("weapp_user").update({
+        "current_streak": streak,
+        "last_record_date": record_day.isoformat(),
+    }).eq("id", user_id).execute()
+    invalidate_request_memo("user", user_id)
+
+
 async def get_streak_days(user_id: str) -> int:
     """
     计算连续记录天数（从今天或昨天起往前，有记录的连续天数）。
     某天至少有 1 条饮食记录即算「有记录」。
-    若今天尚无记录，则从昨天开始计算，避免当天未记录导致 streak 归零。
+    读取 weapp_user 上物化的 current_streak / last_record_date（由饮食记录增删维护），
+    尚未物化（streak_computed_at 为空）时按记录日期一次性重算并写回；无记录用户物化后同样只读。
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        today = datetime.now(CHINA_TZ).date()
+        r = await supabase.table("weapp_user").select(
+            "current_streak, last_record_date, streak_computed_at"
+        ).eq("id", user_id).limit(1).execute()
+        row = (r.data or [{}])[0]
+        if row.get("last_record_date") is None and row.get("streak_computed_at") is None:
+            row = await _recompute_user_streak(supabase, user_id)
+        return _effective_streak_days(row.get("current_streak"), row.get("last_record_date"), datetime.now(CHINA_TZ).date())
+    except Exception as e:
+        print(f"[get_streak_days] 错误: {e}")
+        raise
 
-        def _has_records(day: date) -> bool:
-            start_local = datetime.combine(day, datetime.min.time()).replace(tzinfo=CHINA_TZ)
-            end_local = datetime.combine(day + timedelta(days=1), datetime.min.time()).replace(tzinfo=CHINA_TZ)
-            start_ts = start_local.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
-            end_ts = end_local.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
-            r = supabase.table("user_food_records").select("id").eq("user_id", user_id).gte("record_time", start_ts).lt("record_time", end_ts).limit(1).execute()
-            return bool(r.data and len(r.data) > 0)
 
-        # 若今天尚无记录，从昨天开始作为锚点
-        if not _has_records(today):
-            d = today - timedelta(days=1)
-        else:
-            d = today
+# ---------- 每日营养汇总（user_daily_nutrition） ----------
 
-        streak = 0
-        while True:
-            if not _has_records(d):
-                break
-            streak += 1
-            d -= timedelta(days=1)
-        return streak
+# 这些字段变化时需要重算记录所在日期的汇总行
+_DAILY_NUTRITION_SOURCE_FIELDS = frozenset({
+    "record_time", "meal_type", "items",
+    "total_calories", "total_protein", "total_carbs", "total_fat",
+})
+
+
+async def _refresh_user_daily_nutrition(supabase: Any, user_id: str, days: List[Optional[date]]) -> None:
+    """按天从饮食记录重算 user_daily_nutrition 并调整 weapp_user.record_days_count（幂等，一次 RPC 覆盖全部受影响日期）。"""
+    day_list = sorted({d.isoformat() for d in days if d})
+    if not day_list:
+        return
+    await supabase.rpc("refresh_user_daily_nutrition", {"p_user_id": user_id, "p_dates": day_list}).execute()
+
+
+async def get_user_record_days_count(user_id: str) -> int:
+    """累计有饮食记录的自然日个数（中国时区），读取 weapp_user 上由 refresh_user_daily_nutrition 维护的计数。"""
+    check_supabase_configured()
+    supabase = get_async_supabase_client()
+    try:
+        r = await supabase.table("weapp_user").select("record_days_count").eq("id", user_id).limit(1).execute()
+        row = (r.data or [{}])[0]
+        return max(0, int(row.get("record_days_count") or 0))
     except Exception as e:
-        print(f"[get_streak_days] 错误: {e}")
+        print(f"[get_user_record_days_count] 错误: {e}")
         raise
 
 
+async def list_user_daily_nutrition(
+    user_id: str,
+    start_date: str,
+    end_date: str,
+) -> List[Dict[str, Any]]:
+    """
+    查询日期范围内的每日按餐次营养汇总（用于数据统计，替代拉取完整饮食记录）。
+    start_date/end_date: YYYY-MM-DD（中国时区自然日，含首含尾）。
+    每行含 china_date, meal_type（已归一化到 6 餐次）, record_count, total_calories/protein/carbs/fat/fiber/sugar/sodium_mg。
+    """
+    check_supabase_configured()
+    supabase = get_async_supabase_client()
+    with _tracer.start_as_current_span("db.list_user_daily_nutrition") as span:
+        span.set_attribute("db.table", "user_daily_nutrition")
+        span.set_attribute("db.user_id", user_id)
+        span.set_attribute("db.start_date", start_date)
+        span.set_attribute("db.end_date", end_date)
+        try:
+            result = await (
+                supabase.table("user_daily_nutrition")
+                .select(
+                    "china_date, meal_type, record_count, total_calories, total_protein, total_carbs, total_fat, "
+                    "total_fiber, total_sugar, total_sodium_mg"
+                )
+                .eq("user_id", user_id)
+                .gte("china_date", start_date)
+                .lte("china_date", end_date)
+                .order("china_date", desc=False)
+                .execute()
+            )
+            rows = list(result.data or [])
+            _safe_add_span_event("db.query.success", {"db.rows": len(rows), "db.operation": "list_user_daily_nutrition"})
+            return rows
+        except Exception as e:
+            _record_db_exception("list_user_daily_nutrition", e, **{"db.table": "user_daily_nutrition"})
+            raise
+
+
 async def get_cached_insight(user_id: str, range_type: str, generated_date: str) -> Optional[Dict[str, Any]]:
     """
     查询 AI 营养洞察缓存。
@@ -769,7 +1031,7 @@ async def get_cached_insight(user_id: str, range_type: str, generated_date: str)
     返回 { data_fingerprint, insight_text } 或 None
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.get_cached_insight") as span:
         span.set_attribute("db.table", "ai_stats_insights")
         span.set_attribute("db.user_id", user_id)
@@ -777,7 +1039,7 @@ async def get_cached_insight(user_id: str, range_type: str, generated_date: str)
         span.set_attribute("db.generated_date", generated_date)
         try:
             result = (
-                supabase.table("ai_stats_insights")
+                await supabase.table("ai_stats_insights")
                 .select("generated_date, data_fingerprint, insight_text")
                 .eq("user_id", user_id)
                 .eq("range_type", range_type)
@@ -801,14 +1063,14 @@ async def get_latest_cached_insight(user_id: str, range_type: str) -> Optional[D
     返回 { generated_date, data_fingerprint, insight_text } 或 None
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.get_latest_cached_insight") as span:
         span.set_attribute("db.table", "ai_stats_insights")
         span.set_attribute("db.user_id", user_id)
         span.set_attribute("db.range_type", range_type)
         try:
             result = (
-                supabase.table("ai_stats_insights")
+                await supabase.table("ai_stats_insights")
                 .select("generated_date, data_fingerprint, insight_text")
                 .eq("user_id", user_id)
                 .eq("range_type", range_type)
@@ -838,7 +1100,7 @@ async def upsert_insight_cache(
     利用 (user_id, range_type, generated_date) 唯一约束做 upsert。
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.upsert_insight_cache") as span:
         span.set_attribute("db.table", "ai_stats_insights")
         span.set_attribute("db.user_id", user_id)
@@ -860,7 +1122,7 @@ async def upsert_insight_cache(
             except Exception:
                 safe_row = row
 
-            supabase.table("ai_stats_insights").upsert(
+            await supabase.table("ai_stats_insights").upsert(
                 safe_row,
                 on_conflict="user_id,range_type,generated_date",
             ).execute()
@@ -878,7 +1140,7 @@ async def list_user_weight_records(
 ) -> List[Dict[str, Any]]:
     """读取用户体重记录（按记录日和创建时间升序）。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         query = (
             supabase.table("user_weight_records")
@@ -892,7 +1154,7 @@ async def list_user_weight_records(
         query = query.order("recorded_on", desc=False).order("created_at", desc=False).order("updated_at", desc=False)
         if limit:
             query = query.limit(limit)
-        result = query.execute()
+        result = await query.execute()
         return list(result.data or [])
     except Exception as e:
         print(f"[list_user_weight_records] 错误: {e}")
@@ -902,10 +1164,10 @@ async def list_user_weight_records(
 async def get_latest_user_weight_record(user_id: str) -> Optional[Dict[str, Any]]:
     """读取用户最近一次体重记录（按 recorded_on/created_at 倒序）。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("user_weight_records")
+            await supabase.table("user_weight_records")
             .select("*")
             .eq("user_id", user_id)
             .order("recorded_on", desc=True)
@@ -956,7 +1218,7 @@ async def create_user_weight_record(
 ) -> Dict[str, Any]:
     """新增一条体重记录；若携带 client_record_id，则按该客户端记录 ID 幂等写入。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         now_iso = datetime.now(timezone.utc).isoformat()
         created_at = recorded_at or now_iso
@@ -974,7 +1236,7 @@ async def create_user_weight_record(
             row["client_record_id"] = client_record_id
             try:
                 result = (
-                    supabase.table("user_weight_records")
+                    await supabase.table("user_weight_records")
                     .upsert(row, on_conflict="user_id,client_record_id")
                     .execute()
                 )
@@ -982,9 +1244,9 @@ async def create_user_weight_record(
                 print(f"[create_user_weight_record] client_record_id upsert 回退普通 insert: {upsert_error}")
                 fallback_row = dict(row)
                 fallback_row.pop("client_record_id", None)
-                result = supabase.table("user_weight_records").insert(fallback_row).execute()
+                result = await supabase.table("user_weight_records").insert(fallback_row).execute()
         else:
-            result = supabase.table("user_weight_records").insert(row).execute()
+            result = await supabase.table("user_weight_records").insert(row).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         raise Exception("写入体重记录失败：返回数据为空")
@@ -1022,7 +1284,7 @@ async def list_user_water_logs(
 ) -> List[Dict[str, Any]]:
     """读取用户喝水日志（按时间升序）。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         query = (
             supabase.table("user_water_logs")
@@ -1036,7 +1298,7 @@ async def list_user_water_logs(
         query = query.order("recorded_on", desc=False).order("recorded_at", desc=False)
         if limit:
             query = query.limit(limit)
-        result = query.execute()
+        result = await query.execute()
         return list(result.data or [])
     except Exception as e:
         print(f"[list_user_water_logs] 错误: {e}")
@@ -1051,7 +1313,7 @@ async def create_user_water_log(
 ) -> Dict[str, Any]:
     """新增一条喝水日志。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         day = recorded_on or datetime.now(CHINA_TZ).date().isoformat()
         row = {
@@ -1060,7 +1322,7 @@ async def create_user_water_log(
             "recorded_on": day,
             "source_type": source_type or "manual",
         }
-        result = supabase.table("user_water_logs").insert(row).execute()
+        result = await supabase.table("user_water_logs").insert(row).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         raise Exception("新增喝水日志失败：返回数据为空")
@@ -1072,10 +1334,10 @@ async def create_user_water_log(
 async def delete_user_water_logs_by_date(user_id: str, recorded_on: str) -> int:
     """删除指定日期的喝水日志。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("user_water_logs")
+            await supabase.table("user_water_logs")
             .delete()
             .eq("user_id", user_id)
             .eq("recorded_on", recorded_on)
@@ -1090,10 +1352,10 @@ async def delete_user_water_logs_by_date(user_id: str, recorded_on: str) -> int:
 async def get_user_body_metric_settings(user_id: str) -> Optional[Dict[str, Any]]:
     """读取用户身体指标设置。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("user_body_metric_settings")
+            await supabase.table("user_body_metric_settings")
             .select("*")
             .eq("user_id", user_id)
             .limit(1)
@@ -1110,7 +1372,7 @@ async def get_user_body_metric_settings(user_id: str) -> Optional[Dict[str, Any]
 async def upsert_user_body_metric_settings(user_id: str, water_goal_ml: int) -> Dict[str, Any]:
     """写入用户喝水目标。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         row = {
             "user_id": user_id,
@@ -1118,7 +1380,7 @@ async def upsert_user_body_metric_settings(user_id: str, water_goal_ml: int) ->
             "updated_at": datetime.now(timezone.utc).isoformat(),
         }
         result = (
-            supabase.table("user_body_metric_settings")
+            await supabase.table("user_body_metric_settings")
             .upsert(row, on_conflict="user_id")
             .execute()
         )
@@ -1142,7 +1404,7 @@ async def insert_critical_samples(
         items: 样本列表，每项含 image_path(可选), food_name, ai_weight, user_weight, deviation_percent
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     if not items:
         return
     rows = []
@@ -1159,7 +1421,7 @@ async def insert_critical_samples(
         row["image_path"] = path_val if path_val is not None and str(path_val).strip() else None
         rows.append(row)
     try:
-        supabase.table("critical_samples_weapp").insert(rows).execute()
+        await supabase.table("critical_samples_weapp").insert(rows).execute()
     except Exception as e:
         print(f"[insert_critical_samples] 错误: {e}")
         raise
@@ -1167,6 +1429,23 @@ async def insert_critical_samples(
 
 # ---------- 异步分析任务（analysis_tasks）：Worker 子进程消费 ----------
 
+# 分析任务调度优先级（越大越先被抢占），同档位内按用户轮转，见 sql/add_analysis_task_priority.sql
+TASK_PRIORITY_BACKGROUND = 0
+TASK_PRIORITY_INTERACTIVE = 10
+TASK_PRIORITY_PAID = 15
+# 无人等待结果的后台任务类型
+BACKGROUND_TASK_TYPES = frozenset({"public_food_library_text"})
+# pending 任务每等待该秒数有效优先级 +1（最多 +9），避免低档位任务被饿死
+TASK_PRIORITY_AGING_SECONDS = max(1, int(os.getenv("TASK_PRIORITY_AGING_SECONDS", "30")))
+
+
+def analysis_task_priority(task_type: str, is_pro: bool = False) -> int:
+    """按任务类型与会员状态给出调度优先级：后台任务 < 交互任务 < 付费会员交互任务。"""
+    if task_type in BACKGROUND_TASK_TYPES:
+        return TASK_PRIORITY_BACKGROUND
+    return TASK_PRIORITY_PAID if is_pro else TASK_PRIORITY_INTERACTIVE
+
+
 def create_analysis_task_sync(
     user_id: str,
     task_type: str,
@@ -1174,12 +1453,16 @@ def create_analysis_task_sync(
     image_urls: Optional[List[str]] = None,
     text_input: Optional[str] = None,
     payload: Optional[Dict[str, Any]] = None,
+    priority: Optional[int] = None,
+    status: str = "pending",
 ) -> Dict[str, Any]:
     """
-    创建一条分析任务（pending），返回任务记录。供 API 调用。
+    创建一条分析任务（默认 pending），返回任务记录。供 API 调用。
     - image_url: 图片分析时必填（兼容旧版）
     - image_urls: 多图分析时传入（新版）
     - text_input: 文字分析时必填
+    - priority: 调度优先级，不传时按 analysis_task_priority(task_type) 取默认档位
+    - status: 传 waiting 时任务挂起不被抢占，等子任务全部完成后由数据库放行（精准模式聚合）
     """
     check_supabase_configured()
     supabase = get_supabase_client()
@@ -1191,8 +1474,9 @@ def create_analysis_task_sync(
     row = {
         "user_id": user_id,
         "task_type": task_type,
-        "status": "pending",
+        "status": status,
         "payload": payload or {},
+        "priority": analysis_task_priority(task_type) if priority is None else int(priority),
     }
     # 根据任务类型添加对应字段
     if image_url:
@@ -1220,53 +1504,174 @@ def create_analysis_task_sync(
             raise
 
 
-def claim_next_pending_task_sync(task_type: str) -> Optional[Dict[str, Any]]:
+# 抢占任务的租约时长（秒）：Worker 处理期间按 1/3 周期心跳续约，失联超过该时长的任务被重新排队
+TASK_LEASE_SECONDS = max(10, int(os.getenv("TASK_LEASE_SECONDS", "120")))
+# 单个任务最多被抢占处理的次数，超过后租约过期即标记 failed
+TASK_MAX_ATTEMPTS = max(1, int(os.getenv("TASK_MAX_ATTEMPTS", "3")))
+
+
+def task_lease_owner() -> str:
+    """当前进程的租约持有者标识（主机名:进程号），fork 出的子进程各不相同。"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_pending_tasks_sync(task_type: str, limit: int = 1) -> List[Dict[str, Any]]:
     """
-    原子抢占一条 pending 任务，将其置为 processing 并返回。
-    供 Worker 子进程调用，多进程下通过「先查后更新 where status=pending」避免重复处理。
+    原子抢占至多 limit 条 pending 任务，置为 processing 并返回（按优先级、created_at 先后）。
+    调用数据库函数 claim_analysis_tasks（FOR UPDATE SKIP LOCKED），一次往返完成，
+    多 Worker 并发时各自拿到不同的任务，不会落空。
+    选取顺序：有效优先级（priority + 等待老化）> 用户轮次（各用户轮流取一条）> created_at。
+    抢占的任务带 TASK_LEASE_SECONDS 的租约，由当前进程持有，需通过 heartbeat_task_leases_sync 续约。
     """
     check_supabase_configured()
     supabase = get_supabase_client()
-    with _tracer.start_as_current_span("db.claim_next_pending_task_sync") as span:
+    with _tracer.start_as_current_span("db.claim_pending_tasks_sync") as span:
         span.set_attribute("db.table", "analysis_tasks")
         span.set_attribute("db.task_type", str(task_type or ""))
+        span.set_attribute("db.claim_limit", int(limit))
         try:
-            # 取一条 pending
-            r = (
-                supabase.table("analysis_tasks")
-                .select("*")
-                .eq("status", "pending")
-                .eq("task_type", task_type)
-                .order("created_at")
-                .limit(1)
-                .execute()
-            )
-            rows = list(r.data or [])
-            print(f"[claim_pending] task_type={task_type}, pending_count={len(rows)}")
+            r = supabase.rpc(
+                "claim_analysis_tasks",
+                {
+                    "p_task_type": task_type,
+                    "p_limit": max(int(limit), 1),
+                    "p_lease_seconds": TASK_LEASE_SECONDS,
+                    "p_owner": task_lease_owner(),
+                    "p_aging_seconds": TASK_PRIORITY_AGING_SECONDS,
+                },
+            ).execute()
+            rows = [row for row in (r.data or []) if isinstance(row, dict)]
+            # RETURNING 不保证顺序：按 RPC 附带的有效优先级 / 用户轮次（与抢占时一致）重排，再按 created_at
+            rows.sort(key=lambda row: str(row.get("created_at") or ""))
+            rows.sort(key=lambda row: int(row.get("user_turn") or 0))
+            rows.sort(key=lambda row: -int(row.get("effective_priority") or 0))
+            for row in rows:
+                row.pop("effective_priority", None)
+                row.pop("user_turn", None)
             if not rows:
                 _safe_add_span_event("db.claim.empty", {"db.task_type": task_type})
-                return None
-            task_id = rows[0]["id"]
-            span.set_attribute("db.task_id", str(task_id))
-            # 仅当仍为 pending 时更新为 processing，避免多 Worker 重复抢
-            up = (
-                supabase.table("analysis_tasks")
-                .update({"status": "processing", "updated_at": datetime.now(timezone.utc).isoformat()})
-                .eq("id", task_id)
-                .eq("status", "pending")
-                .execute()
-            )
-            if up.data and len(up.data) > 0:
-                _safe_add_span_event("db.claim.success", {"db.task_id": str(task_id)})
-                return up.data[0]
-            _safe_add_span_event("db.claim.lost_race", {"db.task_id": str(task_id)})
-            return None
+                return []
+            span.set_attribute("db.claimed_count", len(rows))
+            _safe_add_span_event("db.claim.success", {"db.task_ids": ",".join(str(row.get("id")) for row in rows)})
+            return rows
         except Exception as e:
             # 不抛出异常，避免工作进程因网络问题（502/503等）崩溃
-            _record_db_exception("claim_next_pending_task_sync", e, **{"db.task_type": task_type})
+            _record_db_exception("claim_pending_tasks_sync", e, **{"db.task_type": task_type})
             error_msg = str(e)[:200]
-            print(f"[claim_next_pending_task_sync] 网络错误，稍后重试: {error_msg}")
-            return None
+            print(f"[claim_pending_tasks_sync] 网络错误，稍后重试: {error_msg}")
+            return []
+
+
+def claim_next_pending_task_sync(task_type: str) -> Optional[Dict[str, Any]]:
+    """
+    原子抢占一条 pending 任务，将其置为 processing 并返回；无任务时返回 None。
+    """
+    rows = claim_pending_tasks_sync(task_type, limit=1)
+    return rows[0] if rows else None
+
+
+def get_task_queue_stats_sync() -> List[Dict[str, Any]]:
+    """
+    各任务队列的积压情况：[{queue, task_type, pending_count, oldest_pending_at}]，只含有待处理任务的队列。
+    queue 为表名（analysis_tasks / comment_tasks / food_expiry_notification_jobs）。查询失败时抛出异常。
+    """
+    check_supabase_configured()
+    supabase = get_supabase_client()
+    result = supabase.rpc("get_task_queue_stats", {}).execute()
+    return [row for row in (result.data or []) if isinstance(row, dict)]
+
+
+def heartbeat_task_leases_sync(task_ids: List[str]) -> List[str]:
+    """
+    为当前进程持有的 processing 任务续约，返回续约成功的任务 ID。
+    未返回的任务已不归本进程（被取消、完成或租约过期后被重新排队）。
+    """
+    ids = [str(x) for x in task_ids if x]
+    if not ids:
+        return []
+    check_supabase_configured()
+    supabase = get_supabase_client()
+    result = supabase.rpc(
+        "heartbeat_analysis_tasks",
+        {"p_task_ids": ids, "p_lease_seconds": TASK_LEASE_SECONDS, "p_owner": task_lease_owner()},
+    ).execute()
+    renewed: List[str] = []
+    for row in result.data or []:
+        value = row.get("heartbeat_analysis_tasks") if isinstance(row, dict) else row
+        if value:
+            renewed.append(str(value))
+    return renewed
+
+
+def requeue_expired_tasks_sync(max_attempts: Optional[int] = None) -> Dict[str, int]:
+    """
+    回收租约已过期的 processing 任务：未达最大尝试次数的退回 pending，否则标记 failed。
+    返回 {"requeued": n, "failed": m}；由 run_backend.py 的 Supervisor 定期调用。
+    """
+    check_supabase_configured()
+    supabase = get_supabase_client()
+    try:
+        result = supabase.rpc(
+            "requeue_expired_analysis_tasks",
+            {"p_max_attempts": max_attempts or TASK_MAX_ATTEMPTS},
+        ).execute()
+        row = (result.data or [{}])[0] if isinstance(result.data, list) else (result.data or {})
+        counts = {"requeued": int(row.get("requeued") or 0), "failed": int(row.get("failed") or 0)}
+        if counts["requeued"] or counts["failed"]:
+            print(f"[requeue_expired_tasks_sync] 租约过期：重新排队 {counts['requeued']} 个，放弃 {counts['failed']} 个")
+        return counts
+    except Exception as e:
+        print(f"[requeue_expired_tasks_sync] 错误: {e}")
+        return {"requeued": 0, "failed": 0}
+
+
+def release_stale_precision_aggregates_sync(max_wait_seconds: int) -> int:
+    """
+    放行等待子项估计超过 max_wait_seconds 的 precision_aggregate 任务（waiting -> pending），返回放行数量。
+    正常情况下由最后一个完成的子项估计触发放行，这里只兜底子任务丢失的情况；由 run_backend.py 的 Supervisor 定期调用。
+    """
+    check_supabase_configured()
+    supabase = get_supabase_client()
+    try:
+        result = supabase.rpc(
+            "release_stale_precision_aggregates",
+            {"p_max_wait_seconds": int(max_wait_seconds)},
+        ).execute()
+        released = int(result.data or 0) if not isinstance(result.data, list) else int((result.data or [0])[0] or 0)
+        if released:
+            print(f"[release_stale_precision_aggregates_sync] 放行等待超时的聚合任务 {released} 个")
+        return released
+    except Exception as e:
+        print(f"[release_stale_precision_aggregates_sync] 错误: {e}")
+        return 0
+
+
+def requeue_claimed_tasks_sync(task_ids: List[str]) -> int:
+    """
+    将已抢占但尚未开始处理的任务退回 pending（Worker 退出时调用），仅处理仍为 processing 的任务。
+    """
+    ids = [str(x) for x in task_ids if x]
+    if not ids:
+        return 0
+    check_supabase_configured()
+    supabase = get_supabase_client()
+    try:
+        r = (
+            supabase.table("analysis_tasks")
+            .update({
+                "status": "pending",
+                "lease_expires_at": None,
+                "lease_owner": None,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            })
+            .in_("id", ids)
+            .eq("status", "processing")
+            .execute()
+        )
+        return len(r.data or [])
+    except Exception as e:
+        print(f"[requeue_claimed_tasks_sync] 错误: {e}")
+        return 0
 
 
 def update_analysis_task_result_sync(
@@ -1274,10 +1679,13 @@ def update_analysis_task_result_sync(
     status: str,
     result: Optional[Dict[str, Any]] = None,
     error_message: Optional[str] = None,
+    lease_owner: Optional[str] = None,
 ) -> bool:
     """
     更新任务结果（done / failed）。
     如果任务已被取消或删除，则跳过更新并返回 False。
+    传入 lease_owner（Worker 抢占任务时的 task_lease_owner()）时按租约加锁写入：
+    仅当任务仍为 processing 且租约归该持有者时才更新，否则视为已失去任务（被取消、或租约过期后被他人重新抢占），返回 False。
     
     Returns:
         bool: 是否成功更新
@@ -1286,6 +1694,26 @@ def update_analysis_task_result_sync(
     supabase = get_supabase_client()
     
     try:
+        row = {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}
+        if result is not None:
+            row["result"] = result
+        if error_message is not None:
+            row["error_message"] = error_message
+
+        if lease_owner:
+            fenced = (
+                supabase.table("analysis_tasks")
+                .update(row)
+                .eq("id", task_id)
+                .eq("status", "processing")
+                .eq("lease_owner", lease_owner)
+                .execute()
+            )
+            if not fenced.data:
+                print(f"[update_analysis_task_result_sync] 任务 {task_id} 已不归 {lease_owner}（已取消或被重新抢占），跳过更新")
+                return False
+            return True
+
         # 先检查任务是否存在且不是 cancelled 状态
         check = supabase.table("analysis_tasks").select("status").eq("id", task_id).execute()
         if not check.data or len(check.data) == 0:
@@ -1297,12 +1725,6 @@ def update_analysis_task_result_sync(
             print(f"[update_analysis_task_result_sync] 任务 {task_id} 已被取消，跳过更新")
             return False
         
-        row = {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}
-        if result is not None:
-            row["result"] = result
-        if error_message is not None:
-            row["error_message"] = error_message
-        
         supabase.table("analysis_tasks").update(row).eq("id", task_id).execute()
         return True
     except Exception as e:
@@ -1390,13 +1812,13 @@ async def update_analysis_task_result(
     用于用户手动修正分析结果（如修改食物名称）后回写数据库。
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         data = {
             "result": result,
             "updated_at": datetime.now(timezone.utc).isoformat()
         }
-        res = supabase.table("analysis_tasks").update(data).eq("id", task_id).execute()
+        res = await supabase.table("analysis_tasks").update(data).eq("id", task_id).execute()
         if res.data and len(res.data) > 0:
             return res.data[0]
         # 如果更新失败（如 ID 不存在），这里可能需要抛错或返回 None
@@ -1432,12 +1854,12 @@ async def get_analysis_tasks_by_ids(task_ids: List[str]) -> Dict[str, Dict[str,
     if not task_ids:
         return {}
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.get_analysis_tasks_by_ids") as span:
         span.set_attribute("db.table", "analysis_tasks")
         span.set_attribute("db.task_ids.count", len(task_ids))
         try:
-            r = supabase.table("analysis_tasks").select("id, image_paths, image_url").in_("id", task_ids).execute()
+            r = await supabase.table("analysis_tasks").select("id, image_paths, image_url").in_("id", task_ids).execute()
             out = {}
             for row in (r.data or []):
                 tid = row.get("id")
@@ -1594,7 +2016,7 @@ def count_analysis_tasks_by_status_sync(user_id: str) -> Dict[str, Any]:
             else:
                 recorded_ids = set()
 
-            recognizing = sum(1 for t in tasks if t.get("status") in ("pending", "processing"))
+            recognizing = sum(1 for t in tasks if t.get("status") in ("pending", "processing", "waiting"))
             recorded = sum(1 for t in tasks if t.get("status") == "done" and t["id"] in recorded_ids)
             waiting_tasks = [t for t in tasks if t.get("status") == "done" and t["id"] not in recorded_ids]
             waiting_record = len(waiting_tasks)
@@ -1658,6 +2080,7 @@ def update_user_last_seen_analyze_history_sync(user_id: str) -> bool:
                 .eq("id", user_id)
                 .execute()
             )
+            invalidate_request_memo("user", user_id)
             return bool(result.data)
         except Exception as e:
             _record_db_exception("update_user_last_seen_analyze_history_sync", e, **{"db.table": "weapp_user"})
@@ -1707,7 +2130,7 @@ def delete_analysis_task_sync(task_id: str, user_id: str, cancel_processing: boo
         task_status = task.get("status")
         
         # 如果是进行中的任务，先标记为 cancelled
-        if task_status in ("pending", "processing"):
+        if task_status in ("pending", "processing", "waiting"):
             if not cancel_processing:
                 raise Exception("进行中的任务无法删除")
             
@@ -1722,7 +2145,6 @@ def delete_analysis_task_sync(task_id: str, user_id: str, cancel_processing: boo
             print(f"[delete_analysis_task_sync] 任务 {task_id} 已标记为 cancelled")
             
             # 给 worker 一点时间来放弃这个任务
-            import time
             time.sleep(0.5)
         
         # 清理关联的图片资源
@@ -1778,20 +2200,24 @@ def delete_analysis_task_sync(task_id: str, user_id: str, cancel_processing: boo
 def mark_timed_out_tasks_sync(timeout_minutes: int = 5) -> int:
     """
     将超时的 pending/processing 任务标记为 timed_out。
+    processing 任务只要租约仍有效（Worker 在持续心跳）就不算超时，避免误伤耗时较长的精准模式任务。
     返回被标记的任务数量。
     """
     check_supabase_configured()
     supabase = get_supabase_client()
     try:
         # 计算超时时间点
-        cutoff_time = datetime.now(timezone.utc) - timedelta(minutes=timeout_minutes)
+        now = datetime.now(timezone.utc)
+        cutoff_time = now - timedelta(minutes=timeout_minutes)
         
         # 更新超时任务
         result = supabase.table("analysis_tasks").update({
             "status": "timed_out",
             "error_message": "分析超时，请重试",
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }).in_("status", ["pending", "processing"]).lt("created_at", cutoff_time.isoformat()).execute()
+            "updated_at": now.isoformat()
+        }).in_("status", ["pending", "processing"]).lt("created_at", cutoff_time.isoformat()).or_(
+            f'status.eq.pending,lease_expires_at.is.null,lease_expires_at.lt."{now.isoformat()}"'
+        ).execute()
         
         count = len(result.data) if result.data else 0
         if count > 0:
@@ -1903,19 +2329,64 @@ def create_precision_session_round_sync(
         raise
 
 
-def list_precision_session_rounds_sync(session_id: str) -> List[Dict[str, Any]]:
-    """查询精准模式会话的所有轮次。"""
+def arm_precision_round_fan_in_sync(round_id: str, pending_estimate_count: int, aggregate_task_id: str) -> None:
+    """
+    在精准模式轮次上登记待完成的子项估计数与聚合任务。
+    之后每个子项估计首次变为 done / failed 时由数据库触发器原子减一，归零时把聚合任务从 waiting 放行为 pending。
+    """
     check_supabase_configured()
     supabase = get_supabase_client()
     try:
-        result = (
-            supabase.table("precision_session_rounds")
-            .select("*")
-            .eq("session_id", session_id)
-            .order("round_index")
-            .order("created_at")
-            .execute()
-        )
+        supabase.table("precision_session_rounds").update({
+            "pending_estimate_count": int(pending_estimate_count),
+            "aggregate_task_id": aggregate_task_id,
+        }).eq("id", round_id).execute()
+    except Exception as e:
+        print(f"[arm_precision_round_fan_in_sync] 错误: {e}")
+        raise
+
+
+def cancel_unstarted_analysis_tasks_sync(task_ids: List[str], error_message: str) -> int:
+    """
+    将尚未开始处理（waiting / pending）的任务置为 cancelled，返回取消数量；已被抢占或已结束的任务不受影响。
+    用于精准模式子任务未能全部派发时撤销本轮的聚合任务与已派发的子任务。
+    """
+    ids = [str(x) for x in task_ids if x]
+    if not ids:
+        return 0
+    check_supabase_configured()
+    supabase = get_supabase_client()
+    try:
+        result = (
+            supabase.table("analysis_tasks")
+            .update({
+                "status": "cancelled",
+                "error_message": error_message,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            })
+            .in_("id", ids)
+            .in_("status", ["waiting", "pending"])
+            .execute()
+        )
+        return len(result.data or [])
+    except Exception as e:
+        print(f"[cancel_unstarted_analysis_tasks_sync] 错误: {e}")
+        raise
+
+
+def list_precision_session_rounds_sync(session_id: str) -> List[Dict[str, Any]]:
+    """查询精准模式会话的所有轮次。"""
+    check_supabase_configured()
+    supabase = get_supabase_client()
+    try:
+        result = (
+            supabase.table("precision_session_rounds")
+            .select("*")
+            .eq("session_id", session_id)
+            .order("round_index")
+            .order("created_at")
+            .execute()
+        )
         return list(result.data or [])
     except Exception as e:
         print(f"[list_precision_session_rounds_sync] 错误: {e}")
@@ -2319,16 +2790,16 @@ async def get_friend_ids(user_id: str) -> List[str]:
     """获取用户的好友 ID 列表（双向：我→对方 与 对方→我，兼容仅存在单向历史数据的情况）
     【优化】合并两次查询为一次，减少一次网络往返；增加 5 分钟内存缓存。"""
     cache_key = f"friend_ids:{user_id}"
-    cached = _cache_get(_friend_ids_cache, cache_key, ttl_seconds=300)
+    cached = _friend_ids_cache.get(cache_key)
     if cached is not None:
         return cached
 
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 优化：一次查询同时拿到双向关系，减少一次网络往返
         r = (
-            supabase.table("user_friends")
+            await supabase.table("user_friends")
             .select("user_id, friend_id")
             .or_(f"user_id.eq.{user_id},friend_id.eq.{user_id}")
             .execute()
@@ -2344,7 +2815,7 @@ async def get_friend_ids(user_id: str) -> List[str]:
                 if uid:
                     out.add(uid)
         result = list(out)
-        _cache_set(_friend_ids_cache, cache_key, result)
+        _friend_ids_cache.set(cache_key, result)
         return result
     except Exception as e:
         print(f"[get_friend_ids] 错误: {e}")
@@ -2354,12 +2825,12 @@ async def get_friend_ids(user_id: str) -> List[str]:
 async def is_friend(user_id: str, friend_id: str) -> bool:
     """判断两人是否为好友"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        r1 = supabase.table("user_friends").select("id").eq("user_id", user_id).eq("friend_id", friend_id).limit(1).execute()
+        r1 = await supabase.table("user_friends").select("id").eq("user_id", user_id).eq("friend_id", friend_id).limit(1).execute()
         if r1.data and len(r1.data) > 0:
             return True
-        r2 = supabase.table("user_friends").select("id").eq("user_id", friend_id).eq("friend_id", user_id).limit(1).execute()
+        r2 = await supabase.table("user_friends").select("id").eq("user_id", friend_id).eq("friend_id", user_id).limit(1).execute()
         return bool(r2.data and len(r2.data) > 0)
     except Exception as e:
         print(f"[is_friend] 错误: {e}")
@@ -2369,11 +2840,11 @@ async def is_friend(user_id: str, friend_id: str) -> bool:
 async def add_friend_pair(user_id: str, friend_id: str) -> None:
     """建立双向好友关系（插入两条记录），如果已存在则跳过"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 先检查是否已存在好友关系，避免重复插入
-        existing1 = supabase.table("user_friends").select("id").eq("user_id", user_id).eq("friend_id", friend_id).execute()
-        existing2 = supabase.table("user_friends").select("id").eq("user_id", friend_id).eq("friend_id", user_id).execute()
+        existing1 = await supabase.table("user_friends").select("id").eq("user_id", user_id).eq("friend_id", friend_id).execute()
+        existing2 = await supabase.table("user_friends").select("id").eq("user_id", friend_id).eq("friend_id", user_id).execute()
         
         records_to_insert = []
         if not existing1.data or len(existing1.data) == 0:
@@ -2382,7 +2853,8 @@ async def add_friend_pair(user_id: str, friend_id: str) -> None:
             records_to_insert.append({"user_id": friend_id, "friend_id": user_id})
         
         if records_to_insert:
-            supabase.table("user_friends").insert(records_to_insert).execute()
+            await supabase.table("user_friends").insert(records_to_insert).execute()
+            _invalidate_friend_caches(user_id, friend_id)
     except Exception as e:
         # 忽略唯一约束冲突错误
         if "unique" in str(e).lower() or "duplicate" in str(e).lower():
@@ -2396,18 +2868,19 @@ async def remove_friend_pair(user_id: str, friend_id: str) -> None:
     if user_id == friend_id:
         raise ValueError("不能移除自己")
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         if not await is_friend(user_id, friend_id):
             raise ValueError("你们还不是好友")
 
         # 删除双向好友关系（兼容历史单向/重复数据）
-        supabase.table("user_friends").delete().eq("user_id", user_id).eq("friend_id", friend_id).execute()
-        supabase.table("user_friends").delete().eq("user_id", friend_id).eq("friend_id", user_id).execute()
+        await supabase.table("user_friends").delete().eq("user_id", user_id).eq("friend_id", friend_id).execute()
+        await supabase.table("user_friends").delete().eq("user_id", friend_id).eq("friend_id", user_id).execute()
+        _invalidate_friend_caches(user_id, friend_id)
 
         # 清理双方之间可能残留的 pending 请求
-        supabase.table("friend_requests").delete().eq("from_user_id", user_id).eq("to_user_id", friend_id).eq("status", "pending").execute()
-        supabase.table("friend_requests").delete().eq("from_user_id", friend_id).eq("to_user_id", user_id).eq("status", "pending").execute()
+        await supabase.table("friend_requests").delete().eq("from_user_id", user_id).eq("to_user_id", friend_id).eq("status", "pending").execute()
+        await supabase.table("friend_requests").delete().eq("from_user_id", friend_id).eq("to_user_id", user_id).eq("status", "pending").execute()
     except ValueError:
         raise
     except Exception as e:
@@ -2418,9 +2891,9 @@ async def remove_friend_pair(user_id: str, friend_id: str) -> None:
 async def get_pending_request_to_user_ids(from_user_id: str) -> List[str]:
     """获取 from_user_id 已发出的、状态为 pending 的 to_user_id 列表"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("friend_requests").select("to_user_id").eq("from_user_id", from_user_id).eq("status", "pending").execute()
+        result = await supabase.table("friend_requests").select("to_user_id").eq("from_user_id", from_user_id).eq("status", "pending").execute()
         return [r["to_user_id"] for r in (result.data or [])]
     except Exception as e:
         print(f"[get_pending_request_to_user_ids] 错误: {e}")
@@ -2440,14 +2913,14 @@ async def search_users(
     - is_pending: 是否已发送待处理请求
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         if telephone:
             q = supabase.table("weapp_user").select("id, nickname, avatar").eq("telephone", telephone.strip()).neq("id", current_user_id).limit(1)
-            result = q.execute()
+            result = await q.execute()
         elif nickname and nickname.strip():
             q = supabase.table("weapp_user").select("id, nickname, avatar").ilike("nickname", f"%{nickname.strip()}%").neq("id", current_user_id).limit(limit)
-            result = q.execute()
+            result = await q.execute()
         else:
             return []
         users = list(result.data or [])
@@ -2474,16 +2947,16 @@ async def send_friend_request(from_user_id: str, to_user_id: str) -> Dict[str, A
     if await is_friend(from_user_id, to_user_id):
         raise ValueError("你们已是好友")
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        existing = supabase.table("friend_requests").select("*").eq("from_user_id", from_user_id).eq("to_user_id", to_user_id).execute()
+        existing = await supabase.table("friend_requests").select("*").eq("from_user_id", from_user_id).eq("to_user_id", to_user_id).execute()
         if existing.data and len(existing.data) > 0:
             row = existing.data[0]
             if row.get("status") == "pending":
                 return row
-            supabase.table("friend_requests").update({"status": "pending", "updated_at": datetime.now(timezone.utc).isoformat()}).eq("id", row["id"]).execute()
+            await supabase.table("friend_requests").update({"status": "pending", "updated_at": datetime.now(timezone.utc).isoformat()}).eq("id", row["id"]).execute()
             return {**row, "status": "pending"}
-        result = supabase.table("friend_requests").insert({
+        result = await supabase.table("friend_requests").insert({
             "from_user_id": from_user_id,
             "to_user_id": to_user_id,
             "status": "pending",
@@ -2501,14 +2974,14 @@ async def send_friend_request(from_user_id: str, to_user_id: str) -> Dict[str, A
 async def get_friend_requests_received(to_user_id: str) -> List[Dict[str, Any]]:
     """获取收到的待处理好友请求列表"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("friend_requests").select("id, from_user_id, to_user_id, status, created_at").eq("to_user_id", to_user_id).eq("status", "pending").order("created_at", desc=True).execute()
+        result = await supabase.table("friend_requests").select("id, from_user_id, to_user_id, status, created_at").eq("to_user_id", to_user_id).eq("status", "pending").order("created_at", desc=True).execute()
         rows = list(result.data or [])
         if not rows:
             return []
         from_ids = [r["from_user_id"] for r in rows]
-        users_result = supabase.table("weapp_user").select("id, nickname, avatar").in_("id", from_ids).execute()
+        users_result = await supabase.table("weapp_user").select("id, nickname, avatar").in_("id", from_ids).execute()
         users_map = {u["id"]: u for u in (users_result.data or [])}
         out = []
         for r in rows:
@@ -2531,16 +3004,16 @@ async def get_friend_requests_received(to_user_id: str) -> List[Dict[str, Any]]:
 async def respond_friend_request(request_id: str, to_user_id: str, accept: bool) -> None:
     """处理好友请求：接受则建立双向好友关系"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        req = supabase.table("friend_requests").select("*").eq("id", request_id).eq("to_user_id", to_user_id).single().execute()
+        req = await supabase.table("friend_requests").select("*").eq("id", request_id).eq("to_user_id", to_user_id).single().execute()
         if not req.data:
             raise ValueError("请求不存在或无权操作")
         row = req.data
         if row.get("status") != "pending":
             raise ValueError("该请求已处理")
         status = "accepted" if accept else "rejected"
-        supabase.table("friend_requests").update({"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}).eq("id", request_id).execute()
+        await supabase.table("friend_requests").update({"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}).eq("id", request_id).execute()
         if accept:
             await add_friend_pair(row["to_user_id"], row["from_user_id"])
     except ValueError:
@@ -2553,10 +3026,10 @@ async def respond_friend_request(request_id: str, to_user_id: str, accept: bool)
 async def cancel_sent_friend_request(request_id: str, from_user_id: str) -> None:
     """撤销当前用户发出的、仍为 pending 的好友请求（删除该条记录）。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         req = (
-            supabase.table("friend_requests")
+            await supabase.table("friend_requests")
             .select("*")
             .eq("id", request_id)
             .eq("from_user_id", from_user_id)
@@ -2568,7 +3041,7 @@ async def cancel_sent_friend_request(request_id: str, from_user_id: str) -> None
         row = req.data
         if row.get("status") != "pending":
             raise ValueError("只能撤销待对方处理的请求")
-        supabase.table("friend_requests").delete().eq("id", request_id).execute()
+        await supabase.table("friend_requests").delete().eq("id", request_id).execute()
     except ValueError:
         raise
     except Exception as e:
@@ -2584,18 +3057,18 @@ async def get_friends_with_profile(user_id: str) -> List[Dict[str, Any]]:
     # 去重 friend_ids
     unique_friend_ids = list(set(friend_ids))
     check_supabase_configured()
-    supabase = get_supabase_client()
-    result = supabase.table("weapp_user").select("id, nickname, avatar").in_("id", unique_friend_ids).execute()
+    supabase = get_async_supabase_client()
+    result = await supabase.table("weapp_user").select("id, nickname, avatar").in_("id", unique_friend_ids).execute()
     return list(result.data or [])
 
 
 async def count_friends_sync(user_id: str) -> int:
     """获取用户的好友数量（双向关系去重）"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         r = (
-            supabase.table("user_friends")
+            await supabase.table("user_friends")
             .select("user_id, friend_id")
             .or_(f"user_id.eq.{user_id},friend_id.eq.{user_id}")
             .execute()
@@ -2620,13 +3093,15 @@ async def count_friends_sync(user_id: str) -> int:
 async def delete_friend_pair(user_id: str, friend_id: str) -> Dict[str, int]:
     """删除双向好友关系，返回删除条数。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         deleted = 0
-        r1 = supabase.table("user_friends").delete().eq("user_id", user_id).eq("friend_id", friend_id).execute()
+        r1 = await supabase.table("user_friends").delete().eq("user_id", user_id).eq("friend_id", friend_id).execute()
         deleted += len(r1.data or [])
-        r2 = supabase.table("user_friends").delete().eq("user_id", friend_id).eq("friend_id", user_id).execute()
+        r2 = await supabase.table("user_friends").delete().eq("user_id", friend_id).eq("friend_id", user_id).execute()
         deleted += len(r2.data or [])
+        if deleted:
+            _invalidate_friend_caches(user_id, friend_id)
         return {"deleted": deleted}
     except Exception as e:
         print(f"[delete_friend_pair] 错误: {e}")
@@ -2640,17 +3115,17 @@ async def get_friend_requests_overview(user_id: str) -> Dict[str, List[Dict[str,
     - sent: 我发出的请求（pending/accepted/rejected）
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         received_result = (
-            supabase.table("friend_requests")
+            await supabase.table("friend_requests")
             .select("id, from_user_id, to_user_id, status, created_at, updated_at")
             .eq("to_user_id", user_id)
             .order("created_at", desc=True)
             .execute()
         )
         sent_result = (
-            supabase.table("friend_requests")
+            await supabase.table("friend_requests")
             .select("id, from_user_id, to_user_id, status, created_at, updated_at")
             .eq("from_user_id", user_id)
             .order("created_at", desc=True)
@@ -2672,7 +3147,7 @@ async def get_friend_requests_overview(user_id: str) -> Dict[str, List[Dict[str,
         users_map: Dict[str, Dict[str, Any]] = {}
         if counterpart_ids:
             users_result = (
-                supabase.table("weapp_user")
+                await supabase.table("weapp_user")
                 .select("id, nickname, avatar")
                 .in_("id", list(counterpart_ids))
                 .execute()
@@ -2720,10 +3195,10 @@ async def get_friend_requests_overview(user_id: str) -> Dict[str, List[Dict[str,
 async def cleanup_duplicate_friends(user_id: str) -> Dict[str, Any]:
     """清理用户的重复好友记录，只保留每个好友的第一条记录"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 获取该用户的所有好友记录
-        result = supabase.table("user_friends").select("id, friend_id").eq("user_id", user_id).execute()
+        result = await supabase.table("user_friends").select("id, friend_id").eq("user_id", user_id).execute()
         records = result.data or []
         
         # 统计每个 friend_id 的记录
@@ -2741,7 +3216,7 @@ async def cleanup_duplicate_friends(user_id: str) -> Dict[str, Any]:
                 # 保留第一条，删除其他
                 to_delete = record_ids[1:]
                 for rid in to_delete:
-                    supabase.table("user_friends").delete().eq("id", rid).execute()
+                    await supabase.table("user_friends").delete().eq("id", rid).execute()
                     deleted_count += 1
         
         return {"cleaned": deleted_count, "user_id": user_id}
@@ -2761,7 +3236,7 @@ def build_friend_invite_code(user_id: str) -> str:
 async def resolve_user_by_friend_invite_code(invite_code: str) -> Optional[Dict[str, Any]]:
     """根据短邀请码解析用户（匹配 user_id 前缀），返回公开资料。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     code = (invite_code or "").strip().lower()
     if not re.fullmatch(r"[0-9a-f]{6,12}", code):
         return None
@@ -2773,7 +3248,7 @@ async def resolve_user_by_friend_invite_code(invite_code: str) -> Optional[Dict[
         offset = 0
         while True:
             batch = (
-                supabase
+                await supabase
                 .table("weapp_user")
                 .select("id, nickname, avatar")
                 .range(offset, offset + page_size - 1)
@@ -2813,10 +3288,10 @@ async def create_invite_referral_binding(
     if not inviter_user_id or not invitee_user_id or inviter_user_id == invitee_user_id:
         return None
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         existing = (
-            supabase.table("user_invite_referrals")
+            await supabase.table("user_invite_referrals")
             .select("*")
             .eq("invitee_user_id", invitee_user_id)
             .limit(1)
@@ -2835,7 +3310,7 @@ async def create_invite_referral_binding(
         if source_request_id:
             row["source_request_id"] = source_request_id
 
-        result = supabase.table("user_invite_referrals").insert(row).execute()
+        result = await supabase.table("user_invite_referrals").insert(row).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         return None
@@ -3038,7 +3513,8 @@ async def record_invite_referral_valid_use(
     effective_action: str,
     monthly_limit: int = INVITE_REWARD_MONTHLY_LIMIT,
 ) -> Optional[Dict[str, Any]]:
-    return record_invite_referral_valid_use_sync(
+    return await asyncio.to_thread(
+        record_invite_referral_valid_use_sync,
         invitee_user_id,
         effective_action,
         monthly_limit=monthly_limit,
@@ -3076,9 +3552,9 @@ async def get_daily_membership_bonus_breakdown(user_id: str, china_date_str: str
         await materialize_daily_share_poster_reward_credits(user_id, china_date_str)
 
         check_supabase_configured()
-        supabase = get_supabase_client()
+        supabase = get_async_supabase_client()
         rows = (
-            supabase.table("user_earned_credit_ledger")
+            await supabase.table("user_earned_credit_ledger")
             .select("reason,delta")
             .eq("user_id", user_id)
             .eq("related_date", china_date_str)
@@ -3130,7 +3606,14 @@ def get_user_earned_credits_balance_sync(user_id: str) -> int:
 
 
 async def get_user_earned_credits_balance(user_id: str) -> int:
-    return get_user_earned_credits_balance_sync(user_id)
+    # 余额在 weapp_user 行上，复用请求内已读到的用户行
+    user = await get_user_by_id(user_id)
+    if not user:
+        return 0
+    try:
+        return max(int(user.get("earned_credits_balance") or 0), 0)
+    except Exception:
+        return 0
 
 
 def _get_existing_earned_credit_ledger_entry_sync(
@@ -3160,7 +3643,7 @@ async def _get_existing_earned_credit_ledger_entry(
     reason: str,
     source_key: Optional[str],
 ) -> Optional[Dict[str, Any]]:
-    return _get_existing_earned_credit_ledger_entry_sync(user_id, reason, source_key)
+    return await asyncio.to_thread(_get_existing_earned_credit_ledger_entry_sync, user_id, reason, source_key)
 
 
 def _change_user_earned_credits_balance_sync(
@@ -3234,7 +3717,8 @@ async def _change_user_earned_credits_balance(
     related_date: Optional[str] = None,
     meta: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
-    return _change_user_earned_credits_balance_sync(
+    return await asyncio.to_thread(
+        _change_user_earned_credits_balance_sync,
         user_id,
         delta,
         reason,
@@ -3279,7 +3763,8 @@ async def add_user_earned_credits(
     related_date: Optional[str] = None,
     meta: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
-    return add_user_earned_credits_sync(
+    return await asyncio.to_thread(
+        add_user_earned_credits_sync,
         user_id,
         amount,
         reason,
@@ -3324,7 +3809,8 @@ async def deduct_user_earned_credits(
     related_date: Optional[str] = None,
     meta: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
-    return deduct_user_earned_credits_sync(
+    return await asyncio.to_thread(
+        deduct_user_earned_credits_sync,
         user_id,
         amount,
         reason,
@@ -3336,10 +3822,10 @@ async def deduct_user_earned_credits(
 
 async def materialize_daily_invite_reward_credits(user_id: str, china_date_str: str) -> Dict[str, int]:
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         inviter_rows = (
-            supabase.table("user_invite_referrals")
+            await supabase.table("user_invite_referrals")
             .select("id, inviter_user_id, invitee_user_id")
             .eq("inviter_user_id", user_id)
             .eq("status", "reward_active")
@@ -3348,7 +3834,7 @@ async def materialize_daily_invite_reward_credits(user_id: str, china_date_str:
             .execute()
         )
         invitee_rows = (
-            supabase.table("user_invite_referrals")
+            await supabase.table("user_invite_referrals")
             .select("id, inviter_user_id, invitee_user_id")
             .eq("invitee_user_id", user_id)
             .eq("status", "reward_active")
@@ -3394,10 +3880,10 @@ async def materialize_daily_invite_reward_credits(user_id: str, china_date_str:
 
 async def materialize_daily_share_poster_reward_credits(user_id: str, china_date_str: str) -> Dict[str, int]:
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         share_rows = (
-            supabase.table("user_credit_bonus_events")
+            await supabase.table("user_credit_bonus_events")
             .select("id, credits, source_record_id")
             .eq("user_id", user_id)
             .eq("bonus_type", "share_poster")
@@ -3462,11 +3948,11 @@ async def claim_share_poster_bonus(
             "error": "record_id_required",
         }
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     claims_before_insert = 0
     try:
         today_rows = (
-            supabase.table("user_credit_bonus_events")
+            await supabase.table("user_credit_bonus_events")
             .select("id, source_record_id")
             .eq("user_id", user_id)
             .eq("bonus_type", "share_poster")
@@ -3505,7 +3991,7 @@ async def claim_share_poster_bonus(
         }
 
         claims_before_insert = claims_today
-        result = supabase.table("user_credit_bonus_events").insert(row).execute()
+        result = await supabase.table("user_credit_bonus_events").insert(row).execute()
         event = (result.data or [None])[0]
         return {
             "claimed": bool(event),
@@ -3591,8 +4077,59 @@ def _find_recent_duplicate_feed_comment_sync(
         print(f"[_find_recent_duplicate_feed_comment_sync] 查询失败: {e}")
         return None
 
+    return _pick_recent_duplicate_feed_comment(
+        list(result.data or []),
+        parent_comment_id=parent_comment_id,
+        reply_to_user_id=reply_to_user_id,
+        window_seconds=window_seconds,
+    )
+
+
+async def _find_recent_duplicate_feed_comment(
+    supabase,
+    user_id: str,
+    record_id: str,
+    content: str,
+    parent_comment_id: Optional[str] = None,
+    reply_to_user_id: Optional[str] = None,
+    window_seconds: int = 8,
+) -> Optional[Dict[str, Any]]:
+    """异步版：_find_recent_duplicate_feed_comment_sync，supabase 为异步客户端。"""
+    normalized_content = (content or "").strip()
+    if not normalized_content:
+        return None
+
+    try:
+        result = await (
+            supabase.table("feed_comments")
+            .select("id, user_id, record_id, parent_comment_id, reply_to_user_id, content, created_at")
+            .eq("user_id", user_id)
+            .eq("record_id", record_id)
+            .eq("content", normalized_content)
+            .order("created_at", desc=True)
+            .limit(5)
+            .execute()
+        )
+    except Exception as e:
+        print(f"[_find_recent_duplicate_feed_comment] 查询失败: {e}")
+        return None
+
+    return _pick_recent_duplicate_feed_comment(
+        list(result.data or []),
+        parent_comment_id=parent_comment_id,
+        reply_to_user_id=reply_to_user_id,
+        window_seconds=window_seconds,
+    )
+
+
+def _pick_recent_duplicate_feed_comment(
+    rows: List[Dict[str, Any]],
+    parent_comment_id: Optional[str],
+    reply_to_user_id: Optional[str],
+    window_seconds: int,
+) -> Optional[Dict[str, Any]]:
     now = datetime.now(timezone.utc)
-    for row in list(result.data or []):
+    for row in rows:
         if row.get("parent_comment_id") != parent_comment_id:
             continue
         if row.get("reply_to_user_id") != reply_to_user_id:
@@ -3629,24 +4166,30 @@ def _build_feed_comment_bundle(
     return {"comments_map": comments_map, "comment_count_map": comment_count_map}
 
 
-def _query_feed_comments_bundle_sync(
+def _feed_counter(record: Dict[str, Any], column: str) -> int:
+    """读取 user_food_records 上的 like_count / comment_count 计数列。"""
+    try:
+        return max(0, int(record.get(column) or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+async def _query_feed_comment_previews(
     supabase,
     record_ids: List[str],
     comments_limit: int,
-) -> Dict[str, Any]:
-    if not record_ids:
-        return {"comments_map": {}, "comment_count_map": {}}
+) -> Dict[str, List[Dict[str, Any]]]:
+    """批量获取每条动态最近 comments_limit 条评论（数据库内按动态截断，不再下载全部评论）。"""
+    if not record_ids or comments_limit <= 0:
+        return {}
 
-    comments_result = (
-        supabase.table("feed_comments")
-        .select("id, user_id, record_id, parent_comment_id, reply_to_user_id, content, created_at")
-        .in_("record_id", record_ids)
-        .order("created_at", desc=False)
-        .execute()
-    )
+    comments_result = await supabase.rpc(
+        "list_feed_comment_previews",
+        {"p_record_ids": record_ids, "p_limit": comments_limit},
+    ).execute()
     all_comments = list(comments_result.data or [])
     if not all_comments:
-        return {"comments_map": {}, "comment_count_map": {}}
+        return {}
 
     user_ids = {
         uid
@@ -3655,7 +4198,7 @@ def _query_feed_comments_bundle_sync(
     }
     user_map: Dict[str, Dict[str, Any]] = {}
     if user_ids:
-        users = (
+        users = await (
             supabase.table("weapp_user")
             .select("id, nickname, avatar")
             .in_("id", list(user_ids))
@@ -3663,7 +4206,29 @@ def _query_feed_comments_bundle_sync(
         )
         user_map = {u["id"]: u for u in (users.data or [])}
 
-    return _build_feed_comment_bundle(all_comments, user_map, comments_limit)
+    return _build_feed_comment_bundle(all_comments, user_map, comments_limit)["comments_map"]
+
+
+async def _query_feed_liked_record_ids(supabase, record_ids: List[str], user_id: Optional[str]) -> Set[str]:
+    """当前用户点赞过的动态 ID（只查该用户自己的点赞行，走 (user_id, record_id) 唯一索引）。"""
+    if not record_ids or not user_id:
+        return set()
+    my = await supabase.table("feed_likes").select("record_id").eq("user_id", user_id).in_("record_id", record_ids).execute()
+    return {m["record_id"] for m in (my.data or [])}
+
+
+def decay_feed_record_fresh_scores_sync() -> int:
+    """
+    衰减 72 小时内饮食记录的 feed_fresh_score（热门/均衡/推荐排序得分随之由生成列刷新），
+    由 feed-score Worker 定期调用。返回更新的记录数。
+    """
+    check_supabase_configured()
+    supabase = get_supabase_client()
+    result = supabase.rpc("decay_food_record_feed_fresh_scores", {}).execute()
+    try:
+        return int(result.data or 0)
+    except (TypeError, ValueError):
+        return 0
 
 
 def _parse_iso_datetime(value: Any) -> Optional[datetime]:
@@ -3714,21 +4279,6 @@ def _compute_macro_balance_score(
     return round(score * 100.0, 2)
 
 
-def _compute_feed_hot_score(like_count: int, comment_count: int) -> float:
-    raw = float(max(like_count, 0) * 2 + max(comment_count, 0) * 3)
-    return min(raw / 30.0, 1.0)
-
-
-def _compute_freshness_score(record_time: Any, window_hours: float = 72.0) -> float:
-    dt = _parse_iso_datetime(record_time)
-    if not dt:
-        return 0.0
-    delta_hours = max((datetime.now(timezone.utc) - dt).total_seconds() / 3600.0, 0.0)
-    if window_hours <= 0:
-        return 0.0
-    return max(0.0, 1.0 - min(delta_hours, window_hours) / window_hours)
-
-
 def _build_feed_recommend_reason(
     record: Dict[str, Any],
     sort_by: str,
@@ -3760,40 +4310,101 @@ def _build_feed_recommend_reason(
     return "为你推荐"
 
 
-def _score_feed_record(
-    record: Dict[str, Any],
-    *,
-    sort_by: str,
-    like_count: int,
-    comment_count: int,
-    meal_type: Optional[str],
-    diet_goal: Optional[str],
-    priority_author_ids: Optional[List[str]] = None,
-) -> float:
-    balance_score = _compute_macro_balance_score(
-        record.get("total_protein"),
-        record.get("total_carbs"),
-        record.get("total_fat"),
-    ) / 100.0
-    hot_score = _compute_feed_hot_score(like_count, comment_count)
-    fresh_score = _compute_freshness_score(record.get("record_time"))
-    meal_match = 1.0 if meal_type and record.get("meal_type") == meal_type else 0.0
-    goal_match = 1.0 if diet_goal and record.get("diet_goal") == diet_goal else 0.0
-    priority_match = 1.0 if priority_author_ids and str(record.get("user_id") or "") in priority_author_ids else 0.0
-
-    if sort_by == "hot":
-        return hot_score * 100.0 + fresh_score * 10.0 + balance_score * 8.0
-    if sort_by == "balanced":
-        return balance_score * 100.0 + hot_score * 12.0 + fresh_score * 6.0
+# 各排序方式对应的物化得分列（sql/add_feed_record_rank_scores.sql），latest 不需要
+_FEED_RANK_COLUMNS: Dict[str, str] = {
+    "recommended": "feed_recommend_rank",
+    "hot": "feed_hot_rank",
+    "balanced": "feed_balanced_rank",
+}
 
-    return (
-        priority_match * 120.0
-        + meal_match * 45.0
-        + goal_match * 36.0
-        + balance_score * 20.0
-        + hot_score * 18.0
-        + fresh_score * 12.0
-    )
+
+def _feed_rank_value(record: Dict[str, Any], rank_column: Optional[str]) -> float:
+    if not rank_column:
+        return 0.0
+    try:
+        return float(record.get(rank_column) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _encode_feed_cursor(record_time: Any, record_id: Any, rank: Optional[float] = None) -> str:
+    parts = [str(record_time)] + ([repr(float(rank))] if rank is not None else []) + [str(record_id)]
+    raw = "|".join(parts).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_feed_cursor(cursor: Optional[str]) -> Optional[Tuple[str, Optional[float], str]]:
+    """解析游标为 (record_time, rank, id)；按时间排序的游标不带 rank。"""
+    text = (cursor or "").strip()
+    if not text:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(text + "=" * (-len(text) % 4)).decode("utf-8")
+        parts = raw.split("|")
+        if len(parts) == 2:
+            record_time, record_id = parts
+            rank = None
+        elif len(parts) == 3:
+            record_time, rank_text, record_id = parts
+            rank = float(rank_text)
+            if not math.isfinite(rank):
+                return None
+        else:
+            return None
+        # 游标字段会拼进 PostgREST or 过滤：id 必须是 UUID，rank 须为有限数，时间须可解析，否则视为无效游标
+        record_id = str(uuid.UUID(record_id))
+    except Exception:
+        return None
+    if not _parse_iso_datetime(record_time):
+        return None
+    return record_time, rank, record_id
+
+
+def build_feed_next_cursor(records: List[Dict[str, Any]], sort_by: str = "latest") -> Optional[str]:
+    """
+    由本页记录生成下一页游标：取排序键 ([rank,] record_time, id) 最靠后的一条。
+    推荐排序会在页内叠加特别关注加权，因此不能直接取展示顺序的最后一条。
+    """
+    rank_column = _FEED_RANK_COLUMNS.get(sort_by)
+    keyed = [
+        (
+            _feed_rank_value(r, rank_column),
+            (_parse_iso_datetime(r.get("record_time")) or datetime.fromtimestamp(0, tz=timezone.utc)),
+            str(r.get("id") or ""),
+            r,
+        )
+        for r in records
+        if r.get("id") and r.get("record_time")
+    ]
+    if not keyed:
+        return None
+    rank, _, _, last = min(keyed, key=lambda x: (x[0], x[1], x[2]))
+    return _encode_feed_cursor(last.get("record_time"), last.get("id"), rank if rank_column else None)
+
+
+def _page_feed_query(q: Any, cursor: Optional[str], offset: int, limit: int, sort_by: str = "latest") -> Any:
+    """
+    Feed 分页：按 ([rank desc,] record_time desc, id desc) 排序，rank 为 sort_by 对应的物化得分列，
+    热门/均衡/推荐以得分为主序，latest 只按时间。
+    传入有效 cursor 时走 keyset（排序键严格靠后于游标），否则退回 offset 分页。
+    """
+    rank_column = _FEED_RANK_COLUMNS.get(sort_by)
+    if rank_column:
+        q = q.order(rank_column, desc=True)
+    q = q.order("record_time", desc=True).order("id", desc=True)
+    decoded = _decode_feed_cursor(cursor)
+    if decoded:
+        record_time, rank, record_id = decoded
+        if rank_column and rank is not None:
+            q = q.or_(
+                f'{rank_column}.lt.{rank!r},'
+                f'and({rank_column}.eq.{rank!r},record_time.lt."{record_time}"),'
+                f'and({rank_column}.eq.{rank!r},record_time.eq."{record_time}",id.lt.{record_id})'
+            )
+        else:
+            q = q.or_(f'record_time.lt."{record_time}",and(record_time.eq."{record_time}",id.lt.{record_id})')
+        return q.limit(limit)
+    return q.range(offset, offset + limit - 1)
 
 
 async def get_feed_record_interaction_context(user_id: Optional[str], record_id: str) -> Dict[str, Any]:
@@ -3832,6 +4443,7 @@ async def list_friends_feed_records(
     priority_author_ids: Optional[List[str]] = None,
     author_scope: str = "all",
     author_id: Optional[str] = None,
+    cursor: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """
     获取好友 + 自己的饮食记录（支持分页），用于圈子 Feed。
@@ -3839,8 +4451,9 @@ async def list_friends_feed_records(
     Args:
         user_id: 当前用户 ID
         date: 可选日期筛选
-        offset: 分页偏移
+        offset: 分页偏移（未传 cursor 时使用）
         limit: 每页记录数
+        cursor: 上一页返回的游标（build_feed_next_cursor），按排序键续读，翻页成本与第一页相同
         include_comments: 是否包含评论（默认 True）
         comments_limit: 每条记录返回的评论数（默认 5）
         
@@ -3870,12 +4483,12 @@ async def list_friends_feed_records(
                 return []
     
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # author_scope == "public": 查询所有公开记录的用户 + 自己
         if author_scope == "public" and not (author_id and str(author_id).strip()):
             # 只取最近有打卡的公开用户（最多 50 个），避免加载全部用户导致请求过多
-            recent_records = supabase.table("user_food_records").select("user_id").neq("hidden_from_feed", True).order("record_time", desc=True).limit(200).execute()
+            recent_records = await supabase.table("user_food_records").select("user_id").neq("hidden_from_feed", True).order("record_time", desc=True).limit(200).execute()
             recent_user_ids = []
             seen = set()
             for r in (recent_records.data or []):
@@ -3888,7 +4501,7 @@ async def list_friends_feed_records(
             public_user_ids = []
             if recent_user_ids:
                 try:
-                    public_users = supabase.table("weapp_user").select("id").in_("id", recent_user_ids).eq("public_records", "true").execute()
+                    public_users = await supabase.table("weapp_user").select("id").in_("id", recent_user_ids).eq("public_records", "true").execute()
                     public_user_ids = [u["id"] for u in (public_users.data or []) if u.get("id")]
                 except Exception as e:
                     print(f"[list_friends_feed_records] public_records query failed: {e}", flush=True)
@@ -3898,11 +4511,6 @@ async def list_friends_feed_records(
                 if aid in author_ids
             ]
 
-        custom_rank = sort_by in {"recommended", "hot", "balanced"}
-        candidate_limit = max(offset + limit + 40, limit * 3, 60) if custom_rank else limit
-        range_start = 0 if custom_rank else offset
-        range_end = candidate_limit - 1 if custom_rank else offset + limit - 1
-
         q = supabase.table("user_food_records").select("*").in_("user_id", author_ids)
         q = q.neq("hidden_from_feed", True)
         
@@ -3917,65 +4525,42 @@ async def list_friends_feed_records(
         if diet_goal:
             q = q.eq("diet_goal", diet_goal)
 
-        q = q.order("record_time", desc=True).range(range_start, range_end)
-        records = q.execute()
+        # 排序得分已物化在记录上，数据库按 (rank, record_time, id) 直接取出一页
+        q = _page_feed_query(q, cursor, offset, limit, sort_by=sort_by)
+        records = await q.execute()
         
         rec_list = list(records.data or [])
         if not rec_list:
             return []
 
-        likes_map: Dict[str, Dict[str, Any]] = {}
-        comment_count_map: Dict[str, int] = {}
-        if custom_rank:
-            record_ids = [r["id"] for r in rec_list]
-            likes_map = await get_feed_likes_for_records(record_ids, user_id) if record_ids else {}
-            comment_bundle = _query_feed_comments_bundle_sync(supabase, record_ids, 0) if record_ids else {"comment_count_map": {}}
-            comment_count_map = comment_bundle["comment_count_map"]
-
+        if sort_by == "recommended" and normalized_priority_ids:
+            # 特别关注加权因浏览者而异，无法物化，只在本页内叠加后重排
+            priority_set = set(normalized_priority_ids)
             rec_list.sort(
                 key=lambda r: (
+                    (120.0 if str(r.get("user_id") or "") in priority_set else 0.0) + _feed_rank_value(r, "feed_recommend_rank"),
                     (_parse_iso_datetime(r.get("record_time")) or datetime.fromtimestamp(0, tz=timezone.utc)).timestamp(),
-                    _score_feed_record(
-                        r,
-                        sort_by=sort_by,
-                        like_count=likes_map.get(r["id"], {}).get("count", 0),
-                        comment_count=comment_count_map.get(r["id"], 0),
-                        meal_type=meal_type,
-                        diet_goal=diet_goal,
-                        priority_author_ids=normalized_priority_ids,
-                    ),
                 ),
                 reverse=True,
             )
-            rec_list = rec_list[offset: offset + limit]
-            if not rec_list:
-                return []
-            
+
+        record_ids = [r["id"] for r in rec_list]
         # 获取作者信息（仅查询结果中涉及的用户）
         involved_user_ids = list(set(r["user_id"] for r in rec_list))
-        authors = supabase.table("weapp_user").select("id, nickname, avatar").in_("id", involved_user_ids).execute()
+        authors = await supabase.table("weapp_user").select("id, nickname, avatar").in_("id", involved_user_ids).execute()
         author_map = {a["id"]: a for a in (authors.data or [])}
-        
-        # 批量获取评论（如果需要）
+
+        # 批量获取评论预览（如果需要）；点赞/评论数直接取记录上的计数列
         comments_map: Dict[str, List[Dict[str, Any]]] = {}
         if include_comments:
-            record_ids = [r["id"] for r in rec_list]
-            bundle = _query_feed_comments_bundle_sync(supabase, record_ids, comments_limit)
-            comments_map = bundle["comments_map"]
-            comment_count_map = bundle["comment_count_map"]
-        elif not comment_count_map:
-            record_ids = [r["id"] for r in rec_list]
-            if record_ids:
-                comment_count_map = _query_feed_comments_bundle_sync(supabase, record_ids, 0)["comment_count_map"]
-
-        if not likes_map:
-            record_ids = [r["id"] for r in rec_list]
-            likes_map = await get_feed_likes_for_records(record_ids, user_id) if record_ids else {}
-        
+            comments_map = await _query_feed_comment_previews(supabase, record_ids, comments_limit)
+        liked_ids = await _query_feed_liked_record_ids(supabase, record_ids, user_id)
+
         out = []
         for r in rec_list:
             author = author_map.get(r["user_id"], {})
-            like_info = likes_map.get(r["id"], {"count": 0, "liked": False})
+            like_count = _feed_counter(r, "like_count")
+            comment_count = _feed_counter(r, "comment_count")
             item = {
                 "record": r,
                 "author": {
@@ -3983,8 +4568,8 @@ async def list_friends_feed_records(
                     "nickname": author.get("nickname") or "用户",
                     "avatar": author.get("avatar") or "",
                 },
-                "like_count": like_info.get("count", 0),
-                "liked": like_info.get("liked", False),
+                "like_count": like_count,
+                "liked": r["id"] in liked_ids,
                 "is_mine": r.get("user_id") == user_id,
                 "recommend_reason": _build_feed_recommend_reason(
                     r,
@@ -3992,15 +4577,13 @@ async def list_friends_feed_records(
                     meal_type=meal_type,
                     diet_goal=diet_goal,
                     priority_author_ids=normalized_priority_ids,
-                    like_count=like_info.get("count", 0),
-                    comment_count=comment_count_map.get(r["id"], 0),
+                    like_count=like_count,
+                    comment_count=comment_count,
                 ),
             }
             if include_comments:
                 item["comments"] = comments_map.get(r["id"], [])
-                item["comment_count"] = comment_count_map.get(r["id"], 0)
-            else:
-                item["comment_count"] = comment_count_map.get(r["id"], 0)
+            item["comment_count"] = comment_count
             out.append(item)
         return out
     except Exception as e:
@@ -4013,14 +4596,14 @@ async def _get_friend_circle_week_checkin_leaderboard_original(viewer_user_id: s
     """【原始版本】本周打卡排行榜：while循环分页拉取。内联原始 get_friend_ids 逻辑，避免受缓存影响。"""
     # 内联原始 get_friend_ids 逻辑（无缓存）
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     friend_ids_set = set()
-    r1 = supabase.table("user_friends").select("friend_id").eq("user_id", viewer_user_id).execute()
+    r1 = await supabase.table("user_friends").select("friend_id").eq("user_id", viewer_user_id).execute()
     for row in r1.data or []:
         fid = row.get("friend_id")
         if fid:
             friend_ids_set.add(fid)
-    r2 = supabase.table("user_friends").select("user_id").eq("friend_id", viewer_user_id).execute()
+    r2 = await supabase.table("user_friends").select("user_id").eq("friend_id", viewer_user_id).execute()
     for row in r2.data or []:
         uid = row.get("user_id")
         if uid:
@@ -4043,7 +4626,7 @@ async def _get_friend_circle_week_checkin_leaderboard_original(viewer_user_id: s
 
     counts: Counter = Counter()
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         page_size = 1000
         offset = 0
@@ -4056,7 +4639,7 @@ async def _get_friend_circle_week_checkin_leaderboard_original(viewer_user_id: s
                 .lt("record_time", end_ts)
                 .range(offset, offset + page_size - 1)
             )
-            batch = q.execute()
+            batch = await q.execute()
             rows = list(batch.data or [])
             for r in rows:
                 uid = r.get("user_id")
@@ -4067,7 +4650,7 @@ async def _get_friend_circle_week_checkin_leaderboard_original(viewer_user_id: s
             offset += page_size
 
         users_result = (
-            supabase.table("weapp_user")
+            await supabase.table("weapp_user")
             .select("id, nickname, avatar")
             .in_("id", author_ids)
             .execute()
@@ -4127,16 +4710,16 @@ async def get_friend_circle_week_checkin_leaderboard(viewer_user_id: str) -> Dic
 
     # 缓存 key 包含用户 ID 和周起始时间，确保同一周内命中缓存
     cache_key = f"checkin_leaderboard:{viewer_user_id}:{start_ts}"
-    cached = _cache_get(_checkin_leaderboard_cache, cache_key, ttl_seconds=300)
+    cached = _checkin_leaderboard_cache.get(cache_key)
     if cached is not None:
         return cached
 
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 优化：一次查询拉取所有匹配记录，不再分页循环
         records_result = (
-            supabase.table("user_food_records")
+            await supabase.table("user_food_records")
             .select("user_id")
             .in_("user_id", author_ids)
             .gte("record_time", start_ts)
@@ -4151,7 +4734,7 @@ async def get_friend_circle_week_checkin_leaderboard(viewer_user_id: str) -> Dic
                 counts[uid] += 1
 
         users_result = (
-            supabase.table("weapp_user")
+            await supabase.table("weapp_user")
             .select("id, nickname, avatar")
             .in_("id", author_ids)
             .execute()
@@ -4183,7 +4766,7 @@ async def get_friend_circle_week_checkin_leaderboard(viewer_user_id: str) -> Dic
             "week_end": week_end_inclusive,
             "list": items,
         }
-        _cache_set(_checkin_leaderboard_cache, cache_key, result)
+        _checkin_leaderboard_cache.set(cache_key, result)
         return result
     except Exception as e:
         print(f"[get_friend_circle_week_checkin_leaderboard] 错误: {e}")
@@ -4198,16 +4781,17 @@ async def list_public_feed_records(
     meal_type: Optional[str] = None,
     diet_goal: Optional[str] = None,
     sort_by: str = "latest",
+    cursor: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """
     获取公共饮食记录（来自 public_records=true 的用户），无需登录。
-    用于未登录用户浏览圈子。
+    用于未登录用户浏览圈子。cursor 语义同 list_friends_feed_records。
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 只取最近有打卡的公开用户（最多 50 个），避免加载全部用户导致请求过多
-        recent_records = supabase.table("user_food_records").select("user_id").neq("hidden_from_feed", True).order("record_time", desc=True).limit(200).execute()
+        recent_records = await supabase.table("user_food_records").select("user_id").neq("hidden_from_feed", True).order("record_time", desc=True).limit(200).execute()
         recent_user_ids = []
         seen = set()
         for r in (recent_records.data or []):
@@ -4221,7 +4805,7 @@ async def list_public_feed_records(
         public_user_ids = []
         if recent_user_ids:
             try:
-                public_users = supabase.table("weapp_user").select("id").in_("id", recent_user_ids).eq("public_records", "true").execute()
+                public_users = await supabase.table("weapp_user").select("id").in_("id", recent_user_ids).eq("public_records", "true").execute()
                 public_user_ids = [u["id"] for u in (public_users.data or []) if u.get("id")]
             except Exception as e:
                 print(f"[list_public_feed_records] public_records query failed: {e}", flush=True)
@@ -4236,66 +4820,27 @@ async def list_public_feed_records(
         if diet_goal:
             q = q.eq("diet_goal", diet_goal)
 
-        custom_rank = sort_by in {"recommended", "hot", "balanced"}
-        candidate_limit = max(offset + limit + 40, limit * 3, 60) if custom_rank else limit
-        range_start = 0 if custom_rank else offset
-        range_end = candidate_limit - 1 if custom_rank else offset + limit - 1
-        q = q.order("record_time", desc=True).range(range_start, range_end)
-        records = q.execute()
+        # 排序得分已物化在记录上，数据库按 (rank, record_time, id) 直接取出一页
+        q = _page_feed_query(q, cursor, offset, limit, sort_by=sort_by)
+        records = await q.execute()
         rec_list = list(records.data or [])
         if not rec_list:
             return []
 
-        likes_map: Dict[str, Dict[str, Any]] = {}
-        comment_count_map: Dict[str, int] = {}
-        if custom_rank:
-            record_ids = [r["id"] for r in rec_list]
-            likes_map = await get_feed_likes_for_records(record_ids, None) if record_ids else {}
-            comment_bundle = _query_feed_comments_bundle_sync(supabase, record_ids, 0) if record_ids else {"comment_count_map": {}}
-            comment_count_map = comment_bundle["comment_count_map"]
-
-            rec_list.sort(
-                key=lambda r: (
-                    (_parse_iso_datetime(r.get("record_time")) or datetime.fromtimestamp(0, tz=timezone.utc)).timestamp(),
-                    _score_feed_record(
-                        r,
-                        sort_by=sort_by,
-                        like_count=likes_map.get(r["id"], {}).get("count", 0),
-                        comment_count=comment_count_map.get(r["id"], 0),
-                        meal_type=meal_type,
-                        diet_goal=diet_goal,
-                        priority_author_ids=None,
-                    ),
-                ),
-                reverse=True,
-            )
-            rec_list = rec_list[offset: offset + limit]
-            if not rec_list:
-                return []
-
+        record_ids = [r["id"] for r in rec_list]
         involved_user_ids = list(set(r["user_id"] for r in rec_list))
-        authors = supabase.table("weapp_user").select("id, nickname, avatar").in_("id", involved_user_ids).execute()
+        authors = await supabase.table("weapp_user").select("id, nickname, avatar").in_("id", involved_user_ids).execute()
         author_map = {a["id"]: a for a in (authors.data or [])}
 
         comments_map: Dict[str, List[Dict[str, Any]]] = {}
         if include_comments:
-            record_ids = [r["id"] for r in rec_list]
-            bundle = _query_feed_comments_bundle_sync(supabase, record_ids, comments_limit)
-            comments_map = bundle["comments_map"]
-            comment_count_map = bundle["comment_count_map"]
-        elif not comment_count_map:
-            record_ids = [r["id"] for r in rec_list]
-            if record_ids:
-                comment_count_map = _query_feed_comments_bundle_sync(supabase, record_ids, 0)["comment_count_map"]
-
-        if not likes_map:
-            record_ids = [r["id"] for r in rec_list]
-            likes_map = await get_feed_likes_for_records(record_ids, None) if record_ids else {}
+            comments_map = await _query_feed_comment_previews(supabase, record_ids, comments_limit)
 
         out = []
         for r in rec_list:
             author = author_map.get(r["user_id"], {})
-            like_info = likes_map.get(r["id"], {"count": 0, "liked": False})
+            like_count = _feed_counter(r, "like_count")
+            comment_count = _feed_counter(r, "comment_count")
             item: Dict[str, Any] = {
                 "record": r,
                 "author": {
@@ -4303,7 +4848,7 @@ async def list_public_feed_records(
                     "nickname": author.get("nickname") or "用户",
                     "avatar": author.get("avatar") or "",
                 },
-                "like_count": like_info.get("count", 0),
+                "like_count": like_count,
                 "liked": False,
                 "is_mine": False,
                 "recommend_reason": _build_feed_recommend_reason(
@@ -4312,15 +4857,13 @@ async def list_public_feed_records(
                     meal_type=meal_type,
                     diet_goal=diet_goal,
                     priority_author_ids=None,
-                    like_count=like_info.get("count", 0),
-                    comment_count=comment_count_map.get(r["id"], 0),
+                    like_count=like_count,
+                    comment_count=comment_count,
                 ),
             }
             if include_comments:
                 item["comments"] = comments_map.get(r["id"], [])
-                item["comment_count"] = comment_count_map.get(r["id"], 0)
-            else:
-                item["comment_count"] = comment_count_map.get(r["id"], 0)
+            item["comment_count"] = comment_count
             out.append(item)
         return out
     except Exception as e:
@@ -4331,9 +4874,10 @@ async def list_public_feed_records(
 async def add_feed_like(user_id: str, record_id: str) -> bool:
     """对某条饮食记录点赞；返回是否新增了一条点赞。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        supabase.table("feed_likes").insert({"user_id": user_id, "record_id": record_id}).execute()
+        # like_count 由 feed_likes 触发器在同一事务内维护（sql/add_feed_record_counters.sql）
+        await supabase.table("feed_likes").insert({"user_id": user_id, "record_id": record_id}).execute()
         return True
     except Exception as e:
         if "unique" in str(e).lower() or "duplicate" in str(e).lower():
@@ -4345,9 +4889,9 @@ async def add_feed_like(user_id: str, record_id: str) -> bool:
 async def remove_feed_like(user_id: str, record_id: str) -> None:
     """取消点赞"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        supabase.table("feed_likes").delete().eq("user_id", user_id).eq("record_id", record_id).execute()
+        await supabase.table("feed_likes").delete().eq("user_id", user_id).eq("record_id", record_id).execute()
     except Exception as e:
         print(f"[remove_feed_like] 错误: {e}")
         raise
@@ -4358,9 +4902,9 @@ async def _get_feed_likes_for_records_original(record_ids: List[str], current_us
     if not record_ids:
         return {}
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        r = supabase.table("feed_likes").select("record_id").in_("record_id", record_ids).execute()
+        r = await supabase.table("feed_likes").select("record_id").in_("record_id", record_ids).execute()
         rows = r.data or []
         count_map: Dict[str, int] = {}
         for row in rows:
@@ -4368,7 +4912,7 @@ async def _get_feed_likes_for_records_original(record_ids: List[str], current_us
             count_map[rid] = count_map.get(rid, 0) + 1
         my_set: set = set()
         if current_user_id:
-            my = supabase.table("feed_likes").select("record_id").eq("user_id", current_user_id).in_("record_id", record_ids).execute()
+            my = await supabase.table("feed_likes").select("record_id").eq("user_id", current_user_id).in_("record_id", record_ids).execute()
             my_set = {m["record_id"] for m in (my.data or [])}
         return {rid: {"count": count_map.get(rid, 0), "liked": rid in my_set} for rid in record_ids}
     except Exception as e:
@@ -4378,22 +4922,15 @@ async def _get_feed_likes_for_records_original(record_ids: List[str], current_us
 
 async def get_feed_likes_for_records(record_ids: List[str], current_user_id: Optional[str]) -> Dict[str, Any]:
     """批量查询点赞数及当前用户是否已点赞。返回 { record_id: { count, liked } }
-    【优化】合并两次查询为一次，减少一次网络往返。"""
+    点赞数取 user_food_records.like_count 计数列；是否已点赞只查当前用户自己的点赞行。"""
     if not record_ids:
         return {}
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        # 优化：一次查询同时获取 record_id 和 user_id，在 Python 中同时统计
-        r = supabase.table("feed_likes").select("record_id, user_id").in_("record_id", record_ids).execute()
-        rows = r.data or []
-        count_map: Dict[str, int] = {}
-        my_set: set = set()
-        for row in rows:
-            rid = row["record_id"]
-            count_map[rid] = count_map.get(rid, 0) + 1
-            if current_user_id and row.get("user_id") == current_user_id:
-                my_set.add(rid)
+        r = await supabase.table("user_food_records").select("id, like_count").in_("id", record_ids).execute()
+        count_map = {row["id"]: _feed_counter(row, "like_count") for row in (r.data or [])}
+        my_set = await _query_feed_liked_record_ids(supabase, record_ids, current_user_id)
         return {rid: {"count": count_map.get(rid, 0), "liked": rid in my_set} for rid in record_ids}
     except Exception as e:
         print(f"[get_feed_likes_for_records] 错误: {e}")
@@ -4409,10 +4946,10 @@ async def add_feed_comment(
 ) -> Dict[str, Any]:
     """发表评论"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         normalized_content = content.strip()
-        duplicate = _find_recent_duplicate_feed_comment_sync(
+        duplicate = await _find_recent_duplicate_feed_comment(
             supabase,
             user_id=user_id,
             record_id=record_id,
@@ -4433,7 +4970,7 @@ async def add_feed_comment(
             "parent_comment_id": parent_comment_id,
             "reply_to_user_id": reply_to_user_id,
         }
-        result = supabase.table("feed_comments").insert(row).execute()
+        result = await supabase.table("feed_comments").insert(row).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         raise Exception("发表评论失败")
@@ -4487,10 +5024,10 @@ def add_feed_comment_sync(
 async def list_feed_comments(record_id: str, limit: int = 50) -> List[Dict[str, Any]]:
     """某条动态的评论列表，含评论者 nickname、avatar"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("feed_comments")
+            await supabase.table("feed_comments")
             .select("id, user_id, record_id, parent_comment_id, reply_to_user_id, content, created_at")
             .eq("record_id", record_id)
             .order("created_at", desc=False)
@@ -4506,7 +5043,7 @@ async def list_feed_comments(record_id: str, limit: int = 50) -> List[Dict[str,
             for uid in ([r.get("user_id") for r in rows] + [r.get("reply_to_user_id") for r in rows])
             if uid
         }
-        users = supabase.table("weapp_user").select("id, nickname, avatar").in_("id", list(user_ids)).execute()
+        users = await supabase.table("weapp_user").select("id, nickname, avatar").in_("id", list(user_ids)).execute()
         user_map = {u["id"]: u for u in (users.data or [])}
         return [_normalize_feed_comment_row(r, user_map) for r in rows]
     except Exception as e:
@@ -4545,7 +5082,7 @@ async def create_public_food_library_item(
     创建公共食物库条目（上传/分享）。
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     paths = image_paths if image_paths else ([image_path] if image_path else [])
     first_path = paths[0] if paths else image_path
     row = {
@@ -4576,7 +5113,7 @@ async def create_public_food_library_item(
         "published_at": None, # 审核通过后再更新发帖时间
     }
     try:
-        result = supabase.table("public_food_library").insert(row).execute()
+        result = await supabase.table("public_food_library").insert(row).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         raise Exception("创建公共食物库条目失败：返回数据为空")
@@ -4674,7 +5211,7 @@ async def list_public_food_library(
          / balanced（营养更均衡）/ high_protein（高蛋白）/ low_calorie（低热量）/ recommended（综合推荐）。
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         q = supabase.table("public_food_library").select("*").eq("status", "published")
         if city:
@@ -4701,7 +5238,7 @@ async def list_public_food_library(
             q = q.range(0, candidate_limit - 1)
         else:
             q = q.range(offset, offset + limit - 1)
-        result = q.execute()
+        result = await q.execute()
         items = list(result.data or [])
 
         if custom_rank:
@@ -4724,9 +5261,9 @@ async def list_public_food_library(
 async def get_public_food_library_item(item_id: str) -> Optional[Dict[str, Any]]:
     """获取单条公共食物库条目详情"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("public_food_library").select("*").eq("id", item_id).execute()
+        result = await supabase.table("public_food_library").select("*").eq("id", item_id).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         return None
@@ -4738,9 +5275,9 @@ async def get_public_food_library_item(item_id: str) -> Optional[Dict[str, Any]]
 async def list_my_public_food_library(user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
     """获取当前用户上传/分享的公共食物库条目"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("public_food_library").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(limit).execute()
+        result = await supabase.table("public_food_library").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(limit).execute()
         return list(result.data or [])
     except Exception as e:
         print(f"[list_my_public_food_library] 错误: {e}")
@@ -4750,9 +5287,9 @@ async def list_my_public_food_library(user_id: str, limit: int = 50) -> List[Dic
 async def add_public_food_library_like(user_id: str, item_id: str) -> None:
     """对公共食物库条目点赞"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        supabase.table("public_food_library_likes").insert({"user_id": user_id, "library_item_id": item_id}).execute()
+        await supabase.table("public_food_library_likes").insert({"user_id": user_id, "library_item_id": item_id}).execute()
     except Exception as e:
         if "unique" in str(e).lower() or "duplicate" in str(e).lower():
             return
@@ -4763,9 +5300,9 @@ async def add_public_food_library_like(user_id: str, item_id: str) -> None:
 async def remove_public_food_library_like(user_id: str, item_id: str) -> None:
     """取消点赞"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        supabase.table("public_food_library_likes").delete().eq("user_id", user_id).eq("library_item_id", item_id).execute()
+        await supabase.table("public_food_library_likes").delete().eq("user_id", user_id).eq("library_item_id", item_id).execute()
     except Exception as e:
         print(f"[remove_public_food_library_like] 错误: {e}")
         raise
@@ -4776,15 +5313,15 @@ async def get_public_food_library_likes_for_items(item_ids: List[str], current_u
     if not item_ids:
         return {}
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        r = supabase.table("public_food_library_likes").select("library_item_id").in_("library_item_id", item_ids).execute()
+        r = await supabase.table("public_food_library_likes").select("library_item_id").in_("library_item_id", item_ids).execute()
         rows = r.data or []
         count_map: Dict[str, int] = {}
         for row in rows:
             iid = row["library_item_id"]
             count_map[iid] = count_map.get(iid, 0) + 1
-        my = supabase.table("public_food_library_likes").select("library_item_id").eq("user_id", current_user_id).in_("library_item_id", item_ids).execute()
+        my = await supabase.table("public_food_library_likes").select("library_item_id").eq("user_id", current_user_id).in_("library_item_id", item_ids).execute()
         my_set = {m["library_item_id"] for m in (my.data or [])}
         return {iid: {"count": count_map.get(iid, 0), "liked": iid in my_set} for iid in item_ids}
     except Exception as e:
@@ -4795,9 +5332,9 @@ async def get_public_food_library_likes_for_items(item_ids: List[str], current_u
 async def add_public_food_library_collection(user_id: str, item_id: str) -> None:
     """收藏公共食物库条目"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        supabase.table("public_food_library_collections").insert({"user_id": user_id, "library_item_id": item_id}).execute()
+        await supabase.table("public_food_library_collections").insert({"user_id": user_id, "library_item_id": item_id}).execute()
     except Exception as e:
         if "unique" in str(e).lower() or "duplicate" in str(e).lower():
             return
@@ -4808,9 +5345,9 @@ async def add_public_food_library_collection(user_id: str, item_id: str) -> None
 async def remove_public_food_library_collection(user_id: str, item_id: str) -> None:
     """取消收藏"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        supabase.table("public_food_library_collections").delete().eq("user_id", user_id).eq("library_item_id", item_id).execute()
+        await supabase.table("public_food_library_collections").delete().eq("user_id", user_id).eq("library_item_id", item_id).execute()
     except Exception as e:
         print(f"[remove_public_food_library_collection] 错误: {e}")
         raise
@@ -4821,10 +5358,10 @@ async def get_public_food_library_collections_for_items(item_ids: List[str], cur
     if not item_ids:
         return {}
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # collection_count 已在主表中维护，这里主要查当前用户是否收藏
-        my = supabase.table("public_food_library_collections").select("library_item_id").eq("user_id", current_user_id).in_("library_item_id", item_ids).execute()
+        my = await supabase.table("public_food_library_collections").select("library_item_id").eq("user_id", current_user_id).in_("library_item_id", item_ids).execute()
         my_set = {m["library_item_id"] for m in (my.data or [])}
         return {iid: {"collected": iid in my_set} for iid in item_ids}
     except Exception as e:
@@ -4835,10 +5372,10 @@ async def get_public_food_library_collections_for_items(item_ids: List[str], cur
 async def list_collected_public_food_library(user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
     """获取当前用户收藏的公共食物库条目（按收藏时间倒序）。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         rows = (
-            supabase.table("public_food_library_collections")
+            await supabase.table("public_food_library_collections")
             .select("library_item_id, created_at")
             .eq("user_id", user_id)
             .order("created_at", desc=True)
@@ -4851,7 +5388,7 @@ async def list_collected_public_food_library(user_id: str, limit: int = 50) -> L
         item_ids_ordered = [r["library_item_id"] for r in data]
         # 只查已发布的
         result = (
-            supabase.table("public_food_library")
+            await supabase.table("public_food_library")
             .select("*")
             .in_("id", item_ids_ordered)
             .eq("status", "published")
@@ -4877,7 +5414,7 @@ async def add_public_food_library_comment(
 ) -> Dict[str, Any]:
     """发表公共食物库评论（可选评分）"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     row = {
         "user_id": user_id,
         "library_item_id": item_id,
@@ -4886,7 +5423,7 @@ async def add_public_food_library_comment(
     if rating is not None:
         row["rating"] = rating
     try:
-        result = supabase.table("public_food_library_comments").insert(row).execute()
+        result = await supabase.table("public_food_library_comments").insert(row).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         raise Exception("发表评论失败")
@@ -4977,14 +5514,14 @@ def add_public_food_library_feedback_sync(
 async def list_public_food_library_comments(item_id: str, limit: int = 50) -> List[Dict[str, Any]]:
     """公共食物库条目的评论列表，含评论者 nickname、avatar"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("public_food_library_comments").select("id, user_id, library_item_id, content, rating, created_at").eq("library_item_id", item_id).order("created_at", desc=True).limit(limit).execute()
+        result = await supabase.table("public_food_library_comments").select("id, user_id, library_item_id, content, rating, created_at").eq("library_item_id", item_id).order("created_at", desc=True).limit(limit).execute()
         rows = list(result.data or [])
         if not rows:
             return []
         user_ids = list({r["user_id"] for r in rows})
-        users = supabase.table("weapp_user").select("id, nickname, avatar").in_("id", user_ids).execute()
+        users = await supabase.table("weapp_user").select("id, nickname, avatar").in_("id", user_ids).execute()
         user_map = {u["id"]: u for u in (users.data or [])}
         out = []
         for r in rows:
@@ -5008,9 +5545,9 @@ async def list_public_food_library_comments(item_id: str, limit: int = 50) -> Li
 async def get_food_record_by_id(record_id: str) -> Optional[Dict[str, Any]]:
     """通过 ID 获取单条饮食记录（用于分享到公共库时读取来源记录）"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("user_food_records").select("*").eq("id", record_id).execute()
+        result = await supabase.table("user_food_records").select("*").eq("id", record_id).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         return None
@@ -5050,9 +5587,9 @@ def get_feed_comment_by_id_sync(comment_id: str) -> Optional[Dict[str, Any]]:
 async def get_feed_comment_by_id(comment_id: str) -> Optional[Dict[str, Any]]:
     """按 ID 获取圈子评论。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("feed_comments").select("*").eq("id", comment_id).execute()
+        result = await supabase.table("feed_comments").select("*").eq("id", comment_id).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         return None
@@ -5127,10 +5664,10 @@ def create_feed_interaction_notification_sync(
 async def _list_feed_interaction_notifications_original(user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
     """【原始版本】查询用户收到的圈子互动通知列表。两次查询。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("feed_interaction_notifications")
+            await supabase.table("feed_interaction_notifications")
             .select("*")
             .eq("recipient_user_id", user_id)
             .order("created_at", desc=True)
@@ -5143,7 +5680,7 @@ async def _list_feed_interaction_notifications_original(user_id: str, limit: int
         actor_ids = list({row.get("actor_user_id") for row in rows if row.get("actor_user_id")})
         actor_map: Dict[str, Dict[str, Any]] = {}
         if actor_ids:
-            users = supabase.table("weapp_user").select("id, nickname, avatar").in_("id", actor_ids).execute()
+            users = await supabase.table("weapp_user").select("id, nickname, avatar").in_("id", actor_ids).execute()
             actor_map = {u["id"]: u for u in (users.data or [])}
         out = []
         for row in rows:
@@ -5173,10 +5710,10 @@ async def list_feed_interaction_notifications(user_id: str, limit: int = 50) ->
     """查询用户收到的圈子互动通知列表。
     【优化】使用外键关联查询一次性获取通知 + actor 用户信息，减少一次网络往返。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("feed_interaction_notifications")
+            await supabase.table("feed_interaction_notifications")
             .select("*, actor:weapp_user!actor_user_id(id, nickname, avatar)")
             .eq("recipient_user_id", user_id)
             .order("created_at", desc=True)
@@ -5211,10 +5748,10 @@ async def list_feed_interaction_notifications(user_id: str, limit: int = 50) ->
 async def _count_unread_feed_interaction_notifications_original(user_id: str) -> int:
     """【原始版本】统计未读圈子互动通知数。拉取所有 id 再 len()。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("feed_interaction_notifications")
+            await supabase.table("feed_interaction_notifications")
             .select("id")
             .eq("recipient_user_id", user_id)
             .eq("is_read", False)
@@ -5230,10 +5767,10 @@ async def count_unread_feed_interaction_notifications(user_id: str) -> int:
     """统计未读圈子互动通知数。
     【优化】使用 count=exact + limit(0) 直接获取计数，避免传输任何行数据。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("feed_interaction_notifications")
+            await supabase.table("feed_interaction_notifications")
             .select("*", count="exact")
             .eq("recipient_user_id", user_id)
             .eq("is_read", False)
@@ -5252,7 +5789,7 @@ async def mark_feed_interaction_notifications_read(
 ) -> int:
     """标记圈子互动通知为已读；未传 notification_ids 时标记全部已读。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         q = (
             supabase.table("feed_interaction_notifications")
@@ -5262,7 +5799,7 @@ async def mark_feed_interaction_notifications_read(
         )
         if notification_ids:
             q = q.in_("id", notification_ids)
-        result = q.execute()
+        result = await q.execute()
         return len(result.data or [])
     except Exception as e:
         print(f"[mark_feed_interaction_notifications_read] 错误: {e}")
@@ -5272,17 +5809,36 @@ async def mark_feed_interaction_notifications_read(
 async def update_food_record(user_id: str, record_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """更新用户自己的饮食记录，仅当记录属于该用户时更新。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
+        previous_day: Optional[date] = None
+        if "record_time" in data:
+            # 改了记录时间：原所在日期的汇总也要重算
+            prev = await supabase.table("user_food_records").select("record_time").eq("id", record_id).eq("user_id", user_id).limit(1).execute()
+            if prev.data:
+                previous_day = _china_record_date(prev.data[0].get("record_time"))
         result = (
-            supabase.table("user_food_records")
+            await supabase.table("user_food_records")
             .update(data)
             .eq("id", record_id)
             .eq("user_id", user_id)
             .execute()
         )
         if result.data and len(result.data) > 0:
-            return result.data[0]
+            updated = result.data[0]
+            if "record_time" in data:
+                try:
+                    await _recompute_user_streak(supabase, user_id)
+                except Exception as streak_err:
+                    print(f"[update_food_record] 连续记录天数更新失败（已忽略）: {streak_err}")
+            if _DAILY_NUTRITION_SOURCE_FIELDS.intersection(data):
+                try:
+                    await _refresh_user_daily_nutrition(
+                        supabase, user_id, [previous_day, _china_record_date(updated.get("record_time"))]
+                    )
+                except Exception as rollup_err:
+                    print(f"[update_food_record] 每日营养汇总更新失败（已忽略）: {rollup_err}")
+            return updated
         return None
     except Exception as e:
         print(f"[update_food_record] 错误: {e}")
@@ -5292,10 +5848,22 @@ async def update_food_record(user_id: str, record_id: str, data: Dict[str, Any])
 async def delete_food_record(user_id: str, record_id: str) -> bool:
     """删除用户自己的饮食记录，仅当记录属于该用户时删除。返回是否删除了记录。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("user_food_records").delete().eq("id", record_id).eq("user_id", user_id).execute()
-        return result.data is not None and len(result.data) > 0
+        result = await supabase.table("user_food_records").delete().eq("id", record_id).eq("user_id", user_id).execute()
+        deleted = result.data is not None and len(result.data) > 0
+        if deleted:
+            try:
+                await _recompute_user_streak(supabase, user_id)
+            except Exception as streak_err:
+                print(f"[delete_food_record] 连续记录天数更新失败（已忽略）: {streak_err}")
+            try:
+                await _refresh_user_daily_nutrition(
+                    supabase, user_id, [_china_record_date(row.get("record_time")) for row in result.data]
+                )
+            except Exception as rollup_err:
+                print(f"[delete_food_record] 每日营养汇总更新失败（已忽略）: {rollup_err}")
+        return deleted
     except Exception as e:
         print(f"[delete_food_record] 错误: {e}")
         raise
@@ -5304,10 +5872,10 @@ async def delete_food_record(user_id: str, record_id: str) -> bool:
 async def hide_food_record_from_feed(user_id: str, record_id: str) -> bool:
     """将自己的饮食记录从圈子 Feed 中隐藏（不删除记录本身）。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("user_food_records")
+            await supabase.table("user_food_records")
             .update({"hidden_from_feed": True})
             .eq("id", record_id)
             .eq("user_id", user_id)
@@ -5335,7 +5903,7 @@ def _normalize_food_expiry_date_value(value: Any) -> Optional[str]:
 async def create_food_expiry_item_v2(user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """创建新版食物保质期项。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     row = {
         "user_id": user_id,
         "food_name": data.get("food_name"),
@@ -5349,7 +5917,7 @@ async def create_food_expiry_item_v2(user_id: str, data: Dict[str, Any]) -> Dict
         "status": data.get("status") or "active",
     }
     try:
-        result = supabase.table("food_expiry_items").insert(row).execute()
+        result = await supabase.table("food_expiry_items").insert(row).execute()
         return result.data[0] if result.data else {}
     except Exception as e:
         print(f"[create_food_expiry_item_v2] 错误: {e}")
@@ -5359,12 +5927,12 @@ async def create_food_expiry_item_v2(user_id: str, data: Dict[str, Any]) -> Dict
 async def list_food_expiry_items_v2(user_id: str, status: Optional[str] = None) -> List[Dict[str, Any]]:
     """列出新版食物保质期项。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         query = supabase.table("food_expiry_items").select("*").eq("user_id", user_id)
         if status:
             query = query.eq("status", status)
-        result = query.execute()
+        result = await query.execute()
         return list(result.data or [])
     except Exception as e:
         print(f"[list_food_expiry_items_v2] 错误: {e}")
@@ -5374,10 +5942,10 @@ async def list_food_expiry_items_v2(user_id: str, status: Optional[str] = None)
 async def get_food_expiry_item_v2(item_id: str, user_id: str) -> Optional[Dict[str, Any]]:
     """获取新版单个食物保质期项。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("food_expiry_items")
+            await supabase.table("food_expiry_items")
             .select("*")
             .eq("id", item_id)
             .eq("user_id", user_id)
@@ -5395,7 +5963,7 @@ async def get_food_expiry_item_v2(item_id: str, user_id: str) -> Optional[Dict[s
 async def update_food_expiry_item_v2(item_id: str, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """更新新版食物保质期项。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     row = dict(data)
     if "expire_date" in row:
         row["expire_date"] = _normalize_food_expiry_date_value(row.get("expire_date"))
@@ -5403,7 +5971,7 @@ async def update_food_expiry_item_v2(item_id: str, user_id: str, data: Dict[str,
         row["opened_date"] = _normalize_food_expiry_date_value(row.get("opened_date"))
     try:
         result = (
-            supabase.table("food_expiry_items")
+            await supabase.table("food_expiry_items")
             .update(row)
             .eq("id", item_id)
             .eq("user_id", user_id)
@@ -5418,9 +5986,9 @@ async def update_food_expiry_item_v2(item_id: str, user_id: str, data: Dict[str,
 async def delete_food_expiry_item_v2(item_id: str, user_id: str) -> bool:
     """删除新版食物保质期项。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        supabase.table("food_expiry_items").delete().eq("id", item_id).eq("user_id", user_id).execute()
+        await supabase.table("food_expiry_items").delete().eq("id", item_id).eq("user_id", user_id).execute()
         return True
     except Exception as e:
         print(f"[delete_food_expiry_item_v2] 错误: {e}")
@@ -5430,10 +5998,10 @@ async def delete_food_expiry_item_v2(item_id: str, user_id: str) -> bool:
 async def list_food_expiry_notification_jobs_by_item(expiry_item_id: str) -> List[Dict[str, Any]]:
     """获取某个保质期条目的通知任务。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("food_expiry_notification_jobs")
+            await supabase.table("food_expiry_notification_jobs")
             .select("*")
             .eq("expiry_item_id", expiry_item_id)
             .order("created_at", desc=True)
@@ -5456,11 +6024,11 @@ async def upsert_food_expiry_notification_job(
 ) -> Dict[str, Any]:
     """按条目幂等创建或更新通知任务。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     scheduled_at_iso = str(scheduled_at)
     try:
         existing_result = (
-            supabase.table("food_expiry_notification_jobs")
+            await supabase.table("food_expiry_notification_jobs")
             .select("*")
             .eq("expiry_item_id", expiry_item_id)
             .eq("template_id", template_id)
@@ -5485,13 +6053,13 @@ async def upsert_food_expiry_notification_job(
         if existing_result.data:
             existing = existing_result.data[0]
             result = (
-                supabase.table("food_expiry_notification_jobs")
+                await supabase.table("food_expiry_notification_jobs")
                 .update(row)
                 .eq("id", existing["id"])
                 .execute()
             )
             return result.data[0] if result.data else existing
-        result = supabase.table("food_expiry_notification_jobs").insert(row).execute()
+        result = await supabase.table("food_expiry_notification_jobs").insert(row).execute()
         return result.data[0] if result.data else {}
     except Exception as e:
         print(f"[upsert_food_expiry_notification_job] 错误: {e}")
@@ -5501,10 +6069,10 @@ async def upsert_food_expiry_notification_job(
 async def cancel_food_expiry_notification_jobs_by_item(expiry_item_id: str) -> int:
     """取消某个保质期条目的未完成通知任务。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("food_expiry_notification_jobs")
+            await supabase.table("food_expiry_notification_jobs")
             .update({
                 "status": "cancelled",
                 "last_error": None,
@@ -5553,6 +6121,27 @@ def claim_next_pending_food_expiry_notification_job_sync() -> Optional[Dict[str,
         raise
 
 
+def get_next_food_expiry_notification_due_at_sync() -> Optional[datetime]:
+    """最早一条尚未到点的待发送保质期通知的 scheduled_at；没有时返回 None。"""
+    check_supabase_configured()
+    supabase = get_supabase_client()
+    try:
+        result = (
+            supabase.table("food_expiry_notification_jobs")
+            .select("scheduled_at")
+            .eq("status", "pending")
+            .order("scheduled_at", desc=False)
+            .limit(1)
+            .execute()
+        )
+        if not result.data:
+            return None
+        return _parse_iso_datetime(result.data[0].get("scheduled_at"))
+    except Exception as e:
+        print(f"[get_next_food_expiry_notification_due_at_sync] 错误: {e}")
+        raise
+
+
 def update_food_expiry_notification_job_sync(
     job_id: str,
     data: Dict[str, Any],
@@ -5590,7 +6179,7 @@ def get_food_expiry_item_v2_sync(item_id: str) -> Optional[Dict[str, Any]]:
 async def create_user_recipe(user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """创建私人食谱"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         recipe_data = {
             "user_id": user_id,
@@ -5607,7 +6196,7 @@ async def create_user_recipe(user_id: str, data: Dict[str, Any]) -> Dict[str, An
             "meal_type": data.get("meal_type"),
             "is_favorite": data.get("is_favorite", False),
         }
-        result = supabase.table("user_recipes").insert(recipe_data).execute()
+        result = await supabase.table("user_recipes").insert(recipe_data).execute()
         return result.data[0] if result.data else {}
     except Exception as e:
         print(f"[create_user_recipe] 错误: {e}")
@@ -5617,14 +6206,14 @@ async def create_user_recipe(user_id: str, data: Dict[str, Any]) -> Dict[str, An
 async def list_user_recipes(user_id: str, meal_type: Optional[str] = None, is_favorite: Optional[bool] = None) -> List[Dict[str, Any]]:
     """获取用户的私人食谱列表"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         query = supabase.table("user_recipes").select("*").eq("user_id", user_id)
         if meal_type:
             query = query.eq("meal_type", meal_type)
         if is_favorite is not None:
             query = query.eq("is_favorite", is_favorite)
-        result = query.order("created_at", desc=True).execute()
+        result = await query.order("created_at", desc=True).execute()
         return result.data or []
     except Exception as e:
         print(f"[list_user_recipes] 错误: {e}")
@@ -5634,12 +6223,12 @@ async def list_user_recipes(user_id: str, meal_type: Optional[str] = None, is_fa
 async def count_user_recipes_sync(user_id: str, is_favorite: Optional[bool] = None) -> int:
     """获取用户的私人食谱数量"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         query = supabase.table("user_recipes").select("*", count="exact").eq("user_id", user_id)
         if is_favorite is not None:
             query = query.eq("is_favorite", is_favorite)
-        result = query.limit(0).execute()
+        result = await query.limit(0).execute()
         return int(getattr(result, "count", 0) or 0)
     except Exception as e:
         print(f"[count_user_recipes_sync] 错误: {e}")
@@ -5649,9 +6238,9 @@ async def count_user_recipes_sync(user_id: str, is_favorite: Optional[bool] = No
 async def get_user_recipe(recipe_id: str, user_id: str) -> Optional[Dict[str, Any]]:
     """获取单个食谱详情"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("user_recipes").select("*").eq("id", recipe_id).eq("user_id", user_id).execute()
+        result = await supabase.table("user_recipes").select("*").eq("id", recipe_id).eq("user_id", user_id).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         return None
@@ -5663,9 +6252,9 @@ async def get_user_recipe(recipe_id: str, user_id: str) -> Optional[Dict[str, An
 async def update_user_recipe(recipe_id: str, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """更新食谱"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("user_recipes").update(data).eq("id", recipe_id).eq("user_id", user_id).execute()
+        result = await supabase.table("user_recipes").update(data).eq("id", recipe_id).eq("user_id", user_id).execute()
         return result.data[0] if result.data else {}
     except Exception as e:
         print(f"[update_user_recipe] 错误: {e}")
@@ -5675,9 +6264,9 @@ async def update_user_recipe(recipe_id: str, user_id: str, data: Dict[str, Any])
 async def delete_user_recipe(recipe_id: str, user_id: str) -> bool:
     """删除食谱"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        supabase.table("user_recipes").delete().eq("id", recipe_id).eq("user_id", user_id).execute()
+        await supabase.table("user_recipes").delete().eq("id", recipe_id).eq("user_id", user_id).execute()
         return True
     except Exception as e:
         print(f"[delete_user_recipe] 错误: {e}")
@@ -5687,7 +6276,7 @@ async def delete_user_recipe(recipe_id: str, user_id: str) -> bool:
 async def use_recipe_record(recipe_id: str, user_id: str) -> bool:
     """使用食谱时更新使用次数和最后使用时间"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 先获取当前使用次数
         recipe = await get_user_recipe(recipe_id, user_id)
@@ -5695,7 +6284,7 @@ async def use_recipe_record(recipe_id: str, user_id: str) -> bool:
             return False
         
         # 更新使用次数和时间
-        supabase.table("user_recipes").update({
+        await supabase.table("user_recipes").update({
             "use_count": (recipe.get("use_count", 0) + 1),
             "last_used_at": datetime.now(timezone.utc).isoformat()
         }).eq("id", recipe_id).eq("user_id", user_id).execute()
@@ -5707,6 +6296,10 @@ async def use_recipe_record(recipe_id: str, user_id: str) -> bool:
 
 # ========== 模型提示词管理 ==========
 
+# 激活提示词缓存：key = model_type，TTL = 5 分钟；提示词增删改、切换激活时广播失效
+_active_prompt_cache = get_shared_cache("active_prompt", maxsize=16, ttl_seconds=300)
+
+
 async def get_active_prompt(model_type: str) -> Optional[Dict[str, Any]]:
     """
     获取指定模型的当前激活提示词
@@ -5717,16 +6310,21 @@ async def get_active_prompt(model_type: str) -> Optional[Dict[str, Any]]:
     Returns:
         提示词信息字典，如果不存在则返回 None
     """
+    cached = _active_prompt_cache.get(model_type)
+    if cached is not None:
+        return cached
+
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("model_prompts")\
+        result = await supabase.table("model_prompts")\
             .select("*")\
             .eq("model_type", model_type)\
             .eq("is_active", True)\
             .execute()
         
         if result.data and len(result.data) > 0:
+            _active_prompt_cache.set(model_type, result.data[0])
             return result.data[0]
         return None
     except Exception as e:
@@ -5745,12 +6343,12 @@ async def list_prompts(model_type: Optional[str] = None) -> List[Dict[str, Any]]
         提示词列表
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         query = supabase.table("model_prompts").select("*")
         if model_type:
             query = query.eq("model_type", model_type)
-        result = query.order("created_at", desc=True).execute()
+        result = await query.order("created_at", desc=True).execute()
         return result.data or []
     except Exception as e:
         print(f"[list_prompts] 错误: {e}")
@@ -5760,9 +6358,9 @@ async def list_prompts(model_type: Optional[str] = None) -> List[Dict[str, Any]]
 async def get_prompt_by_id(prompt_id: int) -> Optional[Dict[str, Any]]:
     """通过 ID 获取提示词"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("model_prompts")\
+        result = await supabase.table("model_prompts")\
             .select("*")\
             .eq("id", prompt_id)\
             .execute()
@@ -5796,22 +6394,24 @@ async def create_prompt(
         创建的提示词信息
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 如果设为激活，先将该模型的其他提示词设为非激活
         if is_active:
-            supabase.table("model_prompts")\
+            await supabase.table("model_prompts")\
                 .update({"is_active": False})\
                 .eq("model_type", model_type)\
                 .execute()
         
-        result = supabase.table("model_prompts").insert({
+        result = await supabase.table("model_prompts").insert({
             "model_type": model_type,
             "prompt_name": prompt_name,
             "prompt_content": prompt_content,
             "description": description,
             "is_active": is_active
         }).execute()
+        if is_active:
+            _active_prompt_cache.invalidate(model_type)
         
         return result.data[0] if result.data else {}
     except Exception as e:
@@ -5838,13 +6438,13 @@ async def update_prompt(
         更新后的提示词信息
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 先获取原提示词，用于记录历史
         old_prompt = await get_prompt_by_id(prompt_id)
         if old_prompt:
             # 记录修改历史
-            supabase.table("model_prompts_history").insert({
+            await supabase.table("model_prompts_history").insert({
                 "prompt_id": prompt_id,
                 "model_type": old_prompt["model_type"],
                 "prompt_name": old_prompt["prompt_name"],
@@ -5861,10 +6461,12 @@ async def update_prompt(
         if description is not None:
             update_data["description"] = description
         
-        result = supabase.table("model_prompts")\
+        result = await supabase.table("model_prompts")\
             .update(update_data)\
             .eq("id", prompt_id)\
             .execute()
+        if old_prompt:
+            _active_prompt_cache.invalidate(old_prompt["model_type"])
         
         return result.data[0] if result.data else {}
     except Exception as e:
@@ -5883,7 +6485,7 @@ async def set_active_prompt(prompt_id: int) -> bool:
         是否设置成功
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 获取提示词信息
         prompt = await get_prompt_by_id(prompt_id)
@@ -5893,16 +6495,17 @@ async def set_active_prompt(prompt_id: int) -> bool:
         model_type = prompt["model_type"]
         
         # 先将该模型的所有提示词设为非激活
-        supabase.table("model_prompts")\
+        await supabase.table("model_prompts")\
             .update({"is_active": False})\
             .eq("model_type", model_type)\
             .execute()
         
         # 设置指定提示词为激活
-        supabase.table("model_prompts")\
+        await supabase.table("model_prompts")\
             .update({"is_active": True})\
             .eq("id", prompt_id)\
             .execute()
+        _active_prompt_cache.invalidate(model_type)
         
         return True
     except Exception as e:
@@ -5921,7 +6524,7 @@ async def delete_prompt(prompt_id: int) -> bool:
         是否删除成功
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         # 检查是否为激活状态
         prompt = await get_prompt_by_id(prompt_id)
@@ -5931,7 +6534,7 @@ async def delete_prompt(prompt_id: int) -> bool:
         if prompt.get("is_active"):
             raise ValueError("不能删除当前激活的提示词")
         
-        supabase.table("model_prompts")\
+        await supabase.table("model_prompts")\
             .delete()\
             .eq("id", prompt_id)\
             .execute()
@@ -5945,9 +6548,9 @@ async def delete_prompt(prompt_id: int) -> bool:
 async def get_prompt_history(prompt_id: int) -> List[Dict[str, Any]]:
     """获取提示词的修改历史"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("model_prompts_history")\
+        result = await supabase.table("model_prompts_history")\
             .select("*")\
             .eq("prompt_id", prompt_id)\
             .order("changed_at", desc=True)\
@@ -5966,6 +6569,8 @@ _FOOD_ANALYSIS_PRECISION_PLAN_PREFIX = "precision_plan"
 _FOOD_ANALYSIS_STANDARD_CREDIT_COST = 2
 _FOOD_ANALYSIS_PRECISION_CREDIT_COST = 4
 _EXERCISE_LOG_CREDIT_COST = 1
+# 失败 / 超时 / 取消的任务退回已占用的系统积分（与 user_daily_credit_usage 触发器口径一致）
+_CREDIT_RELEASED_TASK_STATUSES = {"failed", "timed_out", "cancelled"}
 
 
 def _is_exercise_fallback_task_payload(payload: Any) -> bool:
@@ -6058,41 +6663,67 @@ def _get_task_system_credit_usage_units(row: Dict[str, Any], china_date_str: str
 
 
 async def get_daily_system_credit_usage(user_id: str, china_date_str: str) -> int:
-    """统计某个中国自然日已占用的系统积分额度。"""
+    """
+    某个中国自然日已占用的系统积分额度。
+    读取 user_daily_credit_usage 上由 analysis_tasks 触发器物化的计数（一行），
+    表未就绪时回退为按任务行重算，见 sql/add_user_daily_credit_usage.sql。
+    """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.get_daily_system_credit_usage") as span:
-        span.set_attribute("db.table", "analysis_tasks")
+        span.set_attribute("db.table", "user_daily_credit_usage")
         span.set_attribute("db.user_id", user_id)
         span.set_attribute("db.china_date", china_date_str)
         try:
-            china_date = datetime.strptime(china_date_str, "%Y-%m-%d").date()
-            window_start = f"{china_date_str}T00:00:00+08:00"
-            window_end = f"{(china_date + timedelta(days=3)).strftime('%Y-%m-%d')}T00:00:00+08:00"
             result = (
-                supabase.table("analysis_tasks")
-                .select("id, task_type, payload, created_at")
+                await supabase.table("user_daily_credit_usage")
+                .select("system_units")
                 .eq("user_id", user_id)
-                .gte("created_at", window_start)
-                .lt("created_at", window_end)
+                .eq("china_date", china_date_str)
+                .limit(1)
                 .execute()
             )
-            rows = result.data or []
-            used_units = sum(_get_task_system_credit_usage_units(row or {}, china_date_str) for row in rows)
+            row = (result.data or [{}])[0]
+            used_units = max(int(row.get("system_units") or 0), 0)
             _safe_add_span_event(
                 "db.count.success",
-                {
-                    "db.operation": "get_daily_system_credit_usage",
-                    "db.rows": len(rows),
-                    "db.count": used_units,
-                },
+                {"db.operation": "get_daily_system_credit_usage", "db.rows": len(result.data or []), "db.count": used_units},
             )
-            return max(int(used_units), 0)
+            return used_units
         except Exception as e:
-            _record_db_exception("get_daily_system_credit_usage", e, **{"db.table": "analysis_tasks"})
+            if _is_table_not_ready_error(e, ["user_daily_credit_usage"]):
+                print(f"[get_daily_system_credit_usage] 计数表未就绪，按任务行统计: {e}")
+                return await _scan_daily_system_credit_usage(supabase, user_id, china_date_str)
+            _record_db_exception("get_daily_system_credit_usage", e, **{"db.table": "user_daily_credit_usage"})
             return 0
 
 
+async def _scan_daily_system_credit_usage(supabase: Any, user_id: str, china_date_str: str) -> int:
+    """按目标日起 3 天内创建的任务行重算系统积分占用（失败 / 超时 / 取消的任务已退回，不计入）。"""
+    try:
+        china_date = datetime.strptime(china_date_str, "%Y-%m-%d").date()
+        window_start = f"{china_date_str}T00:00:00+08:00"
+        window_end = f"{(china_date + timedelta(days=3)).strftime('%Y-%m-%d')}T00:00:00+08:00"
+        result = (
+            await supabase.table("analysis_tasks")
+            .select("id, task_type, status, payload, created_at")
+            .eq("user_id", user_id)
+            .gte("created_at", window_start)
+            .lt("created_at", window_end)
+            .execute()
+        )
+        rows = [row or {} for row in (result.data or [])]
+        used_units = sum(
+            _get_task_system_credit_usage_units(row, china_date_str)
+            for row in rows
+            if row.get("status") not in _CREDIT_RELEASED_TASK_STATUSES
+        )
+        return max(int(used_units), 0)
+    except Exception as e:
+        _record_db_exception("get_daily_system_credit_usage", e, **{"db.table": "analysis_tasks"})
+        return 0
+
+
 async def get_today_food_analysis_count(user_id: str, china_date_str: str) -> int:
     """统计用户今日（中国时区）的食物分析次数。
 
@@ -6103,7 +6734,7 @@ async def get_today_food_analysis_count(user_id: str, china_date_str: str) -> in
     - 不统计：precision_item_estimate* / precision_aggregate*，避免多食物拆分后重复计数
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.get_today_food_analysis_count") as span:
         span.set_attribute("db.table", "analysis_tasks")
         span.set_attribute("db.user_id", user_id)
@@ -6115,7 +6746,7 @@ async def get_today_food_analysis_count(user_id: str, china_date_str: str) -> in
             day_start    = f"{china_date_str}T00:00:00+08:00"
             day_end_excl = f"{next_date.strftime('%Y-%m-%d')}T00:00:00+08:00"
 
-            result = supabase.table("analysis_tasks")\
+            result = await supabase.table("analysis_tasks")\
                 .select("id, task_type, payload")\
                 .eq("user_id", user_id)\
                 .gte("created_at", day_start)\
@@ -6155,7 +6786,7 @@ async def get_today_food_analysis_credit_usage(
     precision_cost 计，后续 item_estimate/aggregate 子任务不重复扣分。
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.get_today_food_analysis_credit_usage") as span:
         span.set_attribute("db.table", "analysis_tasks")
         span.set_attribute("db.user_id", user_id)
@@ -6167,7 +6798,7 @@ async def get_today_food_analysis_credit_usage(
             day_start = f"{china_date_str}T00:00:00+08:00"
             day_end_excl = f"{next_date.strftime('%Y-%m-%d')}T00:00:00+08:00"
 
-            result = supabase.table("analysis_tasks")\
+            result = await supabase.table("analysis_tasks")\
                 .select("id, task_type, payload")\
                 .eq("user_id", user_id)\
                 .gte("created_at", day_start)\
@@ -6209,18 +6840,35 @@ async def get_today_food_analysis_credit_usage(
             return 0
 
 
+# 会员套餐配置缓存：key = "active" / "code:{code}"，TTL = 5 分钟（套餐在后台改表，改动最多 5 分钟后生效，
+# 或调用 invalidate_membership_plan_cache 立即广播失效）
+_membership_plan_cache = get_shared_cache("membership_plans", maxsize=64, ttl_seconds=300)
+
+
+def invalidate_membership_plan_cache() -> None:
+    """清空所有进程的会员套餐配置缓存。"""
+    _membership_plan_cache.clear()
+    invalidate_request_memo("membership_plan")
+
+
 async def list_active_membership_plans() -> List[Dict[str, Any]]:
     """获取所有启用中的会员套餐配置。按 sort_order, created_at 升序返回。"""
+    cached = _membership_plan_cache.get("active")
+    if cached is not None:
+        return cached
+
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("membership_plan_config")\
+        result = await supabase.table("membership_plan_config")\
             .select("*")\
             .eq("is_active", True)\
             .order("sort_order", desc=False)\
             .order("created_at", desc=False)\
             .execute()
-        return result.data or []
+        plans = result.data or []
+        _membership_plan_cache.set("active", plans)
+        return plans
     except Exception as e:
         print(f"[list_active_membership_plans] 错误: {e}")
         raise
@@ -6229,13 +6877,13 @@ async def list_active_membership_plans() -> List[Dict[str, Any]]:
 async def get_today_exercise_log_count(user_id: str, china_date_str: str) -> int:
     """统计用户今日（中国时区 YYYY-MM-DD）的运动记录条数。用于积分消耗计算。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     with _tracer.start_as_current_span("db.get_today_exercise_log_count") as span:
         span.set_attribute("db.table", "user_exercise_logs")
         span.set_attribute("db.user_id", user_id)
         span.set_attribute("db.china_date", china_date_str)
         try:
-            result = supabase.table("user_exercise_logs")\
+            result = await supabase.table("user_exercise_logs")\
                 .select("id")\
                 .eq("user_id", user_id)\
                 .eq("recorded_on", china_date_str)\
@@ -6259,9 +6907,9 @@ async def get_today_exercise_log_count(user_id: str, china_date_str: str) -> int
 async def list_test_backend_datasets() -> List[Dict[str, Any]]:
     """列出测试后台可复用测试集。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("test_backend_datasets").select("*").order("created_at", desc=True).execute()
+        result = await supabase.table("test_backend_datasets").select("*").order("created_at", desc=True).execute()
         return list(result.data or [])
     except Exception as e:
         print(f"[list_test_backend_datasets] 错误: {e}")
@@ -6271,9 +6919,9 @@ async def list_test_backend_datasets() -> List[Dict[str, Any]]:
 async def get_test_backend_dataset(dataset_id: str) -> Optional[Dict[str, Any]]:
     """读取单个测试集。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("test_backend_datasets").select("*").eq("id", dataset_id).limit(1).execute()
+        result = await supabase.table("test_backend_datasets").select("*").eq("id", dataset_id).limit(1).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         return None
@@ -6285,7 +6933,7 @@ async def get_test_backend_dataset(dataset_id: str) -> Optional[Dict[str, Any]]:
 async def create_test_backend_dataset(data: Dict[str, Any]) -> Dict[str, Any]:
     """创建测试集记录。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     row = {
         "id": data.get("id") or str(uuid.uuid4()),
         "name": data.get("name"),
@@ -6299,7 +6947,7 @@ async def create_test_backend_dataset(data: Dict[str, Any]) -> Dict[str, Any]:
         "metadata": data.get("metadata") or {},
     }
     try:
-        result = supabase.table("test_backend_datasets").insert(row).execute()
+        result = await supabase.table("test_backend_datasets").insert(row).execute()
         if result.data and len(result.data) > 0:
             return result.data[0]
         raise Exception("创建测试集失败：返回数据为空")
@@ -6311,7 +6959,7 @@ async def create_test_backend_dataset(data: Dict[str, Any]) -> Dict[str, Any]:
 async def insert_test_backend_dataset_items(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """批量插入测试集图片项。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     if not rows:
         return []
     safe_rows = []
@@ -6328,7 +6976,7 @@ async def insert_test_backend_dataset_items(rows: List[Dict[str, Any]]) -> List[
             "metadata": row.get("metadata") or {},
         })
     try:
-        result = supabase.table("test_backend_dataset_items").insert(safe_rows).execute()
+        result = await supabase.table("test_backend_dataset_items").insert(safe_rows).execute()
         return list(result.data or [])
     except Exception as e:
         print(f"[insert_test_backend_dataset_items] 错误: {e}")
@@ -6338,10 +6986,10 @@ async def insert_test_backend_dataset_items(rows: List[Dict[str, Any]]) -> List[
 async def list_test_backend_dataset_items(dataset_id: str) -> List[Dict[str, Any]]:
     """读取测试集下的全部图片项。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("test_backend_dataset_items")
+            await supabase.table("test_backend_dataset_items")
             .select("*")
             .eq("dataset_id", dataset_id)
             .order("sort_order", desc=False)
@@ -6355,15 +7003,25 @@ async def list_test_backend_dataset_items(dataset_id: str) -> List[Dict[str, Any
 
 async def get_membership_plan_by_code(code: str) -> Optional[Dict[str, Any]]:
     """按套餐编码获取会员套餐配置。"""
+    return await memoized("membership_plan", code, lambda: _fetch_membership_plan_by_code(code))
+
+
+async def _fetch_membership_plan_by_code(code: str) -> Optional[Dict[str, Any]]:
+    cache_key = f"code:{code}"
+    cached = _membership_plan_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("membership_plan_config")\
+        result = await supabase.table("membership_plan_config")\
             .select("*")\
             .eq("code", code)\
             .limit(1)\
             .execute()
         if result.data and len(result.data) > 0:
+            _membership_plan_cache.set(cache_key, result.data[0])
             return result.data[0]
         return None
     except Exception as e:
@@ -6372,11 +7030,15 @@ async def get_membership_plan_by_code(code: str) -> Optional[Dict[str, Any]]:
 
 
 async def get_user_pro_membership(user_id: str) -> Optional[Dict[str, Any]]:
-    """获取用户当前 Pro 会员状态。"""
+    """获取用户当前 Pro 会员状态（同一请求内只查询一次）。"""
+    return await memoized("membership", user_id, lambda: _fetch_user_pro_membership(user_id))
+
+
+async def _fetch_user_pro_membership(user_id: str) -> Optional[Dict[str, Any]]:
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("user_pro_memberships")\
+        result = await supabase.table("user_pro_memberships")\
             .select("*")\
             .eq("user_id", user_id)\
             .limit(1)\
@@ -6392,9 +7054,10 @@ async def get_user_pro_membership(user_id: str) -> Optional[Dict[str, Any]]:
 async def create_user_pro_membership(data: Dict[str, Any]) -> Dict[str, Any]:
     """创建用户 Pro 会员状态记录。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
+    invalidate_request_memo("membership", data.get("user_id"))
     try:
-        result = supabase.table("user_pro_memberships")\
+        result = await supabase.table("user_pro_memberships")\
             .insert(data)\
             .execute()
         if result.data and len(result.data) > 0:
@@ -6408,9 +7071,10 @@ async def create_user_pro_membership(data: Dict[str, Any]) -> Dict[str, Any]:
 async def update_user_pro_membership(user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """更新用户 Pro 会员状态记录。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
+    invalidate_request_memo("membership", user_id)
     try:
-        result = supabase.table("user_pro_memberships")\
+        result = await supabase.table("user_pro_memberships")\
             .update(data)\
             .eq("user_id", user_id)\
             .execute()
@@ -6435,11 +7099,13 @@ async def save_user_pro_membership(user_id: str, data: Dict[str, Any]) -> Dict[s
 async def create_pro_membership_payment_record(data: Dict[str, Any]) -> Dict[str, Any]:
     """创建 Pro 会员支付记录。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
+    _invalidate_paid_membership_memo()
     try:
-        result = supabase.table("pro_membership_payment_records")\
+        result = await supabase.table("pro_membership_payment_records")\
             .insert(data)\
             .execute()
+        _invalidate_early_user_rank_cache(result.data or [])
         if result.data and len(result.data) > 0:
             return result.data[0]
         raise Exception("创建会员支付记录失败：返回数据为空")
@@ -6454,7 +7120,8 @@ async def bulk_update_pro_membership_payment_records(
 ) -> List[Dict[str, Any]]:
     """批量更新会员支付记录。仅用于 pending 清理等后台收口动作。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
+    _invalidate_paid_membership_memo()
     try:
         query = supabase.table("pro_membership_payment_records").update(data)
         for key, value in (filters or {}).items():
@@ -6464,7 +7131,8 @@ async def bulk_update_pro_membership_payment_records(
                 query = query.in_(key, list(value))
             else:
                 query = query.eq(key, value)
-        result = query.execute()
+        result = await query.execute()
+        _invalidate_early_user_rank_cache(result.data or [])
         return list(result.data or [])
     except Exception as e:
         print(f"[bulk_update_pro_membership_payment_records] 错误: {e}")
@@ -6477,7 +7145,7 @@ async def list_pro_membership_payment_records(
 ) -> List[Dict[str, Any]]:
     """按条件查询会员支付记录。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         query = supabase.table("pro_membership_payment_records").select("*")
         for key, value in (filters or {}).items():
@@ -6489,20 +7157,31 @@ async def list_pro_membership_payment_records(
                 query = query.eq(key, value)
         if limit is not None and limit > 0:
             query = query.limit(limit)
-        result = query.execute()
+        result = await query.execute()
         return list(result.data or [])
     except Exception as e:
         print(f"[list_pro_membership_payment_records] 错误: {e}")
         raise
 
 
+def _invalidate_paid_membership_memo() -> None:
+    # 支付记录变化会影响最近已付订单与首批付费名次；订单号更新时拿不到 user_id，按类别整体清掉
+    invalidate_request_memo("latest_paid_membership")
+    invalidate_request_memo("early_user_meta")
+    invalidate_request_memo("early_user_ranks")
+
+
 async def get_latest_paid_membership_payment_record(user_id: str) -> Optional[Dict[str, Any]]:
     """获取用户最近一次已支付的会员订阅订单，排除积分充值等非会员单。"""
+    return await memoized("latest_paid_membership", user_id, lambda: _fetch_latest_paid_membership_payment_record(user_id))
+
+
+async def _fetch_latest_paid_membership_payment_record(user_id: str) -> Optional[Dict[str, Any]]:
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("pro_membership_payment_records")
+            await supabase.table("pro_membership_payment_records")
             .select("*")
             .eq("user_id", user_id)
             .eq("status", "paid")
@@ -6523,9 +7202,9 @@ async def get_latest_paid_membership_payment_record(user_id: str) -> Optional[Di
 async def get_pro_membership_payment_record_by_order_no(order_no: str) -> Optional[Dict[str, Any]]:
     """按平台订单号获取 Pro 会员支付记录。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        result = supabase.table("pro_membership_payment_records")\
+        result = await supabase.table("pro_membership_payment_records")\
             .select("*")\
             .eq("order_no", order_no)\
             .limit(1)\
@@ -6541,12 +7220,14 @@ async def get_pro_membership_payment_record_by_order_no(order_no: str) -> Option
 async def update_pro_membership_payment_record(order_no: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """按平台订单号更新 Pro 会员支付记录。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
+    _invalidate_paid_membership_memo()
     try:
-        result = supabase.table("pro_membership_payment_records")\
+        result = await supabase.table("pro_membership_payment_records")\
             .update(data)\
             .eq("order_no", order_no)\
             .execute()
+        _invalidate_early_user_rank_cache(result.data or [])
         if result.data and len(result.data) > 0:
             return result.data[0]
         raise Exception("更新会员支付记录失败：返回数据为空")
@@ -6595,91 +7276,381 @@ _FOOD_SYNONYM_MAP: Dict[str, List[str]] = {
 }
 
 
-def _try_resolve_by_synonyms(supabase: Any, raw_name: str, normalized: str, fuzzy_threshold: float) -> Optional[Dict[str, Any]]:
-    """通过同义词映射尝试解析食物名称。"""
-    # 直接映射
-    synonyms = _FOOD_SYNONYM_MAP.get(normalized)
-    if not synonyms:
-        # 反向映射：检查输入是否是某个标准名称的同义词
-        for canonical, alias_list in _FOOD_SYNONYM_MAP.items():
-            if normalized in [normalize_food_name(a) for a in alias_list]:
-                synonyms = [canonical] + alias_list
-                break
-    if not synonyms:
-        return None
+def _build_food_synonym_reverse_map(synonym_map: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    反向映射：同义词（归一化后）→ 标准名称 + 全部同义词。
+    多个标准名称共用同一同义词时保留映射表中最先出现的标准名称，与逐项遍历映射表取首个命中的查找结果一致。
+    """
+    reverse: Dict[str, List[str]] = {}
+    for canonical, alias_list in synonym_map.items():
+        for alias in alias_list:
+            reverse.setdefault(normalize_food_name(alias), [canonical] + alias_list)
+    return reverse
 
-    # 用同义词列表重新查询别名表
-    for syn in synonyms:
-        syn_normalized = normalize_food_name(syn)
-        alias_res = (
-            supabase.table("food_nutrition_aliases")
-            .select(
-                f"normalized_alias, food_id, food_nutrition_library!inner(id, canonical_name, source, {FOOD_LIBRARY_NUTRITION_SELECT}, is_active)"
-            )
-            .eq("normalized_alias", syn_normalized)
-            .limit(1)
-            .execute()
-        )
-        alias_rows = list(alias_res.data or [])
-        if alias_rows:
-            row = alias_rows[0]
-            food = row.get("food_nutrition_library") or {}
-            if food and food.get("is_active", True):
-                return {
-                    "resolved": True,
-                    "resolve_status": "exact_alias",
-                    "matched_food_id": str(food.get("id")),
-                    "matched_food_name": str(food.get("canonical_name") or raw_name),
-                    "unit_nutrition_per_100g": _food_row_to_unit_nutrition(food),
-                    "score": 1.0,
-                    "raw_name": raw_name,
-                    "normalized_name": normalized,
-                }
 
-        # 查询 canonical 表
-        food_res = (
-            supabase.table("food_nutrition_library")
-            .select(f"id, canonical_name, normalized_name, source, {FOOD_LIBRARY_NUTRITION_SELECT}")
-            .eq("is_active", True)
-            .eq("normalized_name", syn_normalized)
-            .limit(1)
-            .execute()
-        )
-        food_rows = list(food_res.data or [])
-        if food_rows:
-            food = food_rows[0]
-            return {
-                "resolved": True,
-                "resolve_status": "exact_canonical",
-                "matched_food_id": str(food.get("id")),
-                "matched_food_name": str(food.get("canonical_name") or raw_name),
-                "unit_nutrition_per_100g": _food_row_to_unit_nutrition(food),
-                "score": 1.0,
-                "raw_name": raw_name,
-                "normalized_name": normalized,
-            }
+_FOOD_SYNONYM_REVERSE_MAP: Dict[str, List[str]] = _build_food_synonym_reverse_map(_FOOD_SYNONYM_MAP)
+
+
+# ---- 食物营养库进程内索引 ----
+# 全量加载 food_nutrition_library + food_nutrition_aliases 到内存，按规范化名称/别名建立字典，
+# 之后按 updated_at 增量刷新；精确与同义词解析变为字典查找，不再访问数据库。
+FOOD_NUTRITION_INDEX_ENABLED = os.getenv("FOOD_NUTRITION_INDEX_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+# 增量刷新间隔（秒）：超过该间隔的下一次解析会先拉取 updated_at 之后变更的行
+FOOD_NUTRITION_INDEX_REFRESH_SECONDS = float(os.getenv("FOOD_NUTRITION_INDEX_REFRESH_SECONDS", "60"))
+# 全量重建间隔（秒）：用于清除已删除的别名/食物（删除无法通过 updated_at 增量感知）
+FOOD_NUTRITION_INDEX_FULL_RELOAD_SECONDS = float(os.getenv("FOOD_NUTRITION_INDEX_FULL_RELOAD_SECONDS", "3600"))
+_FOOD_NUTRITION_INDEX_PAGE_SIZE = 1000
+_FOOD_NUTRITION_INDEX_LIBRARY_SELECT = f"id, canonical_name, normalized_name, source, is_active, updated_at, {FOOD_LIBRARY_NUTRITION_SELECT}"
+_FOOD_NUTRITION_INDEX_ALIAS_SELECT = "id, food_id, normalized_alias, updated_at"
+
+# 模糊匹配：按 bigram 倒排取重叠度最高的候选再精排，候选数与扫描的倒排项数都有上限，耗时不随库规模线性增长
+FOOD_FUZZY_CANDIDATE_LIMIT = int(os.getenv("FOOD_FUZZY_CANDIDATE_LIMIT", "64"))
+FOOD_FUZZY_MAX_POSTINGS_SCANNED = int(os.getenv("FOOD_FUZZY_MAX_POSTINGS_SCANNED", "5000"))
+
+
+def _empty_food_nutrition_index() -> Dict[str, Any]:
+    return {
+        "ready": False,
+        # food_id -> 食物库行（含 is_active，停用的行保留以便别名判断）
+        "foods_by_id": {},
+        # normalized_name -> food_id（仅启用的行）
+        "food_id_by_name": {},
+        # normalized_alias -> food_id
+        "food_id_by_alias": {},
+        # alias id -> (normalized_alias, food_id)，用于别名改名/改指向时撤销旧映射
+        "alias_by_id": {},
+        # 模糊匹配键（规范化标准名/别名）-> {food_id: {"canonical", "alias"}}
+        "fuzzy_keys": {},
+        # bigram -> 包含该 bigram 的模糊匹配键集合
+        "gram_postings": {},
+        "library_watermark": None,
+        "alias_watermark": None,
+        "loaded_at": 0.0,
+        "refreshed_at": 0.0,
+    }
+
+
+# 索引按写时复制更新：刷新 / 入库在锁内基于当前索引复制出新版本，改完整体替换模块变量；
+# 读者（线程池里的解析 / 模糊匹配）取一次引用后只读，不会遇到遍历中被修改的集合或新旧混杂的映射
+_food_nutrition_index_lock = threading.Lock()
+_food_nutrition_index: Dict[str, Any] = _empty_food_nutrition_index()
+
+
+def _copy_food_nutrition_index(index: Dict[str, Any]) -> Dict[str, Any]:
+    """浅复制各映射表；内层集合 / 字典与旧版本共享，首次写入时由 _writable_index_entry 再复制。"""
+    fresh = {key: (dict(value) if isinstance(value, dict) else value) for key, value in index.items()}
+    fresh["_owned"] = {}
+    return fresh
+
+
+def _writable_index_entry(index: Dict[str, Any], table: str, key: str, factory: Any) -> Any:
+    """返回 index[table][key] 可安全原地修改的容器（不存在时创建）。"""
+    entry = index[table].get(key)
+    owned = index.get("_owned")
+    if entry is None:
+        entry = factory()
+    elif owned is None or id(entry) in owned:
+        return entry
+    elif isinstance(entry, dict):
+        entry = {k: set(v) for k, v in entry.items()}
+    else:
+        entry = set(entry)
+    index[table][key] = entry
+    if owned is not None:
+        owned[id(entry)] = entry
+    return entry
+
+
+def _publish_food_nutrition_index(index: Dict[str, Any]) -> None:
+    """替换为新版本索引（调用方持有 _food_nutrition_index_lock）。"""
+    global _food_nutrition_index
+    index.pop("_owned", None)
+    _food_nutrition_index = index
+
+
+def _fetch_food_nutrition_index_rows_sync(
+    supabase: Any,
+    table_name: str,
+    columns: str,
+    updated_since: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """按 updated_at 升序分页拉取全部（或 updated_since 之后变更的）行。"""
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        q = supabase.table(table_name).select(columns)
+        if updated_since:
+            q = q.gt("updated_at", updated_since)
+        res = q.order("updated_at").order("id").range(start, start + _FOOD_NUTRITION_INDEX_PAGE_SIZE - 1).execute()
+        batch = list(res.data or [])
+        rows.extend(batch)
+        if len(batch) < _FOOD_NUTRITION_INDEX_PAGE_SIZE:
+            return rows
+        start += _FOOD_NUTRITION_INDEX_PAGE_SIZE
+
+
+def _max_updated_at(current: Optional[str], rows: List[Dict[str, Any]]) -> Optional[str]:
+    values = [str(row.get("updated_at")) for row in rows if row.get("updated_at")]
+    if current:
+        values.append(current)
+    return max(values) if values else None
+
+
+def _food_name_grams(value: str) -> Set[str]:
+    """字符 bigram；单字名称退化为 unigram。"""
+    if len(value) < 2:
+        return {value} if value else set()
+    return {value[i:i + 2] for i in range(len(value) - 1)}
+
+
+def _index_fuzzy_key(index: Dict[str, Any], key: str, food_id: str, match_source: str) -> None:
+    if not key:
+        return
+    if key not in index["fuzzy_keys"]:
+        for gram in _food_name_grams(key):
+            _writable_index_entry(index, "gram_postings", gram, set).add(key)
+    entries = _writable_index_entry(index, "fuzzy_keys", key, dict)
+    entries.setdefault(food_id, set()).add(match_source)
+
+
+def _unindex_fuzzy_key(index: Dict[str, Any], key: str, food_id: str, match_source: str) -> None:
+    entries = index["fuzzy_keys"].get(key)
+    if not entries or food_id not in entries:
+        return
+    entries = _writable_index_entry(index, "fuzzy_keys", key, dict)
+    entries[food_id].discard(match_source)
+    if not entries[food_id]:
+        entries.pop(food_id, None)
+    if entries:
+        return
+    index["fuzzy_keys"].pop(key, None)
+    for gram in _food_name_grams(key):
+        if gram in index["gram_postings"]:
+            keys = _writable_index_entry(index, "gram_postings", gram, set)
+            keys.discard(key)
+            if not keys:
+                index["gram_postings"].pop(gram, None)
+
+
+def _index_food_library_row(index: Dict[str, Any], row: Dict[str, Any]) -> None:
+    food_id = str(row.get("id") or "")
+    if not food_id:
+        return
+    previous = index["foods_by_id"].get(food_id)
+    if previous:
+        previous_name = str(previous.get("normalized_name") or "")
+        if index["food_id_by_name"].get(previous_name) == food_id:
+            index["food_id_by_name"].pop(previous_name, None)
+        _unindex_fuzzy_key(index, previous_name, food_id, "canonical")
+    index["foods_by_id"][food_id] = row
+    normalized_name = str(row.get("normalized_name") or "")
+    if normalized_name and row.get("is_active", True):
+        index["food_id_by_name"][normalized_name] = food_id
+        _index_fuzzy_key(index, normalized_name, food_id, "canonical")
+
+
+def _index_food_alias_row(index: Dict[str, Any], row: Dict[str, Any]) -> None:
+    normalized_alias = str(row.get("normalized_alias") or "")
+    food_id = str(row.get("food_id") or "")
+    alias_id = str(row.get("id") or normalized_alias)
+    previous = index["alias_by_id"].pop(alias_id, None)
+    if previous:
+        previous_alias, previous_food_id = previous
+        if index["food_id_by_alias"].get(previous_alias) == previous_food_id:
+            index["food_id_by_alias"].pop(previous_alias, None)
+        _unindex_fuzzy_key(index, previous_alias, previous_food_id, "alias")
+    if normalized_alias and food_id:
+        index["food_id_by_alias"][normalized_alias] = food_id
+        index["alias_by_id"][alias_id] = (normalized_alias, food_id)
+        _index_fuzzy_key(index, normalized_alias, food_id, "alias")
+
+
+def _load_food_nutrition_index_full_sync(supabase: Any) -> None:
+    library_rows = _fetch_food_nutrition_index_rows_sync(
+        supabase, "food_nutrition_library", _FOOD_NUTRITION_INDEX_LIBRARY_SELECT
+    )
+    alias_rows = _fetch_food_nutrition_index_rows_sync(
+        supabase, "food_nutrition_aliases", _FOOD_NUTRITION_INDEX_ALIAS_SELECT
+    )
+    fresh = _empty_food_nutrition_index()
+    for row in library_rows:
+        _index_food_library_row(fresh, row)
+    for row in alias_rows:
+        _index_food_alias_row(fresh, row)
+    now = time.monotonic()
+    fresh.update({
+        "ready": True,
+        "library_watermark": _max_updated_at(None, library_rows),
+        "alias_watermark": _max_updated_at(None, alias_rows),
+        "loaded_at": now,
+        "refreshed_at": now,
+    })
+    _publish_food_nutrition_index(fresh)
+    _safe_add_span_event("db.food_nutrition_index.loaded", {
+        "db.food_index.foods": len(fresh["foods_by_id"]),
+        "db.food_index.aliases": len(fresh["food_id_by_alias"]),
+    })
+    print(
+        f"[food_nutrition_index] 全量加载完成: foods={len(fresh['foods_by_id'])}, "
+        f"aliases={len(fresh['food_id_by_alias'])}",
+        flush=True,
+    )
+
+
+def _refresh_food_nutrition_index_incremental_sync(supabase: Any) -> None:
+    current = _food_nutrition_index
+    library_rows = _fetch_food_nutrition_index_rows_sync(
+        supabase, "food_nutrition_library", _FOOD_NUTRITION_INDEX_LIBRARY_SELECT, current["library_watermark"]
+    )
+    alias_rows = _fetch_food_nutrition_index_rows_sync(
+        supabase, "food_nutrition_aliases", _FOOD_NUTRITION_INDEX_ALIAS_SELECT, current["alias_watermark"]
+    )
+    if not library_rows and not alias_rows:
+        current["refreshed_at"] = time.monotonic()
+        return
+    index = _copy_food_nutrition_index(current)
+    for row in library_rows:
+        _index_food_library_row(index, row)
+    for row in alias_rows:
+        _index_food_alias_row(index, row)
+    index["library_watermark"] = _max_updated_at(index["library_watermark"], library_rows)
+    index["alias_watermark"] = _max_updated_at(index["alias_watermark"], alias_rows)
+    index["refreshed_at"] = time.monotonic()
+    _publish_food_nutrition_index(index)
+
+
+def ensure_food_nutrition_index_sync(force_full: bool = False) -> bool:
+    """
+    确保进程内食物营养索引已加载且未过期（首次调用全量加载，之后按间隔增量刷新）。
+    Worker 与 API 启动时调用一次预热；解析食物时也会顺带触发过期刷新。
+    返回索引是否可用；不可用（未启用或加载失败）时调用方应回退到数据库查询。
+    """
+    if not FOOD_NUTRITION_INDEX_ENABLED:
+        return False
+    index = _food_nutrition_index
+    if (
+        not force_full
+        and index["ready"]
+        and time.monotonic() - index["refreshed_at"] < FOOD_NUTRITION_INDEX_REFRESH_SECONDS
+    ):
+        return True
+
+    with _food_nutrition_index_lock:
+        index = _food_nutrition_index
+        now = time.monotonic()
+        if not force_full and now - index["refreshed_at"] < FOOD_NUTRITION_INDEX_REFRESH_SECONDS:
+            # 其他线程刚完成刷新，或上次加载失败仍在冷却期
+            return index["ready"]
+        try:
+            supabase = get_supabase_client()
+            if force_full or not index["ready"] or now - index["loaded_at"] >= FOOD_NUTRITION_INDEX_FULL_RELOAD_SECONDS:
+                _load_food_nutrition_index_full_sync(supabase)
+            else:
+                _refresh_food_nutrition_index_incremental_sync(supabase)
+        except Exception as e:
+            # 失败时继续使用旧索引（或回退数据库），并在刷新间隔后再重试，避免每次解析都重复请求
+            _food_nutrition_index["refreshed_at"] = now
+            _record_db_exception("ensure_food_nutrition_index_sync", e, **{"db.table": "food_nutrition_library"})
+    return _food_nutrition_index["ready"]
+
+
+def _lookup_food_nutrition_index(normalized: str) -> Optional[Dict[str, Any]]:
+    """在内存索引中按别名、标准名查找；返回 {"resolve_status", "food"} 或 None。"""
+    index = _food_nutrition_index
+    alias_food_id = index["food_id_by_alias"].get(normalized)
+    if alias_food_id:
+        food = index["foods_by_id"].get(alias_food_id)
+        if food and food.get("is_active", True):
+            return {"resolve_status": "exact_alias", "food": food}
+    food_id = index["food_id_by_name"].get(normalized)
+    if food_id:
+        food = index["foods_by_id"].get(food_id)
+        if food:
+            return {"resolve_status": "exact_canonical", "food": food}
     return None
 
 
-def resolve_food_sync(name: str, fuzzy_threshold: float = 0.72) -> Dict[str, Any]:
+def search_food_nutrition_index_fuzzy(
+    normalized: str,
+    limit: int = 5,
+    min_score: float = 0.0,
+    scorer: Any = None,
+) -> List[Dict[str, Any]]:
     """
-    解析食物名称到标准食物库。
-    返回示例：
-    {
-      "resolved": True/False,
-      "resolve_status": "exact_alias" | "exact_canonical" | "fuzzy" | "unresolved",
-      "matched_food_id": "...",
-      "matched_food_name": "...",
-      "unit_nutrition_per_100g": {...},
-      "score": 0.0~1.0
-    }
+    在内存索引上做模糊匹配（覆盖全库标准名与别名）。
+    先按 bigram 倒排统计重叠数（从最稀有的 bigram 开始，扫描量封顶），
+    取 Dice 系数最高的 FOOD_FUZZY_CANDIDATE_LIMIT 个键再用 scorer 精排；
+    返回按分数倒序、按 food_id 去重的 [{"food", "score", "match_source", "matched_key"}]。
     """
-    check_supabase_configured()
-    supabase = get_supabase_client()
+    index = _food_nutrition_index
+    query_grams = _food_name_grams(normalized)
+    if not query_grams:
+        return []
+    scorer = scorer or _food_similarity
+
+    postings = sorted(
+        (index["gram_postings"].get(gram) for gram in query_grams),
+        key=lambda keys: len(keys) if keys else 0,
+    )
+    overlap: Counter = Counter()
+    scanned = 0
+    for keys in postings:
+        if not keys:
+            continue
+        if scanned and scanned + len(keys) > FOOD_FUZZY_MAX_POSTINGS_SCANNED:
+            break
+        scanned += len(keys)
+        overlap.update(keys)
+
+    query_gram_count = len(query_grams)
+    candidates = heapq.nlargest(
+        max(1, FOOD_FUZZY_CANDIDATE_LIMIT),
+        overlap.items(),
+        key=lambda kv: 2.0 * kv[1] / (query_gram_count + max(len(kv[0]) - 1, 1)),
+    )
+
+    best_by_food: Dict[str, Dict[str, Any]] = {}
+    for key, _shared in candidates:
+        score = float(scorer(normalized, key))
+        if score < min_score:
+            continue
+        for food_id, sources in (index["fuzzy_keys"].get(key) or {}).items():
+            food = index["foods_by_id"].get(food_id)
+            if not food or not food.get("is_active", True):
+                continue
+            previous = best_by_food.get(food_id)
+            if previous is None or score > previous["score"]:
+                best_by_food[food_id] = {
+                    "food": food,
+                    "score": score,
+                    "match_source": "canonical" if "canonical" in sources else "alias",
+                    "matched_key": key,
+                }
+    ranked = sorted(best_by_food.values(), key=lambda x: x["score"], reverse=True)
+    return ranked[:max(1, int(limit))]
+
+
+def _build_food_resolve_result(
+    resolve_status: str,
+    food: Dict[str, Any],
+    raw_name: str,
+    normalized: str,
+    score: float = 1.0,
+) -> Dict[str, Any]:
+    return {
+        "resolved": True,
+        "resolve_status": resolve_status,
+        "matched_food_id": str(food.get("id")),
+        "matched_food_name": str(food.get("canonical_name") or raw_name),
+        "unit_nutrition_per_100g": _food_row_to_unit_nutrition(food),
+        "score": score,
+        "raw_name": raw_name,
+        "normalized_name": normalized,
+    }
+
 
-    raw_name = str(name or "").strip()
-    normalized = normalize_food_name(raw_name)
-    unresolved = {
+def _build_food_unresolved_result(raw_name: str, normalized: str) -> Dict[str, Any]:
+    return {
         "resolved": False,
         "resolve_status": "unresolved",
         "matched_food_id": None,
@@ -6689,65 +7660,83 @@ def resolve_food_sync(name: str, fuzzy_threshold: float = 0.72) -> Dict[str, Any
         "raw_name": raw_name,
         "normalized_name": normalized,
     }
-    if not normalized:
-        return unresolved
 
-    try:
-        alias_res = (
-            supabase.table("food_nutrition_aliases")
-            .select(
-                f"normalized_alias, food_id, food_nutrition_library!inner(id, canonical_name, {FOOD_LIBRARY_NUTRITION_SELECT}, is_active)"
-            )
-            .eq("normalized_alias", normalized)
-            .limit(1)
-            .execute()
-        )
-        alias_rows = list(alias_res.data or [])
-        if alias_rows:
-            row = alias_rows[0]
-            food = row.get("food_nutrition_library") or {}
-            if food and food.get("is_active", True):
-                return {
-                    "resolved": True,
-                    "resolve_status": "exact_alias",
-                    "matched_food_id": str(food.get("id")),
-                    "matched_food_name": str(food.get("canonical_name") or raw_name),
-                    "unit_nutrition_per_100g": _food_row_to_unit_nutrition(food),
-                    "score": 1.0,
-                    "raw_name": raw_name,
-                    "normalized_name": normalized,
-                }
 
-        food_res = (
-            supabase.table("food_nutrition_library")
-            .select(f"id, canonical_name, normalized_name, {FOOD_LIBRARY_NUTRITION_SELECT}")
-            .eq("is_active", True)
-            .eq("normalized_name", normalized)
-            .limit(1)
-            .execute()
-        )
-        food_rows = list(food_res.data or [])
-        if food_rows:
-            food = food_rows[0]
-            return {
-                "resolved": True,
-                "resolve_status": "exact_canonical",
-                "matched_food_id": str(food.get("id")),
-                "matched_food_name": str(food.get("canonical_name") or raw_name),
-                "unit_nutrition_per_100g": _food_row_to_unit_nutrition(food),
-                "score": 1.0,
-                "raw_name": raw_name,
-                "normalized_name": normalized,
-            }
+def _find_food_synonyms(normalized: str) -> Optional[List[str]]:
+    # 直接映射；否则反向映射：检查输入是否是某个标准名称的同义词
+    return _FOOD_SYNONYM_MAP.get(normalized) or _FOOD_SYNONYM_REVERSE_MAP.get(normalized)
 
-        all_foods_res = (
-            supabase.table("food_nutrition_library")
-            .select(f"id, canonical_name, normalized_name, {FOOD_LIBRARY_NUTRITION_SELECT}")
-            .eq("is_active", True)
-            .limit(500)
-            .execute()
+
+def _lookup_foods_exact_batch_sync(supabase: Any, normalized_names: Set[str], index_ready: bool) -> Dict[str, Dict[str, Any]]:
+    """
+    批量精确匹配：别名优先，其次标准名。
+    索引可用时为字典查找；否则别名、标准名各一次 in_ 查询。
+    返回 normalized -> {"resolve_status", "food"}，未命中的名称不出现在结果中。
+    """
+    hits: Dict[str, Dict[str, Any]] = {}
+    if not normalized_names:
+        return hits
+    if index_ready:
+        for normalized in normalized_names:
+            hit = _lookup_food_nutrition_index(normalized)
+            if hit:
+                hits[normalized] = hit
+        return hits
+
+    alias_res = (
+        supabase.table("food_nutrition_aliases")
+        .select(
+            f"normalized_alias, food_id, food_nutrition_library!inner(id, canonical_name, source, {FOOD_LIBRARY_NUTRITION_SELECT}, is_active)"
         )
-        candidates = list(all_foods_res.data or [])
+        .in_("normalized_alias", sorted(normalized_names))
+        .execute()
+    )
+    for row in alias_res.data or []:
+        food = row.get("food_nutrition_library") or {}
+        if food and food.get("is_active", True):
+            hits.setdefault(str(row.get("normalized_alias") or ""), {"resolve_status": "exact_alias", "food": food})
+
+    remaining = sorted(normalized_names - set(hits))
+    if not remaining:
+        return hits
+    food_res = (
+        supabase.table("food_nutrition_library")
+        .select(f"id, canonical_name, normalized_name, source, {FOOD_LIBRARY_NUTRITION_SELECT}")
+        .eq("is_active", True)
+        .in_("normalized_name", remaining)
+        .execute()
+    )
+    for food in food_res.data or []:
+        hits.setdefault(str(food.get("normalized_name") or ""), {"resolve_status": "exact_canonical", "food": food})
+    return hits
+
+
+def _match_foods_fuzzy_batch_sync(
+    supabase: Any,
+    normalized_names: Set[str],
+    index_ready: bool,
+    fuzzy_threshold: float,
+) -> Dict[str, Dict[str, Any]]:
+    """批量模糊匹配，返回 normalized -> {"food", "score"}；索引不可用时所有名称共享同一批候选行。"""
+    matches: Dict[str, Dict[str, Any]] = {}
+    if not normalized_names:
+        return matches
+    if index_ready:
+        for normalized in normalized_names:
+            found = search_food_nutrition_index_fuzzy(normalized, limit=1, min_score=fuzzy_threshold)
+            if found:
+                matches[normalized] = {"food": found[0]["food"], "score": found[0]["score"]}
+        return matches
+
+    all_foods_res = (
+        supabase.table("food_nutrition_library")
+        .select(f"id, canonical_name, normalized_name, {FOOD_LIBRARY_NUTRITION_SELECT}")
+        .eq("is_active", True)
+        .limit(500)
+        .execute()
+    )
+    candidates = list(all_foods_res.data or [])
+    for normalized in normalized_names:
         best = None
         best_score = 0.0
         for food in candidates:
@@ -6756,37 +7745,103 @@ def resolve_food_sync(name: str, fuzzy_threshold: float = 0.72) -> Dict[str, Any
                 best_score = score
                 best = food
         if best and best_score >= fuzzy_threshold:
-            return {
-                "resolved": True,
-                "resolve_status": "fuzzy",
-                "matched_food_id": str(best.get("id")),
-                "matched_food_name": str(best.get("canonical_name") or raw_name),
-                "unit_nutrition_per_100g": _food_row_to_unit_nutrition(best),
-                "score": round(float(best_score), 4),
-                "raw_name": raw_name,
-                "normalized_name": normalized,
-            }
+            matches[normalized] = {"food": best, "score": best_score}
+    return matches
 
-        # 同义词匹配：内置同义词表 + 反向映射
-        synonym_result = _try_resolve_by_synonyms(supabase, raw_name, normalized, fuzzy_threshold)
-        if synonym_result:
-            synonym_result["resolve_status"] = "synonym"
-            return synonym_result
 
-        return unresolved
-    except Exception as e:
-        print(f"[resolve_food_sync] 错误: {e}")
-        return unresolved
+def _match_foods_by_synonyms_batch_sync(
+    supabase: Any,
+    normalized_names: Set[str],
+    index_ready: bool,
+) -> Dict[str, Dict[str, Any]]:
+    """通过内置同义词表批量解析：所有名称的同义词合并为一次精确匹配，再按同义词顺序取首个命中。"""
+    synonyms_by_name: Dict[str, List[str]] = {}
+    for normalized in normalized_names:
+        synonyms = _find_food_synonyms(normalized)
+        if synonyms:
+            synonyms_by_name[normalized] = [normalize_food_name(syn) for syn in synonyms]
+    if not synonyms_by_name:
+        return {}
+
+    all_synonyms = {syn for syns in synonyms_by_name.values() for syn in syns if syn}
+    exact = _lookup_foods_exact_batch_sync(supabase, all_synonyms, index_ready)
+    matches: Dict[str, Dict[str, Any]] = {}
+    for normalized, synonyms in synonyms_by_name.items():
+        for syn in synonyms:
+            if syn in exact:
+                matches[normalized] = exact[syn]
+                break
+    return matches
+
+
+def resolve_food_sync(name: str, fuzzy_threshold: float = 0.72) -> Dict[str, Any]:
+    """
+    解析食物名称到标准食物库。
+    返回示例：
+    {
+      "resolved": True/False,
+      "resolve_status": "exact_alias" | "exact_canonical" | "fuzzy" | "synonym" | "unresolved",
+      "matched_food_id": "...",
+      "matched_food_name": "...",
+      "unit_nutrition_per_100g": {...},
+      "score": 0.0~1.0
+    }
+    """
+    key = str(name or "").strip()
+    return batch_resolve_foods_sync([key], fuzzy_threshold=fuzzy_threshold)[key]
 
 
 def batch_resolve_foods_sync(names: List[str], fuzzy_threshold: float = 0.72) -> Dict[str, Dict[str, Any]]:
-    """批量解析食物名，返回 name -> resolve_result。"""
+    """
+    批量解析食物名，返回 name -> resolve_result（结构同 resolve_food_sync）。
+    按 精确别名/标准名 → 模糊 → 同义词 的顺序逐级处理，每一级只处理上一级剩下的名称，
+    且每一级对全部名称只发一次查询（索引可用时不访问数据库）。
+    """
+    check_supabase_configured()
+    supabase = get_supabase_client()
+
     out: Dict[str, Dict[str, Any]] = {}
+    pending: Dict[str, str] = {}
     for name in names or []:
         key = str(name or "").strip()
-        if key in out:
+        if key in out or key in pending:
             continue
-        out[key] = resolve_food_sync(key, fuzzy_threshold=fuzzy_threshold)
+        normalized = normalize_food_name(key)
+        if normalized:
+            pending[key] = normalized
+        else:
+            out[key] = _build_food_unresolved_result(key, normalized)
+    if not pending:
+        return out
+
+    index_ready = ensure_food_nutrition_index_sync()
+    try:
+        exact = _lookup_foods_exact_batch_sync(supabase, set(pending.values()), index_ready)
+        for key, normalized in list(pending.items()):
+            hit = exact.get(normalized)
+            if hit:
+                out[key] = _build_food_resolve_result(hit["resolve_status"], hit["food"], key, normalized)
+                del pending[key]
+
+        fuzzy = _match_foods_fuzzy_batch_sync(supabase, set(pending.values()), index_ready, fuzzy_threshold)
+        for key, normalized in list(pending.items()):
+            hit = fuzzy.get(normalized)
+            if hit:
+                out[key] = _build_food_resolve_result("fuzzy", hit["food"], key, normalized, round(float(hit["score"]), 4))
+                del pending[key]
+
+        # 同义词匹配：内置同义词表 + 反向映射
+        synonym = _match_foods_by_synonyms_batch_sync(supabase, set(pending.values()), index_ready)
+        for key, normalized in list(pending.items()):
+            hit = synonym.get(normalized)
+            if hit:
+                out[key] = _build_food_resolve_result("synonym", hit["food"], key, normalized)
+                del pending[key]
+    except Exception as e:
+        print(f"[batch_resolve_foods_sync] 错误: {e}")
+
+    for key, normalized in pending.items():
+        out[key] = _build_food_unresolved_result(key, normalized)
     return out
 
 
@@ -6914,6 +7969,12 @@ def upsert_food_nutrition_from_deepseek_sync(
             "normalized_alias": normalized,
             "created_at": now_iso,
         }).execute()
+        with _food_nutrition_index_lock:
+            if _food_nutrition_index["ready"]:
+                # 本进程立即可命中；其他进程在下次增量刷新时拉到
+                index = _copy_food_nutrition_index(_food_nutrition_index)
+                _index_food_library_row(index, {**row, "id": food_id})
+                _publish_food_nutrition_index(index)
         print(f"[deepseek_auto] 已入库: {raw} (normalized={normalized})")
         return str(food_id)
     except Exception as e:
@@ -6959,6 +8020,20 @@ def search_food_nutrition_candidates_sync(query: str, limit: int = 5) -> List[Di
             sim = min(1.0, sim + 0.15)
         return round(sim, 4)
 
+    if ensure_food_nutrition_index_sync():
+        matches = search_food_nutrition_index_fuzzy(normalized_query, limit=max_limit, min_score=0.42, scorer=_score)
+        return [
+            {
+                "food_id": str(match["food"].get("id")),
+                "canonical_name": str(match["food"].get("canonical_name") or ""),
+                "match_source": match["match_source"],
+                "score": match["score"],
+                "source": str(match["food"].get("source") or ""),
+                "unit_nutrition_per_100g": _food_row_to_unit_nutrition(match["food"]),
+            }
+            for match in matches
+        ]
+
     try:
         foods_res = (
             supabase.table("food_nutrition_library")
@@ -7166,24 +8241,18 @@ def _build_manual_nutrition_food_result(row: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-_manual_food_stats_cache: Dict[str, Any] = {
-    "value": None,
-    "expires_at": None,
-}
+_manual_food_stats_cache = get_cache("manual_food_stats", maxsize=1, ttl_seconds=600)
 
 
 def _get_cached_manual_food_stats() -> Optional[Dict[str, int]]:
-    expires_at = _manual_food_stats_cache.get("expires_at")
-    if expires_at and isinstance(expires_at, datetime) and expires_at > datetime.now(timezone.utc):
-        cached = _manual_food_stats_cache.get("value")
-        if isinstance(cached, dict):
-            return cached
+    cached = _manual_food_stats_cache.get("stats")
+    if isinstance(cached, dict):
+        return cached
     return None
 
 
 def _set_cached_manual_food_stats(value: Dict[str, int], ttl_seconds: int = 600) -> None:
-    _manual_food_stats_cache["value"] = value
-    _manual_food_stats_cache["expires_at"] = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+    _manual_food_stats_cache.set("stats", value, ttl_seconds=ttl_seconds)
 
 
 async def get_manual_food_library_stats() -> Dict[str, int]:
@@ -7192,18 +8261,18 @@ async def get_manual_food_library_stats() -> Dict[str, int]:
         return cached
 
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        nutrition_resp = supabase.table("food_nutrition_library") \
+        nutrition_resp = await supabase.table("food_nutrition_library") \
             .select("id", count="exact") \
             .eq("is_active", True) \
             .limit(1) \
             .execute()
-        alias_resp = supabase.table("food_nutrition_aliases") \
+        alias_resp = await supabase.table("food_nutrition_aliases") \
             .select("id", count="exact") \
             .limit(1) \
             .execute()
-        public_resp = supabase.table("public_food_library") \
+        public_resp = await supabase.table("public_food_library") \
             .select("id", count="exact") \
             .eq("status", "published") \
             .limit(1) \
@@ -7299,10 +8368,10 @@ async def _get_manual_food_usage_stats(
         }
 
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         rows = (
-            supabase.table("user_food_records")
+            await supabase.table("user_food_records")
             .select("items,record_time,created_at")
             .eq("user_id", user_id)
             .order("record_time", desc=True)
@@ -7457,7 +8526,7 @@ async def search_manual_food(
         return []
     q = q.strip()
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     usage_stats = await _get_manual_food_usage_stats(current_user_id)
     results: List[Dict[str, Any]] = []
     search_limit = max(min(limit * 3, 60), 20)
@@ -7471,7 +8540,7 @@ async def search_manual_food(
             print(f"[search_manual_food] 读取收藏失败: {e}")
 
     try:
-        pfl = supabase.table("public_food_library")\
+        pfl = await supabase.table("public_food_library")\
             .select("id,food_name,description,merchant_name,items,total_calories,total_protein,total_carbs,total_fat,image_path,image_paths,like_count,collection_count")\
             .eq("status", "published")\
             .or_(f"food_name.ilike.%{q}%,description.ilike.%{q}%,merchant_name.ilike.%{q}%")\
@@ -7487,14 +8556,14 @@ async def search_manual_food(
         print(f"[search_manual_food] public_food_library 搜索出错: {e}")
 
     try:
-        fnl = supabase.table("food_nutrition_library")\
+        fnl = await supabase.table("food_nutrition_library")\
             .select("id,canonical_name,kcal_per_100g,protein_per_100g,carbs_per_100g,fat_per_100g,fiber_per_100g,sugar_per_100g,sodium_mg_per_100g")\
             .eq("is_active", True)\
             .ilike("canonical_name", f"%{q}%")\
             .limit(search_limit)\
             .execute()
         matched_ids = {row["id"] for row in (fnl.data or [])}
-        alias_rows = supabase.table("food_nutrition_aliases")\
+        alias_rows = await supabase.table("food_nutrition_aliases")\
             .select("food_id,alias_name")\
             .ilike("alias_name", f"%{q}%")\
             .limit(search_limit)\
@@ -7503,7 +8572,7 @@ async def search_manual_food(
 
         extra_rows = []
         if alias_food_ids:
-            extra = supabase.table("food_nutrition_library")\
+            extra = await supabase.table("food_nutrition_library")\
                 .select("id,canonical_name,kcal_per_100g,protein_per_100g,carbs_per_100g,fat_per_100g,fiber_per_100g,sugar_per_100g,sodium_mg_per_100g")\
                 .eq("is_active", True)\
                 .in_("id", alias_food_ids[:search_limit])\
@@ -7532,7 +8601,7 @@ async def browse_manual_food_library(
     返回手动记录默认浏览数据，并在已登录时补充最近常吃与收藏公共库。
     """
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     usage_stats = await _get_manual_food_usage_stats(current_user_id)
     public_items: List[Dict[str, Any]] = []
     nutrition_items: List[Dict[str, Any]] = []
@@ -7550,7 +8619,7 @@ async def browse_manual_food_library(
             print(f"[browse_manual_food_library] 收藏公共库出错: {e}")
 
     try:
-        pfl = supabase.table("public_food_library")\
+        pfl = await supabase.table("public_food_library")\
             .select("id,food_name,description,merchant_name,items,total_calories,total_protein,total_carbs,total_fat,image_path,image_paths,like_count,collection_count")\
             .eq("status", "published")\
             .order("like_count", desc=True)\
@@ -7565,7 +8634,7 @@ async def browse_manual_food_library(
         print(f"[browse_manual_food_library] public_food_library 出错: {e}")
 
     try:
-        fnl = supabase.table("food_nutrition_library")\
+        fnl = await supabase.table("food_nutrition_library")\
             .select("id,canonical_name,kcal_per_100g,protein_per_100g,carbs_per_100g,fat_per_100g,fiber_per_100g,sugar_per_100g,sodium_mg_per_100g")\
             .eq("is_active", True)\
             .order("canonical_name")\
@@ -7599,23 +8668,23 @@ async def log_unresolved_food(raw_name: str) -> None:
     if not raw_name or not raw_name.strip():
         return
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     import re
     normalized = re.sub(r'\s+', '', raw_name.strip().lower())
     try:
-        existing = supabase.table("food_unresolved_logs")\
+        existing = await supabase.table("food_unresolved_logs")\
             .select("id,hit_count")\
             .eq("normalized_name", normalized)\
             .limit(1)\
             .execute()
         if existing.data and len(existing.data) > 0:
             row = existing.data[0]
-            supabase.table("food_unresolved_logs")\
+            await supabase.table("food_unresolved_logs")\
                 .update({"hit_count": (row.get("hit_count") or 0) + 1})\
                 .eq("id", row["id"])\
                 .execute()
         else:
-            supabase.table("food_unresolved_logs")\
+            await supabase.table("food_unresolved_logs")\
                 .insert({"raw_name": raw_name.strip(), "normalized_name": normalized, "hit_count": 1})\
                 .execute()
     except Exception as e:
@@ -7632,7 +8701,7 @@ async def list_user_exercise_logs(
 ) -> List[Dict[str, Any]]:
     """读取用户运动记录（按时间倒序）。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         query = (
             supabase.table("user_exercise_logs")
@@ -7646,7 +8715,7 @@ async def list_user_exercise_logs(
         query = query.order("recorded_at", desc=True)
         if limit:
             query = query.limit(limit)
-        result = query.execute()
+        result = await query.execute()
         return list(result.data or [])
     except Exception as e:
         err_s = str(e)
@@ -7791,7 +8860,8 @@ async def create_user_exercise_log(
     ai_reasoning: Optional[str] = None,
 ) -> Dict[str, Any]:
     """新增一条运动记录。"""
-    return create_user_exercise_log_sync(
+    return await asyncio.to_thread(
+        create_user_exercise_log_sync,
         user_id, exercise_desc, calories_burned, recorded_on, ai_reasoning=ai_reasoning
     )
 
@@ -7799,10 +8869,10 @@ async def create_user_exercise_log(
 async def delete_user_exercise_log(user_id: str, log_id: str) -> bool:
     """删除指定ID的运动记录。"""
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
         result = (
-            supabase.table("user_exercise_logs")
+            await supabase.table("user_exercise_logs")
             .delete()
             .eq("id", log_id)
             .eq("user_id", user_id)
@@ -7836,4 +8906,4 @@ def get_exercise_calories_by_date_sync(user_id: str, recorded_on: str) -> int:
 
 async def get_exercise_calories_by_date(user_id: str, recorded_on: str) -> int:
     """获取用户指定日期运动消耗的总卡路里。"""
-    return get_exercise_calories_by_date_sync(user_id, recorded_on)
+    return await asyncio.to_thread(get_exercise_calories_by_date_sync, user_id, recorded_on)
@@ -0,0 +1,432 @@
+"""
+LLM 调用网关：食物分析、文字分析、OCR、精准模式、营养洞察等大模型调用统一经此发出。
+
+- 重试：网络错误 / 超时 / 429 / 5xx 以指数退避 + 全抖动（full jitter）重试，避免各处固定 sleep(1) 同步重试形成重试风暴；
+  空响应、JSON 解析失败同样重试，但不计入熔断
+- 熔断：每个服务商一个熔断器，连续失败 LLM_BREAKER_FAILURE_THRESHOLD 次后打开，
+  LLM_BREAKER_OPEN_SECONDS 内直接跳过该服务商；到期后放一个探测请求（半开），成功即恢复
+- 故障转移：Gemini（OfoxAI）与千问（DashScope）互为备份，首选服务商失败或熔断时自动切到另一家对应的默认模型；
+  DeepSeek 没有备份服务商
+- 400 等调用方错误不重试、不切换，直接抛出
+
+连接复用见 llm_http.py。
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from llm_http import llm_post, llm_post_async
+
+BACKEND_ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+load_dotenv(BACKEND_ENV_PATH, override=True)
+
+PROVIDER_GEMINI = "gemini"
+PROVIDER_QWEN = "qwen"
+PROVIDER_DEEPSEEK = "deepseek"
+
+# 互为备份的服务商
+FAILOVER_PROVIDERS = {
+    PROVIDER_GEMINI: PROVIDER_QWEN,
+    PROVIDER_QWEN: PROVIDER_GEMINI,
+}
+
+# 单次调用最多尝试次数（含故障转移后的尝试）
+LLM_MAX_ATTEMPTS = max(1, int(os.getenv("LLM_MAX_ATTEMPTS", "3")))
+# 退避：第 n 次重试前等待 uniform(0, min(MAX, BASE * 2^n)) 秒
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+LLM_BREAKER_FAILURE_THRESHOLD = max(1, int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5")))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+LLM_FAILOVER_ENABLED = str(os.getenv("LLM_FAILOVER_ENABLED", "1")).strip().lower() not in {"0", "false", "no", "off"}
+
+_RETRYABLE_STATUS = {408, 409, 425, 429}
+
+_PROVIDER_LABELS = {
+    PROVIDER_GEMINI: "Gemini (via OfoxAI)",
+    PROVIDER_QWEN: "千问",
+    PROVIDER_DEEPSEEK: "DeepSeek",
+}
+
+
+class LLMGatewayError(RuntimeError):
+    """大模型调用最终失败（重试耗尽、服务商均不可用或请求被拒绝）。"""
+
+
+class CircuitBreaker:
+    """
+    单个服务商的熔断器（线程安全）：closed -> 连续失败达阈值 -> open -> 冷却到期 -> half_open（只放一个探测请求）。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD, open_seconds: float = LLM_BREAKER_OPEN_SECONDS) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at < self.open_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """是否允许发出请求；半开状态下只有第一个调用者拿到探测机会。"""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def available(self) -> bool:
+        """allow() 的只读版本：判断当前是否会放行，不占用半开探测名额。"""
+        with self._lock:
+            state = self._state(time.monotonic())
+            return state == "closed" or (state == "half_open" and not self._probe_in_flight)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """探测请求既未成功也未失败（被取消或意外异常）时归还探测名额，状态保持半开。"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probe_in_flight:
+                    print(f"[llm_gateway] {self.name} 熔断打开（连续失败 {self._failures} 次），{self.open_seconds:.0f}s 内跳过", flush=True)
+                self._opened_at = now
+            self._probe_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(provider)
+            _breakers[provider] = breaker
+        return breaker
+
+
+def provider_endpoint(provider: str) -> Optional[Dict[str, str]]:
+    """服务商的接口地址与密钥；未配置密钥时返回 None。"""
+    if provider == PROVIDER_GEMINI:
+        api_key = os.getenv("OFOXAI_API_KEY") or os.getenv("ofox_ai_apikey")
+        if not api_key or api_key == "your_ofoxai_api_key_here":
+            return None
+        base_url = os.getenv("OFOXAI_BASE_URL", "https://api.ofox.ai/v1")
+    elif provider == PROVIDER_QWEN:
+        api_key = os.getenv("DASHSCOPE_API_KEY") or os.getenv("API_KEY")
+        if not api_key:
+            return None
+        base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+    elif provider == PROVIDER_DEEPSEEK:
+        api_key = str(os.getenv("DEEPSEEK_API_KEY") or "").strip()
+        if not api_key:
+            return None
+        base_url = str(os.getenv("DEEPSEEK_BASE_URL") or "https://api.deepseek.com")
+    else:
+        return None
+    return {"api_url": f"{base_url.rstrip('/')}/chat/completions", "api_key": api_key}
+
+
+def default_model(provider: str, kind: str = "vision") -> str:
+    """服务商默认模型；kind 为 vision（图片）或 text（纯文本）。"""
+    if provider == PROVIDER_GEMINI:
+        ofox_model = os.getenv("OFOX_MODEL_NAME", os.getenv("GEMINI_MODEL_NAME", "gemini-3-flash-preview"))
+        if kind == "text":
+            return os.getenv("OFOX_TEXT_MODEL_NAME", ofox_model)
+        return os.getenv("OFOX_VISION_MODEL_NAME", ofox_model)
+    if provider == PROVIDER_QWEN:
+        return "qwen-plus" if kind == "text" else "qwen-vl-max"
+    return str(os.getenv("DEEPSEEK_TEXT_MODEL") or "deepseek-v4-flash").strip() or "deepseek-v4-flash"
+
+
+def default_provider() -> str:
+    return PROVIDER_GEMINI if os.getenv("LLM_PROVIDER", "gemini").lower() == PROVIDER_GEMINI else PROVIDER_QWEN
+
+
+def parse_json_content(content: str) -> Any:
+    """解析模型输出的 JSON（去掉 ```json 代码块标记）。"""
+    json_str = re.sub(r"```json", "", content)
+    json_str = re.sub(r"```", "", json_str).strip()
+    return json.loads(json_str)
+
+
+def _backoff_seconds(retry_index: int) -> float:
+    return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * (2 ** retry_index)))
+
+
+def _error_message(provider: str, response: httpx.Response) -> str:
+    try:
+        error_data = response.json() if response.content else {}
+    except Exception:
+        error_data = {}
+    message = error_data.get("error", {}).get("message") if isinstance(error_data, dict) and isinstance(error_data.get("error"), dict) else None
+    return message or f"{_PROVIDER_LABELS.get(provider, provider)} API 错误: {response.status_code}"
+
+
+class _Attempt:
+    """一次调用的尝试计划：按首选服务商 -> 备份服务商排列候选，跳过熔断中的服务商。"""
+
+    def __init__(self, provider: str, model: Optional[str], kind: str, failover: bool, max_attempts: int) -> None:
+        self.kind = kind
+        self.max_attempts = max_attempts
+        self.candidates: List[str] = [provider]
+        partner = FAILOVER_PROVIDERS.get(provider)
+        if failover and LLM_FAILOVER_ENABLED and partner:
+            self.candidates.append(partner)
+        self.preferred = provider
+        self.preferred_model = model
+        self.index = 0
+        self.count = 0
+        self.retries = 0
+        self.last_error: Optional[Exception] = None
+        self.configured = False
+        # 自上次退避以来已失败过的服务商；候选都试过一轮后必须退避
+        self._failed_this_round: set = set()
+
+    def next_target(self) -> Optional[Dict[str, str]]:
+        """选出下一次尝试的服务商与模型；尝试次数用完或全部熔断/未配置时返回 None。"""
+        if self.count >= self.max_attempts:
+            return None
+        for offset in range(len(self.candidates)):
+            provider = self.candidates[(self.index + offset) % len(self.candidates)]
+            endpoint = provider_endpoint(provider)
+            if endpoint is None:
+                continue
+            self.configured = True
+            if not get_circuit_breaker(provider).allow():
+                continue
+            self.index = (self.index + offset) % len(self.candidates)
+            self.count += 1
+            model = self.preferred_model if provider == self.preferred and self.preferred_model else default_model(provider, self.kind)
+            return {"provider": provider, "model": model, **endpoint}
+        return None
+
+    def failover(self, failed_provider: str) -> bool:
+        """
+        服务商故障后切到下一个候选；返回是否换了服务商（换了则不必退避等待）。
+        只切到本轮尚未失败、已配置密钥且熔断器放行的服务商；没有这样的候选时返回 False，
+        调用方退避后开始新一轮。
+        """
+        self._failed_this_round.add(failed_provider)
+        for offset in range(1, len(self.candidates)):
+            index = (self.index + offset) % len(self.candidates)
+            provider = self.candidates[index]
+            if provider in self._failed_this_round or provider_endpoint(provider) is None:
+                continue
+            if not get_circuit_breaker(provider).available():
+                continue
+            self.index = index
+            return True
+        return False
+
+    def backoff_seconds(self) -> float:
+        """本次退避的等待秒数；退避后开始新一轮，所有候选重新可选。"""
+        self._failed_this_round.clear()
+        seconds = _backoff_seconds(self.retries)
+        self.retries += 1
+        return seconds
+
+    @property
+    def exhausted(self) -> bool:
+        return self.count >= self.max_attempts
+
+    def final_error(self) -> LLMGatewayError:
+        if not self.configured:
+            missing = "、".join(_PROVIDER_LABELS.get(p, p) for p in self.candidates)
+            return LLMGatewayError(f"未配置 {missing} 的 API Key")
+        if self.last_error is None:
+            return LLMGatewayError("模型服务暂时不可用（熔断中），请稍后重试")
+        if isinstance(self.last_error, LLMGatewayError):
+            return self.last_error
+        return LLMGatewayError(str(self.last_error) or type(self.last_error).__name__)
+
+
+def _request_body(target: Dict[str, str], messages: List[Dict[str, Any]], temperature: float, json_mode: bool, max_tokens: Optional[int]) -> Dict[str, Any]:
+    body: Dict[str, Any] = {
+        "model": target["model"],
+        "messages": messages,
+        "temperature": temperature,
+    }
+    if json_mode:
+        body["response_format"] = {"type": "json_object"}
+    if max_tokens:
+        body["max_tokens"] = max_tokens
+    return body
+
+
+def _handle_response(
+    attempt: _Attempt,
+    target: Dict[str, str],
+    response: httpx.Response,
+    parse: Optional[Callable[[str], Any]],
+) -> Optional[Dict[str, Any]]:
+    """
+    处理一次响应：成功返回结果；可重试的失败记录 last_error 并返回 None；调用方错误直接抛出。
+    """
+    provider = target["provider"]
+    breaker = get_circuit_breaker(provider)
+    if response.status_code in _RETRYABLE_STATUS or response.status_code >= 500:
+        breaker.record_failure()
+        attempt.last_error = LLMGatewayError(_error_message(provider, response))
+        return None
+    # 服务商正常应答（含 4xx 调用方错误）即视为健康
+    breaker.record_success()
+    if not response.is_success:
+        raise LLMGatewayError(_error_message(provider, response))
+
+    try:
+        data = response.json()
+        content = data.get("choices", [{}])[0].get("message", {}).get("content")
+    except Exception:
+        data, content = {}, None
+    if not content or not str(content).strip():
+        attempt.last_error = LLMGatewayError(f"{_PROVIDER_LABELS.get(provider, provider)} 返回了空响应")
+        return None
+    parsed: Any = None
+    if parse is not None:
+        try:
+            parsed = parse(content)
+        except Exception as e:
+            attempt.last_error = LLMGatewayError(f"{_PROVIDER_LABELS.get(provider, provider)} 返回结果解析失败: {e}")
+            return None
+    return {
+        "provider": provider,
+        "model": target["model"],
+        "content": content,
+        "parsed": parsed,
+        "data": data,
+    }
+
+
+def chat_completion_sync(
+    messages: List[Dict[str, Any]],
+    *,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    kind: str = "vision",
+    timeout: float = 60.0,
+    temperature: float = 0.7,
+    json_mode: bool = True,
+    max_tokens: Optional[int] = None,
+    parse: Optional[Callable[[str], Any]] = None,
+    failover: bool = True,
+    max_attempts: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    调用 OpenAI 兼容的 chat/completions，返回 {"provider", "model", "content", "parsed", "data"}。
+    provider 默认取 LLM_PROVIDER；model 只作用于首选服务商，故障转移后使用备份服务商的 kind 默认模型。
+    parse 用于解析 content（如 parse_json_content），解析失败视为可重试。
+    失败抛出 LLMGatewayError。
+    """
+    attempt = _Attempt(provider or default_provider(), model, kind, failover, max_attempts or LLM_MAX_ATTEMPTS)
+    while True:
+        target = attempt.next_target()
+        if target is None:
+            raise attempt.final_error()
+        try:
+            response = llm_post(
+                target["api_url"],
+                timeout=timeout,
+                headers={
+                    "Authorization": f"Bearer {target['api_key']}",
+                    "Content-Type": "application/json",
+                },
+                json=_request_body(target, messages, temperature, json_mode, max_tokens),
+            )
+            result = _handle_response(attempt, target, response, parse)
+            if result is not None:
+                return result
+            switched = response.status_code in _RETRYABLE_STATUS or response.status_code >= 500
+        except httpx.TransportError as e:
+            get_circuit_breaker(target["provider"]).record_failure()
+            attempt.last_error = e
+            switched = True
+        except BaseException:
+            # 被取消或意外异常：归还半开探测名额，否则该进程内熔断器一直半开且不再放行
+            get_circuit_breaker(target["provider"]).release_probe()
+            raise
+        print(f"[llm_gateway] {target['provider']}/{target['model']} 第 {attempt.count} 次调用失败: {str(attempt.last_error)[:200]}", flush=True)
+        if (switched and attempt.failover(target["provider"])) or attempt.exhausted:
+            continue
+        time.sleep(attempt.backoff_seconds())
+
+
+async def chat_completion_async(
+    messages: List[Dict[str, Any]],
+    *,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    kind: str = "vision",
+    timeout: float = 60.0,
+    temperature: float = 0.7,
+    json_mode: bool = True,
+    max_tokens: Optional[int] = None,
+    parse: Optional[Callable[[str], Any]] = None,
+    failover: bool = True,
+    max_attempts: Optional[int] = None,
+) -> Dict[str, Any]:
+    """chat_completion_sync 的异步版本（API 进程内使用，复用当前事件循环的连接池）。"""
+    attempt = _Attempt(provider or default_provider(), model, kind, failover, max_attempts or LLM_MAX_ATTEMPTS)
+    while True:
+        target = attempt.next_target()
+        if target is None:
+            raise attempt.final_error()
+        try:
+            response = await llm_post_async(
+                target["api_url"],
+                timeout=timeout,
+                headers={
+                    "Authorization": f"Bearer {target['api_key']}",
+                    "Content-Type": "application/json",
+                },
+                json=_request_body(target, messages, temperature, json_mode, max_tokens),
+            )
+            result = _handle_response(attempt, target, response, parse)
+            if result is not None:
+                return result
+            switched = response.status_code in _RETRYABLE_STATUS or response.status_code >= 500
+        except httpx.TransportError as e:
+            get_circuit_breaker(target["provider"]).record_failure()
+            attempt.last_error = e
+            switched = True
+        except BaseException:
+            # 被取消或意外异常：归还半开探测名额，否则该进程内熔断器一直半开且不再放行
+            get_circuit_breaker(target["provider"]).release_probe()
+            raise
+        print(f"[llm_gateway] {target['provider']}/{target['model']} 第 {attempt.count} 次调用失败: {str(attempt.last_error)[:200]}", flush=True)
+        if (switched and attempt.failover(target["provider"])) or attempt.exhausted:
+            continue
+        await asyncio.sleep(attempt.backoff_seconds())
@@ -0,0 +1,173 @@
+"""
+LLM 服务 HTTP 连接池：按服务商（请求地址的 scheme://host）在进程内共享 httpx 客户端。
+
+ofox / DashScope / DeepSeek 等接口调用不再每次新建 httpx.Client，同一服务商的请求（包括重试）
+复用 keep-alive 连接，装有 h2 时走 HTTP/2 多路复用，省去每次调用的 TCP + TLS 握手。
+超时仍由调用方按请求传入；连接池上限通过环境变量调整。
+
+同步客户端进程内共享（线程安全，可被 Worker 线程池并发使用）；
+异步客户端按事件循环缓存（httpx.AsyncClient 的连接池绑定在创建它的事件循环上）。
+"""
+import asyncio
+import os
+import threading
+import weakref
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+from otel_compat import trace
+
+BACKEND_ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+load_dotenv(BACKEND_ENV_PATH, override=True)
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2（httpx[http2]）
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
+
+LLM_HTTP2_ENABLED = str(os.getenv("LLM_HTTP2_ENABLED", "1")).strip().lower() not in {"0", "false", "no", "off"}
+# 每个服务商的连接上限 / 空闲保活连接数 / 空闲连接保活秒数
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "64"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "16"))
+LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS", "90"))
+# 客户端默认超时（调用方通常按请求覆盖）
+LLM_HTTP_DEFAULT_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_DEFAULT_TIMEOUT_SECONDS", "60"))
+
+_PROVIDER_HOSTS = {
+    "api.ofox.ai": "ofox",
+    "dashscope.aliyuncs.com": "dashscope",
+    "api.deepseek.com": "deepseek",
+}
+
+_sync_clients: Dict[str, httpx.Client] = {}
+_sync_clients_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(str(url or ""))
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def llm_provider_name(url: str) -> str:
+    """请求地址对应的服务商名称（用于连接池分组与链路追踪），未知服务商返回 host。"""
+    host = urlsplit(str(url or "")).hostname or ""
+    return _PROVIDER_HOSTS.get(host.lower(), host.lower() or "unknown")
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max(1, LLM_HTTP_MAX_CONNECTIONS),
+        max_keepalive_connections=max(0, LLM_HTTP_MAX_KEEPALIVE),
+        keepalive_expiry=max(1.0, LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS),
+    )
+
+
+def _add_span_event(name: str, attributes: Dict[str, Any]) -> None:
+    span = trace.get_current_span()
+    span_context = span.get_span_context() if span else None
+    if not span_context or not span_context.is_valid:
+        return
+    try:
+        span.add_event(name, attributes=attributes)
+    except Exception:
+        pass
+
+
+def _on_request(request: httpx.Request) -> None:
+    _add_span_event("llm.http.request", {
+        "llm.provider": llm_provider_name(str(request.url)),
+        "http.url.path": request.url.path,
+    })
+
+
+def _on_response(response: httpx.Response) -> None:
+    _add_span_event("llm.http.response", {
+        "llm.provider": llm_provider_name(str(response.request.url)),
+        "http.status_code": response.status_code,
+        "http.flavor": response.http_version,
+    })
+
+
+async def _on_request_async(request: httpx.Request) -> None:
+    _on_request(request)
+
+
+async def _on_response_async(response: httpx.Response) -> None:
+    _on_response(response)
+
+
+def get_llm_http_client(url: str) -> httpx.Client:
+    """获取 url 所属服务商的进程内共享同步客户端（延迟创建）。调用方不要 close 或用 with 包裹。"""
+    origin = _origin(url)
+    client = _sync_clients.get(origin)
+    if client is not None:
+        return client
+    with _sync_clients_lock:
+        client = _sync_clients.get(origin)
+        if client is None:
+            client = httpx.Client(
+                http2=LLM_HTTP2_ENABLED and _H2_AVAILABLE,
+                timeout=LLM_HTTP_DEFAULT_TIMEOUT_SECONDS,
+                limits=_limits(),
+                event_hooks={"request": [_on_request], "response": [_on_response]},
+            )
+            _sync_clients[origin] = client
+    return client
+
+
+def get_async_llm_http_client(url: str) -> httpx.AsyncClient:
+    """获取当前事件循环中 url 所属服务商的共享异步客户端（延迟创建）。调用方不要 close 或用 async with 包裹。"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    origin = _origin(url)
+    client = clients.get(origin)
+    if client is None:
+        client = httpx.AsyncClient(
+            http2=LLM_HTTP2_ENABLED and _H2_AVAILABLE,
+            timeout=LLM_HTTP_DEFAULT_TIMEOUT_SECONDS,
+            limits=_limits(),
+            event_hooks={"request": [_on_request_async], "response": [_on_response_async]},
+        )
+        clients[origin] = client
+    return client
+
+
+def llm_post(url: str, *, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+    """经共享连接池发送 POST，timeout 为本次请求的超时秒数。"""
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return get_llm_http_client(url).post(url, **kwargs)
+
+
+async def llm_post_async(url: str, *, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+    """经当前事件循环的共享连接池发送 POST，timeout 为本次请求的超时秒数。"""
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return await get_async_llm_http_client(url).post(url, **kwargs)
+
+
+def close_llm_http_clients() -> None:
+    """关闭进程内所有同步客户端（进程退出时调用）。"""
+    with _sync_clients_lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+async def close_async_llm_http_clients() -> None:
+    """关闭当前事件循环的异步客户端（应用 shutdown 时调用）。"""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        try:
+            await client.aclose()
+        except Exception:
+            pass
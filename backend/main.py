@@ -31,6 +31,7 @@ import mimetypes
 import calendar
 import logging
 import socket
+from functools import partial
 from urllib.parse import urlparse
 from datetime import timedelta, datetime, timezone, date
 from decimal import Decimal, ROUND_HALF_UP
@@ -47,6 +48,17 @@ from test_backend.utils import (
     is_valid_image_file,
 )
 from exercise_llm import ExerciseLlmError, estimate_exercise_calories_sync
+from memory_cache import cache_stats, get_cache
+from shared_cache import shared_cache_backend_name
+from request_scope import memoized, request_scope
+from llm_gateway import (
+    PROVIDER_DEEPSEEK,
+    PROVIDER_GEMINI,
+    PROVIDER_QWEN,
+    LLMGatewayError,
+    chat_completion_async,
+    parse_json_content,
+)
 
 # OfoxAI API（OpenAI 兼容格式，用于调用 Gemini 模型）
 OFOXAI_BASE_URL = "https://api.ofox.ai/v1"
@@ -65,6 +77,7 @@ from database import (
     insert_food_record,
     update_food_record,
     create_analysis_task_sync,
+    analysis_task_priority,
     get_analysis_task_by_id_sync,
     get_analysis_tasks_by_ids,
     list_analysis_tasks_by_user_sync,
@@ -77,7 +90,8 @@ from database import (
     create_precision_item_estimate_sync,
     list_precision_item_estimates_sync,
     list_food_records,
-    list_food_records_by_range,
+    list_user_daily_nutrition,
+    get_user_record_days_count,
     get_streak_days,
     get_cached_insight,
     get_latest_cached_insight,
@@ -114,6 +128,7 @@ from database import (
     add_feed_like,
     remove_feed_like,
     get_feed_likes_for_records,
+    build_feed_next_cursor,
     add_feed_comment,
     get_feed_comment_by_id,
     get_feed_record_interaction_context,
@@ -924,6 +939,23 @@ def _build_by_meal_calories(records: List[Dict[str, Any]]) -> Dict[str, float]:
     return out
 
 
+def _summarize_daily_nutrition_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总 user_daily_nutrition 行（每日 × 餐次）：总热量/三大营养素、按餐次热量、按自然日热量。"""
+    daily_cal: Dict[str, float] = {}
+    for r in rows:
+        day = str(r.get("china_date") or "")[:10]
+        if day:
+            daily_cal[day] = daily_cal.get(day, 0) + float(r.get("total_calories") or 0)
+    return {
+        "total_calories": sum(float(r.get("total_calories") or 0) for r in rows),
+        "total_protein": sum(float(r.get("total_protein") or 0) for r in rows),
+        "total_carbs": sum(float(r.get("total_carbs") or 0) for r in rows),
+        "total_fat": sum(float(r.get("total_fat") or 0) for r in rows),
+        "by_meal": _build_by_meal_calories(rows),
+        "daily_calories": daily_cal,
+    }
+
+
 def _build_json_datetime(value: Optional[datetime]) -> Optional[str]:
     if value is None:
         return None
@@ -1996,7 +2028,16 @@ async def _resolve_early_user_membership_meta(
     user_id: str,
     user_row: Optional[Dict[str, Any]],
 ) -> Dict[str, Any]:
-    """解析创始资格：前 1000 注册用户或前 100 付费用户可享会员积分翻倍。"""
+    """解析创始资格：前 1000 注册用户或前 100 付费用户可享会员积分翻倍（同一请求内只解析一次）。"""
+    has_registration = bool(user_row and resolve_user_registration_datetime(user_row))
+    return await memoized(
+        "early_user_meta",
+        f"{user_id}:{int(has_registration)}",
+        lambda: _load_early_user_membership_meta(user_id, has_registration),
+    )
+
+
+async def _load_early_user_membership_meta(user_id: str, has_registration: bool) -> Dict[str, Any]:
     default_meta = {
         "early_user_rank": None,
         "early_user_limit": EARLY_USER_TRIAL_LIMIT,
@@ -2008,7 +2049,7 @@ async def _resolve_early_user_membership_meta(
         "early_user_paid_bonus_active": False,
     }
     registration_rank: Optional[int] = None
-    if user_row and resolve_user_registration_datetime(user_row):
+    if has_registration:
         registration_rank = await get_first_membership_trial_batch_rank(user_id, EARLY_USER_TRIAL_LIMIT)
     paid_rank = await get_first_paid_membership_user_rank(user_id, EARLY_PAID_USER_LIMIT)
     is_registration_eligible = registration_rank is not None
@@ -2407,11 +2448,8 @@ def _decrypt_wechatpay_resource(resource: Dict[str, Any], api_v3_key: str) -> Di
 
 app = FastAPI(title="食物分析 API", description="基于 DashScope 的食物图片分析服务")
 
-# 缓存 access_token（有效期为 2 小时）
-_access_token_cache = {
-    "token": None,
-    "expires_at": 0
-}
+# 缓存 access_token（有效期为 2 小时，本地缓存一个半小时后重新获取）
+_access_token_cache = get_cache("wechat_access_token", maxsize=1, ttl_seconds=5400)
 
 # 测试后台批量任务（仅进程内存）
 _test_backend_batches: Dict[str, Dict[str, Any]] = {}
@@ -2444,9 +2482,38 @@ async def attach_trace_headers(request: Request, call_next):
     return response
 
 
+@app.middleware("http")
+async def request_unit_of_work(request: Request, call_next):
+    """每个请求一个读缓存作用域：用户 / 会员 / 套餐 / 积分余额在本请求内只回源一次。"""
+    with request_scope():
+        return await call_next(request)
+
+
 _setup_otel_observability(app)
 
 
+@app.on_event("startup")
+async def _warm_food_nutrition_index() -> None:
+    """后台预热食物营养索引（db_first 同步分析在 API 进程内也会查表），不阻塞启动。"""
+    from database import ensure_food_nutrition_index_sync
+    asyncio.get_running_loop().run_in_executor(None, ensure_food_nutrition_index_sync)
+
+
+@app.on_event("shutdown")
+async def _close_database_clients() -> None:
+    """释放异步 Supabase 客户端的连接池。"""
+    from database import close_async_supabase_client
+    await close_async_supabase_client()
+
+
+@app.on_event("shutdown")
+async def _close_llm_http_clients() -> None:
+    """释放大模型 HTTP 连接池（当前事件循环的异步客户端与进程内同步客户端）。"""
+    from llm_http import close_async_llm_http_clients, close_llm_http_clients
+    await close_async_llm_http_clients()
+    close_llm_http_clients()
+
+
 class Nutrients(BaseModel):
     calories: float = 0
     protein: float = 0
@@ -2736,13 +2803,14 @@ async def _run_engine_compare_once(
                 image_mime_type="image/jpeg",
                 prompt=prompt,
                 model_name=model_config["model"],
+                failover=False,
             )
         else:
             api_key = os.getenv("DASHSCOPE_API_KEY") or os.getenv("API_KEY")
             if not api_key:
                 raise RuntimeError("缺少 DASHSCOPE_API_KEY 环境变量")
             base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-            parsed = await _analyze_with_qwen(request, prompt, image_url_for_api, api_key, base_url)
+            parsed = await _analyze_with_qwen(request, prompt, image_url_for_api, api_key, base_url, failover=False)
 
         parsed = worker_normalize_analysis_response_payload(parsed)
         if analysis_engine == "db_first":
@@ -2889,16 +2957,14 @@ async def _analyze_with_gemini(
     base64_image: str = None,
     image_mime_type: str = "image/jpeg",
     prompt: str = "",
-    model_name: str = GEMINI_MODEL_NAME
+    model_name: str = GEMINI_MODEL_NAME,
+    failover: bool = True,
 ) -> Dict[str, Any]:
     """
     使用 Gemini 模型分析食物图片（通过 OfoxAI OpenAI 兼容 API）。
     支持单图（image_url / base64_image）或多图（image_urls）。
+    failover=True 时 Gemini 不可用会由网关切到千问；模型对比等需固定模型的场景传 False。
     """
-    api_key = os.getenv("OFOXAI_API_KEY") or os.getenv("ofox_ai_apikey")
-    if not api_key or api_key == "your_ofoxai_api_key_here":
-        raise Exception("请在 .env 中配置有效的 OFOXAI_API_KEY")
-
     content_parts = [{"type": "text", "text": prompt}]
     if image_urls and len(image_urls) > 0:
         for u in image_urls:
@@ -2915,78 +2981,31 @@ async def _analyze_with_gemini(
     else:
         raise Exception("请提供 image_url、image_urls 或 base64_image")
 
-    api_url = f"{OFOXAI_BASE_URL}/chat/completions"
-    async with httpx.AsyncClient(timeout=90.0) as client:
-        response = await client.post(
-            api_url,
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model_name,
-                "messages": [{"role": "user", "content": content_parts}],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.7,
-            }
-        )
-        
-        if not response.is_success:
-            error_data = response.json() if response.content else {}
-            error_message = (
-                error_data.get("error", {}).get("message")
-                or f"OfoxAI API 错误: {response.status_code}"
-            )
-            raise Exception(error_message)
-        
-        data = response.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content")
-        
-        if not content:
-            raise Exception("Gemini (via OfoxAI) 返回了空响应")
-        
-        # 清理可能的 markdown 代码块标记
-        json_str = re.sub(r"```json", "", content)
-        json_str = re.sub(r"```", "", json_str).strip()
-        
-        try:
-            parsed = json.loads(json_str)
-        except json.JSONDecodeError:
-            raise Exception("Gemini 返回的 JSON 格式解析失败")
-        
-        return parsed
+    result = await chat_completion_async(
+        [{"role": "user", "content": content_parts}],
+        provider=PROVIDER_GEMINI,
+        model=model_name,
+        kind="vision",
+        timeout=90.0,
+        temperature=0.7,
+        parse=parse_json_content,
+        failover=failover,
+    )
+    return result["parsed"]
 
 
 async def _analyze_text_with_gemini(prompt: str, model_name: str = GEMINI_MODEL_NAME) -> Dict[str, Any]:
     """调用 OfoxAI Gemini 做纯文本分析（如文字描述食物），返回解析后的 JSON。"""
-    api_key = os.getenv("OFOXAI_API_KEY") or os.getenv("ofox_ai_apikey")
-    if not api_key or api_key == "your_ofoxai_api_key_here":
-        raise Exception("请在 .env 中配置有效的 OFOXAI_API_KEY")
-    api_url = f"{OFOXAI_BASE_URL}/chat/completions"
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            api_url,
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model_name,
-                "messages": [{"role": "user", "content": prompt}],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.5,
-            },
-        )
-        if not response.is_success:
-            error_data = response.json() if response.content else {}
-            raise Exception(error_data.get("error", {}).get("message") or f"OfoxAI API 错误: {response.status_code}")
-        data = response.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content")
-        if not content:
-            raise Exception("Gemini 返回了空响应")
-        json_str = re.sub(r"```json", "", content)
-        json_str = re.sub(r"```", "", json_str).strip()
-        return _normalize_analysis_response_payload(json.loads(json_str))
+    result = await chat_completion_async(
+        [{"role": "user", "content": prompt}],
+        provider=PROVIDER_GEMINI,
+        model=model_name,
+        kind="text",
+        timeout=60.0,
+        temperature=0.5,
+        parse=lambda content: _normalize_analysis_response_payload(parse_json_content(content)),
+    )
+    return result["parsed"]
 
 
 async def _analyze_with_qwen(
@@ -2994,52 +3013,33 @@ async def _analyze_with_qwen(
     prompt: str,
     image_url_for_api: str,
     api_key: str,
-    base_url: str
+    base_url: str,
+    failover: bool = True,
 ) -> Dict[str, Any]:
-    """使用千问模型分析食物图片（复用现有逻辑）"""
-    api_url = f"{base_url}/chat/completions"
-    
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            api_url,
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": request.modelName or "gemini-3-flash-preview",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": image_url_for_api}}
-                        ]
-                    }
-                ],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.7,
+    """
+    使用千问模型分析食物图片（复用现有逻辑）。
+    api_key / base_url 保留给旧调用方，实际密钥与地址由 llm_gateway 按 DASHSCOPE_* 环境变量读取；
+    failover=True 时千问不可用会切到 Gemini，模型对比等场景传 False。
+    """
+    result = await chat_completion_async(
+        [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": image_url_for_api}}
+                ]
             }
-        )
-        
-        if not response.is_success:
-            error_data = response.json() if response.content else {}
-            error_message = (
-                error_data.get("error", {}).get("message")
-                or f"DashScope API 错误: {response.status_code}"
-            )
-            raise Exception(error_message)
-        
-        data = response.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content")
-        
-        if not content:
-            raise Exception("千问返回了空响应")
-        
-        json_str = re.sub(r"```json", "", content)
-        json_str = re.sub(r"```", "", json_str).strip()
-
-        return _normalize_analysis_response_payload(json.loads(json_str))
+        ],
+        provider=PROVIDER_QWEN,
+        model=request.modelName or "gemini-3-flash-preview",
+        kind="vision",
+        timeout=60.0,
+        temperature=0.7,
+        parse=lambda content: _normalize_analysis_response_payload(parse_json_content(content)),
+        failover=failover,
+    )
+    return result["parsed"]
 
 
 def _normalize_analysis_response_payload(parsed: Any) -> Dict[str, Any]:
@@ -3638,40 +3638,16 @@ async def analyze_food(
             for url in image_urls_for_api:
                 content_parts.append({"type": "image_url", "image_url": {"url": url}})
 
-            base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-            api_url = f"{base_url}/chat/completions"
-
-            async with httpx.AsyncClient(timeout=90.0) as client:
-                response = await client.post(
-                    api_url,
-                    headers={
-                        "Authorization": f"Bearer {dashscope_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": model_config["model"],
-                        "messages": [{"role": "user", "content": content_parts}],
-                        "response_format": {"type": "json_object"},
-                        "temperature": 0.7,
-                    },
-                )
-
-                if not response.is_success:
-                    error_data = response.json() if response.content else {}
-                    error_message = (
-                        error_data.get("error", {}).get("message")
-                        or f"DashScope API 错误: {response.status_code}"
-                    )
-                    raise Exception(error_message)
-
-                data = response.json()
-                content_str = data.get("choices", [{}])[0].get("message", {}).get("content")
-                if not content_str:
-                    raise Exception("千问返回了空响应")
-
-                json_str = re.sub(r"```json", "", content_str)
-                json_str = re.sub(r"```", "", json_str).strip()
-                parsed = _normalize_analysis_response_payload(json.loads(json_str))
+            result = await chat_completion_async(
+                [{"role": "user", "content": content_parts}],
+                provider=PROVIDER_QWEN,
+                model=model_config["model"],
+                kind="vision",
+                timeout=90.0,
+                temperature=0.7,
+                parse=lambda content: _normalize_analysis_response_payload(parse_json_content(content)),
+            )
+            parsed = result["parsed"]
 
         valid_items = _parse_food_item_responses(parsed)
 
@@ -3744,74 +3720,34 @@ async def _analyze_single_image_for_batch(
     api_key: Optional[str],
     base_url: str,
 ) -> Dict[str, Any]:
-    """为批量分析调用 AI 分析单张图片"""
+    """为批量分析调用 AI 分析单张图片（重试与服务商切换由 llm_gateway 负责）"""
     model_config = _resolve_food_vision_model_config(model_name)
     if model_config["provider"] == "gemini":
-        last_error: Optional[Exception] = None
-        for attempt in range(3):
-            try:
-                parsed = await _analyze_with_gemini(
-                    image_url=image_url,
-                    prompt=prompt,
-                    model_name=model_config["model"],
-                )
-                return _normalize_analysis_response_payload(parsed)
-            except Exception as exc:
-                last_error = exc
-                if attempt < 2:
-                    await asyncio.sleep(0.6 * (attempt + 1))
-                    continue
-        raise RuntimeError(str(last_error) or "单张图片分析失败")
-
-    api_url = f"{base_url}/chat/completions"
-    last_error: Optional[Exception] = None
-    for attempt in range(3):
-        try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    api_url,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": model_config["model"],
-                        "messages": [
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": prompt},
-                                    {"type": "image_url", "image_url": {"url": image_url}},
-                                ],
-                            }
-                        ],
-                        "response_format": {"type": "json_object"},
-                        "temperature": 0.7,
-                    },
-                )
-            if not response.is_success:
-                error_data = response.json() if response.content else {}
-                error_message = (
-                    error_data.get("error", {}).get("message")
-                    or f"DashScope API 错误: {response.status_code}"
-                )
-                raise RuntimeError(error_message)
-
-            data = response.json()
-            content_str = data.get("choices", [{}])[0].get("message", {}).get("content")
-            if not content_str:
-                raise RuntimeError("千问返回了空响应")
-
-            json_str = re.sub(r"```json", "", content_str)
-            json_str = re.sub(r"```", "", json_str).strip()
-            return _normalize_analysis_response_payload(json.loads(json_str))
-        except Exception as exc:
-            last_error = exc
-            if attempt < 2:
-                await asyncio.sleep(0.6 * (attempt + 1))
-                continue
+        parsed = await _analyze_with_gemini(
+            image_url=image_url,
+            prompt=prompt,
+            model_name=model_config["model"],
+        )
+        return _normalize_analysis_response_payload(parsed)
 
-    raise RuntimeError(str(last_error) or "单张图片分析失败")
+    result = await chat_completion_async(
+        [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": image_url}},
+                ],
+            }
+        ],
+        provider=PROVIDER_QWEN,
+        model=model_config["model"],
+        kind="vision",
+        timeout=60.0,
+        temperature=0.7,
+        parse=lambda content: _normalize_analysis_response_payload(parse_json_content(content)),
+    )
+    return result["parsed"]
 
 
 def _merge_unique_text_lists(*values: Any) -> Optional[List[str]]:
@@ -4487,6 +4423,7 @@ async def analyze_submit(
                 image_url=body.image_url.strip() if body.image_url else None,
                 image_urls=body.image_urls,
                 payload=precision_payload,
+                priority=analysis_task_priority(_get_food_task_type("precision_plan"), is_pro=bool(membership_resp.get("is_pro"))),
             )
         except Exception as e:
             _raise_analysis_related_schema_not_ready(e)
@@ -4533,6 +4470,7 @@ async def analyze_submit(
             image_url=body.image_url.strip() if body.image_url else None,
             image_urls=body.image_urls,
             payload=payload,
+            priority=analysis_task_priority(_get_food_task_type("food"), is_pro=bool(membership_resp.get("is_pro"))),
         )
         _debug_log_food_submit(
             "image_submit_created",
@@ -4899,7 +4837,7 @@ async def analyze_food_compare(
                 raise Exception("缺少 DASHSCOPE_API_KEY 环境变量")
             
             base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-            parsed = await _analyze_with_qwen(request, prompt, image_url_for_api, dashscope_api_key, base_url)
+            parsed = await _analyze_with_qwen(request, prompt, image_url_for_api, dashscope_api_key, base_url, failover=False)
             items, desc, insight, pfc, absorption, context = _parse_analyze_result(parsed)
             
             pfc, absorption = _strip_standard_mode_extras(execution_mode, pfc, absorption)
@@ -4933,6 +4871,7 @@ async def analyze_food_compare(
                 image_mime_type="image/jpeg",
                 prompt=prompt,
                 model_name=GEMINI_MODEL_NAME,
+                failover=False,
             )
             items, desc, insight, pfc, absorption, context = _parse_analyze_result(parsed)
             
@@ -5200,33 +5139,17 @@ async def analyze_food_text(
         )
         prompt = prompt_builder(task, profile_block)
 
-        # 使用 DashScope 千问 qwen-plus 进行文本分析
-        base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-        api_url = f"{base_url}/chat/completions"
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                api_url,
-                headers={
-                    "Authorization": f"Bearer {dashscope_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": "qwen-plus",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "response_format": {"type": "json_object"},
-                    "temperature": 0.5,
-                },
-            )
-            if not response.is_success:
-                error_data = response.json() if response.content else {}
-                raise Exception(error_data.get("error", {}).get("message") or f"DashScope API 错误: {response.status_code}")
-            data = response.json()
-            content_str = data.get("choices", [{}])[0].get("message", {}).get("content")
-            if not content_str:
-                raise Exception("千问返回了空响应")
-            json_str = re.sub(r"```json", "", content_str)
-            json_str = re.sub(r"```", "", json_str).strip()
-            parsed = worker_normalize_analysis_response_payload(json.loads(json_str))
+        # 使用 DashScope 千问 qwen-plus 进行文本分析（经 llm_gateway 重试，千问不可用时切到 Gemini）
+        result = await chat_completion_async(
+            [{"role": "user", "content": prompt}],
+            provider=PROVIDER_QWEN,
+            model="qwen-plus",
+            kind="text",
+            timeout=60.0,
+            temperature=0.5,
+            parse=lambda content: worker_normalize_analysis_response_payload(parse_json_content(content)),
+        )
+        parsed = result["parsed"]
 
         if execution_mode == "standard" and analysis_engine == "db_first":
             items_raw = worker_build_result_items_with_lookup(task, parsed.get("items") or [])
@@ -5462,6 +5385,7 @@ async def analyze_text_submit(
                 task_type=_get_food_task_type("precision_plan"),
                 text_input=body.text.strip(),
                 payload=precision_payload,
+                priority=analysis_task_priority(_get_food_task_type("precision_plan"), is_pro=bool(membership_resp.get("is_pro"))),
             )
         except Exception as e:
             _raise_analysis_related_schema_not_ready(e)
@@ -5503,6 +5427,7 @@ async def analyze_text_submit(
             task_type=_get_food_task_type("food_text"),
             text_input=body.text.strip(),
             payload=payload,
+            priority=analysis_task_priority(_get_food_task_type("food_text"), is_pro=bool(membership_resp.get("is_pro"))),
         )
         _debug_log_food_submit(
             "text_submit_created",
@@ -5591,6 +5516,7 @@ async def continue_precision_session(
     task_kwargs: Dict[str, Any] = {
         "user_id": user_info["user_id"],
         "task_type": _get_food_task_type("precision_plan"),
+        "priority": analysis_task_priority(_get_food_task_type("precision_plan"), is_pro=bool(membership_resp.get("is_pro"))),
         "payload": _create_precision_plan_task_payload(
             session_id,
             source_type,
@@ -5688,6 +5614,15 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/api/admin/cache-stats")
+async def admin_cache_stats(admin_key: str = Query(..., description="管理密钥")):
+    """本进程内存缓存的命中统计与共享缓存后端（内部管理接口）。"""
+    expected_key = os.getenv("ADMIN_API_KEY", "")
+    if not expected_key or admin_key != expected_key:
+        raise HTTPException(status_code=403, detail="无权限")
+    return {"caches": cache_stats(), "shared_cache_backend": shared_cache_backend_name()}
+
+
 # ---------- 天地图地名搜索代理 ----------
 
 class LocationSearchRequest(BaseModel):
@@ -6164,26 +6099,8 @@ async def get_user_record_days(
     """
     user_id = user_info["user_id"]
     try:
-        # 获取用户所有记录的日期（按中国时区自然日去重）
-        records = await list_food_records(user_id)
-        if not records:
-            return {"record_days": 0}
-        
-        # 提取所有记录日期（北京时间 YYYY-MM-DD）
-        record_dates = set()
-        for record in records:
-            rt = record.get("record_time")
-            if rt:
-                try:
-                    dt_utc = datetime.fromisoformat(str(rt).replace("Z", "+00:00"))
-                    dt_local = dt_utc.astimezone(CHINA_TZ)
-                    date_str = dt_local.date().isoformat()
-                    record_dates.add(date_str)
-                except Exception as e:
-                    print(f"[get_user_record_days] Date parse error for {rt}: {e}")
-                    continue
-        
-        return {"record_days": len(record_dates)}
+        # 按中国时区自然日去重的计数随饮食记录增删维护，读一列即可
+        return {"record_days": await get_user_record_days_count(user_id)}
     except Exception as e:
         print(f"[get_user_record_days] 错误: {e}")
         raise HTTPException(status_code=500, detail=f"获取记录天数失败: {str(e)}")
@@ -7025,36 +6942,7 @@ async def _ocr_extract_report_image(base64_image: str) -> Dict[str, Any]:
     if not api_key:
         raise HTTPException(status_code=500, detail="缺少 DASHSCOPE_API_KEY 环境变量")
     image_data = base64_image.split(",")[1] if "," in base64_image else base64_image
-    base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-    api_url = f"{base_url}/chat/completions"
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            api_url,
-            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-            json={
-                "model": os.getenv("ANALYZE_MODEL", "gemini-3-flash-preview"),
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": _ocr_report_prompt()},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}},
-                        ],
-                    }
-                ],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.3,
-            },
-        )
-    if not response.is_success:
-        raise HTTPException(status_code=500, detail="OCR 识别服务请求失败")
-    data = response.json()
-    content = data.get("choices", [{}])[0].get("message", {}).get("content")
-    if not content:
-        raise HTTPException(status_code=500, detail="OCR 返回为空")
-    json_str = re.sub(r"```json", "", content)
-    json_str = re.sub(r"```", "", json_str).strip()
-    return json.loads(json_str)
+    return await _ocr_extract_report(f"data:image/jpeg;base64,{image_data}")
 
 
 async def _ocr_extract_report_by_url(image_url: str) -> Dict[str, Any]:
@@ -7062,36 +6950,37 @@ async def _ocr_extract_report_by_url(image_url: str) -> Dict[str, Any]:
     api_key = os.getenv("DASHSCOPE_API_KEY") or os.getenv("API_KEY")
     if not api_key:
         raise HTTPException(status_code=500, detail="缺少 DASHSCOPE_API_KEY 环境变量")
-    base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-    api_url = f"{base_url}/chat/completions"
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            api_url,
-            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-            json={
-                "model": os.getenv("ANALYZE_MODEL", "gemini-3-flash-preview"),
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": _ocr_report_prompt()},
-                            {"type": "image_url", "image_url": {"url": image_url}},
-                        ],
-                    }
-                ],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.3,
-            },
-        )
-    if not response.is_success:
+    return await _ocr_extract_report(image_url)
+
+
+async def _ocr_extract_report(image_url: str) -> Dict[str, Any]:
+    """
+    体检报告 OCR 的模型调用：DashScope 上固定使用 ANALYZE_MODEL，经 llm_gateway 退避重试；
+    模型固定，不做服务商故障转移。
+    """
+    try:
+        result = await chat_completion_async(
+            [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": _ocr_report_prompt()},
+                        {"type": "image_url", "image_url": {"url": image_url}},
+                    ],
+                }
+            ],
+            provider=PROVIDER_QWEN,
+            model=os.getenv("ANALYZE_MODEL", "gemini-3-flash-preview"),
+            kind="vision",
+            timeout=60.0,
+            temperature=0.3,
+            parse=parse_json_content,
+            failover=False,
+        )
+    except LLMGatewayError as e:
+        print(f"[_ocr_extract_report] 错误: {e}")
         raise HTTPException(status_code=500, detail="OCR 识别服务请求失败")
-    data = response.json()
-    content = data.get("choices", [{}])[0].get("message", {}).get("content")
-    if not content:
-        raise HTTPException(status_code=500, detail="OCR 返回为空")
-    json_str = re.sub(r"```json", "", content)
-    json_str = re.sub(r"```", "", json_str).strip()
-    return json.loads(json_str)
+    return result["parsed"]
 
 
 class UploadReportImageRequest(BaseModel):
@@ -7929,6 +7818,7 @@ async def recognize_food_expiry_items(
                 "recognize_mode": "food_expiry",
                 "additional_context": additional_context or None,
             },
+            priority=analysis_task_priority(_get_food_task_type("food"), is_pro=bool(membership_resp.get("is_pro"))),
         )
         await asyncio.to_thread(
             update_analysis_task_result_sync,
@@ -8590,31 +8480,17 @@ async def _generate_nutrition_insight(
     if not deepseek_key:
         return "本期日均摄入与 TDEE 接近，热量控制良好。请继续保持。"
 
-    base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com").rstrip("/")
-    api_url = f"{base_url}/chat/completions"
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            api_url,
-            headers={
-                "Authorization": f"Bearer {deepseek_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": "deepseek-v4-flash",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.6,
-                "max_tokens": 1024,
-            },
-        )
-        if not response.is_success:
-            error_data = response.json() if response.content else {}
-            error_msg = error_data.get("error", {}).get("message") or f"DeepSeek API 错误: {response.status_code}"
-            raise Exception(error_msg)
-        data = response.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content")
-        if not content or not content.strip():
-            raise Exception("DeepSeek 返回了空响应")
-        return content.strip()
+    result = await chat_completion_async(
+        [{"role": "user", "content": prompt}],
+        provider=PROVIDER_DEEPSEEK,
+        model="deepseek-v4-flash",
+        kind="text",
+        timeout=60.0,
+        temperature=0.6,
+        json_mode=False,
+        max_tokens=1024,
+    )
+    return result["content"].strip()
 
 
 @app.get("/api/stats/summary")
@@ -8635,10 +8511,8 @@ async def get_stats_summary(
     try:
         user = await get_user_by_id(user_id)
         tdee = (user.get("tdee") and float(user["tdee"])) or 2000
-        records = await list_food_records_by_range(user_id=user_id, start_date=start_date, end_date=end_date)
-        print(f"[get_stats_summary] Records found: {len(records)}")
-        if records:
-            print(f"[get_stats_summary] First record time: {records[0].get('record_time')} type: {type(records[0].get('record_time'))}")
+        daily_rows = await list_user_daily_nutrition(user_id=user_id, start_date=start_date, end_date=end_date)
+        print(f"[get_stats_summary] Daily nutrition rows found: {len(daily_rows)}")
         streak_days = await get_streak_days(user_id)
     except Exception as e:
         print(f"[get_stats_summary] 错误: {e}")
@@ -8651,25 +8525,13 @@ async def get_stats_summary(
         print(f"[get_stats_summary] 身体指标降级为空摘要: {body_metrics_error}")
         body_metrics_summary = _empty_body_metrics_summary(start_date=start_date, end_date=end_date)
 
-    total_cal = sum(float(r.get("total_calories") or 0) for r in records)
-    total_protein = sum(float(r.get("total_protein") or 0) for r in records)
-    total_carbs = sum(float(r.get("total_carbs") or 0) for r in records)
-    total_fat = sum(float(r.get("total_fat") or 0) for r in records)
-    by_meal_out = _build_by_meal_calories(records)
-
-    daily_cal: Dict[str, float] = {}
-    for r in records:
-        rt = r.get("record_time")
-        if rt:
-            try:
-                # record_time 存的是 UTC 时间戳，这里转换为中国时区的自然日
-                dt_utc = datetime.fromisoformat(str(rt).replace("Z", "+00:00"))
-                dt_local = dt_utc.astimezone(CHINA_TZ)
-                dt_str = dt_local.date().isoformat()
-                daily_cal[dt_str] = daily_cal.get(dt_str, 0) + float(r.get("total_calories") or 0)
-            except Exception as e:
-                print(f"[get_stats_summary] Date parse error for {rt}: {e}")
-                pass
+    summary = _summarize_daily_nutrition_rows(daily_rows)
+    total_cal = summary["total_calories"]
+    total_protein = summary["total_protein"]
+    total_carbs = summary["total_carbs"]
+    total_fat = summary["total_fat"]
+    by_meal_out = summary["by_meal"]
+    daily_cal = summary["daily_calories"]
     full_daily_list = []
     cursor = start_d
     end_day = now.date()
@@ -8763,7 +8625,7 @@ async def generate_stats_insight(
     try:
         user = await get_user_by_id(user_id)
         tdee = (user.get("tdee") and float(user["tdee"])) or 2000
-        records = await list_food_records_by_range(user_id=user_id, start_date=start_date, end_date=end_date)
+        daily_rows = await list_user_daily_nutrition(user_id=user_id, start_date=start_date, end_date=end_date)
         streak_days = await get_streak_days(user_id)
         # 获取身体指标（体重记录）用于 AI 上下文
         try:
@@ -8775,25 +8637,13 @@ async def generate_stats_insight(
         print(f"[generate_stats_insight] 准备数据失败: {e}")
         raise HTTPException(status_code=500, detail="生成 AI 洞察失败")
 
-    total_cal = sum(float(r.get("total_calories") or 0) for r in records)
-    total_protein = sum(float(r.get("total_protein") or 0) for r in records)
-    total_carbs = sum(float(r.get("total_carbs") or 0) for r in records)
-    total_fat = sum(float(r.get("total_fat") or 0) for r in records)
-
-    by_meal_out = _build_by_meal_calories(records)
-
-    daily_cal: Dict[str, float] = {}
-    for r in records:
-        rt = r.get("record_time")
-        if rt:
-            try:
-                dt_utc = datetime.fromisoformat(str(rt).replace("Z", "+00:00"))
-                dt_local = dt_utc.astimezone(CHINA_TZ)
-                dt_str = dt_local.date().isoformat()
-                daily_cal[dt_str] = daily_cal.get(dt_str, 0) + float(r.get("total_calories") or 0)
-            except Exception as e:
-                print(f"[generate_stats_insight] Date parse error for {rt}: {e}")
-                pass
+    summary = _summarize_daily_nutrition_rows(daily_rows)
+    total_cal = summary["total_calories"]
+    total_protein = summary["total_protein"]
+    total_carbs = summary["total_carbs"]
+    total_fat = summary["total_fat"]
+    by_meal_out = summary["by_meal"]
+    daily_cal = summary["daily_calories"]
     daily_list = [{"date": d, "calories": round(c, 1)} for d, c in sorted(daily_cal.items())]
 
     recorded_days = len(daily_cal)
@@ -8858,28 +8708,17 @@ async def save_stats_insight(
     end_date = today
 
     try:
-        records = await list_food_records_by_range(user_id=user_id, start_date=start_date, end_date=end_date)
+        daily_rows = await list_user_daily_nutrition(user_id=user_id, start_date=start_date, end_date=end_date)
     except Exception as e:
         print(f"[save_stats_insight] 获取记录失败: {e}")
         raise HTTPException(status_code=500, detail="保存失败")
 
-    total_cal = sum(float(r.get("total_calories") or 0) for r in records)
-    total_protein = sum(float(r.get("total_protein") or 0) for r in records)
-    total_carbs = sum(float(r.get("total_carbs") or 0) for r in records)
-    total_fat = sum(float(r.get("total_fat") or 0) for r in records)
-
-    daily_cal: Dict[str, float] = {}
-    for r in records:
-        rt = r.get("record_time")
-        if rt:
-            try:
-                dt_utc = datetime.fromisoformat(str(rt).replace("Z", "+00:00"))
-                dt_local = dt_utc.astimezone(CHINA_TZ)
-                dt_str = dt_local.date().isoformat()
-                daily_cal[dt_str] = daily_cal.get(dt_str, 0) + float(r.get("total_calories") or 0)
-            except Exception as e:
-                print(f"[save_stats_insight] Date parse error for {rt}: {e}")
-                pass
+    summary = _summarize_daily_nutrition_rows(daily_rows)
+    total_cal = summary["total_calories"]
+    total_protein = summary["total_protein"]
+    total_carbs = summary["total_carbs"]
+    total_fat = summary["total_fat"]
+    daily_cal = summary["daily_calories"]
 
     recorded_days = len(daily_cal)
     avg_cal_per_day = round(total_cal / recorded_days, 1) if recorded_days > 0 else 0
@@ -8933,33 +8772,21 @@ async def _refresh_stats_insight_for_user(user_id: str) -> None:
             start_date = start_d.strftime("%Y-%m-%d")
             end_date = today
 
-            records = await list_food_records_by_range(
+            daily_rows = await list_user_daily_nutrition(
                 user_id=user_id,
                 start_date=start_date,
                 end_date=end_date,
             )
-            if not records:
+            if not daily_rows:
                 continue
 
-            total_cal = sum(float(r.get("total_calories") or 0) for r in records)
-            total_protein = sum(float(r.get("total_protein") or 0) for r in records)
-            total_carbs = sum(float(r.get("total_carbs") or 0) for r in records)
-            total_fat = sum(float(r.get("total_fat") or 0) for r in records)
-
-            by_meal_out = _build_by_meal_calories(records)
-
-            daily_cal: Dict[str, float] = {}
-            for r in records:
-                rt = r.get("record_time")
-                if rt:
-                    try:
-                        dt_utc = datetime.fromisoformat(str(rt).replace("Z", "+00:00"))
-                        dt_local = dt_utc.astimezone(CHINA_TZ)
-                        dt_str = dt_local.date().isoformat()
-                        daily_cal[dt_str] = daily_cal.get(dt_str, 0) + float(r.get("total_calories") or 0)
-                    except Exception as e:
-                        print(f"[_refresh_stats_insight_for_user] Date parse error for {rt}: {e}")
-                        pass
+            summary = _summarize_daily_nutrition_rows(daily_rows)
+            total_cal = summary["total_calories"]
+            total_protein = summary["total_protein"]
+            total_carbs = summary["total_carbs"]
+            total_fat = summary["total_fat"]
+            by_meal_out = summary["by_meal"]
+            daily_cal = summary["daily_calories"]
 
             recorded_days = len(daily_cal)
             if recorded_days <= 0:
@@ -9044,28 +8871,16 @@ async def ws_stats_insight(websocket: WebSocket):
         # 准备统计数据（与 generate_stats_insight 相同）
         user = await get_user_by_id(user_id)
         tdee = (user.get("tdee") and float(user["tdee"])) or 2000
-        records = await list_food_records_by_range(user_id=user_id, start_date=start_date, end_date=end_date)
+        daily_rows = await list_user_daily_nutrition(user_id=user_id, start_date=start_date, end_date=end_date)
         streak_days = await get_streak_days(user_id)
 
-        total_cal = sum(float(r.get("total_calories") or 0) for r in records)
-        total_protein = sum(float(r.get("total_protein") or 0) for r in records)
-        total_carbs = sum(float(r.get("total_carbs") or 0) for r in records)
-        total_fat = sum(float(r.get("total_fat") or 0) for r in records)
-
-        by_meal_out = _build_by_meal_calories(records)
-
-        daily_cal: Dict[str, float] = {}
-        for r in records:
-            rt = r.get("record_time")
-            if rt:
-                try:
-                    dt_utc = datetime.fromisoformat(str(rt).replace("Z", "+00:00"))
-                    dt_local = dt_utc.astimezone(CHINA_TZ)
-                    dt_str = dt_local.date().isoformat()
-                    daily_cal[dt_str] = daily_cal.get(dt_str, 0) + float(r.get("total_calories") or 0)
-                except Exception as e:
-                    print(f"[ws_stats_insight] Date parse error for {rt}: {e}")
-                    pass
+        summary = _summarize_daily_nutrition_rows(daily_rows)
+        total_cal = summary["total_calories"]
+        total_protein = summary["total_protein"]
+        total_carbs = summary["total_carbs"]
+        total_fat = summary["total_fat"]
+        by_meal_out = summary["by_meal"]
+        daily_cal = summary["daily_calories"]
         daily_list = [{"date": d, "calories": round(c, 1)} for d, c in sorted(daily_cal.items())]
 
         recorded_days = len(daily_cal)
@@ -9426,10 +9241,12 @@ async def api_community_public_feed(
     meal_type: Optional[str] = None,
     diet_goal: Optional[str] = None,
     sort_by: str = "recommended",
+    cursor: Optional[str] = None,
 ):
     """
     公共 Feed：无需登录，返回 public_records=true 的用户的饮食记录。
     带点赞数和评论列表（不含 liked / is_mine）。
+    传入上一页返回的 next_cursor 时按游标续读（优先于 offset）。
     """
     try:
         items = await list_public_feed_records(
@@ -9440,6 +9257,7 @@ async def api_community_public_feed(
             meal_type=meal_type,
             diet_goal=diet_goal,
             sort_by=sort_by,
+            cursor=cursor,
         )
 
         out = []
@@ -9462,7 +9280,8 @@ async def api_community_public_feed(
             out.append(feed_item)
 
         has_more = len(items) >= limit
-        return {"list": out, "has_more": has_more}
+        next_cursor = build_feed_next_cursor([item["record"] for item in items], sort_by=sort_by) if has_more else None
+        return {"list": out, "has_more": has_more, "next_cursor": next_cursor}
     except Exception as e:
         import traceback
         print(f"[api/community/public-feed] 错误: {e}")
@@ -9483,6 +9302,7 @@ async def api_community_feed(
     priority_author_ids: Optional[str] = None,
     author_scope: str = "all",
     author_id: Optional[str] = None,
+    cursor: Optional[str] = None,
     user_info: dict = Depends(get_current_user_info),
 ):
     """
@@ -9490,13 +9310,14 @@ async def api_community_feed(
     
     Args:
         date: 可选日期筛选（YYYY-MM-DD）
-        offset: 分页偏移量
+        offset: 分页偏移量（兼容旧客户端；传 cursor 时忽略）
         limit: 每页记录数
         include_comments: 是否包含评论（默认 True）
         comments_limit: 每条记录返回的评论数（默认 5）
+        cursor: 上一页返回的 next_cursor，按游标续读，翻页成本恒定且新增记录不会造成重复
     
     Returns:
-        { "list": [{ record, author, like_count, liked, is_mine, comments, comment_count }], "has_more": bool }
+        { "list": [{ record, author, like_count, liked, is_mine, comments, comment_count }], "has_more": bool, "next_cursor": str | None }
     """
     try:
         current_user_id = user_info["user_id"]
@@ -9513,6 +9334,7 @@ async def api_community_feed(
             priority_author_ids=[x.strip() for x in (priority_author_ids or "").split(",") if x.strip()],
             author_scope=author_scope,
             author_id=author_id,
+            cursor=cursor,
         )
         
         out = []
@@ -9539,7 +9361,8 @@ async def api_community_feed(
         
         # 返回是否还有更多数据
         has_more = len(items) >= limit
-        return {"list": out, "has_more": has_more}
+        next_cursor = build_feed_next_cursor([item["record"] for item in items], sort_by=sort_by) if has_more else None
+        return {"list": out, "has_more": has_more, "next_cursor": next_cursor}
     except Exception as e:
         import traceback
         print(f"[api/community/feed] 错误: {e}")
@@ -9671,7 +9494,7 @@ async def api_community_feed_record_context(
             "liked": like_info.get("liked", False),
             "is_mine": record.get("user_id") == current_user_id,
             "comments": comments,
-            "comment_count": len(comments),
+            "comment_count": max(len(comments), int(record.get("comment_count") or 0)),
         }
         return {"item": item}
     except HTTPException:
@@ -10008,9 +9831,9 @@ async def api_list_public_food_library(
         collections_map = await get_public_food_library_collections_for_items(item_ids, user_info["user_id"]) if item_ids else {}
         # 批量查询作者信息
         author_ids = list({it["user_id"] for it in items})
-        from database import get_supabase_client
-        supabase = get_supabase_client()
-        authors_result = supabase.table("weapp_user").select("id, nickname, avatar").in_("id", author_ids).execute() if author_ids else None
+        from database import get_async_supabase_client
+        supabase = get_async_supabase_client()
+        authors_result = await supabase.table("weapp_user").select("id, nickname, avatar").in_("id", author_ids).execute() if author_ids else None
         author_map = {a["id"]: a for a in (authors_result.data or [])} if authors_result else {}
         out = []
         for it in items:
@@ -10059,9 +9882,9 @@ async def api_public_food_library_collections(
         likes_map = await get_public_food_library_likes_for_items(item_ids, user_info["user_id"]) if item_ids else {}
         collections_map = await get_public_food_library_collections_for_items(item_ids, user_info["user_id"]) if item_ids else {}
         author_ids = list({it["user_id"] for it in items})
-        from database import get_supabase_client
-        supabase = get_supabase_client()
-        authors_result = supabase.table("weapp_user").select("id, nickname, avatar").in_("id", author_ids).execute() if author_ids else None
+        from database import get_async_supabase_client
+        supabase = get_async_supabase_client()
+        authors_result = await supabase.table("weapp_user").select("id, nickname, avatar").in_("id", author_ids).execute() if author_ids else None
         author_map = {a["id"]: a for a in (authors_result.data or [])} if authors_result else {}
         out = []
         for it in items:
@@ -10280,20 +10103,11 @@ async def get_access_token() -> str:
     获取微信小程序 access_token
     参考文档: https://developers.weixin.qq.com/miniprogram/dev/server/API/mp-access-token/api_getaccesstoken.html
     """
-    global _access_token_cache
-    
     # 按照需求：第一次获取后缓存，如果过去一个半小时（1.5 * 3600 = 5400秒），重新获取
-    current_time = int(time.time())
-    
-    # 确保 cache 字典拥有 fetched_at 字段
-    if "fetched_at" not in _access_token_cache:
-        _access_token_cache["fetched_at"] = 0
-
-    # 如果 token 存在，且当前时间距离上次获取时间还未超过一个半小时（5400秒）
-    if _access_token_cache["token"] and (current_time - _access_token_cache["fetched_at"] < 5400):
-        print(f"[get_access_token] 使用缓存的 access_token: {_access_token_cache['token']}")
-        print(f"[get_access_token] 距离上次获取已过: {current_time - _access_token_cache['fetched_at']} 秒 (缓存有效期: 5400秒)")
-        return _access_token_cache["token"]
+    cached_token = _access_token_cache.get("token")
+    if cached_token:
+        print(f"[get_access_token] 使用缓存的 access_token: {cached_token}")
+        return cached_token
     
     appid = os.getenv("APPID")
     secret = os.getenv("SECRET")
@@ -10322,9 +10136,7 @@ async def get_access_token() -> str:
                 access_token = data.get("access_token")
                 expires_in = data.get("expires_in", 7200)
                 if access_token:
-                    _access_token_cache["token"] = access_token
-                    _access_token_cache["fetched_at"] = current_time
-                    _access_token_cache["expires_at"] = current_time + expires_in
+                    _access_token_cache.set("token", access_token)
                     print(f"[get_access_token] 使用 stable_token，expires_in={expires_in}")
                     return access_token
             else:
@@ -10354,9 +10166,8 @@ async def get_access_token() -> str:
             )
         access_token = data.get("access_token")
         expires_in = data.get("expires_in", 7200)
-        _access_token_cache["token"] = access_token
-        _access_token_cache["fetched_at"] = current_time
-        _access_token_cache["expires_at"] = current_time + expires_in
+        if access_token:
+            _access_token_cache.set("token", access_token)
         print(f"[get_access_token] 回退 token 接口成功，expires_in={expires_in}")
         return access_token
 
@@ -10403,9 +10214,7 @@ async def get_unlimited_qrcode(request: QRCodeRequest):
                 # 40001/42001: token 无效或过期，自动清缓存重试
                 if attempt == 0 and errcode in (40001, 42001):
                     print(f"[api/qrcode] token 失效，清缓存后重试: {err_data}")
-                    _access_token_cache["token"] = None
-                    _access_token_cache["fetched_at"] = 0
-                    _access_token_cache["expires_at"] = 0
+                    _access_token_cache.delete("token")
                     continue
                 raise HTTPException(status_code=500, detail=f"生成二维码失败: {errmsg}")
 
@@ -10932,17 +10741,20 @@ def _get_test_processors():
     """获取测试处理器实例"""
     qwen_api_key = os.getenv("DASHSCOPE_API_KEY")
     qwen_base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+    # 测试后台评估的是指定模型本身，不允许网关切换服务商
+    analyze_with_qwen = partial(_analyze_with_qwen, failover=False)
+    analyze_with_gemini = partial(_analyze_with_gemini, failover=False)
     
     return BatchProcessor(
-        analyze_with_qwen_func=_analyze_with_qwen,
-        analyze_with_gemini_func=_analyze_with_gemini,
+        analyze_with_qwen_func=analyze_with_qwen,
+        analyze_with_gemini_func=analyze_with_gemini,
         build_prompt_func=_build_gemini_prompt,
         qwen_api_key=qwen_api_key,
         qwen_base_url=qwen_base_url,
         max_concurrent=2
     ), SingleProcessor(
-        analyze_with_qwen_func=_analyze_with_qwen,
-        analyze_with_gemini_func=_analyze_with_gemini,
+        analyze_with_qwen_func=analyze_with_qwen,
+        analyze_with_gemini_func=analyze_with_gemini,
         build_prompt_func=_build_gemini_prompt,
         qwen_api_key=qwen_api_key,
         qwen_base_url=qwen_base_url
@@ -11276,7 +11088,6 @@ async def _run_test_backend_provider_analysis(
             _parse_analysis_result_items as worker_parse_analysis_result_items,
             _strip_standard_mode_extra_fields as worker_strip_standard_mode_extra_fields,
             _summarize_db_first_items as worker_summarize_db_first_items,
-            OFOX_BASE_URL as WORKER_OFOX_BASE_URL,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"加载主链路分析模块失败: {str(e)}")
@@ -11319,7 +11130,6 @@ async def _run_test_backend_provider_analysis(
     api_key = os.getenv("OFOXAI_API_KEY") or os.getenv("ofox_ai_apikey")
     if not api_key:
         raise RuntimeError("缺少 OFOXAI_API_KEY 环境变量")
-    api_url = f"{WORKER_OFOX_BASE_URL}/chat/completions"
     model_name = provider
 
     normalized_mode = execution_mode if execution_mode == "custom" else _normalize_execution_mode(execution_mode)
@@ -11328,51 +11138,20 @@ async def _run_test_backend_provider_analysis(
     for url in image_urls:
         content_parts.append({"type": "image_url", "image_url": {"url": url}})
 
-    parsed = None
-    api_duration_ms = None
-    for attempt in range(3):
-        try:
-            async with httpx.AsyncClient(timeout=90.0) as client:
-                api_started_at = time.perf_counter()
-                response = await client.post(
-                    api_url,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": model_name,
-                        "messages": [{"role": "user", "content": content_parts}],
-                        "response_format": {"type": "json_object"},
-                        "temperature": 0.7,
-                    },
-                )
-                api_duration_ms = round((time.perf_counter() - api_started_at) * 1000, 1)
-            if not response.is_success:
-                err = response.json() if response.content else {}
-                msg = err.get("error", {}).get("message") or f"API 错误: {response.status_code}"
-                if attempt < 2:
-                    await asyncio.sleep(1)
-                    continue
-                raise RuntimeError(msg)
-            data = response.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content")
-            if not content:
-                if attempt < 2:
-                    await asyncio.sleep(1)
-                    continue
-                raise RuntimeError("AI 返回了空响应")
-            json_str = re.sub(r"```json", "", content)
-            json_str = re.sub(r"```", "", json_str).strip()
-            parsed = worker_normalize_analysis_response_payload(json.loads(json_str))
-            break
-        except Exception:
-            if attempt >= 2:
-                raise
-            await asyncio.sleep(1)
-
-    if parsed is None:
-        raise RuntimeError("AI 返回解析失败")
+    # 测试后台对比的是指定模型：经 llm_gateway 退避重试，但不切换服务商
+    api_started_at = time.perf_counter()
+    llm_result = await chat_completion_async(
+        [{"role": "user", "content": content_parts}],
+        provider=PROVIDER_GEMINI,
+        model=model_name,
+        kind="vision",
+        timeout=90.0,
+        temperature=0.7,
+        parse=lambda content: worker_normalize_analysis_response_payload(parse_json_content(content)),
+        failover=False,
+    )
+    api_duration_ms = round((time.perf_counter() - api_started_at) * 1000, 1)
+    parsed = llm_result["parsed"]
 
     def _optional_text(value: Any) -> Optional[str]:
         text = str(value or "").strip()
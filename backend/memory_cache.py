@@ -0,0 +1,159 @@
+"""
+进程内缓存：容量上限的 LRU + TTL，支持按 key 前缀失效，并统计命中 / 未命中 / 淘汰次数。
+
+替代原先 database / main / worker 里各自维护的模块级 dict 缓存（只在读到过期 key 时才删除，
+长时间运行的进程内会无限增长，也看不到命中率）。
+- 写入超出 maxsize 时淘汰最久未使用的条目；过期条目在读取或写入时清理
+- get 时向当前链路追踪 span 写入 cache.hit / cache.miss 事件（带累计计数），淘汰时写入 cache.evict
+- cache_stats() 汇总进程内所有命名缓存的计数，供日志与健康检查使用
+
+线程安全：API 进程的线程池与 Worker 线程池可并发读写同一缓存。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from otel_compat import trace
+
+# 未显式指定容量时的默认上限（按 key 计）
+LOCAL_CACHE_DEFAULT_MAXSIZE = int(os.getenv("LOCAL_CACHE_DEFAULT_MAXSIZE", "4096"))
+
+_MISSING = object()
+
+
+def _add_span_event(name: str, attributes: Dict[str, Any]) -> None:
+    span = trace.get_current_span()
+    span_context = span.get_span_context() if span else None
+    if not span_context or not span_context.is_valid:
+        return
+    try:
+        span.add_event(name, attributes=attributes)
+    except Exception:
+        pass
+
+
+class TTLCache:
+    """容量有上限的 LRU 缓存，条目按 TTL 过期。"""
+
+    def __init__(self, name: str, *, maxsize: Optional[int] = None, ttl_seconds: float = 300) -> None:
+        self.name = name
+        self.maxsize = max(1, int(maxsize if maxsize is not None else LOCAL_CACHE_DEFAULT_MAXSIZE))
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def _event(self, name: str, key: str) -> None:
+        _add_span_event(name, {
+            "cache.name": self.name,
+            "cache.key": key,
+            "cache.hits": self.hits,
+            "cache.misses": self.misses,
+            "cache.evictions": self.evictions,
+            "cache.size": len(self._data),
+        })
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取未过期的值并标记为最近使用；不存在或已过期返回 default。"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] <= now:
+                del self._data[key]
+                self.expirations += 1
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                self._event("cache.miss", key)
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            self._event("cache.hit", key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """写入并设置过期时间（默认使用缓存的 ttl_seconds）；超出容量时淘汰最久未使用的条目。"""
+        now = time.monotonic()
+        ttl = self.ttl_seconds if ttl_seconds is None else float(ttl_seconds)
+        with self._lock:
+            self._data[key] = (now + ttl, value)
+            self._data.move_to_end(key)
+            if len(self._data) <= self.maxsize:
+                return
+            # 先清过期条目，仍超限再按 LRU 淘汰
+            for stale_key in [k for k, (expires_at, _) in self._data.items() if expires_at <= now]:
+                del self._data[stale_key]
+                self.expirations += 1
+            while len(self._data) > self.maxsize:
+                evicted_key, _ = self._data.popitem(last=False)
+                self.evictions += 1
+                self._event("cache.evict", evicted_key)
+
+    def delete(self, key: str) -> bool:
+        """删除单个 key，返回是否存在。"""
+        with self._lock:
+            if self._data.pop(key, _MISSING) is _MISSING:
+                return False
+            self.invalidations += 1
+            return True
+
+    def invalidate_prefix(self, prefix: str) -> int:
+        """删除所有以 prefix 开头的 key，返回删除条数。"""
+        with self._lock:
+            keys = [k for k in self._data if k.startswith(prefix)]
+            for key in keys:
+                del self._data[key]
+            self.invalidations += len(keys)
+        if keys:
+            _add_span_event("cache.invalidate", {"cache.name": self.name, "cache.prefix": prefix, "cache.count": len(keys)})
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+_registry: Dict[str, TTLCache] = {}
+_registry_lock = threading.Lock()
+
+
+def get_cache(name: str, *, maxsize: Optional[int] = None, ttl_seconds: float = 300) -> TTLCache:
+    """按名称获取进程内缓存（首次调用时创建并登记，之后的 maxsize / ttl_seconds 参数被忽略）。"""
+    with _registry_lock:
+        cache = _registry.get(name)
+        if cache is None:
+            cache = TTLCache(name, maxsize=maxsize, ttl_seconds=ttl_seconds)
+            _registry[name] = cache
+        return cache
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """进程内所有命名缓存的统计。"""
+    with _registry_lock:
+        caches = list(_registry.values())
+    return {cache.name: cache.stats() for cache in caches}
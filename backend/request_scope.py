@@ -0,0 +1,78 @@
+"""
+请求级读缓存（unit of work）：在一次 HTTP 请求内记住用户、会员、套餐、积分余额等读结果。
+
+/api/analyze/submit 等写路径在一次请求里会经 _get_effective_membership、
+_resolve_early_user_membership_meta、get_user_points_balance 等多处重复读取同一行
+weapp_user / user_pro_memberships，每次都是一次 Supabase 往返。
+- main 的 HTTP 中间件为每个请求打开 request_scope()，作用域随请求结束丢弃，不跨请求复用
+- memoized(kind, key, loader)：作用域内同一 (kind, key) 只回源一次；并发读取共享同一个加载任务；
+  加载失败不缓存。返回深拷贝，调用方修改返回值不会污染后续读取
+- 写操作调用 invalidate_request_memo(kind, key) 清掉本请求内已记住的值，保证读到自己的写
+- 作用域之外（Worker 子进程、定时任务）memoized 直接调用 loader，不做任何缓存
+
+作用域基于 contextvars：asyncio.to_thread 会复制上下文，线程内的同步写操作同样能清掉本请求的缓存。
+"""
+import asyncio
+import copy
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+_request_memo: ContextVar[Optional[Dict[Tuple[str, str], "asyncio.Future[Any]"]]] = ContextVar(
+    "food_link_request_memo",
+    default=None,
+)
+
+
+@contextmanager
+def request_scope() -> Iterator[None]:
+    """打开一个请求级读缓存作用域（可嵌套，内层作用域独立）。"""
+    token = _request_memo.set({})
+    try:
+        yield
+    finally:
+        _request_memo.reset(token)
+
+
+def in_request_scope() -> bool:
+    return _request_memo.get() is not None
+
+
+async def memoized(kind: str, key: Any, loader: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    在当前请求作用域内按 (kind, key) 记住 loader 的结果。
+
+    Args:
+        kind: 数据类别，如 "user" / "membership"，用于按类别失效
+        key: 类别内的标识，通常是 user_id
+        loader: 未命中时调用的异步加载函数
+    """
+    memo = _request_memo.get()
+    if memo is None:
+        return await loader()
+
+    slot = (kind, str(key))
+    task = memo.get(slot)
+    if task is None:
+        task = asyncio.ensure_future(loader())
+        memo[slot] = task
+    try:
+        # shield：某个等待方被取消时不连带取消其他等待方共享的加载任务
+        value = await asyncio.shield(task)
+    except BaseException:
+        if task.done() and memo.get(slot) is task:
+            del memo[slot]
+        raise
+    return copy.deepcopy(value)
+
+
+def invalidate_request_memo(kind: str, key: Any = None) -> None:
+    """清掉当前请求内已记住的值；key 为 None 时清掉该类别的全部条目。作用域外调用无副作用。"""
+    memo = _request_memo.get()
+    if not memo:
+        return
+    if key is not None:
+        memo.pop((kind, str(key)), None)
+        return
+    for slot in [s for s in list(memo) if s[0] == kind]:
+        memo.pop(slot, None)
@@ -2,10 +2,22 @@
 启动后端：先启动多个 Worker 子进程处理异步分析任务，再启动 FastAPI（uvicorn）。
 用法：python run_backend.py
 环境变量：WORKER_COUNT 控制 Worker 数量，默认 2。
+WORKER_RUNTIME=async 时分析类任务改由 asyncio Worker 进程（ASYNC_WORKER_PROCESS_COUNT 个）并发处理，
+每个任务类型的在途上限为 ASYNC_WORKER_CONCURRENCY，可用 WORKER_CONCURRENCY_<TASK_TYPE> 单独覆盖。
+
+各 *_WORKER_COUNT 为常驻下限，*_WORKER_COUNT_MAX 为上限（默认与下限相同，即不伸缩）；
+后台 Supervisor 每 WORKER_SUPERVISOR_INTERVAL_SECONDS 秒查看各队列积压（待处理数、最早待处理时长），
+在上下限之间增减进程，拉起意外退出的 Worker，并把租约过期的分析任务重新排队。
 """
+import math
 import os
 import sys
 import multiprocessing
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
 # 确保 backend 目录在 path 中
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -23,6 +35,8 @@ COMMENT_WORKER_COUNT = int(os.getenv("COMMENT_WORKER_COUNT", "1"))  # 评论审
 PUBLIC_LIBRARY_MODERATION_WORKER_COUNT = int(os.getenv("PUBLIC_LIBRARY_MODERATION_WORKER_COUNT", "1"))  # 食物库审核
 EXPIRY_NOTIFICATION_WORKER_COUNT = int(os.getenv("EXPIRY_NOTIFICATION_WORKER_COUNT", "1"))  # 保质期通知
 EXERCISE_WORKER_COUNT = int(os.getenv("EXERCISE_WORKER_COUNT", "1"))  # 运动热量异步任务
+FEED_SCORE_WORKER_COUNT = max(0, min(int(os.getenv("FEED_SCORE_WORKER_COUNT", "1")), 1))  # 圈子排序得分衰减（至多 1 个）
+FEED_SCORE_DECAY_INTERVAL_SECONDS = float(os.getenv("FEED_SCORE_DECAY_INTERVAL_SECONDS", "600"))
 FOOD_DEBUG_TASK_QUEUE = str(os.getenv("FOOD_DEBUG_TASK_QUEUE") or "").strip().lower() in {"1", "true", "yes", "on"}
 FOOD_TASK_TYPE = "food_debug" if FOOD_DEBUG_TASK_QUEUE else "food"
 TEXT_FOOD_TASK_TYPE = "food_text_debug" if FOOD_DEBUG_TASK_QUEUE else "food_text"
@@ -32,148 +46,377 @@ PRECISION_AGGREGATE_TASK_TYPE = "precision_aggregate_debug" if FOOD_DEBUG_TASK_Q
 PRECISION_PLAN_WORKER_COUNT = int(os.getenv("PRECISION_PLAN_WORKER_COUNT", "1"))
 PRECISION_ITEM_ESTIMATE_WORKER_COUNT = int(os.getenv("PRECISION_ITEM_ESTIMATE_WORKER_COUNT", str(max(1, WORKER_COUNT))))
 PRECISION_AGGREGATE_WORKER_COUNT = int(os.getenv("PRECISION_AGGREGATE_WORKER_COUNT", "1"))
-
-
-def run_food_worker_process(worker_id: int) -> None:
+# Worker 运行方式：process（每个槽位一个进程、一次处理一个任务）| async（asyncio 进程内按任务类型并发）
+WORKER_RUNTIME = str(os.getenv("WORKER_RUNTIME") or "process").strip().lower()
+ASYNC_WORKER_PROCESS_COUNT = max(1, min(int(os.getenv("ASYNC_WORKER_PROCESS_COUNT", "1")), 8))
+ASYNC_WORKER_CONCURRENCY = max(1, int(os.getenv("ASYNC_WORKER_CONCURRENCY", "16")))  # 每个任务类型的默认在途上限
+ASYNC_WORKER_TASK_TYPES = [
+    FOOD_TASK_TYPE,
+    TEXT_FOOD_TASK_TYPE,
+    PRECISION_PLAN_TASK_TYPE,
+    PRECISION_ITEM_ESTIMATE_TASK_TYPE,
+    PRECISION_AGGREGATE_TASK_TYPE,
+    "health_report",
+    "public_food_library_text",
+    "exercise",
+]
+
+
+
+def _max_count_env(name: str, min_count: int, cap: int = 32) -> int:
+    """<name>_MAX：伸缩上限，默认等于下限（不伸缩）。"""
+    return max(min_count, min(int(os.getenv(f"{name}_MAX", str(min_count))), cap))
+
+
+WORKER_COUNT_MAX = _max_count_env("WORKER_COUNT", WORKER_COUNT)
+TEXT_WORKER_COUNT_MAX = _max_count_env("TEXT_WORKER_COUNT", TEXT_WORKER_COUNT)
+PRECISION_PLAN_WORKER_COUNT_MAX = _max_count_env("PRECISION_PLAN_WORKER_COUNT", PRECISION_PLAN_WORKER_COUNT)
+PRECISION_ITEM_ESTIMATE_WORKER_COUNT_MAX = _max_count_env("PRECISION_ITEM_ESTIMATE_WORKER_COUNT", PRECISION_ITEM_ESTIMATE_WORKER_COUNT)
+PRECISION_AGGREGATE_WORKER_COUNT_MAX = _max_count_env("PRECISION_AGGREGATE_WORKER_COUNT", PRECISION_AGGREGATE_WORKER_COUNT)
+HEALTH_REPORT_WORKER_COUNT_MAX = _max_count_env("HEALTH_REPORT_WORKER_COUNT", HEALTH_REPORT_WORKER_COUNT)
+COMMENT_WORKER_COUNT_MAX = _max_count_env("COMMENT_WORKER_COUNT", COMMENT_WORKER_COUNT)
+PUBLIC_LIBRARY_MODERATION_WORKER_COUNT_MAX = _max_count_env("PUBLIC_LIBRARY_MODERATION_WORKER_COUNT", PUBLIC_LIBRARY_MODERATION_WORKER_COUNT)
+EXPIRY_NOTIFICATION_WORKER_COUNT_MAX = _max_count_env("EXPIRY_NOTIFICATION_WORKER_COUNT", EXPIRY_NOTIFICATION_WORKER_COUNT)
+EXERCISE_WORKER_COUNT_MAX = _max_count_env("EXERCISE_WORKER_COUNT", EXERCISE_WORKER_COUNT)
+ASYNC_WORKER_PROCESS_COUNT_MAX = _max_count_env("ASYNC_WORKER_PROCESS_COUNT", ASYNC_WORKER_PROCESS_COUNT, cap=8)
+
+WORKER_SUPERVISOR_INTERVAL_SECONDS = float(os.getenv("WORKER_SUPERVISOR_INTERVAL_SECONDS", "15"))
+# 每个单任务进程对应的积压任务数；积压超过 当前进程数 × 该值 时扩容
+WORKER_SCALE_TASKS_PER_WORKER = max(1, int(os.getenv("WORKER_SCALE_TASKS_PER_WORKER", "2")))
+# 最早待处理任务等待超过该秒数时，至少再加一个进程
+WORKER_SCALE_UP_AGE_SECONDS = float(os.getenv("WORKER_SCALE_UP_AGE_SECONDS", "20"))
+# 积压持续低于当前容量该秒数后才缩容（每次一个）
+WORKER_SCALE_DOWN_DELAY_SECONDS = float(os.getenv("WORKER_SCALE_DOWN_DELAY_SECONDS", "180"))
+# 崩溃保护：窗口内重启次数达到上限后暂停拉起，直到窗口滑过
+WORKER_RESTART_LIMIT = int(os.getenv("WORKER_RESTART_LIMIT", "5"))
+WORKER_RESTART_WINDOW_SECONDS = float(os.getenv("WORKER_RESTART_WINDOW_SECONDS", "60"))
+
+# Worker 一律以 spawn 方式启动：扩容与崩溃拉起发生在 uvicorn 运行之后，此时主进程已有事件循环、
+# 多个线程和 Supabase / httpx 连接池，fork 会把持有中的锁和套接字一并带进子进程
+_WORKER_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def _worker_process_main(target: Callable[..., None], worker_id: int, stop_event: Any) -> None:
+    """Worker 子进程主函数：运行入口函数，退出时释放大模型 HTTP 连接池。"""
+    try:
+        target(worker_id, stop_event)
+    finally:
+        from llm_http import close_llm_http_clients
+        close_llm_http_clients()
+
+
+def run_food_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运行食物分析 Worker。"""
     from worker import run_worker
-    run_worker(worker_id=worker_id, task_type=FOOD_TASK_TYPE, poll_interval=2.0)
+    run_worker(worker_id=worker_id, task_type=FOOD_TASK_TYPE, poll_interval=2.0, stop_event=stop_event)
 
 
-def run_text_food_worker_process(worker_id: int) -> None:
+def run_text_food_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运行文字分析 Worker。"""
     from worker import run_worker
-    run_worker(worker_id=worker_id, task_type=TEXT_FOOD_TASK_TYPE, poll_interval=2.0)
+    run_worker(worker_id=worker_id, task_type=TEXT_FOOD_TASK_TYPE, poll_interval=2.0, stop_event=stop_event)
 
 
-def run_precision_plan_worker_process(worker_id: int) -> None:
+def run_precision_plan_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运行精准模式规划 Worker。"""
     from worker import run_worker
-    run_worker(worker_id=worker_id, task_type=PRECISION_PLAN_TASK_TYPE, poll_interval=2.0)
+    run_worker(worker_id=worker_id, task_type=PRECISION_PLAN_TASK_TYPE, poll_interval=2.0, stop_event=stop_event)
 
 
-def run_precision_item_estimate_worker_process(worker_id: int) -> None:
+def run_precision_item_estimate_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运行精准模式子项估计 Worker。"""
     from worker import run_worker
-    run_worker(worker_id=worker_id, task_type=PRECISION_ITEM_ESTIMATE_TASK_TYPE, poll_interval=2.0)
+    run_worker(worker_id=worker_id, task_type=PRECISION_ITEM_ESTIMATE_TASK_TYPE, poll_interval=2.0, stop_event=stop_event)
 
 
-def run_precision_aggregate_worker_process(worker_id: int) -> None:
+def run_precision_aggregate_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运行精准模式聚合 Worker。"""
     from worker import run_worker
-    run_worker(worker_id=worker_id, task_type=PRECISION_AGGREGATE_TASK_TYPE, poll_interval=2.0)
+    run_worker(worker_id=worker_id, task_type=PRECISION_AGGREGATE_TASK_TYPE, poll_interval=2.0, stop_event=stop_event)
 
 
-def run_health_report_worker_process(worker_id: int) -> None:
+def run_health_report_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运行病历提取 Worker。"""
     from worker import run_worker
-    run_worker(worker_id=worker_id, task_type="health_report", poll_interval=2.0)
+    run_worker(worker_id=worker_id, task_type="health_report", poll_interval=2.0, stop_event=stop_event)
 
-def run_public_library_moderation_worker_process(worker_id: int) -> None:
+def run_public_library_moderation_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运行食物库文本审核 Worker。"""
     from worker import run_worker
-    run_worker(worker_id=worker_id, task_type="public_food_library_text", poll_interval=2.0)
+    run_worker(worker_id=worker_id, task_type="public_food_library_text", poll_interval=2.0, stop_event=stop_event)
 
 
-def run_comment_worker_process(worker_id: int) -> None:
+def run_comment_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运行评论审核 Worker。"""
     from worker import run_comment_worker
-    run_comment_worker(worker_id=worker_id, poll_interval=2.0)
+    run_comment_worker(worker_id=worker_id, poll_interval=2.0, stop_event=stop_event)
 
 
-def run_expiry_notification_worker_process(worker_id: int) -> None:
+def run_expiry_notification_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运行保质期通知 Worker。"""
     from worker import run_food_expiry_notification_worker
-    run_food_expiry_notification_worker(worker_id=worker_id, poll_interval=2.0)
+    run_food_expiry_notification_worker(worker_id=worker_id, poll_interval=2.0, stop_event=stop_event)
 
 
-def run_exercise_worker_process(worker_id: int) -> None:
+def run_exercise_worker_process(worker_id: int, stop_event: Any = None) -> None:
     """子进程入口：运动热量估算异步任务（与食物分析相同 analysis_tasks 表）。"""
     from worker import run_worker
-    run_worker(worker_id=worker_id, task_type="exercise", poll_interval=2.0)
-
-
-def main() -> None:
-    workers: list[multiprocessing.Process] = []
-    
-    # 启动图片食物分析 Worker
-    for i in range(WORKER_COUNT):
-        p = multiprocessing.Process(target=run_food_worker_process, args=(i,), daemon=True)
-        p.start()
-        workers.append(p)
-    
-    # 启动文字食物分析 Worker
-    for i in range(TEXT_WORKER_COUNT):
-        p = multiprocessing.Process(target=run_text_food_worker_process, args=(i,), daemon=True)
-        p.start()
-        workers.append(p)
-
-    # 启动精准模式规划 Worker
-    for i in range(PRECISION_PLAN_WORKER_COUNT):
-        p = multiprocessing.Process(target=run_precision_plan_worker_process, args=(i,), daemon=True)
-        p.start()
-        workers.append(p)
+    run_worker(worker_id=worker_id, task_type="exercise", poll_interval=2.0, stop_event=stop_event)
+
+
+def run_async_worker_process(worker_id: int, stop_event: Any = None) -> None:
+    """子进程入口：asyncio Worker，单进程并发处理全部分析类任务。"""
+    from worker import run_async_worker
+    run_async_worker(
+        worker_id=worker_id,
+        task_types=ASYNC_WORKER_TASK_TYPES,
+        default_concurrency=ASYNC_WORKER_CONCURRENCY,
+        poll_interval=2.0,
+        stop_event=stop_event,
+    )
 
-    # 启动精准模式子项估计 Worker
-    for i in range(PRECISION_ITEM_ESTIMATE_WORKER_COUNT):
-        p = multiprocessing.Process(target=run_precision_item_estimate_worker_process, args=(i,), daemon=True)
-        p.start()
-        workers.append(p)
 
-    # 启动精准模式聚合 Worker
-    for i in range(PRECISION_AGGREGATE_WORKER_COUNT):
-        p = multiprocessing.Process(target=run_precision_aggregate_worker_process, args=(i,), daemon=True)
-        p.start()
-        workers.append(p)
-    
-    # 启动病历提取 Worker
-    for i in range(HEALTH_REPORT_WORKER_COUNT):
-        p = multiprocessing.Process(target=run_health_report_worker_process, args=(i,), daemon=True)
+def run_feed_score_worker_process(worker_id: int, stop_event: Any = None) -> None:
+    """子进程入口：定期衰减圈子排序的新鲜度得分。"""
+    from worker import run_feed_score_decay_worker
+    run_feed_score_decay_worker(worker_id=worker_id, interval=FEED_SCORE_DECAY_INTERVAL_SECONDS, stop_event=stop_event)
+
+
+def desired_worker_count(
+    current: int,
+    min_count: int,
+    max_count: int,
+    pending_count: int,
+    oldest_pending_age: float,
+    tasks_per_worker: int,
+) -> int:
+    """
+    按积压计算目标进程数：待处理数 / 单进程承载量向上取整；最早任务等待过久时至少比当前多一个。
+    结果限制在 [min_count, max_count]。
+    """
+    target = math.ceil(pending_count / max(tasks_per_worker, 1)) if pending_count > 0 else 0
+    if pending_count > 0 and oldest_pending_age >= WORKER_SCALE_UP_AGE_SECONDS:
+        target = max(target, current + 1)
+    return max(min_count, min(max_count, target))
+
+
+class WorkerPool:
+    """
+    同一入口函数的一组 Worker 进程：常驻 min_count 个，按所属队列积压在 max_count 内伸缩，意外退出后自动拉起。
+    缩容通过进程各自的 stop_event 通知，Worker 处理完手上任务后自行退出，不会中断进行中的分析。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        target: Callable[..., None],
+        min_count: int,
+        max_count: int,
+        queue: Optional[str] = None,
+        task_types: Optional[List[str]] = None,
+        tasks_per_worker: int = WORKER_SCALE_TASKS_PER_WORKER,
+    ) -> None:
+        self.name = name
+        self.target = target
+        self.min_count = max(0, min_count)
+        self.max_count = max(self.min_count, max_count)
+        self.queue = queue  # 积压统计口径（表名）；None 表示固定数量
+        self.task_types = task_types  # analysis_tasks 内的 task_type 范围；None 表示整个队列
+        self.tasks_per_worker = tasks_per_worker
+        self.processes: List[Tuple[multiprocessing.Process, Any]] = []
+        self.restarts: Deque[float] = deque()
+        self.below_since: Optional[float] = None
+        self._next_worker_id = 0
+
+    @property
+    def running_count(self) -> int:
+        """未被要求停止的在运行进程数。"""
+        return sum(1 for p, stop in self.processes if p.is_alive() and not stop.is_set())
+
+    def spawn(self) -> None:
+        stop_event = _WORKER_MP_CONTEXT.Event()
+        p = _WORKER_MP_CONTEXT.Process(
+            target=_worker_process_main,
+            args=(self.target, self._next_worker_id, stop_event),
+            daemon=True,
+        )
+        self._next_worker_id += 1
         p.start()
-        workers.append(p)
-    
-    # 启动评论审核 Worker
-    for i in range(COMMENT_WORKER_COUNT):
-        p = multiprocessing.Process(target=run_comment_worker_process, args=(i,), daemon=True)
-        p.start()
-        workers.append(p)
+        self.processes.append((p, stop_event))
+
+    def stop_one(self) -> None:
+        for p, stop in reversed(self.processes):
+            if p.is_alive() and not stop.is_set():
+                stop.set()
+                return
+
+    def reap(self, now: float) -> int:
+        """回收已退出的进程，返回其中非主动停止（崩溃）的个数。"""
+        crashed = 0
+        alive: List[Tuple[multiprocessing.Process, Any]] = []
+        for p, stop in self.processes:
+            if p.is_alive():
+                alive.append((p, stop))
+                continue
+            p.join(timeout=0)
+            if not stop.is_set():
+                crashed += 1
+                self.restarts.append(now)
+                print(f"[supervisor] {self.name} Worker pid={p.pid} 意外退出（exitcode={p.exitcode}），将重新拉起", flush=True)
+        self.processes = alive
+        while self.restarts and now - self.restarts[0] > WORKER_RESTART_WINDOW_SECONDS:
+            self.restarts.popleft()
+        return crashed
+
+    def backlog(self, stats: List[Dict[str, Any]], now_utc: float) -> Tuple[int, float]:
+        """从队列统计中取本池负责的待处理数与最早待处理时长（秒）。"""
+        pending = 0
+        oldest_age = 0.0
+        for row in stats:
+            if row.get("queue") != self.queue:
+                continue
+            if self.task_types is not None and row.get("task_type") not in self.task_types:
+                continue
+            pending += int(row.get("pending_count") or 0)
+            oldest = _parse_timestamp(row.get("oldest_pending_at"))
+            if oldest is not None:
+                oldest_age = max(oldest_age, now_utc - oldest)
+        return pending, oldest_age
+
+    def tick(self, stats: Optional[List[Dict[str, Any]]], now: float) -> None:
+        self.reap(now)
+        current = self.running_count
+        target = max(current, self.min_count)
+        if self.queue and stats is not None:
+            pending, oldest_age = self.backlog(stats, time.time())
+            desired = desired_worker_count(current, self.min_count, self.max_count, pending, oldest_age, self.tasks_per_worker)
+            if desired > current:
+                self.below_since = None
+                target = desired
+                print(
+                    f"[supervisor] {self.name} 扩容 {current} -> {desired}（待处理 {pending}，最早等待 {oldest_age:.0f}s）",
+                    flush=True,
+                )
+            elif desired < current:
+                self.below_since = self.below_since or now
+                if now - self.below_since >= WORKER_SCALE_DOWN_DELAY_SECONDS:
+                    print(f"[supervisor] {self.name} 缩容 {current} -> {current - 1}（待处理 {pending}）", flush=True)
+                    self.stop_one()
+                    self.below_since = now
+                    return
+            else:
+                self.below_since = None
+        missing = target - current
+        if missing > 0 and len(self.restarts) >= WORKER_RESTART_LIMIT:
+            print(f"[supervisor] {self.name} {WORKER_RESTART_WINDOW_SECONDS:.0f}s 内已重启 {len(self.restarts)} 次，暂缓拉起", flush=True)
+            return
+        for _ in range(max(missing, 0)):
+            self.spawn()
+
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        text = str(value).strip().replace("Z", "+00:00")
+        dt = datetime.fromisoformat(text)
+        return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+    except Exception:
+        return None
+
+
+def supervise_worker_pools(pools: List[WorkerPool], interval: float = WORKER_SUPERVISOR_INTERVAL_SECONDS) -> None:
+    """
+    Supervisor 线程：定期回收租约过期的分析任务、放行等待过久的精准模式聚合任务、读取队列积压并调整各池；
+    统计失败时仍负责拉起崩溃的 Worker。
+    """
+    from database import get_task_queue_stats_sync, release_stale_precision_aggregates_sync, requeue_expired_tasks_sync
+    from worker import PRECISION_MAX_AGGREGATE_WAIT_SECONDS
+
+    scaled = any(pool.queue and pool.max_count > pool.min_count for pool in pools)
+    while True:
+        time.sleep(interval)
+        # 崩溃 / OOM 的 Worker 不再心跳，其任务租约到期后重新排队（超过最大尝试次数则标记失败）
+        requeue_expired_tasks_sync()
+        # 子项估计任务丢失时倒计数无法归零，聚合任务等待超时后兜底放行
+        release_stale_precision_aggregates_sync(PRECISION_MAX_AGGREGATE_WAIT_SECONDS)
+        stats: Optional[List[Dict[str, Any]]] = None
+        if scaled:
+            try:
+                stats = get_task_queue_stats_sync()
+            except Exception as e:
+                print(f"[supervisor] 读取队列积压失败（本轮只做崩溃拉起）: {str(e)[:100]}", flush=True)
+        now = time.monotonic()
+        for pool in pools:
+            try:
+                pool.tick(stats, now)
+            except Exception as e:
+                print(f"[supervisor] {pool.name} 调整失败: {str(e)[:100]}", flush=True)
+
+
+def build_worker_pools() -> List[WorkerPool]:
+    pools: List[WorkerPool] = []
+    if WORKER_RUNTIME == "async":
+        # async 运行方式：分析类任务统一由 asyncio Worker 进程承担，每个进程可同时处理 ASYNC_WORKER_CONCURRENCY 个
+        pools.append(WorkerPool(
+            "asyncio 分析", run_async_worker_process, ASYNC_WORKER_PROCESS_COUNT, ASYNC_WORKER_PROCESS_COUNT_MAX,
+            queue="analysis_tasks", task_types=ASYNC_WORKER_TASK_TYPES, tasks_per_worker=ASYNC_WORKER_CONCURRENCY,
+        ))
+    else:
+        pools.extend([
+            WorkerPool("图片分析", run_food_worker_process, WORKER_COUNT, WORKER_COUNT_MAX,
+                       queue="analysis_tasks", task_types=[FOOD_TASK_TYPE]),
+            WorkerPool("文字分析", run_text_food_worker_process, TEXT_WORKER_COUNT, TEXT_WORKER_COUNT_MAX,
+                       queue="analysis_tasks", task_types=[TEXT_FOOD_TASK_TYPE]),
+            WorkerPool("精准规划", run_precision_plan_worker_process, PRECISION_PLAN_WORKER_COUNT, PRECISION_PLAN_WORKER_COUNT_MAX,
+                       queue="analysis_tasks", task_types=[PRECISION_PLAN_TASK_TYPE]),
+            WorkerPool("精准子项估计", run_precision_item_estimate_worker_process,
+                       PRECISION_ITEM_ESTIMATE_WORKER_COUNT, PRECISION_ITEM_ESTIMATE_WORKER_COUNT_MAX,
+                       queue="analysis_tasks", task_types=[PRECISION_ITEM_ESTIMATE_TASK_TYPE]),
+            WorkerPool("精准聚合", run_precision_aggregate_worker_process,
+                       PRECISION_AGGREGATE_WORKER_COUNT, PRECISION_AGGREGATE_WORKER_COUNT_MAX,
+                       queue="analysis_tasks", task_types=[PRECISION_AGGREGATE_TASK_TYPE]),
+            WorkerPool("病历提取", run_health_report_worker_process, HEALTH_REPORT_WORKER_COUNT, HEALTH_REPORT_WORKER_COUNT_MAX,
+                       queue="analysis_tasks", task_types=["health_report"]),
+            WorkerPool("食物库审核", run_public_library_moderation_worker_process,
+                       PUBLIC_LIBRARY_MODERATION_WORKER_COUNT, PUBLIC_LIBRARY_MODERATION_WORKER_COUNT_MAX,
+                       queue="analysis_tasks", task_types=["public_food_library_text"]),
+            WorkerPool("运动分析", run_exercise_worker_process, EXERCISE_WORKER_COUNT, EXERCISE_WORKER_COUNT_MAX,
+                       queue="analysis_tasks", task_types=["exercise"]),
+        ])
+    pools.extend([
+        WorkerPool("评论审核", run_comment_worker_process, COMMENT_WORKER_COUNT, COMMENT_WORKER_COUNT_MAX,
+                   queue="comment_tasks"),
+        WorkerPool("保质期通知", run_expiry_notification_worker_process,
+                   EXPIRY_NOTIFICATION_WORKER_COUNT, EXPIRY_NOTIFICATION_WORKER_COUNT_MAX,
+                   queue="food_expiry_notification_jobs"),
+        WorkerPool("排序得分衰减", run_feed_score_worker_process, FEED_SCORE_WORKER_COUNT, FEED_SCORE_WORKER_COUNT),
+    ])
+    return pools
 
-    # 启动食物库审核 Worker
-    for i in range(PUBLIC_LIBRARY_MODERATION_WORKER_COUNT):
-        p = multiprocessing.Process(target=run_public_library_moderation_worker_process, args=(i,), daemon=True)
-        p.start()
-        workers.append(p)
 
-    # 启动保质期通知 Worker
-    for i in range(EXPIRY_NOTIFICATION_WORKER_COUNT):
-        p = multiprocessing.Process(target=run_expiry_notification_worker_process, args=(i,), daemon=True)
-        p.start()
-        workers.append(p)
+def main() -> None:
+    pools = build_worker_pools()
+    for pool in pools:
+        for _ in range(pool.min_count):
+            pool.spawn()
 
-    # 启动运动热量异步 Worker
-    for i in range(EXERCISE_WORKER_COUNT):
-        p = multiprocessing.Process(target=run_exercise_worker_process, args=(i,), daemon=True)
-        p.start()
-        workers.append(p)
-    
     print(
-        f"[run_backend] 已启动 {WORKER_COUNT} 个图片分析 Worker + "
-        f"{TEXT_WORKER_COUNT} 个文字分析 Worker + "
-        f"{PRECISION_PLAN_WORKER_COUNT} 个精准规划 Worker + "
-        f"{PRECISION_ITEM_ESTIMATE_WORKER_COUNT} 个精准子项估计 Worker + "
-        f"{PRECISION_AGGREGATE_WORKER_COUNT} 个精准聚合 Worker + "
-        f"{HEALTH_REPORT_WORKER_COUNT} 个病历提取 Worker + "
-        f"{COMMENT_WORKER_COUNT} 个评论审核 Worker + "
-        f"{PUBLIC_LIBRARY_MODERATION_WORKER_COUNT} 个食物库审核 Worker + "
-        f"{EXPIRY_NOTIFICATION_WORKER_COUNT} 个保质期通知 Worker + "
-        f"{EXERCISE_WORKER_COUNT} 个运动分析 Worker"
-        f"（food_task_type={FOOD_TASK_TYPE}, text_task_type={TEXT_FOOD_TASK_TYPE}, "
+        "[run_backend] 已启动 "
+        + " + ".join(
+            f"{pool.min_count} 个{pool.name} Worker" + (f"（可伸缩至 {pool.max_count}）" if pool.max_count > pool.min_count else "")
+            for pool in pools
+        )
+        + f"（runtime={WORKER_RUNTIME}, food_task_type={FOOD_TASK_TYPE}, text_task_type={TEXT_FOOD_TASK_TYPE}, "
         f"precision_plan_task_type={PRECISION_PLAN_TASK_TYPE}, "
         f"precision_item_task_type={PRECISION_ITEM_ESTIMATE_TASK_TYPE}, "
         f"precision_aggregate_task_type={PRECISION_AGGREGATE_TASK_TYPE}）",
         flush=True
     )
 
+    # Supervisor：按队列积压伸缩、拉起崩溃的 Worker（daemon 线程随主进程退出）
+    threading.Thread(target=supervise_worker_pools, args=(pools,), name="worker-supervisor", daemon=True).start()
+
     import uvicorn
     # 不使用 --reload，避免主进程重启后 Worker 成为孤儿进程
     uvicorn.run(
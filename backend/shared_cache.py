@@ -0,0 +1,366 @@
+"""
+跨进程共享缓存与失效广播。
+
+API 进程与各 Worker 进程原先各自持有私有内存缓存：在 API 进程里加好友只能清掉本进程的好友列表缓存，
+其他进程（以及 uvicorn 多 worker）要等 TTL 过期才能看到变化，也无法复用彼此已经查到的结果。
+
+两级结构：
+- L1：本进程 memory_cache.TTLCache（容量上限 LRU + TTL），命中不出进程
+- L2：共享层，所有进程可见；后端可插拔
+    * redis：Redis 协议服务（SHARED_CACHE_REDIS_URL / REDIS_URL，需要 redis 包）
+    * sqlite：同机多进程共享的本地替身，SQLite 文件默认放在 /dev/shm（内存文件系统）
+    * local：不启用共享层，仅 L1（测试或单进程调试）
+    * auto（默认）：配置了 Redis 地址且可导入 redis 时用 redis，否则用 sqlite
+失效广播：invalidate / invalidate_prefix 删除 L1 与 L2 后发布失效消息，其他进程据此清理各自的 L1。
+redis 后端走 Pub/Sub（后台订阅线程）；sqlite 后端写入失效日志表，各进程读缓存前按
+SHARED_CACHE_BUS_POLL_SECONDS 节流拉取，L1 的最大陈旧时间即该间隔。
+
+共享层出错时降级为仅 L1（SHARED_CACHE_RETRY_SECONDS 后再尝试），不影响业务读写。
+缓存值需可 JSON 序列化。
+"""
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from memory_cache import TTLCache, get_cache
+
+BACKEND_ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+load_dotenv(BACKEND_ENV_PATH, override=True)
+
+try:
+    import redis  # 可选依赖：仅 redis 后端需要
+    _REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    _REDIS_AVAILABLE = False
+
+SHARED_CACHE_BACKEND = str(os.getenv("SHARED_CACHE_BACKEND", "auto")).strip().lower()
+SHARED_CACHE_REDIS_URL = str(os.getenv("SHARED_CACHE_REDIS_URL") or os.getenv("REDIS_URL") or "").strip()
+SHARED_CACHE_SQLITE_PATH = str(
+    os.getenv("SHARED_CACHE_SQLITE_PATH")
+    or os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "food_link_shared_cache.sqlite3")
+)
+# sqlite 后端：失效日志拉取间隔（秒）、共享层最多保留的条目数
+SHARED_CACHE_BUS_POLL_SECONDS = float(os.getenv("SHARED_CACHE_BUS_POLL_SECONDS", "0.5"))
+SHARED_CACHE_SQLITE_MAX_ROWS = int(os.getenv("SHARED_CACHE_SQLITE_MAX_ROWS", "20000"))
+# 共享层出错后暂停使用的秒数
+SHARED_CACHE_RETRY_SECONDS = 30.0
+
+SHARED_CACHE_CHANNEL = "food_link_cache_invalidation"
+_INVALIDATION_LOG_RETENTION_SECONDS = 600.0
+_PRUNE_EVERY_WRITES = 200
+
+# 本进程标识：忽略自己发布的失效消息（本地已清理）。
+# 带上 pid：fork 出的 Worker 会继承模块级随机串，仅凭它会把兄弟进程的消息当成自己的而漏掉失效
+_ORIGIN_SEED = uuid.uuid4().hex
+_MISSING = object()
+
+
+def _origin() -> str:
+    return f"{_ORIGIN_SEED}:{os.getpid()}"
+
+
+class _SqliteBackend:
+    """同机多进程共享的 SQLite 替身：条目表 + 失效日志表。连接按进程、线程各自创建。"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._last_seen_id: Optional[int] = None
+        self._last_poll = 0.0
+        self._poll_lock = threading.Lock()
+        self._conn().execute("SELECT 1")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_invalidations ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, message TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl_seconds: float) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl_seconds),
+        )
+        self._writes += 1
+        if self._writes % _PRUNE_EVERY_WRITES == 0:
+            self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        now = time.time()
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM cache_entries WHERE key IN ("
+            "SELECT key FROM cache_entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (max(1, SHARED_CACHE_SQLITE_MAX_ROWS),),
+        )
+        conn.execute("DELETE FROM cache_invalidations WHERE created_at < ?", (now - _INVALIDATION_LOG_RETENTION_SECONDS,))
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        self._conn().execute("DELETE FROM cache_entries WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        self._conn().execute(
+            "INSERT INTO cache_invalidations (message, created_at) VALUES (?, ?)",
+            (json.dumps(message), time.time()),
+        )
+
+    def start_listener(self, handler: Callable[[Dict[str, Any]], None]) -> None:
+        """sqlite 没有推送：记录当前日志位置，之后由 poll 拉取。"""
+        row = self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM cache_invalidations").fetchone()
+        self._last_seen_id = int(row[0])
+        self._handler = handler
+
+    def poll(self) -> None:
+        now = time.monotonic()
+        if self._last_seen_id is None or now - self._last_poll < SHARED_CACHE_BUS_POLL_SECONDS:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_poll = now
+            rows = self._conn().execute(
+                "SELECT id, message FROM cache_invalidations WHERE id > ? ORDER BY id", (self._last_seen_id,)
+            ).fetchall()
+            for row_id, message in rows:
+                self._last_seen_id = row_id
+                self._handler(json.loads(message))
+        finally:
+            self._poll_lock.release()
+
+
+class _RedisBackend:
+    """Redis 协议后端：条目用 SET EX 存储，失效消息走 Pub/Sub。"""
+
+    name = "redis"
+
+    def __init__(self, url: str) -> None:
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.client.ping()
+        self._pubsub_thread: Any = None
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl_seconds: float) -> None:
+        self.client.set(key, value, ex=max(1, int(math.ceil(ttl_seconds))))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+    def delete_prefix(self, prefix: str) -> None:
+        escaped = "".join(f"\\{ch}" if ch in "*?[]\\" else ch for ch in prefix)
+        keys = list(self.client.scan_iter(match=escaped + "*", count=500))
+        if keys:
+            self.client.delete(*keys)
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        self.client.publish(SHARED_CACHE_CHANNEL, json.dumps(message))
+
+    def start_listener(self, handler: Callable[[Dict[str, Any]], None]) -> None:
+        def on_message(raw: Dict[str, Any]) -> None:
+            try:
+                handler(json.loads(raw["data"]))
+            except Exception as e:
+                print(f"[shared_cache] 处理失效消息失败: {e}", flush=True)
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{SHARED_CACHE_CHANNEL: on_message})
+        self._pubsub_thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def poll(self) -> None:
+        return None
+
+
+class _SharedTier:
+    """进程内唯一的共享层连接与失效总线（延迟初始化，按进程区分）。"""
+
+    def __init__(self) -> None:
+        self._backend: Any = None
+        self._pid: Optional[int] = None
+        self._disabled_until = 0.0
+        self._lock = threading.Lock()
+
+    def backend(self) -> Any:
+        if self._pid == os.getpid() and self._backend is not None:
+            return self._backend
+        if time.monotonic() < self._disabled_until:
+            return None
+        with self._lock:
+            if self._pid == os.getpid() and self._backend is not None:
+                return self._backend
+            self._pid = os.getpid()
+            self._backend = self._connect()
+            if self._backend is not None:
+                try:
+                    self._backend.start_listener(_apply_invalidation)
+                except Exception as e:
+                    self.fail("订阅失效消息", e)
+            return self._backend
+
+    def _connect(self) -> Any:
+        kind = SHARED_CACHE_BACKEND
+        if kind == "local":
+            self._disabled_until = float("inf")
+            return None
+        if kind == "auto":
+            kind = "redis" if SHARED_CACHE_REDIS_URL and _REDIS_AVAILABLE else "sqlite"
+        try:
+            if kind == "redis":
+                if not _REDIS_AVAILABLE or not SHARED_CACHE_REDIS_URL:
+                    raise RuntimeError("缺少 redis 包或 SHARED_CACHE_REDIS_URL")
+                return _RedisBackend(SHARED_CACHE_REDIS_URL)
+            return _SqliteBackend(SHARED_CACHE_SQLITE_PATH)
+        except Exception as e:
+            self.fail(f"连接 {kind} 共享层", e)
+            return None
+
+    def fail(self, action: str, err: Exception) -> None:
+        """共享层出错：本进程暂停使用一段时间，期间仅走 L1。"""
+        print(f"[shared_cache] {action}失败，{SHARED_CACHE_RETRY_SECONDS:.0f}s 内仅使用进程内缓存: {str(err)[:120]}", flush=True)
+        self._backend = None
+        self._disabled_until = time.monotonic() + SHARED_CACHE_RETRY_SECONDS
+
+    def reset(self) -> None:
+        with self._lock:
+            self._backend = None
+            self._pid = None
+            self._disabled_until = 0.0
+
+
+_tier = _SharedTier()
+_namespaces: Dict[str, "SharedCache"] = {}
+_namespaces_lock = threading.Lock()
+
+
+def _apply_invalidation(message: Dict[str, Any]) -> None:
+    if message.get("origin") == _origin():
+        return
+    cache = _namespaces.get(str(message.get("namespace") or ""))
+    if cache is None:
+        return
+    if message.get("mode") == "prefix":
+        cache.local.invalidate_prefix(str(message.get("key") or ""))
+    else:
+        cache.local.delete(str(message.get("key") or ""))
+
+
+class SharedCache:
+    """
+    跨进程共享缓存的一个命名空间（如 friend_ids、checkin_leaderboard）。
+
+    key 在共享层中存为 "{namespace}:{key}"；接口与 TTLCache 相近：get / set / invalidate / invalidate_prefix。
+    """
+
+    def __init__(self, namespace: str, *, maxsize: Optional[int] = None, ttl_seconds: float = 300) -> None:
+        self.namespace = namespace
+        self.ttl_seconds = float(ttl_seconds)
+        self.local: TTLCache = get_cache(namespace, maxsize=maxsize, ttl_seconds=ttl_seconds)
+
+    def _shared_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _call(self, action: str, fn: Callable[[Any], Any]) -> Any:
+        backend = _tier.backend()
+        if backend is None:
+            return None
+        try:
+            return fn(backend)
+        except Exception as e:
+            _tier.fail(action, e)
+            return None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self._call("拉取失效消息", lambda b: b.poll())
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        raw = self._call("读取共享缓存", lambda b: b.get(self._shared_key(key)))
+        if raw is None:
+            return default
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return default
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else float(ttl_seconds)
+        self.local.set(key, value, ttl_seconds=ttl)
+        try:
+            raw = json.dumps(value, ensure_ascii=False, default=str)
+        except (TypeError, ValueError):
+            return
+        self._call("写入共享缓存", lambda b: b.set(self._shared_key(key), raw, ttl))
+
+    def _broadcast(self, key: str, mode: str) -> None:
+        message = {"origin": _origin(), "namespace": self.namespace, "key": key, "mode": mode}
+        self._call("发布失效消息", lambda b: b.publish(message))
+
+    def invalidate(self, key: str) -> None:
+        """删除单个 key（本进程、共享层，并广播给其他进程）。"""
+        self.local.delete(key)
+        self._call("删除共享缓存", lambda b: b.delete(self._shared_key(key)))
+        self._broadcast(key, "key")
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        """删除所有以 prefix 开头的 key（本进程、共享层，并广播给其他进程）。"""
+        self.local.invalidate_prefix(prefix)
+        self._call("删除共享缓存", lambda b: b.delete_prefix(self._shared_key(prefix)))
+        self._broadcast(prefix, "prefix")
+
+    def clear(self) -> None:
+        self.invalidate_prefix("")
+
+
+def get_shared_cache(namespace: str, *, maxsize: Optional[int] = None, ttl_seconds: float = 300) -> SharedCache:
+    """按命名空间获取共享缓存（首次调用时创建并登记，用于接收其他进程的失效消息）。"""
+    with _namespaces_lock:
+        cache = _namespaces.get(namespace)
+        if cache is None:
+            cache = SharedCache(namespace, maxsize=maxsize, ttl_seconds=ttl_seconds)
+            _namespaces[namespace] = cache
+        return cache
+
+
+def shared_cache_backend_name() -> str:
+    """当前进程实际使用的共享层后端（未启用或降级时为 local）。"""
+    backend = _tier.backend()
+    return backend.name if backend is not None else "local"
+
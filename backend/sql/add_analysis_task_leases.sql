@@ -0,0 +1,114 @@
+-- analysis_tasks 租约（可见性超时）与心跳
+-- 执行位置：Supabase SQL Editor（需先执行 add_claim_analysis_tasks.sql）
+--
+-- 变更说明：
+--   1. analysis_tasks 新增 lease_expires_at / lease_owner / attempt_count
+--   2. claim_analysis_tasks 抢占时写入租约（默认 120 秒）与持有者，并累加 attempt_count
+--   3. heartbeat_analysis_tasks：Worker 处理期间定期续约，只续仍由自己持有的 processing 任务
+--   4. requeue_expired_analysis_tasks：租约过期（Worker 崩溃 / OOM / 被杀）的任务退回 pending 重新排队；
+--      已达最大尝试次数的标记为 failed，不再让用户无限等待
+--
+-- 租约过期回收由 run_backend.py 的 Supervisor 定期调用；进行中的长任务有心跳续约，不会被误判超时。
+
+ALTER TABLE public.analysis_tasks
+  ADD COLUMN IF NOT EXISTS lease_expires_at timestamp with time zone NULL,
+  ADD COLUMN IF NOT EXISTS lease_owner text NULL,
+  ADD COLUMN IF NOT EXISTS attempt_count integer NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN public.analysis_tasks.lease_expires_at IS 'processing 任务的租约到期时间，Worker 心跳续约；过期视为 Worker 已失联';
+COMMENT ON COLUMN public.analysis_tasks.lease_owner IS '持有租约的 Worker（主机名:进程号）';
+COMMENT ON COLUMN public.analysis_tasks.attempt_count IS '已被抢占处理的次数';
+
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_processing_lease
+  ON public.analysis_tasks(lease_expires_at)
+  WHERE status = 'processing';
+
+DROP FUNCTION IF EXISTS public.claim_analysis_tasks(text, integer);
+
+CREATE OR REPLACE FUNCTION public.claim_analysis_tasks(
+  p_task_type text,
+  p_limit integer DEFAULT 1,
+  p_lease_seconds integer DEFAULT 120,
+  p_owner text DEFAULT NULL
+)
+RETURNS SETOF public.analysis_tasks
+LANGUAGE sql
+AS $$
+  WITH picked AS (
+    SELECT id
+    FROM public.analysis_tasks
+    WHERE status = 'pending'
+      AND task_type = p_task_type
+    ORDER BY created_at
+    LIMIT GREATEST(p_limit, 1)
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE public.analysis_tasks t
+  SET status = 'processing',
+      updated_at = now(),
+      lease_expires_at = now() + make_interval(secs => GREATEST(p_lease_seconds, 10)),
+      lease_owner = p_owner,
+      attempt_count = t.attempt_count + 1
+  FROM picked
+  WHERE t.id = picked.id
+  RETURNING t.*;
+$$;
+
+CREATE OR REPLACE FUNCTION public.heartbeat_analysis_tasks(
+  p_task_ids uuid[],
+  p_lease_seconds integer DEFAULT 120,
+  p_owner text DEFAULT NULL
+)
+RETURNS SETOF uuid
+LANGUAGE sql
+AS $$
+  UPDATE public.analysis_tasks
+  SET lease_expires_at = now() + make_interval(secs => GREATEST(p_lease_seconds, 10))
+  WHERE id = ANY (p_task_ids)
+    AND status = 'processing'
+    AND lease_owner IS NOT DISTINCT FROM p_owner
+  RETURNING id;
+$$;
+
+CREATE OR REPLACE FUNCTION public.requeue_expired_analysis_tasks(p_max_attempts integer DEFAULT 3)
+RETURNS TABLE (requeued integer, failed integer)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_requeued integer := 0;
+  v_failed integer := 0;
+BEGIN
+  WITH expired AS (
+    SELECT id, attempt_count
+    FROM public.analysis_tasks
+    WHERE status = 'processing'
+      AND lease_expires_at IS NOT NULL
+      AND lease_expires_at < now()
+    FOR UPDATE SKIP LOCKED
+  ), requeue AS (
+    UPDATE public.analysis_tasks t
+    SET status = 'pending',
+        lease_expires_at = NULL,
+        lease_owner = NULL,
+        updated_at = now()
+    FROM expired e
+    WHERE t.id = e.id
+      AND e.attempt_count < GREATEST(p_max_attempts, 1)
+    RETURNING t.id
+  ), give_up AS (
+    UPDATE public.analysis_tasks t
+    SET status = 'failed',
+        error_message = '分析服务中断，已重试多次仍未完成，请重新提交',
+        lease_expires_at = NULL,
+        updated_at = now()
+    FROM expired e
+    WHERE t.id = e.id
+      AND e.attempt_count >= GREATEST(p_max_attempts, 1)
+    RETURNING t.id
+  )
+  SELECT (SELECT COUNT(*) FROM requeue), (SELECT COUNT(*) FROM give_up)
+  INTO v_requeued, v_failed;
+
+  RETURN QUERY SELECT v_requeued, v_failed;
+END;
+$$;
@@ -0,0 +1,89 @@
+-- analysis_tasks 优先级与按用户公平调度
+-- 执行位置：Supabase SQL Editor（需先执行 add_analysis_task_leases.sql）
+--
+-- 变更说明：
+--   1. analysis_tasks 新增 priority（数值越大越先处理）：后台任务 0 / 用户交互任务 10 / 付费会员交互任务 15，
+--      由后端创建任务时写入（database.analysis_task_priority），精准模式子任务继承父任务优先级
+--   2. claim_analysis_tasks 不再严格按 created_at 先到先得，而是依次按：
+--      a) 有效优先级 = priority + 等待老化加成（每等待 p_aging_seconds 秒 +1，最多 +9），
+--         老化保证后台任务与免费用户不会被饿死，但永远追不上刚提交的高一档交互任务；
+--      b) 用户轮次 = 该用户在本队列中排第几个 pending + 该用户正在处理中的任务数，
+--         即各用户轮流各取一条：某用户一次上传 20 张图只占自己的轮次，不会挡住其他用户的单张图；
+--      c) created_at 先后
+--   3. 仍然 FOR UPDATE SKIP LOCKED 一次往返抢占，租约参数与 add_analysis_task_leases.sql 一致
+--   4. UPDATE ... RETURNING 不保证返回顺序，因此每行 JSON 附带 effective_priority / user_turn，
+--      后端按与抢占相同的键排序后再分发（返回类型由 SETOF analysis_tasks 改为 SETOF jsonb）
+--   5. 新增部分索引 idx_analysis_tasks_pending_user_priority (task_type, user_id, priority DESC, created_at) WHERE status = 'pending'，
+--      列顺序与用户轮次窗口 PARTITION BY user_id ORDER BY priority DESC, created_at 一致，窗口按索引顺序读取无需额外排序
+--
+-- 排序只在该队列的 pending 积压上计算（原有的 idx_analysis_tasks_pending_type_created 同样可用于按 task_type 过滤），
+-- 积压清空时开销可忽略。
+
+ALTER TABLE public.analysis_tasks
+  ADD COLUMN IF NOT EXISTS priority smallint NOT NULL DEFAULT 10;
+
+COMMENT ON COLUMN public.analysis_tasks.priority IS '调度优先级，越大越先处理：0 后台 / 10 交互 / 15 付费会员交互';
+
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_pending_user_priority
+  ON public.analysis_tasks(task_type, user_id, priority DESC, created_at)
+  WHERE status = 'pending';
+
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_processing_user
+  ON public.analysis_tasks(task_type, user_id)
+  WHERE status = 'processing';
+
+DROP FUNCTION IF EXISTS public.claim_analysis_tasks(text, integer, integer, text);
+DROP FUNCTION IF EXISTS public.claim_analysis_tasks(text, integer, integer, text, integer);
+
+CREATE OR REPLACE FUNCTION public.claim_analysis_tasks(
+  p_task_type text,
+  p_limit integer DEFAULT 1,
+  p_lease_seconds integer DEFAULT 120,
+  p_owner text DEFAULT NULL,
+  p_aging_seconds integer DEFAULT 30
+)
+RETURNS SETOF jsonb
+LANGUAGE sql
+AS $$
+  WITH inflight AS (
+    SELECT user_id, COUNT(*)::integer AS processing_count
+    FROM public.analysis_tasks
+    WHERE status = 'processing'
+      AND task_type = p_task_type
+    GROUP BY user_id
+  ), ranked AS (
+    SELECT
+      p.id,
+      p.created_at,
+      p.priority + LEAST(
+        FLOOR(GREATEST(EXTRACT(EPOCH FROM (now() - p.created_at)), 0) / GREATEST(p_aging_seconds, 1))::integer,
+        9
+      ) AS effective_priority,
+      ROW_NUMBER() OVER (PARTITION BY p.user_id ORDER BY p.priority DESC, p.created_at)
+        + COALESCE(i.processing_count, 0) AS user_turn
+    FROM public.analysis_tasks p
+    LEFT JOIN inflight i ON i.user_id = p.user_id
+    WHERE p.status = 'pending'
+      AND p.task_type = p_task_type
+  ), picked AS (
+    SELECT t.id, r.effective_priority, r.user_turn
+    FROM public.analysis_tasks t
+    JOIN ranked r ON r.id = t.id
+    WHERE t.status = 'pending'
+    ORDER BY r.effective_priority DESC, r.user_turn, r.created_at
+    LIMIT GREATEST(p_limit, 1)
+    FOR UPDATE OF t SKIP LOCKED
+  )
+  UPDATE public.analysis_tasks t
+  SET status = 'processing',
+      updated_at = now(),
+      lease_expires_at = now() + make_interval(secs => GREATEST(p_lease_seconds, 10)),
+      lease_owner = p_owner,
+      attempt_count = t.attempt_count + 1
+  FROM picked
+  WHERE t.id = picked.id
+  RETURNING to_jsonb(t.*) || jsonb_build_object(
+    'effective_priority', picked.effective_priority,
+    'user_turn', picked.user_turn
+  );
+$$;
@@ -0,0 +1,34 @@
+-- analysis_tasks 批量原子抢占
+-- 执行位置：Supabase SQL Editor
+--
+-- 变更说明：
+--   1. claim_analysis_tasks(p_task_type, p_limit)：一条语句把最早的至多 p_limit 条 pending 任务置为 processing 并返回；
+--      FOR UPDATE SKIP LOCKED 让并发 Worker 各自跳过已被锁定的行，不再出现「先查后改」落空的抢占
+--   2. 按 (task_type, created_at) 建 pending 部分索引，抢占只扫描待处理任务
+--
+-- Worker 通过 claim_pending_tasks_sync 调用（RPC），一次往返即可取得一批任务。
+
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_pending_type_created
+  ON public.analysis_tasks(task_type, created_at)
+  WHERE status = 'pending';
+
+CREATE OR REPLACE FUNCTION public.claim_analysis_tasks(p_task_type text, p_limit integer DEFAULT 1)
+RETURNS SETOF public.analysis_tasks
+LANGUAGE sql
+AS $$
+  WITH picked AS (
+    SELECT id
+    FROM public.analysis_tasks
+    WHERE status = 'pending'
+      AND task_type = p_task_type
+    ORDER BY created_at
+    LIMIT GREATEST(p_limit, 1)
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE public.analysis_tasks t
+  SET status = 'processing',
+      updated_at = now()
+  FROM picked
+  WHERE t.id = picked.id
+  RETURNING t.*;
+$$;
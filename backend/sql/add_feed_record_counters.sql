@@ -0,0 +1,122 @@
+-- 圈子动态点赞/评论计数列
+-- 执行位置：Supabase SQL Editor（需先执行 database/feed_likes_comments.sql）
+--
+-- 变更说明：
+--   1. user_food_records 新增 like_count / comment_count，Feed 列表直接读取，不再为计数下载全部点赞/评论行
+--   2. feed_likes / feed_comments 的 AFTER INSERT / DELETE 触发器在同一事务内 col = col ± 1 原子维护计数，
+--      后端不再单独调用 RPC（早期版本的 adjust_food_record_feed_counters 一并删除）；级联删除的回复同样会扣减
+--   3. recount_food_record_feed_counters：按实际点赞/评论行重算（计数校正用）
+--   4. list_feed_comment_previews：按动态取最近 N 条评论，评论预览不再下载整条动态的全部评论
+--   5. 回填现有计数（期间锁住点赞/评论表，避免触发器与回填重复计数）
+
+ALTER TABLE public.user_food_records
+  ADD COLUMN IF NOT EXISTS like_count integer NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS comment_count integer NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN public.user_food_records.like_count IS '圈子动态点赞数（由 feed_likes 触发器维护）';
+COMMENT ON COLUMN public.user_food_records.comment_count IS '圈子动态评论数（由 feed_comments 触发器维护）';
+
+CREATE INDEX IF NOT EXISTS idx_feed_comments_record_id_created_at
+  ON public.feed_comments(record_id, created_at DESC);
+
+DROP FUNCTION IF EXISTS public.adjust_food_record_feed_counters(uuid, integer, integer);
+
+CREATE OR REPLACE FUNCTION public.track_feed_like_count()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE public.user_food_records
+    SET like_count = like_count + 1
+    WHERE id = NEW.record_id;
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE public.user_food_records
+    SET like_count = GREATEST(0, like_count - 1)
+    WHERE id = OLD.record_id;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.track_feed_comment_count()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE public.user_food_records
+    SET comment_count = comment_count + 1
+    WHERE id = NEW.record_id;
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE public.user_food_records
+    SET comment_count = GREATEST(0, comment_count - 1)
+    WHERE id = OLD.record_id;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.recount_food_record_feed_counters(p_record_ids uuid[])
+RETURNS void
+LANGUAGE sql
+AS $$
+  UPDATE public.user_food_records r
+  SET like_count = (SELECT COUNT(*) FROM public.feed_likes l WHERE l.record_id = r.id),
+      comment_count = (SELECT COUNT(*) FROM public.feed_comments c WHERE c.record_id = r.id)
+  WHERE r.id = ANY (p_record_ids);
+$$;
+
+CREATE OR REPLACE FUNCTION public.list_feed_comment_previews(p_record_ids uuid[], p_limit integer)
+RETURNS TABLE (
+  id uuid,
+  user_id uuid,
+  record_id uuid,
+  parent_comment_id uuid,
+  reply_to_user_id uuid,
+  content text,
+  created_at timestamp with time zone
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT t.id, t.user_id, t.record_id, t.parent_comment_id, t.reply_to_user_id, t.content, t.created_at
+  FROM (
+    SELECT c.*, ROW_NUMBER() OVER (PARTITION BY c.record_id ORDER BY c.created_at DESC) AS rn
+    FROM public.feed_comments c
+    WHERE c.record_id = ANY (p_record_ids)
+  ) t
+  WHERE t.rn <= GREATEST(p_limit, 0)
+  ORDER BY t.record_id, t.created_at ASC;
+$$;
+
+BEGIN;
+
+-- 回填期间挡住点赞/评论写入，避免触发器与回填重复计数
+LOCK TABLE public.feed_likes IN SHARE ROW EXCLUSIVE MODE;
+LOCK TABLE public.feed_comments IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS trg_feed_likes_count ON public.feed_likes;
+CREATE TRIGGER trg_feed_likes_count
+  AFTER INSERT OR DELETE ON public.feed_likes
+  FOR EACH ROW
+  EXECUTE FUNCTION public.track_feed_like_count();
+
+DROP TRIGGER IF EXISTS trg_feed_comments_count ON public.feed_comments;
+CREATE TRIGGER trg_feed_comments_count
+  AFTER INSERT OR DELETE ON public.feed_comments
+  FOR EACH ROW
+  EXECUTE FUNCTION public.track_feed_comment_count();
+
+-- 回填
+UPDATE public.user_food_records r
+SET like_count = l.cnt
+FROM (SELECT record_id, COUNT(*)::integer AS cnt FROM public.feed_likes GROUP BY record_id) l
+WHERE r.id = l.record_id;
+
+UPDATE public.user_food_records r
+SET comment_count = c.cnt
+FROM (SELECT record_id, COUNT(*)::integer AS cnt FROM public.feed_comments GROUP BY record_id) c
+WHERE r.id = c.record_id;
+
+COMMIT;
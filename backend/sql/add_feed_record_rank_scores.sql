@@ -0,0 +1,138 @@
+-- 圈子动态排序得分物化
+-- 执行位置：Supabase SQL Editor（需先执行 add_feed_record_counters.sql）
+--
+-- 变更说明：
+--   1. 新增打分函数 food_record_balance_score / food_record_feed_hot_score / food_record_feed_fresh_score，
+--      公式与原后端 _compute_macro_balance_score / _compute_feed_hot_score / _compute_freshness_score 一致
+--   2. user_food_records 新增 feed_fresh_score（新鲜度，72 小时内线性衰减到 0）：
+--      新增或修改 record_time 时由触发器写入，之后由 decay_food_record_feed_fresh_scores() 定期衰减
+--   3. 新增生成列 feed_hot_rank / feed_balanced_rank / feed_recommend_rank，
+--      由营养素、like_count / comment_count 与 feed_fresh_score 计算，点赞/评论计数或营养素变化时数据库自动刷新
+--   4. 建立 (rank, record_time, id) 索引，Feed 直接 ORDER BY <rank> DESC, record_time DESC, id DESC LIMIT n，
+--      不再在 API 进程内逐条打分排序（早期版本的索引以 record_time 为首列，这里先删除再重建）
+--
+-- 衰减任务：run_backend.py 启动的 feed-score Worker 每 FEED_SCORE_DECAY_INTERVAL_SECONDS 秒调用一次；
+-- 若项目已启用 pg_cron，也可改为：
+--   SELECT cron.schedule('decay-feed-fresh-scores', '*/10 * * * *', 'SELECT public.decay_food_record_feed_fresh_scores()');
+
+CREATE OR REPLACE FUNCTION public.food_record_balance_score(p_protein numeric, p_carbs numeric, p_fat numeric)
+RETURNS double precision
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE
+    WHEN t.total_kcal <= 0 THEN 0::double precision
+    ELSE round((GREATEST(0, 1 - (
+      abs(t.protein_kcal / t.total_kcal - 0.30)
+      + abs(t.carbs_kcal / t.total_kcal - 0.40)
+      + abs(t.fat_kcal / t.total_kcal - 0.30)
+    ) / 0.9) * 100)::numeric, 2)::double precision / 100
+  END
+  FROM (
+    SELECT
+      GREATEST(COALESCE(p_protein, 0), 0) * 4 AS protein_kcal,
+      GREATEST(COALESCE(p_carbs, 0), 0) * 4 AS carbs_kcal,
+      GREATEST(COALESCE(p_fat, 0), 0) * 9 AS fat_kcal,
+      GREATEST(COALESCE(p_protein, 0), 0) * 4 + GREATEST(COALESCE(p_carbs, 0), 0) * 4 + GREATEST(COALESCE(p_fat, 0), 0) * 9 AS total_kcal
+  ) t;
+$$;
+
+CREATE OR REPLACE FUNCTION public.food_record_feed_hot_score(p_like_count integer, p_comment_count integer)
+RETURNS double precision
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT LEAST((GREATEST(COALESCE(p_like_count, 0), 0) * 2 + GREATEST(COALESCE(p_comment_count, 0), 0) * 3) / 30.0, 1.0)::double precision;
+$$;
+
+CREATE OR REPLACE FUNCTION public.food_record_feed_fresh_score(p_record_time timestamp with time zone, p_now timestamp with time zone)
+RETURNS double precision
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE
+    WHEN p_record_time IS NULL THEN 0::double precision
+    ELSE GREATEST(0, 1 - LEAST(GREATEST(EXTRACT(EPOCH FROM (p_now - p_record_time)) / 3600.0, 0), 72) / 72)::double precision
+  END;
+$$;
+
+ALTER TABLE public.user_food_records
+  ADD COLUMN IF NOT EXISTS feed_fresh_score double precision NOT NULL DEFAULT 0;
+
+ALTER TABLE public.user_food_records
+  ADD COLUMN IF NOT EXISTS feed_hot_rank double precision GENERATED ALWAYS AS (
+    public.food_record_feed_hot_score(like_count, comment_count) * 100
+    + feed_fresh_score * 10
+    + public.food_record_balance_score(total_protein, total_carbs, total_fat) * 8
+  ) STORED,
+  ADD COLUMN IF NOT EXISTS feed_balanced_rank double precision GENERATED ALWAYS AS (
+    public.food_record_balance_score(total_protein, total_carbs, total_fat) * 100
+    + public.food_record_feed_hot_score(like_count, comment_count) * 12
+    + feed_fresh_score * 6
+  ) STORED,
+  ADD COLUMN IF NOT EXISTS feed_recommend_rank double precision GENERATED ALWAYS AS (
+    public.food_record_balance_score(total_protein, total_carbs, total_fat) * 20
+    + public.food_record_feed_hot_score(like_count, comment_count) * 18
+    + feed_fresh_score * 12
+  ) STORED;
+
+COMMENT ON COLUMN public.user_food_records.feed_fresh_score IS '新鲜度得分 0~1（72 小时线性衰减），由触发器写入、decay_food_record_feed_fresh_scores 定期衰减';
+COMMENT ON COLUMN public.user_food_records.feed_hot_rank IS '圈子「热门」排序得分（生成列）';
+COMMENT ON COLUMN public.user_food_records.feed_balanced_rank IS '圈子「均衡」排序得分（生成列）';
+COMMENT ON COLUMN public.user_food_records.feed_recommend_rank IS '圈子「推荐」排序得分中与浏览者无关的部分（生成列）';
+
+CREATE OR REPLACE FUNCTION public.set_food_record_feed_fresh_score()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.feed_fresh_score := public.food_record_feed_fresh_score(NEW.record_time, now());
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_user_food_records_feed_fresh_score ON public.user_food_records;
+CREATE TRIGGER trg_user_food_records_feed_fresh_score
+  BEFORE INSERT OR UPDATE OF record_time ON public.user_food_records
+  FOR EACH ROW
+  EXECUTE FUNCTION public.set_food_record_feed_fresh_score();
+
+-- 只有 72 小时内的记录得分非 0，衰减任务只扫描这部分
+CREATE OR REPLACE FUNCTION public.decay_food_record_feed_fresh_scores()
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_updated integer;
+BEGIN
+  UPDATE public.user_food_records
+  SET feed_fresh_score = public.food_record_feed_fresh_score(record_time, now())
+  WHERE feed_fresh_score > 0;
+  GET DIAGNOSTICS v_updated = ROW_COUNT;
+  RETURN v_updated;
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_user_food_records_feed_fresh
+  ON public.user_food_records(record_time)
+  WHERE feed_fresh_score > 0;
+
+DROP INDEX IF EXISTS public.idx_user_food_records_feed_hot_rank;
+CREATE INDEX IF NOT EXISTS idx_user_food_records_feed_hot_rank
+  ON public.user_food_records(feed_hot_rank DESC, record_time DESC, id DESC)
+  WHERE hidden_from_feed IS NOT TRUE;
+
+DROP INDEX IF EXISTS public.idx_user_food_records_feed_balanced_rank;
+CREATE INDEX IF NOT EXISTS idx_user_food_records_feed_balanced_rank
+  ON public.user_food_records(feed_balanced_rank DESC, record_time DESC, id DESC)
+  WHERE hidden_from_feed IS NOT TRUE;
+
+DROP INDEX IF EXISTS public.idx_user_food_records_feed_recommend_rank;
+CREATE INDEX IF NOT EXISTS idx_user_food_records_feed_recommend_rank
+  ON public.user_food_records(feed_recommend_rank DESC, record_time DESC, id DESC)
+  WHERE hidden_from_feed IS NOT TRUE;
+
+-- 回填最近 72 小时记录的新鲜度（更早的记录默认 0 即为正确值）
+UPDATE public.user_food_records
+SET feed_fresh_score = public.food_record_feed_fresh_score(record_time, now())
+WHERE record_time > now() - interval '72 hours';
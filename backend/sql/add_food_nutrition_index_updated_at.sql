@@ -0,0 +1,33 @@
+-- 食物营养库进程内索引：按 updated_at 增量刷新
+-- 执行位置：Supabase SQL Editor
+--
+-- 变更说明：
+--   1. food_nutrition_library / food_nutrition_aliases 在 UPDATE 时自动刷新 updated_at，
+--      保证脚本或后台直接改库的变更也能被 Worker/API 的增量刷新拉到
+--   2. 为 updated_at 建索引，增量刷新查询 (updated_at > watermark) 走索引
+
+CREATE OR REPLACE FUNCTION update_food_nutrition_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_update_food_nutrition_library_updated_at ON public.food_nutrition_library;
+CREATE TRIGGER trigger_update_food_nutrition_library_updated_at
+  BEFORE UPDATE ON public.food_nutrition_library
+  FOR EACH ROW
+  EXECUTE FUNCTION update_food_nutrition_updated_at();
+
+DROP TRIGGER IF EXISTS trigger_update_food_nutrition_aliases_updated_at ON public.food_nutrition_aliases;
+CREATE TRIGGER trigger_update_food_nutrition_aliases_updated_at
+  BEFORE UPDATE ON public.food_nutrition_aliases
+  FOR EACH ROW
+  EXECUTE FUNCTION update_food_nutrition_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_food_nutrition_library_updated_at
+  ON public.food_nutrition_library(updated_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_food_nutrition_aliases_updated_at
+  ON public.food_nutrition_aliases(updated_at, id);
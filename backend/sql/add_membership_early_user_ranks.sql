@@ -0,0 +1,160 @@
+-- 创始用户名次表（首批注册用户 / 首批付费会员）
+-- 执行位置：Supabase SQL Editor
+--
+-- 变更说明：
+--   1. 新增 membership_early_user_ranks(kind, user_id, rank)：名次一经分配不再变化，
+--      会员/积分接口按 user_id 读一行，不再每次扫描 1000 行 weapp_user、5000 条支付记录后在后端排序
+--      kind = 'registration'：按注册时间升序的前 N 名（与后端 resolve_user_registration_datetime 取同一组时间字段）
+--      kind = 'paid'：按首笔会员订阅支付时间升序的前 N 名用户（排除积分充值等非会员单）
+--   2. assign_membership_early_user_ranks(kind, limit)：名额未满时按顺序补齐，已分配的名次保持不变；
+--      同一 kind 用 advisory lock 串行，并发注册/支付不会分到重复名次；
+--      先不加锁检查名额，已满时直接返回，避免名额满后每次注册/支付仍在同一把锁上排队，加锁后再复查一次
+--   3. weapp_user 新增用户、会员支付记录变为 paid 时由触发器补齐名次（名额满后直接返回）
+--   4. 回填现有名次
+--
+-- 名额（1000 / 100）须与 main.py 中 EARLY_USER_TRIAL_LIMIT / EARLY_PAID_USER_LIMIT 一致。
+
+CREATE TABLE IF NOT EXISTS public.membership_early_user_ranks (
+  kind text NOT NULL CHECK (kind IN ('registration', 'paid')),
+  user_id uuid NOT NULL REFERENCES public.weapp_user(id) ON DELETE CASCADE,
+  rank integer NOT NULL CHECK (rank > 0),
+  assigned_at timestamp with time zone NOT NULL DEFAULT now(),
+  PRIMARY KEY (kind, user_id),
+  UNIQUE (kind, rank)
+);
+
+CREATE INDEX IF NOT EXISTS idx_membership_early_user_ranks_user_id
+  ON public.membership_early_user_ranks(user_id);
+
+COMMENT ON TABLE public.membership_early_user_ranks IS '创始用户名次（首批注册 / 首批付费会员），分配后不变';
+
+CREATE OR REPLACE FUNCTION public.try_parse_timestamptz(p_value text)
+RETURNS timestamp with time zone
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+BEGIN
+  IF p_value IS NULL OR btrim(p_value) = '' THEN
+    RETURN NULL;
+  END IF;
+  RETURN p_value::timestamp with time zone;
+EXCEPTION WHEN others THEN
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.assign_membership_early_user_ranks(p_kind text, p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_assigned integer;
+  v_max_rank integer;
+  v_inserted integer := 0;
+BEGIN
+  IF p_kind NOT IN ('registration', 'paid') OR COALESCE(p_limit, 0) <= 0 THEN
+    RETURN 0;
+  END IF;
+
+  -- 名额已满（名次只增不减）：无需加锁
+  SELECT COUNT(*) INTO v_assigned
+  FROM public.membership_early_user_ranks
+  WHERE kind = p_kind;
+  IF v_assigned >= p_limit THEN
+    RETURN 0;
+  END IF;
+
+  PERFORM pg_advisory_xact_lock(hashtext('membership_early_user_ranks:' || p_kind));
+
+  -- 加锁后复查：等锁期间其他事务可能已补齐名额
+  SELECT COUNT(*), COALESCE(MAX(rank), 0) INTO v_assigned, v_max_rank
+  FROM public.membership_early_user_ranks
+  WHERE kind = p_kind;
+  IF v_assigned >= p_limit THEN
+    RETURN 0;
+  END IF;
+
+  IF p_kind = 'registration' THEN
+    INSERT INTO public.membership_early_user_ranks (kind, user_id, rank)
+    SELECT 'registration', c.id, v_max_rank + ROW_NUMBER() OVER (ORDER BY c.registered_at, c.id::text)
+    FROM (
+      SELECT u.id,
+             COALESCE(
+               public.try_parse_timestamptz(to_jsonb(u) ->> 'created_at'),
+               public.try_parse_timestamptz(to_jsonb(u) ->> 'create_time'),
+               public.try_parse_timestamptz(to_jsonb(u) ->> 'created_time'),
+               public.try_parse_timestamptz(to_jsonb(u) ->> 'register_time'),
+               public.try_parse_timestamptz(to_jsonb(u) ->> 'registered_at'),
+               public.try_parse_timestamptz(to_jsonb(u) ->> 'updated_at')
+             ) AS registered_at
+      FROM public.weapp_user u
+      WHERE NOT EXISTS (
+        SELECT 1 FROM public.membership_early_user_ranks r
+        WHERE r.kind = 'registration' AND r.user_id = u.id
+      )
+    ) c
+    WHERE c.registered_at IS NOT NULL
+    ORDER BY c.registered_at, c.id::text
+    LIMIT p_limit - v_assigned;
+  ELSE
+    INSERT INTO public.membership_early_user_ranks (kind, user_id, rank)
+    SELECT 'paid', f.user_id, v_max_rank + ROW_NUMBER() OVER (ORDER BY f.first_paid_at, f.first_created_at, f.id)
+    FROM (
+      SELECT DISTINCT ON (p.user_id)
+             p.user_id,
+             COALESCE(p.paid_at, p.created_at, 'infinity'::timestamptz) AS first_paid_at,
+             COALESCE(p.created_at, p.paid_at, 'infinity'::timestamptz) AS first_created_at,
+             p.id::text AS id
+      FROM public.pro_membership_payment_records p
+      WHERE p.status = 'paid'
+        AND p.user_id IS NOT NULL
+        AND (
+          lower(btrim(COALESCE(p.plan_code, ''))) = 'pro_monthly'
+          OR lower(btrim(COALESCE(p.plan_code, ''))) LIKE 'light\_%'
+          OR lower(btrim(COALESCE(p.plan_code, ''))) LIKE 'standard\_%'
+          OR lower(btrim(COALESCE(p.plan_code, ''))) LIKE 'advanced\_%'
+        )
+        AND NOT EXISTS (
+          SELECT 1 FROM public.membership_early_user_ranks r
+          WHERE r.kind = 'paid' AND r.user_id = p.user_id
+        )
+      ORDER BY p.user_id,
+               COALESCE(p.paid_at, p.created_at, 'infinity'::timestamptz),
+               COALESCE(p.created_at, p.paid_at, 'infinity'::timestamptz),
+               p.id::text
+    ) f
+    ORDER BY f.first_paid_at, f.first_created_at, f.id
+    LIMIT p_limit - v_assigned;
+  END IF;
+
+  GET DIAGNOSTICS v_inserted = ROW_COUNT;
+  RETURN v_inserted;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.assign_membership_early_user_ranks_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM public.assign_membership_early_user_ranks(TG_ARGV[0], TG_ARGV[1]::integer);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_weapp_user_assign_early_rank ON public.weapp_user;
+CREATE TRIGGER trg_weapp_user_assign_early_rank
+  AFTER INSERT ON public.weapp_user
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.assign_membership_early_user_ranks_trigger('registration', '1000');
+
+DROP TRIGGER IF EXISTS trg_membership_payment_assign_early_rank ON public.pro_membership_payment_records;
+CREATE TRIGGER trg_membership_payment_assign_early_rank
+  AFTER INSERT OR UPDATE OF status ON public.pro_membership_payment_records
+  FOR EACH ROW
+  WHEN (NEW.status = 'paid')
+  EXECUTE FUNCTION public.assign_membership_early_user_ranks_trigger('paid', '100');
+
+-- 回填
+SELECT public.assign_membership_early_user_ranks('registration', 1000);
+SELECT public.assign_membership_early_user_ranks('paid', 100);
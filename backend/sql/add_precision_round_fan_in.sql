@@ -0,0 +1,98 @@
+-- 精准模式并行估计的事件驱动汇聚（fan-in 倒计数）
+-- 执行位置：Supabase SQL Editor（需先执行 add_precision_sessions.sql、add_cancelled_status.sql、add_task_notify_triggers.sql）
+--
+-- 变更说明：
+--   1. analysis_tasks 新增 waiting 状态：precision_aggregate 任务创建时先挂起，Worker 不会抢占
+--   2. precision_session_rounds 新增 pending_estimate_count / aggregate_task_id：
+--      规划 Worker 在本轮 assistant 轮次上登记待完成的子项估计数与聚合任务
+--   3. precision_item_estimates 状态首次变为 done / failed 时由触发器原子减一；
+--      最后一个完成者把聚合任务从 waiting 置为 pending，notify_pending_task 触发器随即唤醒聚合 Worker。
+--      聚合 Worker 不再每秒轮询子项估计直到 PRECISION_MAX_AGGREGATE_WAIT_SECONDS
+--   4. release_stale_precision_aggregates：子任务丢失（租约过期重试耗尽、超时）导致倒计数无法归零时，
+--      由 Supervisor 定期把等待过久的聚合任务放行，聚合 Worker 将未完成的子项按失败处理
+--      （该兜底只由 run_backend.py 的 Supervisor 调用，单独运行 worker.py 时不会执行；
+--      规划 Worker 派发子任务中途失败时会直接撤销聚合任务，不依赖此兜底）
+
+ALTER TABLE public.analysis_tasks DROP CONSTRAINT IF EXISTS analysis_tasks_status_check;
+ALTER TABLE public.analysis_tasks ADD CONSTRAINT analysis_tasks_status_check CHECK (
+    status = ANY (
+        array[
+            'pending'::text,
+            'processing'::text,
+            'done'::text,
+            'failed'::text,
+            'timed_out'::text,
+            'violated'::text,
+            'cancelled'::text,
+            'waiting'::text
+        ]
+    )
+);
+
+COMMENT ON CONSTRAINT analysis_tasks_status_check ON public.analysis_tasks IS
+    '任务状态: pending(待处理), processing(处理中), done(完成), failed(失败), timed_out(超时), violated(违规), cancelled(已取消), waiting(等待子任务完成)';
+
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_waiting
+  ON public.analysis_tasks(created_at)
+  WHERE status = 'waiting';
+
+ALTER TABLE public.precision_session_rounds
+  ADD COLUMN IF NOT EXISTS pending_estimate_count integer NULL,
+  ADD COLUMN IF NOT EXISTS aggregate_task_id uuid NULL REFERENCES public.analysis_tasks(id) ON DELETE SET NULL;
+
+COMMENT ON COLUMN public.precision_session_rounds.pending_estimate_count IS '本轮尚未完成的子项估计数，归零时放行 aggregate_task_id；NULL 表示本轮不走队列汇聚';
+COMMENT ON COLUMN public.precision_session_rounds.aggregate_task_id IS '本轮等待子项估计完成的 precision_aggregate 任务';
+
+CREATE OR REPLACE FUNCTION public.precision_item_estimate_fan_in()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_aggregate_task_id uuid;
+BEGIN
+  IF NEW.status NOT IN ('done', 'failed') OR OLD.status IN ('done', 'failed') THEN
+    RETURN NULL;
+  END IF;
+
+  UPDATE public.precision_session_rounds
+  SET pending_estimate_count = pending_estimate_count - 1
+  WHERE session_id = NEW.session_id
+    AND round_index = NEW.round_index
+    AND actor_role = 'assistant'
+    AND pending_estimate_count > 0
+  RETURNING CASE WHEN pending_estimate_count = 0 THEN aggregate_task_id END
+  INTO v_aggregate_task_id;
+
+  IF v_aggregate_task_id IS NOT NULL THEN
+    UPDATE public.analysis_tasks
+    SET status = 'pending',
+        updated_at = now()
+    WHERE id = v_aggregate_task_id
+      AND status = 'waiting';
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_precision_item_estimates_fan_in ON public.precision_item_estimates;
+CREATE TRIGGER trg_precision_item_estimates_fan_in
+  AFTER UPDATE OF status ON public.precision_item_estimates
+  FOR EACH ROW
+  EXECUTE FUNCTION public.precision_item_estimate_fan_in();
+
+CREATE OR REPLACE FUNCTION public.release_stale_precision_aggregates(p_max_wait_seconds integer DEFAULT 120)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_released integer;
+BEGIN
+  UPDATE public.analysis_tasks
+  SET status = 'pending',
+      updated_at = now()
+  WHERE status = 'waiting'
+    AND created_at < now() - make_interval(secs => GREATEST(p_max_wait_seconds, 1));
+  GET DIAGNOSTICS v_released = ROW_COUNT;
+  RETURN v_released;
+END;
+$$;
@@ -0,0 +1,51 @@
+-- 异步任务入库通知（Worker 事件驱动唤醒）
+-- 执行位置：Supabase SQL Editor
+--
+-- 变更说明：
+--   1. analysis_tasks / comment_tasks / food_expiry_notification_jobs 新增或重新置为 pending 时 pg_notify，
+--      频道名即表名；负载分别为 task_type / comment_type / 空串
+--   2. Worker（task_wakeup.TaskWakeup）LISTEN 对应频道，收到通知立即抢占，轮询降为 WORKER_FALLBACK_POLL_SECONDS 的兜底
+--
+-- 通知在事务提交后才投递，Worker 醒来时任务行一定已可见。
+
+CREATE OR REPLACE FUNCTION public.notify_pending_task()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_payload text;
+BEGIN
+  IF NEW.status IS DISTINCT FROM 'pending' THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP = 'UPDATE' AND OLD.status IS NOT DISTINCT FROM 'pending' THEN
+    RETURN NULL;
+  END IF;
+
+  v_payload := CASE TG_TABLE_NAME
+    WHEN 'analysis_tasks' THEN COALESCE(to_jsonb(NEW) ->> 'task_type', '')
+    WHEN 'comment_tasks' THEN COALESCE(to_jsonb(NEW) ->> 'comment_type', '')
+    ELSE ''
+  END;
+  PERFORM pg_notify(TG_TABLE_NAME, v_payload);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_analysis_tasks_notify_pending ON public.analysis_tasks;
+CREATE TRIGGER trg_analysis_tasks_notify_pending
+  AFTER INSERT OR UPDATE OF status ON public.analysis_tasks
+  FOR EACH ROW
+  EXECUTE FUNCTION public.notify_pending_task();
+
+DROP TRIGGER IF EXISTS trg_comment_tasks_notify_pending ON public.comment_tasks;
+CREATE TRIGGER trg_comment_tasks_notify_pending
+  AFTER INSERT OR UPDATE OF status ON public.comment_tasks
+  FOR EACH ROW
+  EXECUTE FUNCTION public.notify_pending_task();
+
+DROP TRIGGER IF EXISTS trg_food_expiry_notification_jobs_notify_pending ON public.food_expiry_notification_jobs;
+CREATE TRIGGER trg_food_expiry_notification_jobs_notify_pending
+  AFTER INSERT OR UPDATE OF status ON public.food_expiry_notification_jobs
+  FOR EACH ROW
+  EXECUTE FUNCTION public.notify_pending_task();
@@ -0,0 +1,38 @@
+-- 任务队列积压统计（run_backend.py Worker 伸缩使用）
+-- 执行位置：Supabase SQL Editor（建议先执行 add_claim_analysis_tasks.sql，复用其 pending 部分索引）
+--
+-- 变更说明：
+--   1. get_task_queue_stats()：按队列返回待处理任务数与最早待处理时间，一次调用覆盖三类任务表：
+--      analysis_tasks 按 task_type 分组，comment_tasks 按 comment_type 分组，food_expiry_notification_jobs 只统计已到点的任务
+--   2. comment_tasks 新增 pending 部分索引
+
+CREATE INDEX IF NOT EXISTS idx_comment_tasks_pending_created
+  ON public.comment_tasks(created_at)
+  WHERE status = 'pending';
+
+CREATE OR REPLACE FUNCTION public.get_task_queue_stats()
+RETURNS TABLE (
+  queue text,
+  task_type text,
+  pending_count bigint,
+  oldest_pending_at timestamp with time zone
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT 'analysis_tasks'::text, t.task_type, COUNT(*), MIN(t.created_at)
+  FROM public.analysis_tasks t
+  WHERE t.status = 'pending'
+  GROUP BY t.task_type
+  UNION ALL
+  SELECT 'comment_tasks'::text, c.comment_type, COUNT(*), MIN(c.created_at)
+  FROM public.comment_tasks c
+  WHERE c.status = 'pending'
+  GROUP BY c.comment_type
+  UNION ALL
+  SELECT 'food_expiry_notification_jobs'::text, ''::text, COUNT(*), MIN(j.scheduled_at)
+  FROM public.food_expiry_notification_jobs j
+  WHERE j.status = 'pending'
+    AND j.scheduled_at <= now()
+  HAVING COUNT(*) > 0;
+$$;
@@ -0,0 +1,151 @@
+-- 每日系统积分占用计数（按用户 + 中国自然日物化）
+-- 执行位置：Supabase SQL Editor（需先执行 add_cancelled_status.sql / add_timed_out_status.sql）
+--
+-- 变更说明：
+--   1. 新增 user_daily_credit_usage(user_id, china_date, system_units)：积分概况直接读一行，
+--      不再下载 3 天内全部 analysis_tasks（含 payload）在后端重算
+--   2. analysis_task_credit_units_by_date：单个任务按日期占用的系统积分，规则与后端
+--      _get_task_system_credit_usage_units 一致（优先 payload.credit_usage.system_by_date，
+--      否则按任务类型在创建当日计：运动 1 / 精准模式入口 4 / 标准食物分析 2 / 其他 0）
+--   3. analysis_tasks 触发器在同一事务内原子维护计数：
+--      新建任务计入；状态变为 failed / timed_out / cancelled 时退回；从这些状态重新排队时再计入；
+--      删除仍计入中的任务时退回（与原先按现存任务行统计的口径一致）
+--   4. 回填最近 4 天创建的任务（原统计窗口为目标日起 3 天内创建的任务）
+
+CREATE TABLE IF NOT EXISTS public.user_daily_credit_usage (
+  user_id uuid NOT NULL REFERENCES public.weapp_user(id) ON DELETE CASCADE,
+  china_date date NOT NULL,
+  system_units integer NOT NULL DEFAULT 0,
+  updated_at timestamp with time zone NOT NULL DEFAULT now(),
+  PRIMARY KEY (user_id, china_date)
+);
+
+COMMENT ON TABLE public.user_daily_credit_usage IS '用户每个中国自然日已占用的系统积分（由 analysis_tasks 触发器原子维护）';
+
+CREATE OR REPLACE FUNCTION public.analysis_task_credit_units_by_date(
+  p_task_type text,
+  p_payload jsonb,
+  p_created_at timestamp with time zone
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+  v_payload jsonb := CASE WHEN jsonb_typeof(p_payload) = 'object' THEN p_payload ELSE '{}'::jsonb END;
+  v_by_date jsonb := v_payload -> 'credit_usage' -> 'system_by_date';
+  v_type text := btrim(COALESCE(p_task_type, ''));
+  v_day text := to_char((COALESCE(p_created_at, now()) AT TIME ZONE 'Asia/Shanghai')::date, 'YYYY-MM-DD');
+BEGIN
+  IF jsonb_typeof(v_payload -> 'credit_usage') = 'object' AND jsonb_typeof(v_by_date) = 'object' THEN
+    RETURN v_by_date;
+  END IF;
+  IF v_type = 'exercise' OR COALESCE(v_payload -> 'exercise', 'false'::jsonb) NOT IN ('false'::jsonb, 'null'::jsonb, '""'::jsonb, '0'::jsonb) THEN
+    RETURN jsonb_build_object(v_day, 1);
+  END IF;
+  IF v_type LIKE 'precision\_plan%' THEN
+    RETURN jsonb_build_object(v_day, 4);
+  END IF;
+  IF v_type IN ('food', 'food_text') OR v_type LIKE 'food\_debug%' OR v_type LIKE 'food\_text\_debug%' THEN
+    RETURN jsonb_build_object(v_day, 2);
+  END IF;
+  RETURN '{}'::jsonb;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.adjust_user_daily_credit_usage(
+  p_user_id uuid,
+  p_units_by_date jsonb,
+  p_sign integer
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_key text;
+  v_value text;
+  v_day date;
+  v_units integer;
+BEGIN
+  IF p_user_id IS NULL OR jsonb_typeof(p_units_by_date) IS DISTINCT FROM 'object' THEN
+    RETURN;
+  END IF;
+  FOR v_key, v_value IN SELECT key, value FROM jsonb_each_text(p_units_by_date) LOOP
+    BEGIN
+      v_day := v_key::date;
+      v_units := GREATEST(v_value::numeric::integer, 0);
+    EXCEPTION WHEN others THEN
+      CONTINUE;
+    END;
+    IF v_units = 0 THEN
+      CONTINUE;
+    END IF;
+    INSERT INTO public.user_daily_credit_usage AS u (user_id, china_date, system_units, updated_at)
+    VALUES (p_user_id, v_day, GREATEST(p_sign * v_units, 0), now())
+    ON CONFLICT (user_id, china_date) DO UPDATE
+      SET system_units = GREATEST(u.system_units + p_sign * v_units, 0),
+          updated_at = now();
+  END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.track_analysis_task_credit_usage()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_old_charged boolean;
+  v_new_charged boolean;
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    v_old_charged := COALESCE(OLD.status, '') NOT IN ('failed', 'timed_out', 'cancelled');
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    v_new_charged := COALESCE(NEW.status, '') NOT IN ('failed', 'timed_out', 'cancelled');
+  END IF;
+
+  IF TG_OP = 'INSERT' AND v_new_charged THEN
+    PERFORM public.adjust_user_daily_credit_usage(
+      NEW.user_id, public.analysis_task_credit_units_by_date(NEW.task_type, NEW.payload, NEW.created_at), 1
+    );
+  ELSIF TG_OP = 'DELETE' AND v_old_charged THEN
+    PERFORM public.adjust_user_daily_credit_usage(
+      OLD.user_id, public.analysis_task_credit_units_by_date(OLD.task_type, OLD.payload, OLD.created_at), -1
+    );
+  ELSIF TG_OP = 'UPDATE' AND v_old_charged IS DISTINCT FROM v_new_charged THEN
+    PERFORM public.adjust_user_daily_credit_usage(
+      NEW.user_id,
+      public.analysis_task_credit_units_by_date(NEW.task_type, NEW.payload, NEW.created_at),
+      CASE WHEN v_new_charged THEN 1 ELSE -1 END
+    );
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+BEGIN;
+
+-- 回填期间挡住任务写入，避免触发器与回填重复计数
+LOCK TABLE public.analysis_tasks IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS trg_analysis_tasks_credit_usage ON public.analysis_tasks;
+CREATE TRIGGER trg_analysis_tasks_credit_usage
+  AFTER INSERT OR DELETE OR UPDATE OF status ON public.analysis_tasks
+  FOR EACH ROW
+  EXECUTE FUNCTION public.track_analysis_task_credit_usage();
+
+-- 回填
+INSERT INTO public.user_daily_credit_usage (user_id, china_date, system_units, updated_at)
+SELECT t.user_id, u.key::date, SUM(GREATEST(u.value::numeric::integer, 0))::integer, now()
+FROM public.analysis_tasks t
+CROSS JOIN LATERAL jsonb_each_text(public.analysis_task_credit_units_by_date(t.task_type, t.payload, t.created_at)) u
+WHERE t.created_at >= date_trunc('day', now() AT TIME ZONE 'Asia/Shanghai') AT TIME ZONE 'Asia/Shanghai' - interval '3 days'
+  AND t.user_id IS NOT NULL
+  AND COALESCE(t.status, '') NOT IN ('failed', 'timed_out', 'cancelled')
+  AND u.key ~ '^\d{4}-\d{2}-\d{2}$'
+GROUP BY t.user_id, u.key::date
+ON CONFLICT (user_id, china_date) DO UPDATE
+  SET system_units = EXCLUDED.system_units,
+      updated_at = now();
+
+COMMIT;
@@ -0,0 +1,119 @@
+-- 用户每日营养汇总（按中国时区自然日 + 餐次）
+-- 执行位置：Supabase SQL Editor
+--
+-- 变更说明：
+--   1. 新建 user_daily_nutrition：每个 (user_id, china_date, meal_type) 一行，保存记录条数与热量/三大营养素/
+--      纤维/糖/钠合计；meal_type 已按后端规则归一化到 6 餐次（legacy snack 按记录时间映射）
+--   2. refresh_user_daily_nutrition(p_user_id, p_dates)：按天从 user_food_records 重算对应汇总行，
+--      后端在新增/修改/删除饮食记录后调用；重算是幂等的，并发写入同一天也不会累加出错
+--   3. 回填全部历史记录
+--
+-- 数据统计与 AI 洞察接口改为读取该表，不再拉取整段时间的完整饮食记录（含 items JSON）。
+
+CREATE TABLE IF NOT EXISTS public.user_daily_nutrition (
+  user_id uuid NOT NULL REFERENCES public.weapp_user(id) ON DELETE CASCADE,
+  china_date date NOT NULL,
+  meal_type text NOT NULL,
+  record_count integer NOT NULL DEFAULT 0,
+  total_calories numeric NOT NULL DEFAULT 0,
+  total_protein numeric NOT NULL DEFAULT 0,
+  total_carbs numeric NOT NULL DEFAULT 0,
+  total_fat numeric NOT NULL DEFAULT 0,
+  total_fiber numeric NOT NULL DEFAULT 0,
+  total_sugar numeric NOT NULL DEFAULT 0,
+  total_sodium_mg numeric NOT NULL DEFAULT 0,
+  updated_at timestamp with time zone NOT NULL DEFAULT now(),
+  CONSTRAINT user_daily_nutrition_pkey PRIMARY KEY (user_id, china_date, meal_type)
+) TABLESPACE pg_default;
+
+COMMENT ON TABLE public.user_daily_nutrition IS '用户每日按餐次的营养汇总（由饮食记录增删改维护）';
+COMMENT ON COLUMN public.user_daily_nutrition.china_date IS '记录时间所在的中国时区自然日';
+COMMENT ON COLUMN public.user_daily_nutrition.meal_type IS '归一化后的 6 餐次：breakfast/morning_snack/lunch/afternoon_snack/dinner/evening_snack';
+
+CREATE OR REPLACE FUNCTION public.food_record_meal_slot(p_meal_type text, p_record_time timestamp with time zone)
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE
+    WHEN p_meal_type IN ('breakfast', 'morning_snack', 'lunch', 'afternoon_snack', 'dinner', 'evening_snack') THEN p_meal_type
+    WHEN p_meal_type = 'snack' AND p_record_time IS NOT NULL THEN
+      CASE
+        WHEN EXTRACT(HOUR FROM p_record_time AT TIME ZONE 'Asia/Shanghai') < 11 THEN 'morning_snack'
+        WHEN EXTRACT(HOUR FROM p_record_time AT TIME ZONE 'Asia/Shanghai') < 17 THEN 'afternoon_snack'
+        ELSE 'evening_snack'
+      END
+    ELSE 'afternoon_snack'
+  END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.food_record_item_nutrient_sum(p_items jsonb, p_keys text[])
+RETURNS numeric
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT COALESCE(SUM(
+    COALESCE(
+      (SELECT NULLIF(item -> 'nutrients' ->> k, '')::numeric FROM unnest(p_keys) AS k WHERE item -> 'nutrients' ? k LIMIT 1),
+      0
+    )
+  ), 0)
+  FROM jsonb_array_elements(CASE WHEN jsonb_typeof(p_items) = 'array' THEN p_items ELSE '[]'::jsonb END) AS item;
+$$;
+
+CREATE OR REPLACE FUNCTION public.refresh_user_daily_nutrition(p_user_id uuid, p_dates date[])
+RETURNS void
+LANGUAGE sql
+AS $$
+  DELETE FROM public.user_daily_nutrition
+  WHERE user_id = p_user_id
+    AND china_date = ANY (p_dates);
+
+  INSERT INTO public.user_daily_nutrition (
+    user_id, china_date, meal_type, record_count,
+    total_calories, total_protein, total_carbs, total_fat,
+    total_fiber, total_sugar, total_sodium_mg, updated_at
+  )
+  SELECT
+    r.user_id,
+    (r.record_time AT TIME ZONE 'Asia/Shanghai')::date,
+    public.food_record_meal_slot(r.meal_type, r.record_time),
+    COUNT(*)::integer,
+    COALESCE(SUM(r.total_calories), 0),
+    COALESCE(SUM(r.total_protein), 0),
+    COALESCE(SUM(r.total_carbs), 0),
+    COALESCE(SUM(r.total_fat), 0),
+    COALESCE(SUM(public.food_record_item_nutrient_sum(r.items, ARRAY['fiber'])), 0),
+    COALESCE(SUM(public.food_record_item_nutrient_sum(r.items, ARRAY['sugar'])), 0),
+    COALESCE(SUM(public.food_record_item_nutrient_sum(r.items, ARRAY['sodium_mg', 'sodiumMg'])), 0),
+    now()
+  FROM public.user_food_records r
+  WHERE r.user_id = p_user_id
+    AND r.record_time IS NOT NULL
+    AND (r.record_time AT TIME ZONE 'Asia/Shanghai')::date = ANY (p_dates)
+  GROUP BY 1, 2, 3;
+$$;
+
+-- 回填历史数据
+INSERT INTO public.user_daily_nutrition (
+  user_id, china_date, meal_type, record_count,
+  total_calories, total_protein, total_carbs, total_fat,
+  total_fiber, total_sugar, total_sodium_mg, updated_at
+)
+SELECT
+  r.user_id,
+  (r.record_time AT TIME ZONE 'Asia/Shanghai')::date,
+  public.food_record_meal_slot(r.meal_type, r.record_time),
+  COUNT(*)::integer,
+  COALESCE(SUM(r.total_calories), 0),
+  COALESCE(SUM(r.total_protein), 0),
+  COALESCE(SUM(r.total_carbs), 0),
+  COALESCE(SUM(r.total_fat), 0),
+  COALESCE(SUM(public.food_record_item_nutrient_sum(r.items, ARRAY['fiber'])), 0),
+  COALESCE(SUM(public.food_record_item_nutrient_sum(r.items, ARRAY['sugar'])), 0),
+  COALESCE(SUM(public.food_record_item_nutrient_sum(r.items, ARRAY['sodium_mg', 'sodiumMg'])), 0),
+  now()
+FROM public.user_food_records r
+WHERE r.record_time IS NOT NULL
+GROUP BY 1, 2, 3
+ON CONFLICT (user_id, china_date, meal_type) DO NOTHING;
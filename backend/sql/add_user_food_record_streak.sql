@@ -0,0 +1,62 @@
+-- 连续记录天数：集合化计算 + weapp_user 上物化
+-- 执行位置：Supabase SQL Editor
+--
+-- 变更说明：
+--   1. weapp_user 新增 current_streak / last_record_date，由后端在新增/删除/改时间饮食记录时维护，
+--      读取 streak 只需读一行用户数据
+--   2. get_user_food_record_streak(p_user_id)：一次查询按中国时区去重记录日期，
+--      用 gaps-and-islands 取最近一段连续记录（天数 + 最后记录日），供首次物化与删除后重算
+--   3. (user_id, record_time) 复合索引，重算时只扫描该用户的记录
+--   4. 回填现有用户
+--   5. weapp_user.streak_computed_at：streak 已物化的标记。没有任何记录的用户 last_record_date 为 NULL，
+--      仅凭它无法区分「未物化」与「无记录」，会导致每次读取都重算并写回；回填后全部标记，新用户默认已物化
+
+ALTER TABLE public.weapp_user
+  ADD COLUMN IF NOT EXISTS current_streak integer NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS last_record_date date NULL,
+  ADD COLUMN IF NOT EXISTS streak_computed_at timestamp with time zone NULL;
+
+COMMENT ON COLUMN public.weapp_user.current_streak IS '截至 last_record_date 的连续记录天数（中国时区自然日）';
+COMMENT ON COLUMN public.weapp_user.last_record_date IS '最近一次饮食记录所在自然日（中国时区）';
+COMMENT ON COLUMN public.weapp_user.streak_computed_at IS 'current_streak / last_record_date 最近一次物化时间；NULL 表示尚未物化';
+
+CREATE INDEX IF NOT EXISTS idx_user_food_records_user_id_record_time
+  ON public.user_food_records USING btree (user_id, record_time DESC);
+
+CREATE OR REPLACE FUNCTION public.get_user_food_record_streak(p_user_id uuid)
+RETURNS TABLE (current_streak integer, last_record_date date)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH days AS (
+    SELECT DISTINCT (record_time AT TIME ZONE 'Asia/Shanghai')::date AS d
+    FROM public.user_food_records
+    WHERE user_id = p_user_id
+      AND record_time IS NOT NULL
+  ),
+  ranked AS (
+    -- 同一段连续日期的 d + 倒序名次 相同
+    SELECT d, d + (ROW_NUMBER() OVER (ORDER BY d DESC))::integer AS grp
+    FROM days
+  )
+  SELECT COUNT(*)::integer AS current_streak, MAX(d) AS last_record_date
+  FROM ranked
+  WHERE grp = (SELECT grp FROM ranked ORDER BY d DESC LIMIT 1);
+$$;
+
+UPDATE public.weapp_user u
+SET current_streak = s.current_streak,
+    last_record_date = s.last_record_date
+FROM public.weapp_user w
+CROSS JOIN LATERAL public.get_user_food_record_streak(w.id) s
+WHERE u.id = w.id
+  AND s.last_record_date IS NOT NULL;
+
+-- 无记录用户的 0 / NULL 即为正确结果，一并标记为已物化
+UPDATE public.weapp_user
+SET streak_computed_at = now()
+WHERE streak_computed_at IS NULL;
+
+-- 新注册用户尚无记录，插入即视为已物化
+ALTER TABLE public.weapp_user
+  ALTER COLUMN streak_computed_at SET DEFAULT now();
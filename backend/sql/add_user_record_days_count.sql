@@ -0,0 +1,81 @@
+-- 用户累计记录天数：weapp_user 上物化
+-- 执行位置：Supabase SQL Editor（需先执行 add_user_daily_nutrition.sql）
+--
+-- 变更说明：
+--   1. weapp_user 新增 record_days_count：有饮食记录的中国时区自然日个数
+--   2. refresh_user_daily_nutrition 在重算汇总行的同时，按「重算前后这几天是否有记录」增量调整 record_days_count；
+--      先锁定用户行，同一用户的并发重算串行执行，避免重复计数
+--   3. 按 user_daily_nutrition 回填
+--
+-- GET /api/user/record-days 只读这一列，与历史记录条数无关。
+
+ALTER TABLE public.weapp_user
+  ADD COLUMN IF NOT EXISTS record_days_count integer NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN public.weapp_user.record_days_count IS '有饮食记录的自然日个数（中国时区），由 refresh_user_daily_nutrition 维护';
+
+CREATE OR REPLACE FUNCTION public.refresh_user_daily_nutrition(p_user_id uuid, p_dates date[])
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_days_before integer;
+  v_days_after integer;
+BEGIN
+  PERFORM 1 FROM public.weapp_user WHERE id = p_user_id FOR UPDATE;
+
+  SELECT COUNT(DISTINCT china_date) INTO v_days_before
+  FROM public.user_daily_nutrition
+  WHERE user_id = p_user_id
+    AND china_date = ANY (p_dates);
+
+  DELETE FROM public.user_daily_nutrition
+  WHERE user_id = p_user_id
+    AND china_date = ANY (p_dates);
+
+  INSERT INTO public.user_daily_nutrition (
+    user_id, china_date, meal_type, record_count,
+    total_calories, total_protein, total_carbs, total_fat,
+    total_fiber, total_sugar, total_sodium_mg, updated_at
+  )
+  SELECT
+    r.user_id,
+    (r.record_time AT TIME ZONE 'Asia/Shanghai')::date,
+    public.food_record_meal_slot(r.meal_type, r.record_time),
+    COUNT(*)::integer,
+    COALESCE(SUM(r.total_calories), 0),
+    COALESCE(SUM(r.total_protein), 0),
+    COALESCE(SUM(r.total_carbs), 0),
+    COALESCE(SUM(r.total_fat), 0),
+    COALESCE(SUM(public.food_record_item_nutrient_sum(r.items, ARRAY['fiber'])), 0),
+    COALESCE(SUM(public.food_record_item_nutrient_sum(r.items, ARRAY['sugar'])), 0),
+    COALESCE(SUM(public.food_record_item_nutrient_sum(r.items, ARRAY['sodium_mg', 'sodiumMg'])), 0),
+    now()
+  FROM public.user_food_records r
+  WHERE r.user_id = p_user_id
+    AND r.record_time IS NOT NULL
+    AND (r.record_time AT TIME ZONE 'Asia/Shanghai')::date = ANY (p_dates)
+  GROUP BY 1, 2, 3;
+
+  SELECT COUNT(DISTINCT china_date) INTO v_days_after
+  FROM public.user_daily_nutrition
+  WHERE user_id = p_user_id
+    AND china_date = ANY (p_dates);
+
+  IF v_days_after <> v_days_before THEN
+    UPDATE public.weapp_user
+    SET record_days_count = GREATEST(0, record_days_count + v_days_after - v_days_before)
+    WHERE id = p_user_id;
+  END IF;
+END;
+$$;
+
+-- 回填
+UPDATE public.weapp_user u
+SET record_days_count = d.days
+FROM (
+  SELECT user_id, COUNT(DISTINCT china_date)::integer AS days
+  FROM public.user_daily_nutrition
+  GROUP BY user_id
+) d
+WHERE u.id = d.user_id;
@@ -0,0 +1,116 @@
+"""
+Worker 任务唤醒：新任务入库时由数据库触发器 pg_notify，Worker 通过 LISTEN 立即醒来抢占，
+轮询仅作为慢速兜底（连接不可用、通知丢失、保质期任务到点等）。
+
+需要直连 Postgres 的连接串 SUPABASE_DB_URL / DATABASE_URL（会话模式，事务模式的连接池不支持 LISTEN）；
+未配置或 psycopg2 不可用时自动退回按 poll_interval 轮询。
+触发器见 sql/add_task_notify_triggers.sql。
+"""
+import os
+import select
+import time
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+BACKEND_ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+load_dotenv(BACKEND_ENV_PATH, override=True)
+
+TASK_WAKEUP_DB_URL = str(os.getenv("SUPABASE_DB_URL") or os.getenv("DATABASE_URL") or "").strip()
+TASK_WAKEUP_ENABLED = str(os.getenv("TASK_WAKEUP_ENABLED", "1")).strip().lower() not in {"0", "false", "no", "off"}
+# 已 LISTEN 时的兜底轮询间隔（秒）
+WORKER_FALLBACK_POLL_SECONDS = float(os.getenv("WORKER_FALLBACK_POLL_SECONDS", "30"))
+# 连接断开后重连的最短间隔（秒）
+TASK_WAKEUP_RECONNECT_SECONDS = 30.0
+
+
+class TaskWakeup:
+    """
+    阻塞等待某个通知频道上的新任务。
+
+    channel: 频道名（与表名一致：analysis_tasks / comment_tasks / food_expiry_notification_jobs）
+    payload: 只关心该负载的通知（如 task_type）；None 表示频道上任何通知都唤醒
+    poll_interval: 无法 LISTEN 时的轮询间隔
+    """
+
+    def __init__(self, channel: str, payload: Optional[str] = None, poll_interval: float = 2.0) -> None:
+        self.channel = channel
+        self.payload = payload
+        self.poll_interval = poll_interval
+        self._conn: Any = None
+        self._last_connect_attempt = 0.0
+
+    @property
+    def listening(self) -> bool:
+        return self._conn is not None
+
+    def _connect(self) -> None:
+        if not TASK_WAKEUP_ENABLED or not TASK_WAKEUP_DB_URL:
+            return
+        now = time.monotonic()
+        if self._last_connect_attempt and now - self._last_connect_attempt < TASK_WAKEUP_RECONNECT_SECONDS:
+            return
+        self._last_connect_attempt = now
+        try:
+            import psycopg2
+            import psycopg2.extensions
+
+            conn = psycopg2.connect(TASK_WAKEUP_DB_URL)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{self.channel}"')
+            self._conn = conn
+            print(f"[task_wakeup] 已监听频道 {self.channel}（payload={self.payload or '*'}）", flush=True)
+        except Exception as e:
+            print(f"[task_wakeup] LISTEN {self.channel} 失败，退回轮询: {str(e)[:100]}", flush=True)
+            self._conn = None
+
+    def _close(self) -> None:
+        conn, self._conn = self._conn, None
+        try:
+            if conn is not None:
+                conn.close()
+        except Exception:
+            pass
+
+    def _drain(self) -> bool:
+        """读取已到达的通知，返回其中是否有本 Worker 关心的。"""
+        self._conn.poll()
+        matched = False
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            if self.payload is None or getattr(notify, "payload", None) == self.payload:
+                matched = True
+        return matched
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待下一次唤醒：收到匹配通知立即返回 True；超时（兜底轮询）返回 False。
+        Worker 忙于处理任务期间到达的通知留在连接上，下次 wait 时立即返回，不会丢失唤醒。
+        timeout: 本次最多等待的秒数（如下一条定时任务到点的时间），不超过兜底轮询间隔
+        """
+        if self._conn is None:
+            self._connect()
+        if self._conn is None:
+            time.sleep(self.poll_interval if timeout is None else max(0.0, min(self.poll_interval, timeout)))
+            return False
+
+        wait_seconds = max(WORKER_FALLBACK_POLL_SECONDS, self.poll_interval)
+        if timeout is not None:
+            wait_seconds = max(0.0, min(wait_seconds, timeout))
+        deadline = time.monotonic() + wait_seconds
+        try:
+            if self._drain():
+                return True
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                readable, _, _ = select.select([self._conn], [], [], remaining)
+                if readable and self._drain():
+                    return True
+        except Exception as e:
+            print(f"[task_wakeup] 频道 {self.channel} 连接异常，退回轮询: {str(e)[:100]}", flush=True)
+            self._close()
+            time.sleep(self.poll_interval)
+            return False
@@ -4,9 +4,12 @@ Pytest 配置文件 - 共享 fixtures 和配置
 import pytest
 import os
 import sys
-from typing import AsyncGenerator, Generator
+import json
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, List, Optional
 from datetime import datetime, timedelta
 
+import httpx
+
 # 确保 backend 目录在 path 中
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -14,6 +17,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-for-testing-only-min-32-chars")
 os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
 os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-key")
+# 测试默认不使用跨进程共享缓存层，避免 /dev/shm 中残留的缓存影响用例
+os.environ.setdefault("SHARED_CACHE_BACKEND", "local")
 
 
 @pytest.fixture
@@ -113,3 +118,55 @@ def cleanup_test_data():
             pass
         except Exception as e:
             print(f"清理测试数据失败: {record}, 错误: {e}")
+
+
+class FakeSupabaseBackend:
+    """
+    Supabase 假后端：经 httpx.MockTransport 接入 database 的异步客户端，按 handler 应答并记录全部请求。
+    各用例只需提供按路径/方法应答的 handler，客户端安装与关闭由 fake_supabase fixture 负责。
+    """
+
+    def __init__(self) -> None:
+        self.requests: List[httpx.Request] = []
+        self._handler: Optional[Callable[[httpx.Request], Any]] = None
+
+    def _handle(self, request: httpx.Request) -> Any:
+        self.requests.append(request)
+        assert self._handler is not None
+        return self._handler(request)
+
+    def install(self, handler: Callable[[httpx.Request], Any]) -> Any:
+        """把假后端装成当前事件循环的异步 Supabase 客户端（需在测试协程内调用）"""
+        import asyncio
+
+        from supabase import AsyncClient, AsyncClientOptions
+
+        import database
+
+        self._handler = handler
+        client = AsyncClient(
+            "https://test.supabase.co",
+            "test-key",
+            AsyncClientOptions(httpx_client=httpx.AsyncClient(transport=httpx.MockTransport(self._handle))),
+        )
+        database._async_supabase_clients[asyncio.get_running_loop()] = client
+        return client
+
+    def tables(self) -> List[str]:
+        """按顺序返回请求过的表名 / RPC 名"""
+        return [r.url.path.rsplit("/", 1)[-1] for r in self.requests]
+
+    def rpc_calls(self, name: str) -> List[Dict[str, Any]]:
+        """返回某个 RPC 每次调用的参数"""
+        return [json.loads(r.content) for r in self.requests if r.url.path.endswith(f"/rpc/{name}")]
+
+
+@pytest.fixture
+async def fake_supabase() -> AsyncGenerator[FakeSupabaseBackend, None]:
+    """Supabase 假后端，测试结束时关闭已安装的异步客户端"""
+    import database
+
+    backend = FakeSupabaseBackend()
+    yield backend
+    if backend._handler is not None:
+        await database.close_async_supabase_client()
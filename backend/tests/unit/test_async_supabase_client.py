@@ -0,0 +1,43 @@
+"""
+异步数据访问层：async 查询函数走 get_async_supabase_client，可并发执行而不阻塞事件循环
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import database
+from tests.conftest import FakeSupabaseBackend
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestAsyncSupabaseClient:
+    async def test_client_is_cached_per_event_loop(self) -> None:
+        first = database.get_async_supabase_client()
+        second = database.get_async_supabase_client()
+        assert first is second
+        await database.close_async_supabase_client()
+        assert database.get_async_supabase_client() is not first
+        await database.close_async_supabase_client()
+
+    async def test_get_user_by_id_uses_async_client(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(lambda request: httpx.Response(200, json=[{"id": "u1", "nickname": "测试"}]))
+        user = await database.get_user_by_id("u1")
+        assert user == {"id": "u1", "nickname": "测试"}
+        assert [r.url.path for r in fake_supabase.requests] == ["/rest/v1/weapp_user"]
+
+    async def test_concurrent_queries_overlap(self, fake_supabase: FakeSupabaseBackend) -> None:
+        """慢查询不再串行：5 个 0.2s 的请求并发完成总耗时应远小于 1s。"""
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json=[{"id": "u1"}])
+
+        fake_supabase.install(handler)
+        started = time.monotonic()
+        results = await asyncio.gather(*[database.get_user_by_id("u1") for _ in range(5)])
+        elapsed = time.monotonic() - started
+        assert all(r == {"id": "u1"} for r in results)
+        assert elapsed < 0.6
@@ -0,0 +1,119 @@
+"""
+asyncio Worker：单进程内同一任务类型最多 concurrency 个任务在途，空闲槽位数即一次抢占上限，任务完成即补位
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List
+
+import pytest
+
+import worker
+
+
+class _IdleWakeup:
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    def wait(self) -> bool:
+        time.sleep(0.05)
+        return False
+
+
+class _SilentWakeup:
+    """没有 NOTIFY、兜底轮询很久才到期：槽位只能靠任务完成补位。"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self._never = threading.Event()
+
+    def wait(self) -> bool:
+        self._never.wait(5)
+        return False
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestAsyncWorkerLane:
+    async def test_respects_concurrency_and_drains_queue(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        pending = [{"id": f"t{i}"} for i in range(7)]
+        claim_limits: List[int] = []
+        done: List[str] = []
+        lock = threading.Lock()
+        running = {"now": 0, "peak": 0}
+
+        def fake_claim(task_type: str, limit: int = 1) -> List[Dict[str, Any]]:
+            claim_limits.append(limit)
+            with lock:
+                batch = pending[:limit]
+                del pending[:limit]
+            return batch
+
+        def fake_processor(task: Dict[str, Any]) -> None:
+            with lock:
+                running["now"] += 1
+                running["peak"] = max(running["peak"], running["now"])
+            time.sleep(0.05)
+            with lock:
+                running["now"] -= 1
+                done.append(task["id"])
+
+        monkeypatch.setattr(worker, "claim_pending_tasks_sync", fake_claim)
+        monkeypatch.setattr(worker, "_get_task_processor", lambda task_type: fake_processor)
+        monkeypatch.setattr(worker, "TaskWakeup", _IdleWakeup)
+
+        lane = asyncio.create_task(worker._run_task_lane(0, "food", concurrency=3, poll_interval=0.05))
+        try:
+            for _ in range(100):
+                if len(done) == 7:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            lane.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await lane
+
+        assert sorted(done) == sorted(f"t{i}" for i in range(7))
+        assert running["peak"] == 3
+        assert claim_limits[0] == 3
+        assert max(claim_limits) <= 3
+
+    async def test_finished_task_refills_slot_without_wakeup(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        pending = [{"id": f"t{i}"} for i in range(3)]
+        done: List[str] = []
+        lock = threading.Lock()
+
+        def fake_claim(task_type: str, limit: int = 1) -> List[Dict[str, Any]]:
+            with lock:
+                batch = pending[:limit]
+                del pending[:limit]
+            return batch
+
+        def fake_processor(task: Dict[str, Any]) -> None:
+            time.sleep(0.02)
+            with lock:
+                done.append(task["id"])
+
+        monkeypatch.setattr(worker, "claim_pending_tasks_sync", fake_claim)
+        monkeypatch.setattr(worker, "_get_task_processor", lambda task_type: fake_processor)
+        monkeypatch.setattr(worker, "TaskWakeup", _SilentWakeup)
+
+        lane = asyncio.create_task(worker._run_task_lane(0, "food", concurrency=1, poll_interval=5))
+        try:
+            for _ in range(50):
+                if len(done) == 3:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            lane.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await lane
+
+        assert done == ["t0", "t1", "t2"]
+
+
+@pytest.mark.unit
+class TestTaskTypeConcurrency:
+    def test_env_override(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("WORKER_CONCURRENCY_PRECISION_ITEM_ESTIMATE", "24")
+        assert worker._task_type_concurrency("precision_item_estimate", 16) == 24
+        assert worker._task_type_concurrency("food", 16) == 16
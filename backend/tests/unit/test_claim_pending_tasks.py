@@ -0,0 +1,144 @@
+"""
+analysis_tasks 批量抢占：一次 RPC（claim_analysis_tasks，SKIP LOCKED）取回至多 N 条任务，不再先查后改
+"""
+import json
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+from supabase import Client
+from supabase.lib.client_options import SyncClientOptions
+
+import database
+import worker
+
+
+class _FakeTaskBackend:
+    def __init__(self, claimed: List[Dict[str, Any]]) -> None:
+        self.claimed = claimed
+        self.patched: List[Dict[str, Any]] = [{"id": "t2", "status": "pending"}]
+        self.requests: List[httpx.Request] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path.endswith("/rpc/claim_analysis_tasks"):
+            return httpx.Response(200, json=self.claimed)
+        if request.url.path.endswith("/rpc/heartbeat_analysis_tasks"):
+            return httpx.Response(200, json=["t1"])
+        if request.url.path.endswith("/rpc/requeue_expired_analysis_tasks"):
+            return httpx.Response(200, json=[{"requeued": 2, "failed": 1}])
+        if request.method == "POST" and request.url.path.endswith("/analysis_tasks"):
+            return httpx.Response(201, json=[{"id": "t3", **json.loads(request.content)}])
+        if request.method == "PATCH":
+            return httpx.Response(200, json=self.patched)
+        return httpx.Response(200, json=[])
+
+
+@pytest.fixture
+def task_backend(monkeypatch: pytest.MonkeyPatch) -> _FakeTaskBackend:
+    backend = _FakeTaskBackend([
+        {"id": "t2", "status": "processing", "created_at": "2026-05-10T02:00:01+00:00"},
+        {"id": "t1", "status": "processing", "created_at": "2026-05-10T02:00:00+00:00"},
+    ])
+    client = Client(
+        "https://test.supabase.co",
+        "test-key",
+        SyncClientOptions(httpx_client=httpx.Client(transport=httpx.MockTransport(backend.handler))),
+    )
+    monkeypatch.setattr(database, "get_supabase_client", lambda: client)
+    return backend
+
+
+@pytest.mark.unit
+class TestClaimPendingTasks:
+    def test_batch_claim_is_single_rpc(self, task_backend: _FakeTaskBackend) -> None:
+        tasks = database.claim_pending_tasks_sync("food", limit=4)
+        assert [t["id"] for t in tasks] == ["t1", "t2"]
+        assert len(task_backend.requests) == 1
+        assert json.loads(task_backend.requests[0].content) == {
+            "p_task_type": "food",
+            "p_limit": 4,
+            "p_lease_seconds": database.TASK_LEASE_SECONDS,
+            "p_owner": database.task_lease_owner(),
+            "p_aging_seconds": database.TASK_PRIORITY_AGING_SECONDS,
+        }
+
+    def test_single_claim_returns_oldest_or_none(self, task_backend: _FakeTaskBackend) -> None:
+        task_backend.claimed = task_backend.claimed[1:]
+        assert database.claim_next_pending_task_sync("food")["id"] == "t1"
+        task_backend.claimed = []
+        assert database.claim_next_pending_task_sync("food") is None
+
+    def test_requeue_only_touches_processing_rows(self, task_backend: _FakeTaskBackend) -> None:
+        assert database.requeue_claimed_tasks_sync(["t2"]) == 1
+        patch = task_backend.requests[-1]
+        assert patch.url.params.get("status") == "eq.processing"
+        assert json.loads(patch.content)["status"] == "pending"
+
+
+@pytest.mark.unit
+class TestTaskLeases:
+    def test_heartbeat_returns_renewed_ids(self, task_backend: _FakeTaskBackend) -> None:
+        assert database.heartbeat_task_leases_sync(["t1", "t2"]) == ["t1"]
+        body = json.loads(task_backend.requests[-1].content)
+        assert body["p_task_ids"] == ["t1", "t2"]
+        assert body["p_owner"] == database.task_lease_owner()
+
+    def test_requeue_expired_counts(self, task_backend: _FakeTaskBackend) -> None:
+        assert database.requeue_expired_tasks_sync(max_attempts=3) == {"requeued": 2, "failed": 1}
+        assert json.loads(task_backend.requests[-1].content) == {"p_max_attempts": 3}
+
+    def test_result_write_is_fenced_by_lease_owner(self, task_backend: _FakeTaskBackend) -> None:
+        owner = database.task_lease_owner()
+        assert database.update_analysis_task_result_sync("t2", status="done", result={"ok": 1}, lease_owner=owner) is True
+        assert len(task_backend.requests) == 1
+        patch = task_backend.requests[0]
+        assert patch.url.params.get("status") == "eq.processing"
+        assert patch.url.params.get("lease_owner") == f"eq.{owner}"
+
+    def test_result_write_after_losing_lease_is_dropped(self, task_backend: _FakeTaskBackend) -> None:
+        task_backend.patched = []
+        assert database.update_analysis_task_result_sync(
+            "t2", status="failed", error_message="超时", lease_owner=database.task_lease_owner()
+        ) is False
+
+    def test_keeper_stops_renewing_lost_leases(self, task_backend: _FakeTaskBackend) -> None:
+        keeper = worker._TaskLeaseKeeper(interval=3600)
+        keeper._task_ids.update({"t1", "t2"})
+        keeper.heartbeat()
+        assert keeper._task_ids == {"t1"}
+        keeper.release(["t1"])
+        keeper.heartbeat()
+        assert not any(r.url.path.endswith("/rpc/heartbeat_analysis_tasks") for r in task_backend.requests[1:])
+
+
+@pytest.mark.unit
+class TestTaskPriority:
+    def test_priority_classes(self) -> None:
+        assert database.analysis_task_priority("public_food_library_text", is_pro=True) == database.TASK_PRIORITY_BACKGROUND
+        assert database.analysis_task_priority("food") == database.TASK_PRIORITY_INTERACTIVE
+        assert database.analysis_task_priority("food", is_pro=True) == database.TASK_PRIORITY_PAID
+        assert database.TASK_PRIORITY_BACKGROUND < database.TASK_PRIORITY_INTERACTIVE < database.TASK_PRIORITY_PAID
+
+    def test_create_task_writes_priority(self, task_backend: _FakeTaskBackend) -> None:
+        assert database.create_analysis_task_sync("u1", "food", text_input="米饭")["priority"] == database.TASK_PRIORITY_INTERACTIVE
+        task = database.create_analysis_task_sync("u1", "precision_item_estimate", text_input="米饭", priority=15)
+        assert task["priority"] == 15
+
+    def test_claimed_batch_ordered_by_effective_priority_and_user_turn(self, task_backend: _FakeTaskBackend) -> None:
+        # t3 为后台任务但已等待足够久（老化后与交互任务同档）；t1 / t4 属同一用户，t4 排在该用户第二轮
+        task_backend.claimed = [
+            {"id": "t1", "user_id": "u1", "priority": 10, "effective_priority": 12, "user_turn": 1,
+             "created_at": "2026-05-10T02:00:00+00:00"},
+            {"id": "t2", "user_id": "u2", "priority": 15, "effective_priority": 15, "user_turn": 1,
+             "created_at": "2026-05-10T02:00:01+00:00"},
+            {"id": "t3", "user_id": "u3", "priority": 0, "effective_priority": 9, "user_turn": 1,
+             "created_at": "2026-05-09T02:00:00+00:00"},
+            {"id": "t4", "user_id": "u1", "priority": 10, "effective_priority": 12, "user_turn": 2,
+             "created_at": "2026-05-09T23:00:00+00:00"},
+            {"id": "t5", "user_id": "u4", "priority": 10, "effective_priority": 12, "user_turn": 1,
+             "created_at": "2026-05-10T02:00:02+00:00"},
+        ]
+        tasks = database.claim_pending_tasks_sync("food", limit=5)
+        assert [t["id"] for t in tasks] == ["t2", "t1", "t5", "t4", "t3"]
+        assert all("effective_priority" not in t and "user_turn" not in t for t in tasks)
@@ -0,0 +1,55 @@
+"""
+每日系统积分占用：读取 user_daily_credit_usage 物化计数（一行），计数表未就绪时回退为按任务行统计
+"""
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+import database
+from tests.conftest import FakeSupabaseBackend
+
+
+class _FakeCreditBackend:
+    def __init__(self, *, counter_ready: bool = True) -> None:
+        self.counter_ready = counter_ready
+        self.tasks: List[Dict[str, Any]] = [
+            {"id": "t1", "task_type": "food", "status": "done", "created_at": "2026-10-17T02:00:00+00:00",
+             "payload": {"credit_usage": {"system_by_date": {"2026-10-17": 2}}}},
+            {"id": "t2", "task_type": "precision_plan", "status": "failed", "created_at": "2026-10-17T03:00:00+00:00",
+             "payload": {}},
+            {"id": "t3", "task_type": "exercise", "status": "pending", "created_at": "2026-10-17T04:00:00+00:00",
+             "payload": {}},
+        ]
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/user_daily_credit_usage"):
+            if not self.counter_ready:
+                return httpx.Response(404, json={
+                    "code": "PGRST205",
+                    "message": "Could not find the table 'public.user_daily_credit_usage' in the schema cache",
+                })
+            return httpx.Response(200, json=[{"system_units": 7}])
+        if path.endswith("/analysis_tasks"):
+            return httpx.Response(200, json=self.tasks)
+        return httpx.Response(200, json=[])
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestDailyCreditUsage:
+    async def test_reads_single_counter_row(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_FakeCreditBackend().handler)
+        assert await database.get_daily_system_credit_usage("u1", "2026-10-17") == 7
+
+        assert fake_supabase.tables() == ["user_daily_credit_usage"]
+        params = fake_supabase.requests[0].url.params
+        assert params.get("user_id") == "eq.u1"
+        assert params.get("china_date") == "eq.2026-10-17"
+
+    async def test_falls_back_to_task_scan_without_released_tasks(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_FakeCreditBackend(counter_ready=False).handler)
+        # t1 按 system_by_date 计 2，t2 失败已退回，t3 运动计 1
+        assert await database.get_daily_system_credit_usage("u1", "2026-10-17") == 3
+        assert fake_supabase.tables()[-1] == "analysis_tasks"
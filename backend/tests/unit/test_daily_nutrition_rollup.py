@@ -0,0 +1,56 @@
+"""
+每日营养汇总：饮食记录增删改后按天重算 user_daily_nutrition，统计接口基于汇总行计算
+"""
+import httpx
+import pytest
+
+import database
+from main import _summarize_daily_nutrition_rows
+from tests.conftest import FakeSupabaseBackend
+
+
+def _food_record_handler(request: httpx.Request) -> httpx.Response:
+    path = request.url.path
+    if "/rpc/" in path:
+        return httpx.Response(200, json=[])
+    if path.endswith("/user_food_records") and request.method == "DELETE":
+        return httpx.Response(200, json=[{"id": "r1", "user_id": "u1", "record_time": "2026-05-09T17:30:00+00:00"}])
+    return httpx.Response(200, json=[{"id": "u1", "current_streak": 0, "last_record_date": None}])
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestDailyNutritionRefresh:
+    async def test_delete_refreshes_china_local_day(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_food_record_handler)
+        assert await database.delete_food_record("u1", "r1") is True
+        # UTC 17:30 已是中国时区次日
+        assert fake_supabase.rpc_calls("refresh_user_daily_nutrition") == [{"p_user_id": "u1", "p_dates": ["2026-05-10"]}]
+
+    async def test_update_without_nutrition_fields_skips_refresh(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_food_record_handler)
+        await database.update_food_record("u1", "r1", {"hidden_from_feed": True})
+        assert not any("/rpc/" in r.url.path for r in fake_supabase.requests)
+
+    async def test_record_days_count_reads_single_column(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(lambda request: httpx.Response(200, json=[{"record_days_count": 412}]))
+        assert await database.get_user_record_days_count("u1") == 412
+        assert len(fake_supabase.requests) == 1
+        assert fake_supabase.requests[0].url.params.get("select") == "record_days_count"
+
+
+@pytest.mark.unit
+class TestSummarizeDailyNutritionRows:
+    def test_totals_by_meal_and_day(self) -> None:
+        rows = [
+            {"china_date": "2026-05-09", "meal_type": "breakfast", "total_calories": 300, "total_protein": 10, "total_carbs": 40, "total_fat": 8},
+            {"china_date": "2026-05-09", "meal_type": "evening_snack", "total_calories": 150.5, "total_protein": 2, "total_carbs": 20, "total_fat": 5},
+            {"china_date": "2026-05-10", "meal_type": "lunch", "total_calories": "600", "total_protein": 30, "total_carbs": 70, "total_fat": 20},
+        ]
+        summary = _summarize_daily_nutrition_rows(rows)
+        assert summary["total_calories"] == 1050.5
+        assert summary["total_protein"] == 42
+        assert summary["daily_calories"] == {"2026-05-09": 450.5, "2026-05-10": 600.0}
+        assert summary["by_meal"]["breakfast"] == 300.0
+        assert summary["by_meal"]["evening_snack"] == 150.5
+        assert summary["by_meal"]["lunch"] == 600.0
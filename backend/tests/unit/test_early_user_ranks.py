@@ -0,0 +1,71 @@
+"""
+创始用户名次：读取持久化的名次表（一行查询 + 缓存），不再扫描 weapp_user / 支付记录；名次表未就绪时回退为扫描
+"""
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+import database
+from tests.conftest import FakeSupabaseBackend
+
+
+class _FakeRankBackend:
+    def __init__(self, *, ranks_ready: bool = True) -> None:
+        self.ranks_ready = ranks_ready
+        self.ranks: List[Dict[str, Any]] = [{"kind": "registration", "rank": 800}]
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/membership_early_user_ranks"):
+            if not self.ranks_ready:
+                return httpx.Response(404, json={
+                    "code": "PGRST205",
+                    "message": "Could not find the table 'public.membership_early_user_ranks' in the schema cache",
+                })
+            return httpx.Response(200, json=self.ranks)
+        if path.endswith("/weapp_user"):
+            return httpx.Response(200, json=[
+                {"id": "u2", "created_at": "2026-01-02T00:00:00+00:00"},
+                {"id": "u1", "created_at": "2026-01-03T00:00:00+00:00"},
+            ])
+        if path.endswith("/pro_membership_payment_records") and request.method == "PATCH":
+            return httpx.Response(200, json=[{"order_no": "o1", "user_id": "u1", "status": "paid"}])
+        if path.endswith("/pro_membership_payment_records"):
+            return httpx.Response(200, json=[])
+        return httpx.Response(200, json=[])
+
+
+@pytest.fixture(autouse=True)
+def _clear_rank_cache():
+    database._early_user_rank_cache.clear()
+    yield
+    database._early_user_rank_cache.clear()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestEarlyUserRanks:
+    async def test_ranks_read_from_rank_table_and_cached(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_FakeRankBackend().handler)
+        assert await database.get_first_membership_trial_batch_rank("u1", 1000) == 800
+        assert await database.get_first_membership_trial_batch_rank("u1", 500) is None
+        assert await database.get_first_paid_membership_user_rank("u1", 100) is None
+
+        assert fake_supabase.tables() == ["membership_early_user_ranks"]
+
+    async def test_paid_order_invalidates_cached_ranks(self, fake_supabase: FakeSupabaseBackend) -> None:
+        backend = _FakeRankBackend()
+        fake_supabase.install(backend.handler)
+        assert await database.get_first_paid_membership_user_rank("u1", 100) is None
+        await database.update_pro_membership_payment_record("o1", {"status": "paid"})
+        backend.ranks.append({"kind": "paid", "rank": 42})
+        assert await database.get_first_paid_membership_user_rank("u1", 100) == 42
+
+    async def test_falls_back_to_scan_when_rank_table_missing(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_FakeRankBackend(ranks_ready=False).handler)
+        assert await database.get_first_membership_trial_batch_rank("u1", 1000) == 2
+        assert await database.get_first_paid_membership_user_rank("u1", 100) is None
+
+        assert "weapp_user" in fake_supabase.tables()
+        assert "pro_membership_payment_records" in fake_supabase.tables()
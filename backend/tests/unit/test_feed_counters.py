@@ -0,0 +1,139 @@
+"""
+圈子动态计数列：点赞/评论数取 user_food_records 上的计数，点赞与评论时原子调整，不再为计数下载全部点赞/评论行
+"""
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+import database
+from tests.conftest import FakeSupabaseBackend
+
+R1 = "00000000-0000-4000-8000-000000000001"
+R2 = "00000000-0000-4000-8000-000000000002"
+R3 = "00000000-0000-4000-8000-000000000003"
+R9 = "00000000-0000-4000-8000-000000000009"
+
+
+class _FakeFeedBackend:
+    def __init__(self) -> None:
+        self.records: List[Dict[str, Any]] = [
+            {"id": "r1", "user_id": "u1", "record_time": "2026-05-10T02:00:00+00:00", "meal_type": "lunch",
+             "like_count": 1200, "comment_count": 3, "total_protein": 30, "total_carbs": 40, "total_fat": 10},
+        ]
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/rpc/list_feed_comment_previews"):
+            return httpx.Response(200, json=[
+                {"id": "c1", "user_id": "u2", "record_id": "r1", "parent_comment_id": None,
+                 "reply_to_user_id": None, "content": "好吃", "created_at": "2026-05-10T03:00:00+00:00"},
+            ])
+        if "/rpc/" in path:
+            return httpx.Response(200, json=None)
+        if path.endswith("/user_food_records") and request.url.params.get("select") == "user_id":
+            return httpx.Response(200, json=[{"user_id": "u1"}])
+        if path.endswith("/user_food_records"):
+            return httpx.Response(200, json=self.records)
+        if path.endswith("/weapp_user"):
+            return httpx.Response(200, json=[{"id": "u1", "nickname": "作者"}, {"id": "u2", "nickname": "评论者"}])
+        if path.endswith("/feed_likes") and request.method == "DELETE":
+            return httpx.Response(200, json=[{"id": "l1", "user_id": "u2", "record_id": "r1"}])
+        return httpx.Response(201 if request.method == "POST" else 200, json=[])
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestFeedCounters:
+    async def test_public_feed_reads_counter_columns(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_FakeFeedBackend().handler)
+        items = await database.list_public_feed_records(limit=10, sort_by="hot")
+
+        assert items[0]["like_count"] == 1200
+        assert items[0]["comment_count"] == 3
+        assert [c["id"] for c in items[0]["comments"]] == ["c1"]
+        assert "feed_likes" not in fake_supabase.tables()
+        assert "feed_comments" not in fake_supabase.tables()
+
+    async def test_like_and_unlike_leave_counter_to_trigger(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_FakeFeedBackend().handler)
+        assert await database.add_feed_like("u2", "r1") is True
+        await database.remove_feed_like("u2", "r1")
+
+        assert [r.method for r in fake_supabase.requests] == ["POST", "DELETE"]
+        assert fake_supabase.tables() == ["feed_likes", "feed_likes"]
+
+    async def test_liked_check_only_queries_viewer_rows(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_FakeFeedBackend().handler)
+        await database.get_feed_likes_for_records(["r1"], "u2")
+
+        like_queries = [r for r in fake_supabase.requests if r.url.path.endswith("/feed_likes")]
+        assert len(like_queries) == 1
+        assert like_queries[0].url.params.get("user_id") == "eq.u2"
+
+
+@pytest.mark.unit
+class TestFeedCursor:
+    def test_cursor_round_trip(self) -> None:
+        cursor = database._encode_feed_cursor("2026-05-10T02:00:00+00:00", R1)
+        assert database._decode_feed_cursor(cursor) == ("2026-05-10T02:00:00+00:00", None, R1)
+        ranked = database._encode_feed_cursor("2026-05-10T02:00:00+00:00", R1, 42.5)
+        assert database._decode_feed_cursor(ranked) == ("2026-05-10T02:00:00+00:00", 42.5, R1)
+        assert database._decode_feed_cursor("not-a-cursor") is None
+
+    def test_cursor_with_injected_fields_is_rejected(self) -> None:
+        injected = database._encode_feed_cursor("2026-05-10T02:00:00+00:00", "r1,user_id.neq.x")
+        assert database._decode_feed_cursor(injected) is None
+        not_finite = database._encode_feed_cursor("2026-05-10T02:00:00+00:00", R1, float("nan"))
+        assert database._decode_feed_cursor(not_finite) is None
+
+    def test_next_cursor_points_at_oldest_record(self) -> None:
+        records = [
+            {"id": R2, "record_time": "2026-05-10T02:00:00+00:00"},
+            {"id": R1, "record_time": "2026-05-09T23:00:00+00:00"},
+            {"id": R3, "record_time": "2026-05-10T02:00:00+00:00"},
+        ]
+        cursor = database.build_feed_next_cursor(records)
+        assert database._decode_feed_cursor(cursor) == ("2026-05-09T23:00:00+00:00", None, R1)
+
+    def test_ranked_next_cursor_points_at_lowest_rank(self) -> None:
+        records = [
+            {"id": R1, "record_time": "2026-05-09T23:00:00+00:00", "feed_hot_rank": 80.0},
+            {"id": R2, "record_time": "2026-05-10T02:00:00+00:00", "feed_hot_rank": 5.0},
+            {"id": R3, "record_time": "2026-05-10T03:00:00+00:00", "feed_hot_rank": 5.0},
+        ]
+        cursor = database.build_feed_next_cursor(records, sort_by="hot")
+        assert database._decode_feed_cursor(cursor) == ("2026-05-10T02:00:00+00:00", 5.0, R2)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestFeedKeysetPagination:
+    async def test_cursor_page_uses_keyset_filter(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_FakeFeedBackend().handler)
+        cursor = database._encode_feed_cursor("2026-05-10T02:00:00+00:00", R9)
+        await database.list_public_feed_records(limit=10, cursor=cursor, include_comments=False)
+
+        page_query = [
+            r for r in fake_supabase.requests
+            if r.url.path.endswith("/user_food_records") and r.url.params.get("select") != "user_id"
+        ][0]
+        assert "record_time.lt." in page_query.url.params.get("or", "")
+        assert page_query.url.params.get("limit") == "10"
+        assert "offset" not in page_query.url.params
+        assert page_query.url.params.get("order") == "record_time.desc,id.desc"
+
+    async def test_hot_feed_orders_by_materialized_rank(self, fake_supabase: FakeSupabaseBackend) -> None:
+        fake_supabase.install(_FakeFeedBackend().handler)
+        cursor = database._encode_feed_cursor("2026-05-10T02:00:00+00:00", R9, 12.5)
+        await database.list_public_feed_records(limit=10, sort_by="hot", cursor=cursor, include_comments=False)
+
+        page_query = [
+            r for r in fake_supabase.requests
+            if r.url.path.endswith("/user_food_records") and r.url.params.get("select") != "user_id"
+        ][0]
+        assert page_query.url.params.get("order") == "feed_hot_rank.desc,record_time.desc,id.desc"
+        keyset = page_query.url.params.get("or", "")
+        assert keyset.startswith("(feed_hot_rank.lt.12.5,")
+        assert 'and(feed_hot_rank.eq.12.5,record_time.lt."2026-05-10T02:00:00+00:00")' in keyset
+        assert page_query.url.params.get("limit") == "10"
@@ -0,0 +1,219 @@
+"""
+食物营养库进程内索引：全量加载后精确/别名/同义词解析不再访问数据库，按 updated_at 增量刷新
+"""
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+from supabase import Client
+from supabase.lib.client_options import SyncClientOptions
+
+import database
+
+
+def _food_row(food_id: str, name: str, kcal: float, updated_at: str, is_active: bool = True) -> Dict[str, Any]:
+    return {
+        "id": food_id,
+        "canonical_name": name,
+        "normalized_name": database.normalize_food_name(name),
+        "source": "test",
+        "is_active": is_active,
+        "updated_at": updated_at,
+        "kcal_per_100g": kcal,
+        "protein_per_100g": 2.0,
+    }
+
+
+class _FakeFoodTables:
+    """按 PostgREST 路径返回食物库/别名表数据，并记录请求。"""
+
+    def __init__(self) -> None:
+        self.library: List[Dict[str, Any]] = [
+            _food_row("f-rice", "米饭", 116, "2026-01-01T00:00:00+00:00"),
+            _food_row("f-egg", "番茄炒蛋", 86, "2026-01-01T00:00:00+00:00"),
+            _food_row("f-old", "停用食物", 10, "2026-01-01T00:00:00+00:00", is_active=False),
+        ]
+        self.aliases: List[Dict[str, Any]] = [
+            {"id": "a1", "food_id": "f-rice", "normalized_alias": "大米饭", "updated_at": "2026-01-01T00:00:00+00:00"},
+            {"id": "a2", "food_id": "f-old", "normalized_alias": "旧别名", "updated_at": "2026-01-01T00:00:00+00:00"},
+        ]
+        self.requests: List[httpx.Request] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        table = request.url.path.rsplit("/", 1)[-1]
+        rows = self.library if table == "food_nutrition_library" else self.aliases
+        since = request.url.params.get("updated_at")
+        if since:
+            watermark = since.split(".", 1)[1]
+            rows = [r for r in rows if r["updated_at"] > watermark]
+        for column in ("normalized_name", "normalized_alias"):
+            value = request.url.params.get(column) or ""
+            if value.startswith("in.("):
+                wanted = set(value[4:-1].split(","))
+                rows = [r for r in rows if r[column] in wanted]
+        if table == "food_nutrition_aliases" and "food_nutrition_library" in (request.url.params.get("select") or ""):
+            foods = {r["id"]: r for r in self.library}
+            rows = [{**r, "food_nutrition_library": foods.get(r["food_id"])} for r in rows]
+        offset = int(request.url.params.get("offset") or 0)
+        limit = int(request.url.params.get("limit") or len(rows))
+        return httpx.Response(200, json=rows[offset:offset + limit])
+
+
+@pytest.fixture
+def fake_tables(monkeypatch: pytest.MonkeyPatch) -> _FakeFoodTables:
+    tables = _FakeFoodTables()
+    client = Client(
+        "https://test.supabase.co",
+        "test-key",
+        SyncClientOptions(httpx_client=httpx.Client(transport=httpx.MockTransport(tables.handler))),
+    )
+    monkeypatch.setattr(database, "get_supabase_client", lambda: client)
+    monkeypatch.setattr(database, "FOOD_NUTRITION_INDEX_ENABLED", True)
+    monkeypatch.setattr(database, "_food_nutrition_index", database._empty_food_nutrition_index())
+    return tables
+
+
+@pytest.mark.unit
+class TestFoodNutritionIndex:
+    def test_exact_and_alias_resolution_without_queries(self, fake_tables: _FakeFoodTables) -> None:
+        assert database.ensure_food_nutrition_index_sync() is True
+        loaded_requests = len(fake_tables.requests)
+
+        canonical = database.resolve_food_sync("米饭")
+        alias = database.resolve_food_sync(" 大米饭 ")
+
+        assert canonical["resolve_status"] == "exact_canonical"
+        assert canonical["matched_food_id"] == "f-rice"
+        assert canonical["unit_nutrition_per_100g"]["calories"] == 116.0
+        assert alias["resolve_status"] == "exact_alias"
+        assert alias["matched_food_name"] == "米饭"
+        assert len(fake_tables.requests) == loaded_requests
+
+    def test_synonym_resolution_uses_index(self, fake_tables: _FakeFoodTables) -> None:
+        database.ensure_food_nutrition_index_sync()
+        result = database.resolve_food_sync("西红柿炒蛋")
+        assert result["resolved"] is True
+        assert result["resolve_status"] == "synonym"
+        assert result["matched_food_id"] == "f-egg"
+
+    def test_shared_synonym_keeps_first_canonical(self) -> None:
+        reverse = database._build_food_synonym_reverse_map({"番茄炒蛋": ["西红柿炒鸡蛋"], "番茄炒鸡蛋": ["西红柿炒鸡蛋", "番茄蛋"]})
+        assert reverse[database.normalize_food_name("西红柿炒鸡蛋")] == ["番茄炒蛋", "西红柿炒鸡蛋"]
+        assert reverse[database.normalize_food_name("番茄蛋")][0] == "番茄炒鸡蛋"
+
+    def test_inactive_food_alias_is_ignored(self, fake_tables: _FakeFoodTables) -> None:
+        database.ensure_food_nutrition_index_sync()
+        assert database._lookup_food_nutrition_index("旧别名") is None
+        assert database._lookup_food_nutrition_index("停用食物") is None
+
+    def test_incremental_refresh_by_updated_at(self, fake_tables: _FakeFoodTables, monkeypatch: pytest.MonkeyPatch) -> None:
+        database.ensure_food_nutrition_index_sync()
+        fake_tables.library.append(_food_row("f-noodle", "牛肉面", 110, "2026-02-01T00:00:00+00:00"))
+        fake_tables.library[0] = _food_row("f-rice", "米饭", 130, "2026-02-01T00:00:00+00:00")
+        fake_tables.requests.clear()
+        monkeypatch.setattr(database, "FOOD_NUTRITION_INDEX_REFRESH_SECONDS", 0.0)
+
+        assert database.ensure_food_nutrition_index_sync() is True
+
+        assert all(r.url.params.get("updated_at") == "gt.2026-01-01T00:00:00+00:00" for r in fake_tables.requests)
+        assert database._lookup_food_nutrition_index("牛肉面")["food"]["id"] == "f-noodle"
+        assert database._lookup_food_nutrition_index("米饭")["food"]["kcal_per_100g"] == 130
+        assert database._food_nutrition_index["library_watermark"] == "2026-02-01T00:00:00+00:00"
+
+
+@pytest.mark.unit
+class TestFoodNutritionFuzzyIndex:
+    def test_fuzzy_match_covers_whole_library(self, fake_tables: _FakeFoodTables) -> None:
+        """目标行排在第 3000 行之后也能命中（旧实现只比对任意 500 行）。"""
+        fake_tables.library = [
+            _food_row(f"f-{i}", f"测试食物{i:05d}号", 100, "2026-01-01T00:00:00+00:00")
+            for i in range(3000)
+        ] + [_food_row("f-target", "宫保鸡丁盖饭", 160, "2026-01-01T00:00:00+00:00")]
+        database.ensure_food_nutrition_index_sync()
+        loaded_requests = len(fake_tables.requests)
+
+        result = database.resolve_food_sync("宫保鸡丁饭")
+
+        assert result["resolve_status"] == "fuzzy"
+        assert result["matched_food_id"] == "f-target"
+        assert result["score"] >= 0.72
+        assert len(fake_tables.requests) == loaded_requests
+
+    def test_fuzzy_match_uses_aliases(self, fake_tables: _FakeFoodTables) -> None:
+        fake_tables.aliases.append(
+            {"id": "a3", "food_id": "f-egg", "normalized_alias": "西红柿炒鸡蛋盖饭", "updated_at": "2026-01-01T00:00:00+00:00"}
+        )
+        database.ensure_food_nutrition_index_sync()
+
+        matches = database.search_food_nutrition_index_fuzzy("西红柿炒鸡蛋饭", limit=3, min_score=0.72)
+
+        assert [m["food"]["id"] for m in matches] == ["f-egg"]
+        assert matches[0]["match_source"] == "alias"
+
+    def test_candidate_scoring_is_bounded(self, fake_tables: _FakeFoodTables, monkeypatch: pytest.MonkeyPatch) -> None:
+        fake_tables.library = [
+            _food_row(f"f-{i}", f"鸡肉{i:04d}", 100, "2026-01-01T00:00:00+00:00") for i in range(2000)
+        ]
+        database.ensure_food_nutrition_index_sync()
+        monkeypatch.setattr(database, "FOOD_FUZZY_CANDIDATE_LIMIT", 10)
+        scored: List[str] = []
+
+        def _counting_scorer(a: str, b: str) -> float:
+            scored.append(b)
+            return database._food_similarity(a, b)
+
+        database.search_food_nutrition_index_fuzzy("鸡肉", limit=5, scorer=_counting_scorer)
+
+        assert len(scored) == 10
+
+    def test_renamed_food_leaves_fuzzy_index(self, fake_tables: _FakeFoodTables, monkeypatch: pytest.MonkeyPatch) -> None:
+        database.ensure_food_nutrition_index_sync()
+        fake_tables.library[1] = _food_row("f-egg", "蛋炒饭", 180, "2026-02-01T00:00:00+00:00")
+        monkeypatch.setattr(database, "FOOD_NUTRITION_INDEX_REFRESH_SECONDS", 0.0)
+        database.ensure_food_nutrition_index_sync()
+
+        assert "番茄炒蛋" not in database._food_nutrition_index["fuzzy_keys"]
+        assert database.search_food_nutrition_index_fuzzy("番茄炒蛋", min_score=0.72) == []
+        assert database.search_food_nutrition_index_fuzzy("扬州蛋炒饭", min_score=0.72)[0]["food"]["id"] == "f-egg"
+
+    def test_refresh_does_not_mutate_published_index(self, fake_tables: _FakeFoodTables, monkeypatch: pytest.MonkeyPatch) -> None:
+        """读者拿到的旧版本在增量刷新期间保持不变（写时复制），遍历倒排集合不会遇到并发修改。"""
+        database.ensure_food_nutrition_index_sync()
+        snapshot = database._food_nutrition_index
+        postings_before = {gram: set(keys) for gram, keys in snapshot["gram_postings"].items()}
+        fake_tables.library[1] = _food_row("f-egg", "蛋炒饭", 180, "2026-02-01T00:00:00+00:00")
+        fake_tables.library.append(_food_row("f-noodle", "番茄牛肉面", 110, "2026-02-01T00:00:00+00:00"))
+        monkeypatch.setattr(database, "FOOD_NUTRITION_INDEX_REFRESH_SECONDS", 0.0)
+
+        database.ensure_food_nutrition_index_sync()
+
+        assert database._food_nutrition_index is not snapshot
+        assert snapshot["gram_postings"] == postings_before
+        assert "番茄炒蛋" in snapshot["fuzzy_keys"]
+        assert "番茄牛肉面" in database._food_nutrition_index["fuzzy_keys"]
+        assert "_owned" not in database._food_nutrition_index
+
+
+@pytest.mark.unit
+class TestBatchResolveFoods:
+    def test_batch_without_index_uses_one_query_per_stage(self, fake_tables: _FakeFoodTables, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(database, "FOOD_NUTRITION_INDEX_ENABLED", False)
+
+        out = database.batch_resolve_foods_sync(["米饭", "大米饭", "番茄炒蛋饭", "西红柿炒蛋", "火星石头", "米饭", ""])
+
+        assert out["米饭"]["resolve_status"] == "exact_canonical"
+        assert out["大米饭"]["resolve_status"] == "exact_alias"
+        assert out["大米饭"]["matched_food_id"] == "f-rice"
+        assert out["番茄炒蛋饭"]["resolve_status"] == "fuzzy"
+        assert out["西红柿炒蛋"]["resolve_status"] == "synonym"
+        assert out["西红柿炒蛋"]["matched_food_id"] == "f-egg"
+        assert out["火星石头"]["resolve_status"] == "unresolved"
+        assert out[""]["resolve_status"] == "unresolved"
+        # 精确别名 + 精确标准名 + 模糊候选 + 同义词别名 + 同义词标准名，与名称个数无关
+        assert len(fake_tables.requests) == 5
+
+    def test_batch_matches_single_resolution(self, fake_tables: _FakeFoodTables) -> None:
+        names = ["米饭", "大米饭", "番茄炒蛋饭", "西红柿炒蛋", "火星石头"]
+        batch = database.batch_resolve_foods_sync(names)
+        assert {name: batch[name] for name in names} == {name: database.resolve_food_sync(name) for name in names}
@@ -0,0 +1,298 @@
+"""
+LLM 调用网关：退避重试、服务商熔断、Gemini / 千问故障转移，调用方错误不重试
+"""
+import asyncio
+import json
+from typing import Callable, Dict, List
+
+import httpx
+import pytest
+
+import llm_gateway
+import llm_http
+
+OFOX_URL = "https://api.ofox.ai/v1/chat/completions"
+DASHSCOPE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
+
+
+def _completion(content: str) -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"message": {"content": content}}], "usage": {"total_tokens": 10}})
+
+
+class _FakeProviders:
+    """按服务商排队返回响应，记录每次请求的服务商与模型。"""
+
+    def __init__(self, monkeypatch: pytest.MonkeyPatch, responses: Dict[str, List[Callable[[], httpx.Response]]]) -> None:
+        self.responses = responses
+        self.calls: List[tuple] = []
+        self.sleeps: List[float] = []
+        for url in (OFOX_URL, DASHSCOPE_URL):
+            llm_http._sync_clients[llm_http._origin(url)] = httpx.Client(transport=httpx.MockTransport(self.handle))
+        monkeypatch.setattr(llm_gateway.time, "sleep", self.sleeps.append)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        provider = llm_http.llm_provider_name(str(request.url))
+        self.calls.append((provider, json.loads(request.content)["model"]))
+        queue = self.responses[provider]
+        return queue.pop(0)() if len(queue) > 1 else queue[0]()
+
+
+@pytest.fixture(autouse=True)
+def _gateway_env(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("OFOXAI_API_KEY", "ofox-key")
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "dashscope-key")
+    monkeypatch.delenv("OFOXAI_BASE_URL", raising=False)
+    monkeypatch.delenv("DASHSCOPE_BASE_URL", raising=False)
+    monkeypatch.setattr(llm_gateway, "_breakers", {})
+    llm_http.close_llm_http_clients()
+    yield
+    llm_http.close_llm_http_clients()
+
+
+@pytest.mark.unit
+class TestCircuitBreaker:
+    def test_opens_after_threshold_and_allows_single_probe(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        now = [100.0]
+        monkeypatch.setattr(llm_gateway.time, "monotonic", lambda: now[0])
+        breaker = llm_gateway.CircuitBreaker("gemini", failure_threshold=2, open_seconds=30)
+
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+        now[0] += 31
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        now[0] += 31
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_cancelled_probe_releases_half_open_slot(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        now = [100.0]
+        monkeypatch.setattr(llm_gateway.time, "monotonic", lambda: now[0])
+        breaker = llm_gateway.CircuitBreaker("gemini", failure_threshold=1, open_seconds=30)
+        monkeypatch.setattr(llm_gateway, "_breakers", {"gemini": breaker})
+        breaker.record_failure()
+        now[0] += 31
+        started = asyncio.Event()
+
+        async def hanging_post(*_args, **_kwargs):
+            started.set()
+            await asyncio.sleep(60)
+
+        monkeypatch.setattr(llm_gateway, "llm_post_async", hanging_post)
+
+        async def run() -> None:
+            call = asyncio.create_task(llm_gateway.chat_completion_async(
+                [{"role": "user", "content": "hi"}], provider="gemini", failover=False,
+            ))
+            await started.wait()
+            assert not breaker.allow()
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+
+        asyncio.run(run())
+
+        assert breaker.state == "half_open"
+        assert breaker.allow()
+
+    def test_unexpected_probe_error_releases_half_open_slot(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        now = [100.0]
+        monkeypatch.setattr(llm_gateway.time, "monotonic", lambda: now[0])
+        breaker = llm_gateway.CircuitBreaker("gemini", failure_threshold=1, open_seconds=30)
+        monkeypatch.setattr(llm_gateway, "_breakers", {"gemini": breaker})
+        breaker.record_failure()
+        now[0] += 31
+
+        def broken_post(*_args, **_kwargs):
+            raise ValueError("bad header")
+
+        monkeypatch.setattr(llm_gateway, "llm_post", broken_post)
+
+        with pytest.raises(ValueError):
+            llm_gateway.chat_completion_sync([{"role": "user", "content": "hi"}], provider="gemini", failover=False)
+
+        assert breaker.allow()
+
+
+@pytest.mark.unit
+class TestChatCompletion:
+    def test_fails_over_to_qwen_on_server_error(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        fake = _FakeProviders(monkeypatch, {
+            "ofox": [lambda: httpx.Response(503, json={"error": {"message": "overloaded"}})],
+            "dashscope": [lambda: _completion('{"items": []}')],
+        })
+
+        result = llm_gateway.chat_completion_sync(
+            [{"role": "user", "content": "hi"}],
+            provider="gemini",
+            model="gemini-custom",
+            kind="vision",
+            parse=llm_gateway.parse_json_content,
+        )
+
+        assert fake.calls == [("ofox", "gemini-custom"), ("dashscope", "qwen-vl-max")]
+        assert result["provider"] == "qwen"
+        assert result["parsed"] == {"items": []}
+        assert fake.sleeps == []
+
+    def test_open_breaker_skips_provider(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        fake = _FakeProviders(monkeypatch, {
+            "ofox": [lambda: _completion("{}")],
+            "dashscope": [lambda: _completion('{"ok": true}')],
+        })
+        monkeypatch.setattr(llm_gateway, "_breakers", {"gemini": llm_gateway.CircuitBreaker("gemini", failure_threshold=1)})
+        llm_gateway.get_circuit_breaker("gemini").record_failure()
+
+        result = llm_gateway.chat_completion_sync([{"role": "user", "content": "hi"}], provider="gemini", kind="text")
+
+        assert [c[0] for c in fake.calls] == ["dashscope"]
+        assert result["model"] == "qwen-plus"
+
+    def test_no_failover_retries_same_provider_with_backoff(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        fake = _FakeProviders(monkeypatch, {
+            "ofox": [lambda: httpx.Response(429), lambda: _completion('{"ok": true}')],
+            "dashscope": [lambda: _completion("{}")],
+        })
+
+        result = llm_gateway.chat_completion_sync(
+            [{"role": "user", "content": "hi"}],
+            provider="gemini",
+            failover=False,
+            parse=llm_gateway.parse_json_content,
+        )
+
+        assert [c[0] for c in fake.calls] == ["ofox", "ofox"]
+        assert result["parsed"] == {"ok": True}
+        assert len(fake.sleeps) == 1
+        assert 0 <= fake.sleeps[0] <= llm_gateway.LLM_RETRY_BASE_SECONDS
+
+    def test_single_configured_provider_backs_off_between_retries(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.delenv("DASHSCOPE_API_KEY")
+        monkeypatch.delenv("API_KEY", raising=False)
+        fake = _FakeProviders(monkeypatch, {
+            "ofox": [lambda: httpx.Response(503)],
+            "dashscope": [lambda: _completion("{}")],
+        })
+
+        with pytest.raises(llm_gateway.LLMGatewayError, match="503"):
+            llm_gateway.chat_completion_sync([{"role": "user", "content": "hi"}], provider="gemini", max_attempts=3)
+
+        assert [c[0] for c in fake.calls] == ["ofox", "ofox", "ofox"]
+        # 备份服务商未配置：每次重试前都退避，最后一次失败后不再空等
+        assert len(fake.sleeps) == 2
+
+    def test_both_providers_failing_back_off_after_each_round(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        fake = _FakeProviders(monkeypatch, {
+            "ofox": [lambda: httpx.Response(503)],
+            "dashscope": [lambda: httpx.Response(502)],
+        })
+
+        with pytest.raises(llm_gateway.LLMGatewayError):
+            llm_gateway.chat_completion_sync([{"role": "user", "content": "hi"}], provider="gemini", max_attempts=4)
+
+        assert [c[0] for c in fake.calls] == ["ofox", "dashscope", "dashscope", "ofox"]
+        # 一轮（两家各失败一次）之后才退避一次，而不是在两家之间无间隔来回切换
+        assert len(fake.sleeps) == 1
+
+    def test_client_error_is_not_retried(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        fake = _FakeProviders(monkeypatch, {
+            "ofox": [lambda: httpx.Response(400, json={"error": {"message": "bad image"}})],
+            "dashscope": [lambda: _completion("{}")],
+        })
+
+        with pytest.raises(llm_gateway.LLMGatewayError, match="bad image"):
+            llm_gateway.chat_completion_sync([{"role": "user", "content": "hi"}], provider="gemini")
+
+        assert [c[0] for c in fake.calls] == ["ofox"]
+        assert llm_gateway.get_circuit_breaker("gemini").state == "closed"
+
+    def test_unparseable_content_retried_without_tripping_breaker(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        fake = _FakeProviders(monkeypatch, {
+            "ofox": [lambda: _completion("not json"), lambda: _completion('```json\n{"ok": 1}\n```')],
+            "dashscope": [lambda: _completion("{}")],
+        })
+
+        result = llm_gateway.chat_completion_sync(
+            [{"role": "user", "content": "hi"}],
+            provider="gemini",
+            parse=llm_gateway.parse_json_content,
+        )
+
+        assert [c[0] for c in fake.calls] == ["ofox", "ofox"]
+        assert result["parsed"] == {"ok": 1}
+        assert llm_gateway.get_circuit_breaker("gemini").state == "closed"
+
+    def test_attempts_exhausted_raises_last_error(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        fake = _FakeProviders(monkeypatch, {
+            "ofox": [lambda: httpx.Response(500)],
+            "dashscope": [lambda: httpx.Response(502)],
+        })
+
+        with pytest.raises(llm_gateway.LLMGatewayError, match="502"):
+            llm_gateway.chat_completion_sync([{"role": "user", "content": "hi"}], provider="gemini", max_attempts=2)
+
+        assert [c[0] for c in fake.calls] == ["ofox", "dashscope"]
+
+    def test_async_fails_over_on_transport_error(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        calls: List[str] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            provider = llm_http.llm_provider_name(str(request.url))
+            calls.append(provider)
+            if provider == "ofox":
+                raise httpx.ConnectError("refused", request=request)
+            return _completion('{"ok": true}')
+
+        async def run() -> dict:
+            clients = llm_http._async_clients.setdefault(asyncio.get_running_loop(), {})
+            for url in (OFOX_URL, DASHSCOPE_URL):
+                clients[llm_http._origin(url)] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            try:
+                return await llm_gateway.chat_completion_async(
+                    [{"role": "user", "content": "hi"}],
+                    provider="gemini",
+                    parse=llm_gateway.parse_json_content,
+                )
+            finally:
+                await llm_http.close_async_llm_http_clients()
+
+        result = asyncio.run(run())
+
+        assert calls == ["ofox", "dashscope"]
+        assert result["provider"] == "qwen"
+
+
+@pytest.mark.unit
+class TestCallSites:
+    def test_report_ocr_goes_through_gateway_without_failover(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        import main
+
+        calls: List[dict] = []
+
+        async def fake_completion(messages, **kwargs):
+            calls.append(kwargs)
+            return {"parsed": {"indicators": []}}
+
+        monkeypatch.setattr(main, "chat_completion_async", fake_completion)
+        assert asyncio.run(main._ocr_extract_report_by_url("https://img/r.jpg")) == {"indicators": []}
+        assert calls[0]["provider"] == llm_gateway.PROVIDER_QWEN
+        assert calls[0]["failover"] is False
+
+    def test_report_ocr_gateway_failure_is_http_500(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        import main
+
+        async def failing_completion(messages, **kwargs):
+            raise llm_gateway.LLMGatewayError("千问 API 错误: 503")
+
+        monkeypatch.setattr(main, "chat_completion_async", failing_completion)
+        with pytest.raises(main.HTTPException) as exc_info:
+            asyncio.run(main._ocr_extract_report_by_url("https://img/r.jpg"))
+        assert exc_info.value.status_code == 500
@@ -0,0 +1,54 @@
+"""
+LLM HTTP 连接池：同一服务商复用进程内共享客户端，不同服务商各自独立，超时按请求传入
+"""
+import asyncio
+from typing import List
+
+import httpx
+import pytest
+
+import llm_http
+
+
+@pytest.fixture(autouse=True)
+def _reset_clients():
+    llm_http.close_llm_http_clients()
+    yield
+    llm_http.close_llm_http_clients()
+
+
+@pytest.mark.unit
+class TestLlmHttpClient:
+    def test_provider_name(self) -> None:
+        assert llm_http.llm_provider_name("https://api.ofox.ai/v1/chat/completions") == "ofox"
+        assert llm_http.llm_provider_name("https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions") == "dashscope"
+        assert llm_http.llm_provider_name("https://example.com/v1") == "example.com"
+
+    def test_client_shared_per_provider(self) -> None:
+        ofox = llm_http.get_llm_http_client("https://api.ofox.ai/v1/chat/completions")
+        assert llm_http.get_llm_http_client("https://api.ofox.ai/v1/models") is ofox
+        assert llm_http.get_llm_http_client("https://api.deepseek.com/chat/completions") is not ofox
+
+    def test_post_reuses_pooled_client_with_request_timeout(self) -> None:
+        seen: List[httpx.Request] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append(request)
+            return httpx.Response(200, json={"ok": True})
+
+        url = "https://api.ofox.ai/v1/chat/completions"
+        llm_http._sync_clients[llm_http._origin(url)] = httpx.Client(transport=httpx.MockTransport(handler))
+        for _ in range(2):
+            assert llm_http.llm_post(url, timeout=12.5, json={"model": "m"}).json() == {"ok": True}
+        assert len(seen) == 2
+        assert seen[0].extensions["timeout"]["read"] == 12.5
+
+    def test_async_client_cached_per_loop(self) -> None:
+        async def _get_twice():
+            first = llm_http.get_async_llm_http_client("https://api.ofox.ai/v1/chat/completions")
+            second = llm_http.get_async_llm_http_client("https://api.ofox.ai/v1/other")
+            await llm_http.close_async_llm_http_clients()
+            return first, second
+
+        first, second = asyncio.run(_get_twice())
+        assert first is second
@@ -0,0 +1,127 @@
+"""
+进程内缓存：容量上限 LRU + TTL、按前缀失效、命中统计；好友关系变化时清理相关缓存
+"""
+from typing import Any, Dict, List
+
+import pytest
+
+import database
+import memory_cache
+
+
+@pytest.mark.unit
+class TestTTLCache:
+    def test_lru_eviction_keeps_recently_used(self) -> None:
+        cache = memory_cache.TTLCache("t", maxsize=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert len(cache) == 2
+        assert cache.stats()["evictions"] == 1
+
+    def test_entries_expire(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        now = [1000.0]
+        monkeypatch.setattr(memory_cache.time, "monotonic", lambda: now[0])
+        cache = memory_cache.TTLCache("t", maxsize=10, ttl_seconds=5)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl_seconds=60)
+
+        now[0] += 6
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+        assert cache.stats()["expirations"] == 1
+
+    def test_expired_entries_dropped_before_lru_eviction(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        now = [1000.0]
+        monkeypatch.setattr(memory_cache.time, "monotonic", lambda: now[0])
+        cache = memory_cache.TTLCache("t", maxsize=2, ttl_seconds=60)
+        cache.set("old", 1, ttl_seconds=1)
+        cache.set("a", 2)
+        now[0] += 2
+        cache.set("b", 3)
+
+        assert cache.get("a") == 2
+        assert cache.stats()["evictions"] == 0
+
+    def test_invalidate_prefix_and_stats(self) -> None:
+        cache = memory_cache.TTLCache("t", maxsize=10, ttl_seconds=60)
+        cache.set("board:u1:w1", 1)
+        cache.set("board:u1:w2", 2)
+        cache.set("board:u2:w1", 3)
+
+        assert cache.invalidate_prefix("board:u1:") == 2
+        assert cache.get("board:u1:w1") is None
+        assert cache.get("board:u2:w1") == 3
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 1, 2)
+        assert stats["hit_rate"] == 0.5
+
+    def test_registry_returns_named_cache(self) -> None:
+        cache = memory_cache.get_cache("test_registry_cache", maxsize=3, ttl_seconds=1)
+        assert memory_cache.get_cache("test_registry_cache") is cache
+        assert memory_cache.cache_stats()["test_registry_cache"]["maxsize"] == 3
+
+
+class _FakeQuery:
+    def __init__(self, table: "_FakeFriendsTable", op: str) -> None:
+        self.table = table
+        self.op = op
+        self.filters: Dict[str, Any] = {}
+
+    def select(self, *_args: Any) -> "_FakeQuery":
+        return self
+
+    def eq(self, column: str, value: Any) -> "_FakeQuery":
+        self.filters[column] = value
+        return self
+
+    async def execute(self) -> Any:
+        rows = [r for r in self.table.rows if all(r.get(k) == v for k, v in self.filters.items())]
+        if self.op == "delete":
+            self.table.rows = [r for r in self.table.rows if r not in rows]
+        return type("Result", (), {"data": rows})()
+
+
+class _FakeFriendsTable:
+    def __init__(self) -> None:
+        self.rows: List[Dict[str, Any]] = []
+
+    def select(self, *_args: Any) -> _FakeQuery:
+        return _FakeQuery(self, "select")
+
+    def delete(self) -> _FakeQuery:
+        return _FakeQuery(self, "delete")
+
+    def insert(self, records: List[Dict[str, Any]]) -> _FakeQuery:
+        self.rows.extend(records)
+        return _FakeQuery(self, "insert")
+
+
+@pytest.mark.unit
+class TestFriendCacheInvalidation:
+    async def test_friend_changes_clear_both_users_caches(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        table = _FakeFriendsTable()
+        client = type("Client", (), {"table": lambda self, name: table})()
+        monkeypatch.setattr(database, "check_supabase_configured", lambda: None)
+        monkeypatch.setattr(database, "get_async_supabase_client", lambda: client)
+        database._friend_ids_cache.clear()
+        database._checkin_leaderboard_cache.clear()
+        for uid in ("u1", "u2", "u3"):
+            database._friend_ids_cache.set(f"friend_ids:{uid}", [])
+            database._checkin_leaderboard_cache.set(f"checkin_leaderboard:{uid}:2026-10-12T00:00:00Z", {"list": []})
+
+        await database.add_friend_pair("u1", "u2")
+
+        assert database._friend_ids_cache.get("friend_ids:u1") is None
+        assert database._friend_ids_cache.get("friend_ids:u2") is None
+        assert database._checkin_leaderboard_cache.get("checkin_leaderboard:u2:2026-10-12T00:00:00Z") is None
+        assert database._friend_ids_cache.get("friend_ids:u3") == []
+
+        database._friend_ids_cache.set("friend_ids:u1", ["u2"])
+        assert await database.delete_friend_pair("u1", "u2") == {"deleted": 2}
+        assert database._friend_ids_cache.get("friend_ids:u1") is None
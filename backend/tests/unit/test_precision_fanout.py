@@ -0,0 +1,171 @@
+"""
+精准模式扇出 / 汇聚：
+- 进程内扇出：规划 Worker 并发估计各组并直接聚合，仍写入 precision_item_estimates，不再派发子任务与聚合任务
+- 队列扇出：聚合任务以 waiting 创建并先登记轮次倒计数，子任务完成后由数据库放行，聚合只读一次不轮询
+"""
+import threading
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+import worker
+
+
+class _FakePrecisionStore:
+    def __init__(self, items: List[Dict[str, Any]], fail_item: Optional[str] = None) -> None:
+        self.items = items
+        self.fail_item = fail_item
+        self.estimates: Dict[str, Dict[str, Any]] = {}
+        self.session_updates: List[Dict[str, Any]] = []
+        self.task_results: List[Dict[str, Any]] = []
+        self.created_tasks: List[Dict[str, Any]] = []
+        self.armed: List[Any] = []
+        self.cancelled: List[str] = []
+        self.fail_create_after: Optional[int] = None
+        self.events: List[str] = []
+        self._lock = threading.Lock()
+
+    def install(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(worker, "PRECISION_INPROCESS_FANOUT", True)
+        monkeypatch.setattr(worker, "_run_precision_plan_sync", lambda task: {"splitStrategy": "multi_item_parallel"})
+        monkeypatch.setattr(worker, "_build_precision_estimate_items", lambda planner_result, source_type: self.items)
+        monkeypatch.setattr(worker, "get_precision_session_by_id_sync", lambda session_id: {"id": session_id, "round_index": 1, "latest_inputs": {"text": "午餐"}})
+        monkeypatch.setattr(worker, "create_precision_session_round_sync", lambda *args, **kwargs: {"id": "r1"})
+        monkeypatch.setattr(worker, "arm_precision_round_fan_in_sync", self.arm)
+        monkeypatch.setattr(worker, "create_precision_item_estimate_sync", self.create_estimate)
+        monkeypatch.setattr(worker, "update_precision_item_estimate_sync", self.update_estimate)
+        monkeypatch.setattr(worker, "list_precision_item_estimates_sync", lambda session_id, round_index=None: sorted(self.estimates.values(), key=lambda e: e["item_index"]))
+        monkeypatch.setattr(worker, "_run_precision_item_estimate_sync", self.estimate)
+        monkeypatch.setattr(worker, "_build_precision_final_result", lambda **kwargs: {"items": [e["result"] for e in kwargs["estimates"]]})
+        monkeypatch.setattr(worker, "update_precision_session_sync", lambda session_id, updates: self.session_updates.append(updates))
+        monkeypatch.setattr(worker, "update_analysis_task_result_sync", lambda task_id, **kwargs: self.task_results.append(kwargs))
+        monkeypatch.setattr(worker, "create_analysis_task_sync", self.create_task)
+        monkeypatch.setattr(worker, "cancel_unstarted_analysis_tasks_sync", lambda task_ids, error_message: self.cancelled.extend(task_ids))
+
+    def create_task(self, **kwargs: Any) -> Dict[str, Any]:
+        if self.fail_create_after is not None and len(self.created_tasks) >= self.fail_create_after:
+            raise RuntimeError("网络错误")
+        task = {"id": f"t{len(self.created_tasks)}", "status": "pending", **kwargs}
+        self.created_tasks.append(task)
+        self.events.append(f"task:{kwargs['task_type']}")
+        return task
+
+    def arm(self, round_id: str, pending_estimate_count: int, aggregate_task_id: str) -> None:
+        self.armed.append((round_id, pending_estimate_count, aggregate_task_id))
+        self.events.append("arm")
+
+    def create_estimate(self, **kwargs: Any) -> Dict[str, Any]:
+        row = {"id": f"e{kwargs['item_index']}", "status": "pending", **kwargs}
+        with self._lock:
+            self.estimates[row["id"]] = row
+        return row
+
+    def update_estimate(self, estimate_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.estimates[estimate_id].update(updates)
+            return dict(self.estimates[estimate_id])
+
+    def estimate(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        names = [item["item_name"] for item in task["payload"]["items_to_estimate"]]
+        if self.fail_item in names:
+            raise RuntimeError("估计超时")
+        return {"names": names}
+
+
+def _plan_task() -> Dict[str, Any]:
+    return {
+        "id": "plan-1",
+        "user_id": "u1",
+        "task_type": "precision_plan",
+        "payload": {"precision_session_id": "s1", "source_type": "text"},
+    }
+
+
+@pytest.mark.unit
+class TestPrecisionInprocessFanout:
+    def test_estimates_and_aggregates_without_queue_hops(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        items = [{"item_name": f"菜{i}", "uncertainty_level": "high"} for i in range(3)]
+        store = _FakePrecisionStore(items)
+        store.install(monkeypatch)
+
+        worker.process_one_precision_plan_task(_plan_task())
+
+        assert store.created_tasks == []
+        assert [e["status"] for e in store.estimates.values()] == ["done", "done"]
+        assert store.session_updates[0]["status"] == "estimating"
+        assert store.session_updates[0]["current_task_id"] == "plan-1"
+        assert store.session_updates[-1]["status"] == "done"
+        assert store.task_results[-1]["status"] == "done"
+        assert store.task_results[-1]["result"] == {"items": [{"names": ["菜0", "菜1"]}, {"names": ["菜2"]}]}
+
+    def test_failed_group_fails_plan_task(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        items = [{"item_name": f"菜{i}", "uncertainty_level": "high"} for i in range(3)]
+        store = _FakePrecisionStore(items, fail_item="菜2")
+        store.install(monkeypatch)
+
+        worker.process_one_precision_plan_task(_plan_task())
+
+        assert store.estimates["e1"]["status"] == "failed"
+        assert store.session_updates[-1]["status"] == "failed"
+        assert store.task_results[-1]["status"] == "failed"
+        assert "估计超时" in store.task_results[-1]["error_message"]
+
+
+@pytest.mark.unit
+class TestPrecisionQueuedFanIn:
+    def test_aggregate_waits_and_countdown_armed_before_children(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        items = [{"item_name": f"菜{i}", "uncertainty_level": "high"} for i in range(3)]
+        store = _FakePrecisionStore(items)
+        store.install(monkeypatch)
+        monkeypatch.setattr(worker, "PRECISION_INPROCESS_FANOUT", False)
+
+        worker.process_one_precision_plan_task(_plan_task())
+
+        aggregate = store.created_tasks[0]
+        assert aggregate["task_type"] == "precision_aggregate"
+        assert aggregate["status"] == "waiting"
+        assert store.armed == [("r1", 2, aggregate["id"])]
+        assert store.events[:2] == ["task:precision_aggregate", "arm"]
+        children = store.created_tasks[1:]
+        assert [c["payload"]["precision_estimate_id"] for c in children] == ["e0", "e1"]
+        assert [store.estimates[f"e{i}"]["source_task_id"] for i in range(2)] == [c["id"] for c in children]
+        assert store.task_results[-1]["result"]["redirectTaskId"] == aggregate["id"]
+
+    def test_partial_enqueue_cancels_aggregate_and_children(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        items = [{"item_name": f"菜{i}", "uncertainty_level": "high"} for i in range(5)]
+        store = _FakePrecisionStore(items)
+        store.install(monkeypatch)
+        monkeypatch.setattr(worker, "PRECISION_INPROCESS_FANOUT", False)
+        store.fail_create_after = 2  # 聚合任务 + 第一个子任务创建成功，第二个子任务失败
+
+        worker.process_one_precision_plan_task(_plan_task())
+
+        aggregate, child = store.created_tasks
+        assert store.armed == [("r1", 3, aggregate["id"])]
+        assert store.cancelled == [aggregate["id"], child["id"]]
+        assert store.task_results[-1]["status"] == "failed"
+        assert store.session_updates[-1]["status"] == "failed"
+
+    def test_aggregate_reads_once_and_fails_unfinished(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        store = _FakePrecisionStore([])
+        store.install(monkeypatch)
+        store.estimates = {
+            "e0": {"id": "e0", "item_index": 0, "item_name": "米饭", "status": "done", "result": {"names": ["米饭"]}},
+            "e1": {"id": "e1", "item_index": 1, "item_name": "红烧肉", "status": "processing"},
+        }
+        reads: List[int] = []
+        monkeypatch.setattr(
+            worker,
+            "list_precision_item_estimates_sync",
+            lambda session_id, round_index=None: reads.append(1) or list(store.estimates.values()),
+        )
+
+        worker.process_one_precision_aggregate_task({
+            "id": "agg-1",
+            "payload": {"precision_session_id": "s1", "round_index": 1, "split_strategy": "multi_item_parallel"},
+        })
+
+        assert reads == [1]
+        assert store.task_results[-1]["status"] == "failed"
+        assert "红烧肉" in store.task_results[-1]["error_message"]
+        assert "子项估计超时未完成" in store.task_results[-1]["error_message"]
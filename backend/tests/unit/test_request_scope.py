@@ -0,0 +1,133 @@
+"""
+请求级读缓存：作用域内同一读取只回源一次，写操作后重新读取，作用域外不缓存
+"""
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+import database
+from request_scope import invalidate_request_memo, memoized, request_scope
+
+
+class _Loader:
+    def __init__(self, value: Any = None) -> None:
+        self.value = value
+        self.calls = 0
+
+    async def __call__(self) -> Any:
+        self.calls += 1
+        await asyncio.sleep(0)
+        return self.value
+
+
+@pytest.mark.unit
+class TestRequestScope:
+    async def test_reads_once_within_scope(self) -> None:
+        loader = _Loader({"id": "u1", "tags": ["a"]})
+        with request_scope():
+            first = await memoized("user", "u1", loader)
+            first["tags"].append("mutated")
+            second = await memoized("user", "u1", loader)
+
+        assert loader.calls == 1
+        assert second == {"id": "u1", "tags": ["a"]}
+
+    async def test_no_memo_outside_scope(self) -> None:
+        loader = _Loader(1)
+        await memoized("user", "u1", loader)
+        await memoized("user", "u1", loader)
+        assert loader.calls == 2
+
+    async def test_scopes_do_not_share(self) -> None:
+        loader = _Loader(1)
+        with request_scope():
+            await memoized("user", "u1", loader)
+        with request_scope():
+            await memoized("user", "u1", loader)
+        assert loader.calls == 2
+
+    async def test_concurrent_reads_share_one_load(self) -> None:
+        loader = _Loader(1)
+        with request_scope():
+            results = await asyncio.gather(*(memoized("user", "u1", loader) for _ in range(3)))
+        assert results == [1, 1, 1]
+        assert loader.calls == 1
+
+    async def test_failures_are_not_memoized(self) -> None:
+        calls: List[int] = []
+
+        async def flaky() -> int:
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("timeout")
+            return 2
+
+        with request_scope():
+            with pytest.raises(RuntimeError):
+                await memoized("membership", "u1", flaky)
+            assert await memoized("membership", "u1", flaky) == 2
+
+    async def test_invalidation_by_key_kind_and_from_thread(self) -> None:
+        loader = _Loader(1)
+        with request_scope():
+            await memoized("user", "u1", loader)
+            invalidate_request_memo("user", "u1")
+            await memoized("user", "u1", loader)
+            invalidate_request_memo("user")
+            await memoized("user", "u1", loader)
+            # asyncio.to_thread 复制上下文：线程内的同步写同样清掉本请求缓存
+            await asyncio.to_thread(invalidate_request_memo, "user", "u1")
+            await memoized("user", "u1", loader)
+        assert loader.calls == 4
+
+
+class _FakeUserQuery:
+    def __init__(self, rows: Dict[str, Dict[str, Any]], counter: Dict[str, int], update: Any = None) -> None:
+        self.rows = rows
+        self.counter = counter
+        self.update_data = update
+        self.user_id = ""
+
+    def select(self, *_args: Any) -> "_FakeUserQuery":
+        return self
+
+    def eq(self, _column: str, value: Any) -> "_FakeUserQuery":
+        self.user_id = value
+        return self
+
+    async def execute(self) -> Any:
+        row = self.rows.get(self.user_id)
+        if self.update_data is not None and row is not None:
+            row.update(self.update_data)
+        else:
+            self.counter["selects"] += 1
+        return type("Result", (), {"data": [dict(row)] if row else []})()
+
+
+@pytest.mark.unit
+class TestUserLookupMemo:
+    async def test_user_and_earned_balance_share_one_read(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        rows = {"u1": {"id": "u1", "earned_credits_balance": 5}}
+        counter = {"selects": 0}
+
+        class _Table:
+            def select(self, *args: Any) -> _FakeUserQuery:
+                return _FakeUserQuery(rows, counter).select(*args)
+
+            def update(self, data: Dict[str, Any]) -> _FakeUserQuery:
+                return _FakeUserQuery(rows, counter, update=data)
+
+        client = type("Client", (), {"table": lambda self, name: _Table()})()
+        monkeypatch.setattr(database, "check_supabase_configured", lambda: None)
+        monkeypatch.setattr(database, "get_async_supabase_client", lambda: client)
+
+        with request_scope():
+            user = await database.get_user_by_id("u1")
+            assert await database.get_user_earned_credits_balance("u1") == 5
+            assert counter["selects"] == 1
+
+            user["earned_credits_balance"] = 99
+            await database.update_user("u1", {"earned_credits_balance": 7})
+            assert await database.get_user_earned_credits_balance("u1") == 7
+            assert counter["selects"] == 2
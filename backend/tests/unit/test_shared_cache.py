@@ -0,0 +1,88 @@
+"""
+跨进程共享缓存：L1 未命中回源共享层，失效消息让其他进程清掉各自的 L1，共享层故障时降级为仅进程内缓存
+"""
+import pytest
+
+import shared_cache
+
+
+@pytest.fixture
+def sqlite_tier(monkeypatch: pytest.MonkeyPatch, tmp_path):
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_BACKEND", "sqlite")
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_SQLITE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_BUS_POLL_SECONDS", 0.0)
+    shared_cache._tier.reset()
+    yield str(tmp_path / "cache.sqlite3")
+    shared_cache._tier.reset()
+
+
+@pytest.mark.unit
+class TestSharedCache:
+    def test_local_miss_reads_shared_tier(self, sqlite_tier: str) -> None:
+        cache = shared_cache.get_shared_cache("test_shared_read", ttl_seconds=60)
+        cache.set("friend_ids:u1", ["u2", "u3"])
+        cache.local.clear()
+
+        assert cache.get("friend_ids:u1") == ["u2", "u3"]
+        assert shared_cache.shared_cache_backend_name() == "sqlite"
+        assert cache.local.stats()["misses"] == 1
+
+    def test_invalidation_from_other_process_clears_local(self, sqlite_tier: str) -> None:
+        cache = shared_cache.get_shared_cache("test_shared_bus", ttl_seconds=60)
+        cache.set("board:u1:w1", {"list": [1]})
+        cache.set("board:u2:w1", {"list": [2]})
+        assert cache.get("board:u1:w1") == {"list": [1]}
+
+        # 另一个进程：删除共享层并发布前缀失效
+        other = shared_cache._SqliteBackend(sqlite_tier)
+        other.delete_prefix("test_shared_bus:board:u1:")
+        other.publish({"origin": "other-process", "namespace": "test_shared_bus", "key": "board:u1:", "mode": "prefix"})
+
+        assert cache.get("board:u1:w1") is None
+        assert cache.get("board:u2:w1") == {"list": [2]}
+
+    def test_forked_process_does_not_ignore_parent_messages(
+        self, sqlite_tier: str, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        cache = shared_cache.get_shared_cache("test_shared_fork", ttl_seconds=60)
+        cache.set("k", 1)
+        parent_origin = shared_cache._origin()
+
+        # fork 后子进程继承同一随机串，但 pid 不同：父进程发布的失效消息仍要生效
+        real_pid = shared_cache.os.getpid()
+        monkeypatch.setattr(shared_cache.os, "getpid", lambda: real_pid + 1)
+        assert shared_cache._origin() != parent_origin
+        shared_cache._apply_invalidation({"origin": parent_origin, "namespace": "test_shared_fork", "key": "k", "mode": "key"})
+
+        assert cache.local.get("k") is None
+
+    def test_invalidate_removes_shared_entry(self, sqlite_tier: str) -> None:
+        cache = shared_cache.get_shared_cache("test_shared_delete", ttl_seconds=60)
+        cache.set("code:pro", {"code": "pro"})
+        cache.invalidate("code:pro")
+        cache.local.clear()
+
+        assert cache.get("code:pro") is None
+
+    def test_backend_error_falls_back_to_local(self, sqlite_tier: str, monkeypatch: pytest.MonkeyPatch) -> None:
+        cache = shared_cache.get_shared_cache("test_shared_fallback", ttl_seconds=60)
+        backend = shared_cache._tier.backend()
+
+        def broken(*_args):
+            raise RuntimeError("database is locked")
+
+        monkeypatch.setattr(backend, "set", broken)
+        cache.set("k", 1)
+
+        assert cache.get("k") == 1
+        assert shared_cache.shared_cache_backend_name() == "local"
+
+    def test_local_backend_is_process_only(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(shared_cache, "SHARED_CACHE_BACKEND", "local")
+        shared_cache._tier.reset()
+        cache = shared_cache.get_shared_cache("test_shared_local", ttl_seconds=60)
+        cache.set("k", 1)
+        cache.local.clear()
+
+        assert cache.get("k") is None
+        shared_cache._tier.reset()
@@ -0,0 +1,99 @@
+"""
+Worker 任务唤醒：LISTEN 到匹配通知立即返回，不匹配的通知被忽略，无连接串时退回按 poll_interval 轮询；
+保质期 Worker 按最早一条通知的 scheduled_at 缩短等待
+"""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+
+import task_wakeup
+import worker
+from task_wakeup import TaskWakeup
+
+
+class _FakeConn:
+    def __init__(self, payloads: List[str]) -> None:
+        self.notifies = [SimpleNamespace(channel="analysis_tasks", payload=p) for p in payloads]
+        self.polls = 0
+
+    def poll(self) -> None:
+        self.polls += 1
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.mark.unit
+class TestTaskWakeup:
+    def test_pending_matching_notify_returns_immediately(self) -> None:
+        wakeup = TaskWakeup("analysis_tasks", payload="food")
+        wakeup._conn = _FakeConn(["food_text", "food"])
+        assert wakeup.wait() is True
+        assert wakeup._conn.notifies == []
+
+    def test_other_task_types_do_not_wake(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(task_wakeup.select, "select", lambda r, w, x, timeout: ([], [], []))
+        monkeypatch.setattr(task_wakeup, "WORKER_FALLBACK_POLL_SECONDS", 0.0)
+        wakeup = TaskWakeup("analysis_tasks", payload="food", poll_interval=0.0)
+        wakeup._conn = _FakeConn(["food_text"])
+        assert wakeup.wait() is False
+
+    def test_without_db_url_falls_back_to_polling(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        slept: List[float] = []
+        monkeypatch.setattr(task_wakeup, "TASK_WAKEUP_DB_URL", "")
+        monkeypatch.setattr(task_wakeup.time, "sleep", slept.append)
+        wakeup = TaskWakeup("comment_tasks", poll_interval=2.0)
+        assert wakeup.wait() is False
+        assert slept == [2.0]
+        assert not wakeup.listening
+
+    def test_timeout_caps_listen_wait(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        timeouts: List[float] = []
+
+        def fake_select(r: Any, w: Any, x: Any, timeout: float) -> Any:
+            timeouts.append(timeout)
+            monkeypatch.setattr(task_wakeup.time, "monotonic", lambda: float("inf"))
+            return [], [], []
+
+        monkeypatch.setattr(task_wakeup.select, "select", fake_select)
+        monkeypatch.setattr(task_wakeup, "WORKER_FALLBACK_POLL_SECONDS", 30.0)
+        wakeup = TaskWakeup("food_expiry_notification_jobs")
+        wakeup._conn = _FakeConn([])
+        assert wakeup.wait(timeout=5.0) is False
+        assert len(timeouts) == 1 and timeouts[0] <= 5.0
+
+    def test_timeout_caps_polling_sleep(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        slept: List[float] = []
+        monkeypatch.setattr(task_wakeup, "TASK_WAKEUP_DB_URL", "")
+        monkeypatch.setattr(task_wakeup.time, "sleep", slept.append)
+        wakeup = TaskWakeup("food_expiry_notification_jobs", poll_interval=2.0)
+        wakeup.wait(timeout=0.5)
+        wakeup.wait(timeout=-3.0)
+        assert slept == [0.5, 0.0]
+
+
+@pytest.mark.unit
+class TestFoodExpiryWorkerWakeup:
+    def test_idle_worker_sleeps_until_next_scheduled_job(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        timeouts: List[Any] = []
+        stop = SimpleNamespace(is_set=lambda: bool(timeouts))
+
+        class _Wakeup:
+            def __init__(self, *args: Any, **kwargs: Any) -> None:
+                pass
+
+            def wait(self, timeout: Any = None) -> bool:
+                timeouts.append(timeout)
+                return False
+
+        due_at = datetime.now(timezone.utc) + timedelta(seconds=12)
+        monkeypatch.setattr(worker, "TaskWakeup", _Wakeup)
+        monkeypatch.setattr(worker, "claim_next_pending_food_expiry_notification_job_sync", lambda: None)
+        monkeypatch.setattr(worker, "get_next_food_expiry_notification_due_at_sync", lambda: due_at)
+
+        worker.run_food_expiry_notification_worker(0, stop_event=stop)
+
+        assert len(timeouts) == 1
+        assert 10.0 < timeouts[0] <= 12.0
@@ -0,0 +1,102 @@
+"""
+连续记录天数：读取物化的 current_streak / last_record_date，新增记录时增量维护，补录或删除时一次查询重算
+"""
+import json
+from datetime import date, datetime, timedelta
+from typing import Any, Dict
+
+import httpx
+import pytest
+
+import database
+from tests.conftest import FakeSupabaseBackend
+
+
+class _FakeStreakBackend:
+    def __init__(self, user: Dict[str, Any], rpc_result: Dict[str, Any]) -> None:
+        self.user = user
+        self.rpc_result = rpc_result
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/rpc/get_user_food_record_streak"):
+            return httpx.Response(200, json=[self.rpc_result])
+        if request.method == "PATCH":
+            self.user.update(json.loads(request.content))
+            return httpx.Response(200, json=[self.user])
+        return httpx.Response(200, json=[self.user])
+
+
+def _today() -> date:
+    return datetime.now(database.CHINA_TZ).date()
+
+
+@pytest.mark.unit
+class TestEffectiveStreakDays:
+    def test_streak_valid_until_yesterday(self) -> None:
+        today = date(2026, 5, 10)
+        assert database._effective_streak_days(7, "2026-05-10", today) == 7
+        assert database._effective_streak_days(7, "2026-05-09", today) == 7
+        assert database._effective_streak_days(7, "2026-05-08", today) == 0
+        assert database._effective_streak_days(0, None, today) == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+class TestMaterializedStreak:
+    async def test_read_is_single_query(self, fake_supabase: FakeSupabaseBackend) -> None:
+        backend = _FakeStreakBackend({"id": "u1", "current_streak": 200, "last_record_date": _today().isoformat()}, {})
+        fake_supabase.install(backend.handler)
+        assert await database.get_streak_days("u1") == 200
+        assert len(fake_supabase.requests) == 1
+
+    async def test_unmaterialized_user_is_recomputed(self, fake_supabase: FakeSupabaseBackend) -> None:
+        yesterday = (_today() - timedelta(days=1)).isoformat()
+        backend = _FakeStreakBackend(
+            {"id": "u1", "current_streak": 0, "last_record_date": None},
+            {"current_streak": 3, "last_record_date": yesterday},
+        )
+        fake_supabase.install(backend.handler)
+        assert await database.get_streak_days("u1") == 3
+        assert backend.user["last_record_date"] == yesterday
+        assert backend.user["streak_computed_at"]
+
+    async def test_materialized_user_without_records_stays_read_only(self, fake_supabase: FakeSupabaseBackend) -> None:
+        backend = _FakeStreakBackend(
+            {"id": "u1", "current_streak": 0, "last_record_date": None, "streak_computed_at": "2026-05-01T00:00:00+00:00"},
+            {},
+        )
+        fake_supabase.install(backend.handler)
+        assert await database.get_streak_days("u1") == 0
+        assert await database.get_streak_days("u1") == 0
+        assert [r.method for r in fake_supabase.requests] == ["GET", "GET"]
+
+    async def test_first_record_of_materialized_user_starts_streak(self, fake_supabase: FakeSupabaseBackend) -> None:
+        backend = _FakeStreakBackend(
+            {"id": "u1", "current_streak": 0, "last_record_date": None, "streak_computed_at": "2026-05-01T00:00:00+00:00"},
+            {},
+        )
+        client = fake_supabase.install(backend.handler)
+        await database._advance_user_streak(client, "u1", date(2026, 5, 10))
+        assert backend.user["current_streak"] == 1
+        assert backend.user["last_record_date"] == "2026-05-10"
+        assert not any("/rpc/" in r.url.path for r in fake_supabase.requests)
+
+    async def test_advance_next_day_and_after_gap(self, fake_supabase: FakeSupabaseBackend) -> None:
+        backend = _FakeStreakBackend({"id": "u1", "current_streak": 4, "last_record_date": "2026-05-09"}, {})
+        client = fake_supabase.install(backend.handler)
+        await database._advance_user_streak(client, "u1", date(2026, 5, 9))
+        assert backend.user["current_streak"] == 4
+        await database._advance_user_streak(client, "u1", date(2026, 5, 10))
+        assert backend.user == {"id": "u1", "current_streak": 5, "last_record_date": "2026-05-10"}
+        await database._advance_user_streak(client, "u1", date(2026, 5, 13))
+        assert backend.user["current_streak"] == 1
+        assert not any("/rpc/" in r.url.path for r in fake_supabase.requests)
+
+    async def test_backfilled_record_triggers_recompute(self, fake_supabase: FakeSupabaseBackend) -> None:
+        backend = _FakeStreakBackend(
+            {"id": "u1", "current_streak": 1, "last_record_date": "2026-05-10"},
+            {"current_streak": 6, "last_record_date": "2026-05-10"},
+        )
+        client = fake_supabase.install(backend.handler)
+        await database._advance_user_streak(client, "u1", date(2026, 5, 9))
+        assert backend.user["current_streak"] == 6
@@ -0,0 +1,137 @@
+"""
+Worker Supervisor：按队列积压在上下限之间伸缩进程数，缩容需持续低负载，意外退出的 Worker 被重新拉起
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, List
+
+import pytest
+
+import run_backend
+from run_backend import WorkerPool, desired_worker_count
+
+
+class _FakeStop:
+    def __init__(self) -> None:
+        self._set = False
+
+    def set(self) -> None:
+        self._set = True
+
+    def is_set(self) -> bool:
+        return self._set
+
+
+class _FakeProcess:
+    def __init__(self) -> None:
+        self.alive = True
+        self.pid = 1
+        self.exitcode = None
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+    def join(self, timeout: Any = None) -> None:
+        pass
+
+
+def _pool(monkeypatch: pytest.MonkeyPatch, min_count: int = 1, max_count: int = 4) -> WorkerPool:
+    pool = WorkerPool("图片分析", lambda *a: None, min_count, max_count, queue="analysis_tasks", task_types=["food"])
+
+    def fake_spawn() -> None:
+        pool.processes.append((_FakeProcess(), _FakeStop()))
+
+    monkeypatch.setattr(pool, "spawn", fake_spawn)
+    for _ in range(min_count):
+        pool.spawn()
+    return pool
+
+
+def _stats(pending: int, age_seconds: float = 0.0) -> List[dict]:
+    oldest = (datetime.now(timezone.utc) - timedelta(seconds=age_seconds)).isoformat()
+    return [
+        {"queue": "analysis_tasks", "task_type": "food", "pending_count": pending, "oldest_pending_at": oldest},
+        {"queue": "analysis_tasks", "task_type": "food_text", "pending_count": 50, "oldest_pending_at": oldest},
+    ]
+
+
+@pytest.mark.unit
+class TestDesiredWorkerCount:
+    def test_scales_with_backlog_within_bounds(self) -> None:
+        assert desired_worker_count(1, 1, 4, 0, 0, 2) == 1
+        assert desired_worker_count(1, 1, 4, 5, 0, 2) == 3
+        assert desired_worker_count(1, 1, 4, 100, 0, 2) == 4
+
+    def test_old_pending_task_adds_one(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(run_backend, "WORKER_SCALE_UP_AGE_SECONDS", 20.0)
+        assert desired_worker_count(2, 1, 4, 1, 30, 2) == 3
+
+
+@pytest.mark.unit
+class TestWorkerPool:
+    def test_scale_up_uses_only_own_task_types(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        pool = _pool(monkeypatch)
+        pool.tick(_stats(pending=6), now=100.0)
+        assert pool.running_count == 3
+
+    def test_scale_down_waits_for_delay_and_stops_one(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(run_backend, "WORKER_SCALE_DOWN_DELAY_SECONDS", 60.0)
+        pool = _pool(monkeypatch)
+        pool.tick(_stats(pending=8), now=0.0)
+        assert pool.running_count == 4
+        pool.tick(_stats(pending=0), now=10.0)
+        assert pool.running_count == 4
+        pool.tick(_stats(pending=0), now=80.0)
+        assert pool.running_count == 3
+        assert sum(1 for _, stop in pool.processes if stop.is_set()) == 1
+
+    def test_crashed_worker_is_restarted(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        pool = _pool(monkeypatch, min_count=2)
+        pool.processes[0][0].alive = False
+        pool.tick(None, now=5.0)
+        assert pool.running_count == 2
+        assert len(pool.restarts) == 1
+
+    def test_crash_loop_pauses_restarts(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(run_backend, "WORKER_RESTART_LIMIT", 2)
+        pool = _pool(monkeypatch, min_count=1)
+        for t in (1.0, 2.0):
+            pool.processes[-1][0].alive = False
+            pool.tick(None, now=t)
+        assert pool.running_count == 0
+
+
+@pytest.mark.unit
+class TestWorkerSpawn:
+    def test_workers_started_with_spawn_context(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        started: List[Any] = []
+
+        class _RecordingContext:
+            def Event(self) -> _FakeStop:
+                return _FakeStop()
+
+            def Process(self, target: Any, args: Any, daemon: bool) -> _FakeProcess:
+                process = _FakeProcess()
+                process.start = lambda: started.append((target, args, daemon))
+                return process
+
+        assert run_backend._WORKER_MP_CONTEXT.get_start_method() == "spawn"
+        monkeypatch.setattr(run_backend, "_WORKER_MP_CONTEXT", _RecordingContext())
+        pool = WorkerPool("图片分析", run_backend.run_food_worker_process, 1, 1)
+        pool.spawn()
+
+        assert started[0][0] is run_backend._worker_process_main
+        assert started[0][1][:2] == (run_backend.run_food_worker_process, 0)
+        assert isinstance(started[0][1][2], _FakeStop)
+
+    def test_worker_exit_closes_llm_clients(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        import llm_http
+
+        closed: List[bool] = []
+        monkeypatch.setattr(llm_http, "close_llm_http_clients", lambda: closed.append(True))
+
+        def crashing_target(worker_id: int, stop_event: Any) -> None:
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            run_backend._worker_process_main(crashing_target, 0, _FakeStop())
+        assert closed == [True]
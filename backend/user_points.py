@@ -13,7 +13,7 @@ from database import (
     check_supabase_configured,
     create_invite_referral_binding,
     create_user,
-    get_supabase_client,
+    get_async_supabase_client,
     get_user_by_id,
     resolve_user_by_friend_invite_code,
     update_user,
@@ -52,7 +52,7 @@ async def _insert_ledger(
     meta: Optional[Dict[str, Any]] = None,
 ) -> None:
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     row: Dict[str, Any] = {
         "user_id": user_id,
         "delta": float(delta),
@@ -61,7 +61,7 @@ async def _insert_ledger(
     }
     if meta is not None:
         row["meta"] = meta
-    supabase.table("user_points_ledger").insert(row).execute()
+    await supabase.table("user_points_ledger").insert(row).execute()
 
 
 async def add_user_points(
@@ -167,9 +167,9 @@ async def get_user_by_registration_invite_code(code: str) -> Optional[Dict[str,
     if not c:
         return None
     check_supabase_configured()
-    supabase = get_supabase_client()
+    supabase = get_async_supabase_client()
     try:
-        r = supabase.table("weapp_user").select("id, nickname, openid").eq("registration_invite_code", c).limit(1).execute()
+        r = await supabase.table("weapp_user").select("id, nickname, openid").eq("registration_invite_code", c).limit(1).execute()
         if r.data:
             return r.data[0]
     except Exception as e:
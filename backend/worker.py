@@ -8,6 +8,8 @@ import sys
 import json
 import re
 import time
+import asyncio
+import threading
 from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta, timezone
 
@@ -32,7 +34,11 @@ if os.name == "nt":
 import httpx
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from database import (
-    claim_next_pending_task_sync,
+    claim_pending_tasks_sync,
+    requeue_claimed_tasks_sync,
+    heartbeat_task_leases_sync,
+    task_lease_owner,
+    TASK_LEASE_SECONDS,
     update_analysis_task_result_sync,
     create_user_exercise_log_sync,
     get_exercise_calories_by_date_sync,
@@ -47,6 +53,8 @@ from database import (
     list_precision_item_estimates_sync,
     get_precision_item_estimate_by_source_task_sync,
     update_precision_item_estimate_sync,
+    arm_precision_round_fan_in_sync,
+    cancel_unstarted_analysis_tasks_sync,
     get_food_record_by_id_sync,
     get_feed_comment_by_id_sync,
     insert_health_document_sync,
@@ -61,14 +69,25 @@ from database import (
     create_feed_interaction_notification_sync,
     update_public_food_library_status_sync,
     claim_next_pending_food_expiry_notification_job_sync,
+    get_next_food_expiry_notification_due_at_sync,
     update_food_expiry_notification_job_sync,
     get_food_expiry_item_v2_sync,
     get_user_openid_by_id_sync,
     batch_resolve_foods_sync,
+    ensure_food_nutrition_index_sync,
     log_unresolved_food_sync,
     upsert_food_nutrition_from_deepseek_sync,
+    decay_feed_record_fresh_scores_sync,
 )
 from metabolic import get_age_from_birthday
+from task_wakeup import TaskWakeup
+from llm_gateway import (
+    PROVIDER_DEEPSEEK,
+    chat_completion_sync,
+    parse_json_content,
+)
+from llm_http import close_async_llm_http_clients, llm_post
+from memory_cache import get_cache
 from image_compressor import compress_task_images
 
 ACTIVITY_LEVEL_LABELS = {
@@ -97,10 +116,8 @@ EXPIRY_NOTIFICATION_RETRY_DELAYS_MINUTES = [5, 30, 120]
 ANALYSIS_SUBSCRIBE_ACCEPT_STATUSES = {"accept", "acceptwithalert", "acceptwithaudio"}
 ANALYSIS_SUBSCRIBE_TEMPLATE_ID = str(os.getenv("ANALYSIS_SUBSCRIBE_TEMPLATE_ID") or "").strip()
 ANALYSIS_SUBSCRIBE_PAGE = "/pages/result/index"
-_wechat_access_token_cache: Dict[str, Any] = {
-    "token": None,
-    "fetched_at": 0,
-}
+# 微信 access_token 本地缓存一个半小时（有效期 2 小时）
+_wechat_access_token_cache = get_cache("wechat_access_token", maxsize=1, ttl_seconds=5400)
 
 VALID_RECOGNITION_OUTCOMES = {"ok", "soft_reject", "hard_reject"}
 VALID_ALLOWED_FOOD_CATEGORIES = {"carb", "lean_protein", "unknown"}
@@ -166,12 +183,9 @@ TEXT_AMBIGUOUS_QUANTITY_PATTERN = re.compile(
 
 
 def _get_wechat_access_token_sync() -> str:
-    current_time = int(time.time())
-    if (
-        _wechat_access_token_cache["token"]
-        and current_time - int(_wechat_access_token_cache.get("fetched_at") or 0) < 5400
-    ):
-        return str(_wechat_access_token_cache["token"])
+    cached_token = _wechat_access_token_cache.get("token")
+    if cached_token:
+        return str(cached_token)
 
     appid = os.getenv("APPID", "").strip()
     secret = os.getenv("SECRET", "").strip()
@@ -191,8 +205,7 @@ def _get_wechat_access_token_sync() -> str:
         if stable_resp.is_success:
             stable_data = stable_resp.json()
             if not stable_data.get("errcode") and stable_data.get("access_token"):
-                _wechat_access_token_cache["token"] = stable_data["access_token"]
-                _wechat_access_token_cache["fetched_at"] = current_time
+                _wechat_access_token_cache.set("token", stable_data["access_token"])
                 return str(stable_data["access_token"])
 
         fallback_resp = client.get(
@@ -211,8 +224,7 @@ def _get_wechat_access_token_sync() -> str:
         token = data.get("access_token")
         if not token:
             raise RuntimeError("获取 access_token 失败: access_token 为空")
-        _wechat_access_token_cache["token"] = token
-        _wechat_access_token_cache["fetched_at"] = current_time
+        _wechat_access_token_cache.set("token", token)
         return str(token)
 
 
@@ -795,7 +807,12 @@ def _parse_analysis_result_items(parsed: Dict[str, Any]) -> List[Dict[str, Any]]
 
 PRECISION_PLAN_STATUSES = {"needs_user_input", "needs_retake", "ready_for_estimate"}
 PRECISION_SPLIT_STRATEGIES = {"single_item", "multi_item_parallel", "single_shot", "grouped_parallel", "retake_required", "user_annotation_required"}
+# 聚合任务等待子项估计的最长时间，超过后由 Supervisor 兜底放行（release_stale_precision_aggregates_sync）。
+# 该兜底只在 run_backend.py 的 Supervisor 中执行：单独运行 worker.py 时，子任务丢失的聚合任务会一直停在 waiting
 PRECISION_MAX_AGGREGATE_WAIT_SECONDS = 120
+# 精准模式子项估计在规划 Worker 进程内并发执行并直接聚合（不再经 precision_item_estimate / precision_aggregate 队列中转）
+PRECISION_INPROCESS_FANOUT = str(os.getenv("PRECISION_INPROCESS_FANOUT", "0")).strip().lower() in {"1", "true", "yes", "on"}
+PRECISION_INPROCESS_MAX_WORKERS = max(1, int(os.getenv("PRECISION_INPROCESS_MAX_WORKERS", "4")))
 PRECISION_WEIGHT_REFINEMENT_KEYWORDS = (
     "米饭",
     "白饭",
@@ -815,29 +832,6 @@ PRECISION_WEIGHT_REFINEMENT_KEYWORDS = (
 )
 
 
-def _get_llm_client_config(source_type: str) -> Dict[str, str]:
-    llm_provider = os.getenv("LLM_PROVIDER", "gemini").lower()
-    if llm_provider == "gemini":
-        api_key = os.getenv("OFOXAI_API_KEY") or os.getenv("ofox_ai_apikey")
-        if not api_key:
-            raise RuntimeError("缺少 OFOXAI_API_KEY 环境变量")
-        return {
-            "provider": llm_provider,
-            "api_key": api_key,
-            "api_url": "https://api.ofox.ai/v1/chat/completions",
-            "model": OFOX_VISION_MODEL_NAME if source_type == "image" else OFOX_TEXT_MODEL_NAME,
-        }
-    api_key = os.getenv("DASHSCOPE_API_KEY") or os.getenv("API_KEY")
-    if not api_key:
-        raise RuntimeError("缺少 DASHSCOPE_API_KEY 环境变量")
-    return {
-        "provider": llm_provider,
-        "api_key": api_key,
-        "api_url": f"{DASHSCOPE_BASE_URL}/chat/completions",
-        "model": QWEN_VL_MODEL if source_type == "image" else QWEN_TEXT_MODEL,
-    }
-
-
 def _run_json_completion_sync(
     *,
     source_type: str,
@@ -845,32 +839,14 @@ def _run_json_completion_sync(
     timeout_seconds: float,
     temperature: float = 0.3,
 ) -> Dict[str, Any]:
-    config = _get_llm_client_config(source_type)
-    with httpx.Client(timeout=timeout_seconds) as client:
-        response = client.post(
-            config["api_url"],
-            headers={
-                "Authorization": f"Bearer {config['api_key']}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": config["model"],
-                "messages": [{"role": "user", "content": content}],
-                "response_format": {"type": "json_object"},
-                "temperature": temperature,
-            },
-        )
-    if not response.is_success:
-        err = response.json() if response.content else {}
-        msg = err.get("error", {}).get("message") or f"API 错误: {response.status_code}"
-        raise RuntimeError(msg)
-    data = response.json()
-    raw_content = data.get("choices", [{}])[0].get("message", {}).get("content")
-    if not raw_content:
-        raise RuntimeError("AI 返回了空响应")
-    json_str = re.sub(r"```json", "", raw_content)
-    json_str = re.sub(r"```", "", json_str).strip()
-    parsed = json.loads(json_str)
+    result = chat_completion_sync(
+        [{"role": "user", "content": content}],
+        kind="vision" if source_type == "image" else "text",
+        timeout=timeout_seconds,
+        temperature=temperature,
+        parse=parse_json_content,
+    )
+    parsed = result["parsed"]
     if isinstance(parsed, dict):
         return parsed
     raise RuntimeError("AI 返回结果格式异常")
@@ -2149,20 +2125,20 @@ def run_content_moderation_sync(task: Dict[str, Any]) -> Optional[Dict[str, Any]
             ]
             model = "qwen-vl-max"
 
-            with httpx.Client(timeout=30.0) as client:
-                response = client.post(
-                    api_url,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": model,
-                        "messages": [{"role": "user", "content": content}],
-                        "response_format": {"type": "json_object"},
-                        "temperature": 0.1,
-                    },
-                )
+            response = llm_post(
+                api_url,
+                timeout=30.0,
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json",
+                },
+                json={
+                    "model": model,
+                    "messages": [{"role": "user", "content": content}],
+                    "response_format": {"type": "json_object"},
+                    "temperature": 0.1,
+                },
+            )
 
         elif task_type in ("food_text", "public_food_library_text"):
             # 文本审核：使用文本模型
@@ -2172,20 +2148,20 @@ def run_content_moderation_sync(task: Dict[str, Any]) -> Optional[Dict[str, Any]
 
             model = "qwen-plus"
 
-            with httpx.Client(timeout=30.0) as client:
-                response = client.post(
-                    api_url,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": model,
-                        "messages": [{"role": "user", "content": _text_moderation_prompt(text_input)}],
-                        "response_format": {"type": "json_object"},
-                        "temperature": 0.1,
-                    },
-                )
+            response = llm_post(
+                api_url,
+                timeout=30.0,
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json",
+                },
+                json={
+                    "model": model,
+                    "messages": [{"role": "user", "content": _text_moderation_prompt(text_input)}],
+                    "response_format": {"type": "json_object"},
+                    "temperature": 0.1,
+                },
+            )
         else:
             return None  # 未知任务类型，跳过审核
 
@@ -2331,12 +2307,9 @@ def _estimate_unresolved_nutrition_with_deepseek_sync(
     *,
     additional_context: str = "",
 ) -> Dict[int, Dict[str, float]]:
-    api_key = str(os.getenv("DEEPSEEK_API_KEY") or "").strip()
-    if not api_key:
+    if not str(os.getenv("DEEPSEEK_API_KEY") or "").strip():
         return {}
 
-    model_name = str(os.getenv("DEEPSEEK_TEXT_MODEL") or "deepseek-v4-flash").strip() or "deepseek-v4-flash"
-    api_url = f"{str(os.getenv('DEEPSEEK_BASE_URL') or 'https://api.deepseek.com').rstrip('/')}/chat/completions"
     payload_items = []
     for item in unresolved_items:
         try:
@@ -2382,36 +2355,17 @@ def _estimate_unresolved_nutrition_with_deepseek_sync(
         },
     }
 
-    with httpx.Client(timeout=25.0) as client:
-        response = client.post(
-            api_url,
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model_name,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": json.dumps(user_prompt, ensure_ascii=False)},
-                ],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.2,
-                "stream": False,
-            },
-        )
-    if not response.is_success:
-        err = response.json() if response.content else {}
-        msg = err.get("error", {}).get("message") or f"DeepSeek API 错误: {response.status_code}"
-        raise RuntimeError(msg)
-
-    data = response.json()
-    raw_content = data.get("choices", [{}])[0].get("message", {}).get("content")
-    if not raw_content:
-        raise RuntimeError("DeepSeek 返回了空响应")
-    json_str = re.sub(r"```json", "", raw_content)
-    json_str = re.sub(r"```", "", json_str).strip()
-    parsed = json.loads(json_str)
+    parsed = chat_completion_sync(
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": json.dumps(user_prompt, ensure_ascii=False)},
+        ],
+        provider=PROVIDER_DEEPSEEK,
+        kind="text",
+        timeout=25.0,
+        temperature=0.2,
+        parse=parse_json_content,
+    )["parsed"]
     raw_items = parsed.get("items") if isinstance(parsed, dict) else None
     if not isinstance(raw_items, list):
         return {}
@@ -3003,10 +2957,9 @@ def _merge_multi_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
 def _run_multi_food_analysis_sync(
     task: Dict[str, Any],
     target_image_urls: List[str],
-    api_url: str,
-    api_key: str,
+    llm_provider: str,
     model: str,
-    max_retries: int,
+    failover: bool,
     profile_block: str,
     execution_mode: str,
     analysis_engine: str,
@@ -3024,51 +2977,19 @@ def _run_multi_food_analysis_sync(
         content_parts: list = [{"type": "text", "text": single_prompt}]
         content_parts.append({"type": "image_url", "image_url": {"url": image_url}})
 
-        for attempt in range(max_retries):
-            try:
-                with httpx.Client(timeout=90.0) as client:
-                    response = client.post(
-                        api_url,
-                        headers={
-                            "Authorization": f"Bearer {api_key}",
-                            "Content-Type": "application/json",
-                        },
-                        json={
-                            "model": model,
-                            "messages": [{"role": "user", "content": content_parts}],
-                            "response_format": {"type": "json_object"},
-                            "temperature": 0.7,
-                        },
-                    )
-                if not response.is_success:
-                    err = response.json() if response.content else {}
-                    msg = err.get("error", {}).get("message") or f"API 错误: {response.status_code}"
-                    if attempt < max_retries - 1:
-                        time.sleep(1)
-                        continue
-                    raise RuntimeError(msg)
-
-                data = response.json()
-                content = data.get("choices", [{}])[0].get("message", {}).get("content")
-                if not content:
-                    if attempt < max_retries - 1:
-                        time.sleep(1)
-                        continue
-                    raise RuntimeError("AI 返回了空响应")
-
-                json_str = re.sub(r"```json", "", content)
-                json_str = re.sub(r"```", "", json_str).strip()
-                parsed = _normalize_analysis_response_payload(json.loads(json_str))
-                if analysis_engine == "db_first":
-                    parsed["items"] = _build_result_items_with_lookup(task, parsed.get("items") or [])
-                return parsed
-
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                else:
-                    raise
-        raise RuntimeError("分析失败")
+        parsed = chat_completion_sync(
+            [{"role": "user", "content": content_parts}],
+            provider=llm_provider,
+            model=model,
+            kind="vision",
+            timeout=90.0,
+            temperature=0.7,
+            parse=lambda content: _normalize_analysis_response_payload(parse_json_content(content)),
+            failover=failover,
+        )["parsed"]
+        if analysis_engine == "db_first":
+            parsed["items"] = _build_result_items_with_lookup(task, parsed.get("items") or [])
+        return parsed
 
     max_workers = min(3, len(target_image_urls))
     ordered: Dict[int, Any] = {}
@@ -3126,17 +3047,8 @@ def run_food_analysis_sync(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
             model = OFOX_VISION_MODEL_NAME
         else:
             model = QWEN_VL_MODEL
-
-    if llm_provider == "gemini":
-        api_key = os.getenv("OFOXAI_API_KEY") or os.getenv("ofox_ai_apikey")
-        if not api_key:
-            raise RuntimeError("缺少 OFOXAI_API_KEY 环境变量")
-        api_url = "https://api.ofox.ai/v1/chat/completions"
-    else:
-        api_key = os.getenv("DASHSCOPE_API_KEY") or os.getenv("API_KEY")
-        if not api_key:
-            raise RuntimeError("缺少 DASHSCOPE_API_KEY 环境变量")
-        api_url = f"{DASHSCOPE_BASE_URL}/chat/completions"
+    # 指定了模型（如模型对比）时不切换服务商
+    failover = not model_name_override
 
     image_url = task.get("image_url")
     image_paths = task.get("image_paths")
@@ -3167,18 +3079,15 @@ def run_food_analysis_sync(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
                 + profile_block
             )
 
-    max_retries = 3
-
     # 多图 + 非多视角：每张单独识别后累加汇总
     if len(target_image_urls) > 1 and not payload.get("is_multi_view"):
         print(f"[worker] 多图分别分析模式 (非多视角): {len(target_image_urls)} 张图片", flush=True)
         result = _run_multi_food_analysis_sync(
             task=task,
             target_image_urls=target_image_urls,
-            api_url=api_url,
-            api_key=api_key,
+            llm_provider=llm_provider,
             model=model,
-            max_retries=max_retries,
+            failover=failover,
             profile_block=profile_block,
             execution_mode=execution_mode,
             analysis_engine=analysis_engine,
@@ -3234,57 +3143,26 @@ def run_food_analysis_sync(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         for url in target_image_urls:
             content_parts.append({"type": "image_url", "image_url": {"url": url}})
 
-    parsed = None
-    
-    for attempt in range(max_retries):
-        try:
-            with httpx.Client(timeout=90.0) as client:
-                response = client.post(
-                    api_url,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": model,
-                        "messages": [{"role": "user", "content": content_parts}],
-                        "response_format": {"type": "json_object"},
-                        "temperature": 0.7,
-                    },
-                )
-
-                if not response.is_success:
-                    err = response.json() if response.content else {}
-                    msg = err.get("error", {}).get("message") or f"API 错误: {response.status_code}"
-                    print(f"[worker] Food analysis attempt {attempt + 1} failed: {msg}")
-                    if attempt < max_retries - 1:
-                        time.sleep(1)
-                        continue
-                    raise RuntimeError("API 请求失败")
-
-                data = response.json()
-                content = data.get("choices", [{}])[0].get("message", {}).get("content")
-                _debug_log_analysis(task, execution_mode, "response_usage", data.get("usage") or {})
-                _debug_log_analysis(task, execution_mode, "raw_model_output", content or "")
-                if not content:
-                    print(f"[worker] Food analysis attempt {attempt + 1} empty response")
-                    if attempt < max_retries - 1:
-                        time.sleep(1)
-                        continue
-                    raise RuntimeError("AI 返回了空响应")
-
-                json_str = re.sub(r"```json", "", content)
-                json_str = re.sub(r"```", "", json_str).strip()
-                parsed = _normalize_analysis_response_payload(json.loads(json_str))
-                break  # 成功，跳出重试循环
-
-        except Exception as e:
-            print(f"[worker] Food analysis attempt {attempt + 1} exception: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-            else:
-                # hide internal model details
-                raise RuntimeError("系统繁忙，请稍后重试")
+    try:
+        completion = chat_completion_sync(
+            [{"role": "user", "content": content_parts}],
+            provider=llm_provider,
+            model=model,
+            kind="vision",
+            timeout=90.0,
+            temperature=0.7,
+            parse=lambda content: _normalize_analysis_response_payload(parse_json_content(content)),
+            failover=failover,
+        )
+    except Exception as e:
+        print(f"[worker] Food analysis failed: {e}")
+        # hide internal model details
+        raise RuntimeError("系统繁忙，请稍后重试")
+    llm_provider = completion["provider"]
+    model = completion["model"]
+    _debug_log_analysis(task, execution_mode, "response_usage", completion["data"].get("usage") or {})
+    _debug_log_analysis(task, execution_mode, "raw_model_output", completion["content"])
+    parsed = completion["parsed"]
 
     # 转为与 API 一致的 result 结构（供前端与保存记录使用）
     if analysis_engine == "db_first":
@@ -3337,7 +3215,7 @@ def process_one_food_task(task: Dict[str, Any]) -> None:
         result = run_food_analysis_sync(task)
         
         # 更新结果，如果被取消则跳过
-        updated = update_analysis_task_result_sync(task_id, status="done", result=result)
+        updated = update_analysis_task_result_sync(task_id, status="done", result=result, lease_owner=task_lease_owner())
         if not updated:
             print(f"[food_analysis] 任务 {task_id} 已被取消，放弃结果写入", flush=True)
             return
@@ -3355,7 +3233,7 @@ def process_one_food_task(task: Dict[str, Any]) -> None:
     except Exception as e:
         err_msg = str(e) or type(e).__name__
         print(f"[food_analysis] 任务 {task_id} 处理失败: {err_msg}", flush=True)
-        updated = update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg)
+        updated = update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg, lease_owner=task_lease_owner())
         if not updated:
             print(f"[food_analysis] 任务 {task_id} 已被取消，放弃错误写入", flush=True)
 
@@ -3677,16 +3555,9 @@ def run_text_food_analysis_sync(task: Dict[str, Any]) -> Optional[Dict[str, Any]
     analysis_started = time.perf_counter()
     llm_provider = os.getenv("LLM_PROVIDER", "gemini").lower()
     if llm_provider == "gemini":
-        api_key = os.getenv("OFOXAI_API_KEY") or os.getenv("ofox_ai_apikey")
-        if not api_key:
-            raise RuntimeError("缺少 OFOXAI_API_KEY 环境变量")
-        api_url = "https://api.ofox.ai/v1/chat/completions"
         model = OFOX_TEXT_MODEL_NAME
     else:
-        api_key = os.getenv("DASHSCOPE_API_KEY") or os.getenv("API_KEY")
-        if not api_key:
-            raise RuntimeError("缺少 DASHSCOPE_API_KEY 环境变量")
-        api_url = f"{DASHSCOPE_BASE_URL}/chat/completions"
+        llm_provider = "qwen"
         model = QWEN_TEXT_MODEL
     text_input = task.get("text_input") or ""
     if not text_input:
@@ -3733,58 +3604,25 @@ def run_text_food_analysis_sync(task: Dict[str, Any]) -> Optional[Dict[str, Any]
         },
     )
 
-    max_retries = 3
-    parsed = None
-
-    for attempt in range(max_retries):
-        try:
-            with httpx.Client(timeout=60.0) as client:
-                response = client.post(
-                    api_url,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": model,
-                        "messages": [{"role": "user", "content": prompt}],
-                        "response_format": {"type": "json_object"},
-                        "temperature": 0.5,
-                    },
-                )
-
-                if not response.is_success:
-                    err = response.json() if response.content else {}
-                    msg = err.get("error", {}).get("message") or f"API 错误: {response.status_code}"
-                    print(f"[worker] Text food analysis attempt {attempt + 1} failed: {msg}")
-                    if attempt < max_retries - 1:
-                        time.sleep(1)
-                        continue
-                    raise RuntimeError("API 请求失败")
-
-                data = response.json()
-                content = data.get("choices", [{}])[0].get("message", {}).get("content")
-                _debug_log_analysis(task, execution_mode, "response_usage", data.get("usage") or {})
-                _debug_log_analysis(task, execution_mode, "raw_model_output", content or "")
-                if not content:
-                    print(f"[worker] Text food analysis attempt {attempt + 1} empty response")
-                    if attempt < max_retries - 1:
-                        time.sleep(1)
-                        continue
-                    raise RuntimeError("AI 返回了空响应")
-
-                json_str = re.sub(r"```json", "", content)
-                json_str = re.sub(r"```", "", json_str).strip()
-                parsed = _normalize_analysis_response_payload(json.loads(json_str))
-                break # 成功，跳出重试循环
-
-        except Exception as e:
-            print(f"[worker] Text food analysis attempt {attempt + 1} exception: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-            else:
-                # hide internal model details
-                raise RuntimeError("系统繁忙，请稍后重试")
+    try:
+        completion = chat_completion_sync(
+            [{"role": "user", "content": prompt}],
+            provider=llm_provider,
+            model=model,
+            kind="text",
+            timeout=60.0,
+            temperature=0.5,
+            parse=lambda content: _normalize_analysis_response_payload(parse_json_content(content)),
+        )
+    except Exception as e:
+        print(f"[worker] Text food analysis failed: {e}")
+        # hide internal model details
+        raise RuntimeError("系统繁忙，请稍后重试")
+    llm_provider = completion["provider"]
+    model = completion["model"]
+    _debug_log_analysis(task, execution_mode, "response_usage", completion["data"].get("usage") or {})
+    _debug_log_analysis(task, execution_mode, "raw_model_output", completion["content"])
+    parsed = completion["parsed"]
 
     # 转为与 API 一致的 result 结构
     if execution_mode == "standard" and analysis_engine == "db_first":
@@ -3836,7 +3674,7 @@ def process_one_text_food_task(task: Dict[str, Any]) -> None:
     try:
         print(f"[food_analysis] MODERATION_SKIPPED task_id={task_id} type=text", flush=True)
         result = run_text_food_analysis_sync(task)
-        updated = update_analysis_task_result_sync(task_id, status="done", result=result)
+        updated = update_analysis_task_result_sync(task_id, status="done", result=result, lease_owner=task_lease_owner())
         if not updated:
             print(f"[food_analysis] 任务 {task_id} 已被取消，放弃结果写入", flush=True)
             return
@@ -3846,18 +3684,305 @@ def process_one_text_food_task(task: Dict[str, Any]) -> None:
             pass
     except Exception as e:
         err_msg = str(e) or type(e).__name__
-        updated = update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg)
+        updated = update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg, lease_owner=task_lease_owner())
         if not updated:
             print(f"[food_analysis] 任务 {task_id} 已被取消，放弃错误写入", flush=True)
 
 
+def _split_precision_groups(items_to_estimate: List[Dict[str, Any]], split_strategy: str) -> List[List[Dict[str, Any]]]:
+    """按难度分组：high 每2个一组，medium/low 每3个一组；single_shot 且不超过 3 个时整体一组。"""
+    if split_strategy == "single_shot" and len(items_to_estimate) <= 3:
+        return [items_to_estimate]
+    groups: List[List[Dict[str, Any]]] = []
+    high_items = [i for i in items_to_estimate if str(i.get("uncertainty_level")) == "high"]
+    other_items = [i for i in items_to_estimate if str(i.get("uncertainty_level")) != "high"]
+    for i in range(0, len(high_items), 2):
+        groups.append(high_items[i:i + 2])
+    for i in range(0, len(other_items), 3):
+        groups.append(other_items[i:i + 3])
+    return groups
+
+
+def _build_precision_group_payload(
+    *,
+    session_id: str,
+    session: Dict[str, Any],
+    payload: Dict[str, Any],
+    round_index: int,
+    group_index: int,
+    group_items: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    latest_inputs = session.get("latest_inputs") or {}
+    group_payload = {
+        "precision_session_id": session_id,
+        "source_type": payload.get("source_type") or session.get("source_type") or "image",
+        "round_index": round_index,
+        "group_index": group_index,
+        "items_to_estimate": group_items,
+        "additionalContext": latest_inputs.get("additionalContext"),
+        "reference_objects": latest_inputs.get("reference_objects") or session.get("reference_objects") or [],
+        "image_url": latest_inputs.get("image_url"),
+        "image_urls": latest_inputs.get("image_urls") or [],
+        "text": latest_inputs.get("text"),
+    }
+    if len(group_items) == 1 and isinstance(group_items[0], dict):
+        single_group_item = group_items[0]
+        group_payload.update({
+            "item_key": single_group_item.get("item_key"),
+            "item_name": single_group_item.get("item_name"),
+            "item_hint": single_group_item.get("item_hint"),
+            "requires_reference": bool(single_group_item.get("requires_reference")),
+            "uncertainty_level": single_group_item.get("uncertainty_level"),
+            "uncertainty_reason": single_group_item.get("uncertainty_reason"),
+        })
+    return group_payload
+
+
+def _create_precision_group_estimate(
+    *,
+    session_id: str,
+    round_index: int,
+    group_index: int,
+    group_items: List[Dict[str, Any]],
+    group_payload: Dict[str, Any],
+    source_task_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    # 每个 group 只创建一条 estimate 记录（多食物模式下也如此，result 中会包含 items 数组）
+    group_item_names = [str(i.get("item_name") or i.get("name") or "").strip() for i in group_items]
+    group_display_name = "、".join(group_item_names[:3])
+    if len(group_item_names) > 3:
+        group_display_name += "等"
+    return create_precision_item_estimate_sync(
+        session_id=session_id,
+        round_index=round_index,
+        item_index=group_index,
+        item_key=f"group_{group_index}",
+        item_name=group_display_name or f"第{group_index + 1}组",
+        payload=group_payload,
+        source_task_id=source_task_id,
+    )
+
+
+def _estimate_precision_group_sync(task: Dict[str, Any], estimate_row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """执行一组子项估计并同步 precision_item_estimates 记录状态；失败时记录标记 failed 后原样抛出。"""
+    try:
+        if estimate_row:
+            update_precision_item_estimate_sync(estimate_row["id"], {"status": "processing"})
+        result = _run_precision_item_estimate_sync(task)
+        if estimate_row:
+            update_precision_item_estimate_sync(
+                estimate_row["id"],
+                {
+                    "status": "done",
+                    "result": result,
+                    "error_message": None,
+                },
+            )
+        return result
+    except Exception as e:
+        if estimate_row:
+            update_precision_item_estimate_sync(
+                estimate_row["id"],
+                {
+                    "status": "failed",
+                    "error_message": str(e) or type(e).__name__,
+                },
+            )
+        raise
+
+
+def _finalize_precision_estimates(
+    *,
+    task_id: str,
+    session_id: str,
+    round_index: int,
+    split_strategy: str,
+    estimates: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """汇总本轮子项估计为最终结果；有子项失败时抛出 RuntimeError。"""
+    if not estimates:
+        raise RuntimeError("精准模式聚合未找到子项估计结果")
+
+    failed_estimates = [
+        estimate for estimate in estimates
+        if str(estimate.get("status") or "").strip().lower() == "failed"
+    ]
+    if failed_estimates:
+        failed_names = [
+            str(estimate.get("item_name") or "").strip()
+            for estimate in failed_estimates
+            if str(estimate.get("item_name") or "").strip()
+        ]
+        failed_errors = [
+            str(estimate.get("error_message") or "").strip()
+            for estimate in failed_estimates
+            if str(estimate.get("error_message") or "").strip()
+        ]
+        failed_label = "、".join(failed_names[:3]) if failed_names else "部分主体"
+        error_detail = failed_errors[0] if failed_errors else "子项估计失败"
+        raise RuntimeError(f"{failed_label} 精准估计失败，请补充参考物或重拍后重试。原因：{error_detail}")
+
+    final_result = _build_precision_final_result(
+        session_id=session_id,
+        round_index=round_index,
+        split_strategy=split_strategy,
+        estimates=estimates,
+    )
+    lookup_summary = final_result.get("dbLookupSummary") or {}
+    print(
+        f"[precision_aggregate] task_id={task_id} session_id={session_id} round={round_index} "
+        f"split_strategy={split_strategy} items={lookup_summary.get('total', 0)} "
+        f"db_hit={lookup_summary.get('library_hits', 0)}/{lookup_summary.get('total', 0)} "
+        f"deepseek_fallback={lookup_summary.get('deepseek_fallback', 0)} "
+        f"unresolved={lookup_summary.get('unresolved', 0)}",
+        flush=True,
+    )
+    return final_result
+
+
+def _run_precision_groups_inprocess(
+    task: Dict[str, Any],
+    *,
+    session_id: str,
+    session: Dict[str, Any],
+    round_index: int,
+    split_strategy: str,
+    groups: List[List[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """在当前进程内并发估计各组并直接聚合，返回最终结果（与 precision_aggregate 任务结果一致）。"""
+    payload = task.get("payload") or {}
+    jobs: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    for group_index, group_items in enumerate(groups):
+        group_payload = _build_precision_group_payload(
+            session_id=session_id,
+            session=session,
+            payload=payload,
+            round_index=round_index,
+            group_index=group_index,
+            group_items=group_items,
+        )
+        estimate_row = _create_precision_group_estimate(
+            session_id=session_id,
+            round_index=round_index,
+            group_index=group_index,
+            group_items=group_items,
+            group_payload=group_payload,
+        )
+        group_task = {
+            "id": task["id"],
+            "user_id": task.get("user_id"),
+            "task_type": _precision_task_type("precision_item_estimate"),
+            "payload": group_payload,
+        }
+        jobs.append((group_task, estimate_row))
+
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(PRECISION_INPROCESS_MAX_WORKERS, len(jobs))) as executor:
+            futures = [executor.submit(_estimate_precision_group_sync, group_task, estimate_row) for group_task, estimate_row in jobs]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    # 失败已写入对应 estimate 记录，由聚合统一报错
+                    print(f"[precision_plan] 子项估计失败 session_id={session_id} round={round_index}: {e}", flush=True)
+
+    return _finalize_precision_estimates(
+        task_id=task["id"],
+        session_id=session_id,
+        round_index=round_index,
+        split_strategy=split_strategy,
+        estimates=list_precision_item_estimates_sync(session_id, round_index),
+    )
+
+
+def _enqueue_precision_groups(
+    task: Dict[str, Any],
+    *,
+    session_id: str,
+    session: Dict[str, Any],
+    round_row: Dict[str, Any],
+    round_index: int,
+    split_strategy: str,
+    groups: List[List[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """
+    为每组创建 precision_item_estimate 子任务，并创建等待它们的 precision_aggregate 任务，返回聚合任务。
+    聚合任务以 waiting 状态创建，并在本轮 assistant 轮次上登记倒计数（先于子任务登记，避免子任务先完成漏减）；
+    最后一个子项估计完成时由数据库放行聚合任务，见 sql/add_precision_round_fan_in.sql。
+    若中途派发失败，倒计数已无法归零，且缺少的组无法汇总出完整结果：立即撤销聚合任务与已派发但未开始的子任务，
+    再抛出异常由规划任务报错，不等待 Supervisor 的 PRECISION_MAX_AGGREGATE_WAIT_SECONDS 兜底放行。
+    """
+    payload = task.get("payload") or {}
+    aggregate_task = create_analysis_task_sync(
+        user_id=task["user_id"],
+        task_type=_precision_task_type("precision_aggregate"),
+        payload={
+            "precision_session_id": session_id,
+            "round_index": round_index,
+            "split_strategy": split_strategy,
+        },
+        priority=task.get("priority"),
+        status="waiting" if groups else "pending",
+    )
+    if groups:
+        arm_precision_round_fan_in_sync(round_row["id"], len(groups), aggregate_task["id"])
+
+    child_task_ids: List[str] = []
+    try:
+        for group_index, group_items in enumerate(groups):
+            group_payload = _build_precision_group_payload(
+                session_id=session_id,
+                session=session,
+                payload=payload,
+                round_index=round_index,
+                group_index=group_index,
+                group_items=group_items,
+            )
+            estimate_row = _create_precision_group_estimate(
+                session_id=session_id,
+                round_index=round_index,
+                group_index=group_index,
+                group_items=group_items,
+                group_payload=group_payload,
+            )
+            child_payload = {**group_payload, "precision_estimate_id": estimate_row["id"]}
+            if group_payload["source_type"] == "image":
+                child_task = create_analysis_task_sync(
+                    user_id=task["user_id"],
+                    task_type=_precision_task_type("precision_item_estimate"),
+                    image_url=group_payload.get("image_url"),
+                    image_urls=group_payload.get("image_urls") or None,
+                    payload=child_payload,
+                    priority=task.get("priority"),
+                )
+            else:
+                child_task = create_analysis_task_sync(
+                    user_id=task["user_id"],
+                    task_type=_precision_task_type("precision_item_estimate"),
+                    text_input=group_payload.get("text"),
+                    payload=child_payload,
+                    priority=task.get("priority"),
+                )
+            child_task_ids.append(child_task["id"])
+            update_precision_item_estimate_sync(estimate_row["id"], {"source_task_id": child_task["id"]})
+    except Exception:
+        cancel_unstarted_analysis_tasks_sync([aggregate_task["id"], *child_task_ids], "精准模式子任务派发失败")
+        raise
+
+    return aggregate_task
+
+
 def process_one_precision_plan_task(task: Dict[str, Any]) -> None:
-    """处理精准模式规划任务：直接拆分并进入估计，不再回传交互式中间态。"""
+    """
+    处理精准模式规划任务：直接拆分并进入估计，不再回传交互式中间态。
+    PRECISION_INPROCESS_FANOUT 开启时在本进程内并发估计并聚合，任务直接返回最终结果；
+    否则派发子估计任务与聚合任务，结果中以 redirectTaskId 指向聚合任务。
+    """
     task_id = task["id"]
     payload = task.get("payload") or {}
     session_id = str(payload.get("precision_session_id") or "").strip()
     if not session_id:
-        update_analysis_task_result_sync(task_id, status="failed", error_message="精准模式规划任务缺少 precision_session_id")
+        update_analysis_task_result_sync(task_id, status="failed", error_message="精准模式规划任务缺少 precision_session_id", lease_owner=task_lease_owner())
         return
     try:
         planner_result = _run_precision_plan_sync(task)
@@ -3865,7 +3990,7 @@ def process_one_precision_plan_task(task: Dict[str, Any]) -> None:
         if not session:
             raise RuntimeError("精准模式会话不存在")
         round_index = int(payload.get("round_index") or session.get("round_index") or 1)
-        create_precision_session_round_sync(
+        round_row = create_precision_session_round_sync(
             session_id,
             round_index,
             "assistant",
@@ -3874,109 +3999,60 @@ def process_one_precision_plan_task(task: Dict[str, Any]) -> None:
         )
 
         split_strategy = planner_result["splitStrategy"]
-        latest_inputs = session.get("latest_inputs") or {}
-
         items_to_estimate = _build_precision_estimate_items(
             planner_result,
             source_type=str(payload.get("source_type") or session.get("source_type") or "image"),
         )
-        # 按难度分组：high 每2个一组，medium/low 每3个一组
-        groups: List[List[Dict[str, Any]]] = []
-        if split_strategy == "single_shot" and len(items_to_estimate) <= 3:
-            groups = [items_to_estimate]
-        else:
-            high_items = [i for i in items_to_estimate if str(i.get("uncertainty_level")) == "high"]
-            other_items = [i for i in items_to_estimate if str(i.get("uncertainty_level")) != "high"]
-            for i in range(0, len(high_items), 2):
-                groups.append(high_items[i:i + 2])
-            for i in range(0, len(other_items), 3):
-                groups.append(other_items[i:i + 3])
+        groups = _split_precision_groups(items_to_estimate, split_strategy)
 
         print(
             f"[precision_plan] task_id={task_id} session_id={session_id} round={round_index} "
             f"split_strategy={split_strategy} items={len(items_to_estimate)} groups={len(groups)} "
-            f"detail={_format_precision_groups(groups)}",
+            f"inprocess={PRECISION_INPROCESS_FANOUT} detail={_format_precision_groups(groups)}",
             flush=True,
         )
 
-        child_task_ids: List[str] = []
-        for group_index, group_items in enumerate(groups):
-            group_payload = {
-                "precision_session_id": session_id,
-                "source_type": payload.get("source_type") or session.get("source_type") or "image",
-                "round_index": round_index,
-                "group_index": group_index,
-                "items_to_estimate": group_items,
-                "additionalContext": latest_inputs.get("additionalContext"),
-                "reference_objects": latest_inputs.get("reference_objects") or session.get("reference_objects") or [],
-                "image_url": latest_inputs.get("image_url"),
-                "image_urls": latest_inputs.get("image_urls") or [],
-                "text": latest_inputs.get("text"),
-            }
-            if len(group_items) == 1 and isinstance(group_items[0], dict):
-                single_group_item = group_items[0]
-                group_payload.update({
-                    "item_key": single_group_item.get("item_key"),
-                    "item_name": single_group_item.get("item_name"),
-                    "item_hint": single_group_item.get("item_hint"),
-                    "requires_reference": bool(single_group_item.get("requires_reference")),
-                    "uncertainty_level": single_group_item.get("uncertainty_level"),
-                    "uncertainty_reason": single_group_item.get("uncertainty_reason"),
-                })
-            if group_payload["source_type"] == "image":
-                child_task = create_analysis_task_sync(
-                    user_id=task["user_id"],
-                    task_type=_precision_task_type("precision_item_estimate"),
-                    image_url=group_payload.get("image_url"),
-                    image_urls=group_payload.get("image_urls") or None,
-                    payload=group_payload,
-                )
-            else:
-                child_task = create_analysis_task_sync(
-                    user_id=task["user_id"],
-                    task_type=_precision_task_type("precision_item_estimate"),
-                    text_input=group_payload.get("text"),
-                    payload=group_payload,
-                )
-            child_task_ids.append(child_task["id"])
-            # 每个 group 只创建一条 estimate 记录（多食物模式下也如此，result 中会包含 items 数组）
-            group_item_names = [str(i.get("item_name") or i.get("name") or "").strip() for i in group_items]
-            group_display_name = "、".join(group_item_names[:3])
-            if len(group_item_names) > 3:
-                group_display_name += "等"
-            create_precision_item_estimate_sync(
+        estimating_updates = {
+            "status": "estimating",
+            "split_plan": {
+                "splitStrategy": split_strategy,
+                "items": items_to_estimate,
+            },
+            "latest_planner_result": planner_result,
+            "pending_requirements": [],
+        }
+        if PRECISION_INPROCESS_FANOUT:
+            update_precision_session_sync(session_id, {**estimating_updates, "current_task_id": task_id})
+            final_result = _run_precision_groups_inprocess(
+                task,
                 session_id=session_id,
+                session=session,
                 round_index=round_index,
-                item_index=group_index,
-                item_key=f"group_{group_index}",
-                item_name=group_display_name or f"第{group_index + 1}组",
-                payload=group_payload,
-                source_task_id=child_task["id"],
+                split_strategy=split_strategy,
+                groups=groups,
             )
-
-        aggregate_task = create_analysis_task_sync(
-            user_id=task["user_id"],
-            task_type=_precision_task_type("precision_aggregate"),
-            payload={
-                "precision_session_id": session_id,
-                "round_index": round_index,
-                "split_strategy": split_strategy,
-                "child_task_ids": child_task_ids,
-            },
-        )
-        update_precision_session_sync(
-            session_id,
-            {
-                "status": "estimating",
-                "split_plan": {
-                    "splitStrategy": split_strategy,
-                    "items": items_to_estimate,
+            update_precision_session_sync(
+                session_id,
+                {
+                    "status": "done",
+                    "final_result": final_result,
+                    "current_task_id": task_id,
+                    "last_error": None,
                 },
-                "latest_planner_result": planner_result,
-                "pending_requirements": [],
-                "current_task_id": aggregate_task["id"],
-            },
+            )
+            update_analysis_task_result_sync(task_id, status="done", result=final_result, lease_owner=task_lease_owner())
+            return
+
+        aggregate_task = _enqueue_precision_groups(
+            task,
+            session_id=session_id,
+            session=session,
+            round_row=round_row,
+            round_index=round_index,
+            split_strategy=split_strategy,
+            groups=groups,
         )
+        update_precision_session_sync(session_id, {**estimating_updates, "current_task_id": aggregate_task["id"]})
         update_analysis_task_result_sync(
             task_id,
             status="done",
@@ -3992,6 +4068,7 @@ def process_one_precision_plan_task(task: Dict[str, Any]) -> None:
                 "uncertaintyNotes": planner_result.get("uncertaintyNotes") or None,
                 "redirectTaskId": aggregate_task["id"],
             },
+            lease_owner=task_lease_owner(),
         )
     except Exception as e:
         err_msg = str(e) or type(e).__name__
@@ -4002,106 +4079,49 @@ def process_one_precision_plan_task(task: Dict[str, Any]) -> None:
                 "last_error": err_msg,
             },
         )
-        update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg)
+        update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg, lease_owner=task_lease_owner())
 
 
 def process_one_precision_item_estimate_task(task: Dict[str, Any]) -> None:
     """处理精准模式子项估计任务。"""
     task_id = task["id"]
-    estimate_row = get_precision_item_estimate_by_source_task_sync(task_id)
+    estimate_id = (task.get("payload") or {}).get("precision_estimate_id")
+    estimate_row = {"id": estimate_id} if estimate_id else get_precision_item_estimate_by_source_task_sync(task_id)
     try:
-        if estimate_row:
-            update_precision_item_estimate_sync(estimate_row["id"], {"status": "processing"})
-        result = _run_precision_item_estimate_sync(task)
-        if estimate_row:
-            update_precision_item_estimate_sync(
-                estimate_row["id"],
-                {
-                    "status": "done",
-                    "result": result,
-                    "error_message": None,
-                },
-            )
-        update_analysis_task_result_sync(task_id, status="done", result=result)
-    except (RuntimeError, ValueError) as e:
-        err_msg = str(e)
-        if estimate_row:
-            update_precision_item_estimate_sync(
-                estimate_row["id"],
-                {
-                    "status": "failed",
-                    "error_message": err_msg,
-                },
-            )
-        update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg)
+        result = _estimate_precision_group_sync(task, estimate_row)
+        update_analysis_task_result_sync(task_id, status="done", result=result, lease_owner=task_lease_owner())
     except Exception as e:
         err_msg = str(e) or type(e).__name__
-        if estimate_row:
-            update_precision_item_estimate_sync(
-                estimate_row["id"],
-                {
-                    "status": "failed",
-                    "error_message": err_msg,
-                },
-            )
-        update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg)
+        update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg, lease_owner=task_lease_owner())
 
 
 def process_one_precision_aggregate_task(task: Dict[str, Any]) -> None:
-    """处理精准模式聚合任务：等待并行子估计完成后，汇总最终结果。"""
+    """
+    处理精准模式聚合任务：汇总本轮子项估计的最终结果。
+    任务在子项估计全部完成时才被放行为 pending，这里只读一次；
+    若因兜底超时被放行，仍未完成的子项按失败处理。
+    """
     task_id = task["id"]
     payload = task.get("payload") or {}
     session_id = str(payload.get("precision_session_id") or "").strip()
     round_index = int(payload.get("round_index") or 1)
     split_strategy = str(payload.get("split_strategy") or "single_item")
     if not session_id:
-        update_analysis_task_result_sync(task_id, status="failed", error_message="精准模式聚合任务缺少 precision_session_id")
+        update_analysis_task_result_sync(task_id, status="failed", error_message="精准模式聚合任务缺少 precision_session_id", lease_owner=task_lease_owner())
         return
     try:
-        deadline = time.time() + PRECISION_MAX_AGGREGATE_WAIT_SECONDS
-        estimates: List[Dict[str, Any]] = []
-        while time.time() < deadline:
-            estimates = list_precision_item_estimates_sync(session_id, round_index)
-            if estimates and all(str(item.get("status") or "") in {"done", "failed"} for item in estimates):
-                break
-            time.sleep(1.0)
-        if not estimates:
-            raise RuntimeError("精准模式聚合未找到子项估计结果")
-
-        failed_estimates = [
-            estimate for estimate in estimates
-            if str(estimate.get("status") or "").strip().lower() == "failed"
+        estimates = [
+            estimate if str(estimate.get("status") or "") in {"done", "failed"}
+            else {**estimate, "status": "failed", "error_message": estimate.get("error_message") or "子项估计超时未完成"}
+            for estimate in list_precision_item_estimates_sync(session_id, round_index)
         ]
-        if failed_estimates:
-            failed_names = [
-                str(estimate.get("item_name") or "").strip()
-                for estimate in failed_estimates
-                if str(estimate.get("item_name") or "").strip()
-            ]
-            failed_errors = [
-                str(estimate.get("error_message") or "").strip()
-                for estimate in failed_estimates
-                if str(estimate.get("error_message") or "").strip()
-            ]
-            failed_label = "、".join(failed_names[:3]) if failed_names else "部分主体"
-            error_detail = failed_errors[0] if failed_errors else "子项估计失败"
-            raise RuntimeError(f"{failed_label} 精准估计失败，请补充参考物或重拍后重试。原因：{error_detail}")
-
-        final_result = _build_precision_final_result(
+        final_result = _finalize_precision_estimates(
+            task_id=task_id,
             session_id=session_id,
             round_index=round_index,
             split_strategy=split_strategy,
             estimates=estimates,
         )
-        lookup_summary = final_result.get("dbLookupSummary") or {}
-        print(
-            f"[precision_aggregate] task_id={task_id} session_id={session_id} round={round_index} "
-            f"split_strategy={split_strategy} items={lookup_summary.get('total', 0)} "
-            f"db_hit={lookup_summary.get('library_hits', 0)}/{lookup_summary.get('total', 0)} "
-            f"deepseek_fallback={lookup_summary.get('deepseek_fallback', 0)} "
-            f"unresolved={lookup_summary.get('unresolved', 0)}",
-            flush=True,
-        )
         update_precision_session_sync(
             session_id,
             {
@@ -4111,7 +4131,7 @@ def process_one_precision_aggregate_task(task: Dict[str, Any]) -> None:
                 "last_error": None,
             },
         )
-        update_analysis_task_result_sync(task_id, status="done", result=final_result)
+        update_analysis_task_result_sync(task_id, status="done", result=final_result, lease_owner=task_lease_owner())
     except Exception as e:
         err_msg = str(e) or type(e).__name__
         update_precision_session_sync(
@@ -4122,7 +4142,7 @@ def process_one_precision_aggregate_task(task: Dict[str, Any]) -> None:
                 "current_task_id": task_id,
             },
         )
-        update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg)
+        update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg, lease_owner=task_lease_owner())
 
 
 def process_one_public_library_moderation_task(task: Dict[str, Any]) -> None:
@@ -4143,12 +4163,12 @@ def process_one_public_library_moderation_task(task: Dict[str, Any]) -> None:
             update_public_food_library_status_sync(item_id, "rejected")
         else:
             update_public_food_library_status_sync(item_id, "published")
-            updated = update_analysis_task_result_sync(task_id, status="done", result={"status": "approved"})
+            updated = update_analysis_task_result_sync(task_id, status="done", result={"status": "approved"}, lease_owner=task_lease_owner())
             if not updated:
                 print(f"[worker] 任务 {task_id} 已被取消，放弃结果写入", flush=True)
     except Exception as e:
         err_msg = str(e) or type(e).__name__
-        updated = update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg)
+        updated = update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg, lease_owner=task_lease_owner())
         if not updated:
             print(f"[worker] 任务 {task_id} 已被取消，放弃错误写入", flush=True)
 
@@ -4177,54 +4197,28 @@ def _ocr_extract_single_sync(image_url: str) -> Dict[str, Any]:
     """单张图片 OCR：支持 DashScope 或 Gemini（通过 LLM_PROVIDER 切换）。"""
     llm_provider = os.getenv("LLM_PROVIDER", "qwen").lower()
     if llm_provider == "gemini":
-        api_key = os.getenv("OFOXAI_API_KEY") or os.getenv("ofox_ai_apikey")
-        if not api_key:
-            raise RuntimeError("缺少 OFOXAI_API_KEY 环境变量")
-        api_url = "https://api.ofox.ai/v1/chat/completions"
         model = OFOX_VISION_MODEL_NAME
     else:
-        api_key = os.getenv("DASHSCOPE_API_KEY") or os.getenv("API_KEY")
-        if not api_key:
-            raise RuntimeError("缺少 DASHSCOPE_API_KEY（或 API_KEY）环境变量")
-        api_url = f"{DASHSCOPE_BASE_URL}/chat/completions"
+        llm_provider = "qwen"
         model = os.getenv("ANALYZE_MODEL", QWEN_VL_MODEL)
 
-    with httpx.Client(timeout=60.0) as client:
-        response = client.post(
-            api_url,
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": _ocr_report_prompt()},
-                            {"type": "image_url", "image_url": {"url": image_url}},
-                        ],
-                    }
+    return chat_completion_sync(
+        [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": _ocr_report_prompt()},
+                    {"type": "image_url", "image_url": {"url": image_url}},
                 ],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.3,
-            },
-        )
-
-        if not response.is_success:
-            err = response.json() if response.content else {}
-            msg = err.get("error", {}).get("message") or f"API 错误: {response.status_code}"
-            raise RuntimeError(msg)
-
-        data = response.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content")
-        if not content:
-            raise RuntimeError("OCR 返回为空")
-
-        json_str = re.sub(r"```json", "", content)
-        json_str = re.sub(r"```", "", json_str).strip()
-        return json.loads(json_str)
+            }
+        ],
+        provider=llm_provider,
+        model=model,
+        kind="vision",
+        timeout=60.0,
+        temperature=0.3,
+        parse=parse_json_content,
+    )["parsed"]
 
 
 def run_health_report_ocr_sync(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -4297,7 +4291,7 @@ def process_one_health_report_task(task: Dict[str, Any]) -> None:
     try:
         extracted = run_health_report_ocr_sync(task)
         print(f"[health_report] 任务 {task_id} OCR 完成, indicators={len(extracted.get('indicators', []))}", flush=True)
-        updated = update_analysis_task_result_sync(task_id, status="done", result={"extracted_content": extracted})
+        updated = update_analysis_task_result_sync(task_id, status="done", result={"extracted_content": extracted}, lease_owner=task_lease_owner())
         if not updated:
             print(f"[health_report] 任务 {task_id} 已被取消，放弃结果写入", flush=True)
         else:
@@ -4305,7 +4299,7 @@ def process_one_health_report_task(task: Dict[str, Any]) -> None:
     except Exception as e:
         err_msg = str(e) or type(e).__name__
         print(f"[health_report] 任务 {task_id} 失败: {err_msg}", flush=True)
-        updated = update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg)
+        updated = update_analysis_task_result_sync(task_id, status="failed", error_message=err_msg, lease_owner=task_lease_owner())
         if not updated:
             print(f"[health_report] 任务 {task_id} 已被取消，放弃错误写入", flush=True)
 
@@ -4356,20 +4350,20 @@ def run_comment_moderation_sync(content: str) -> Optional[Dict[str, Any]]:
     api_url = f"{OFOX_BASE_URL}/chat/completions"
 
     try:
-        with httpx.Client(timeout=COMMENT_MODERATION_TIMEOUT_SECONDS) as client:
-            response = client.post(
-                api_url,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": COMMENT_MODERATION_MODEL,
-                    "messages": [{"role": "user", "content": _comment_moderation_prompt(content)}],
-                    "response_format": {"type": "json_object"},
-                    "temperature": 0.0,
-                },
-            )
+        response = llm_post(
+            api_url,
+            timeout=COMMENT_MODERATION_TIMEOUT_SECONDS,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": COMMENT_MODERATION_MODEL,
+                "messages": [{"role": "user", "content": _comment_moderation_prompt(content)}],
+                "response_format": {"type": "json_object"},
+                "temperature": 0.0,
+            },
+        )
 
         if not response.is_success:
             print(f"[comment_moderation] API 请求失败: {response.status_code}")
@@ -4506,17 +4500,23 @@ def process_one_comment_task(task: Dict[str, Any]) -> None:
         update_comment_task_result_sync(task_id, status="failed", error_message=err_msg)
 
 
-def run_comment_worker(worker_id: int, poll_interval: float = 2.0) -> None:
+def _should_stop(stop_event: Any) -> bool:
+    """Supervisor 请求收缩时置位 stop_event，Worker 在两次任务之间检查并自行退出。"""
+    return stop_event is not None and stop_event.is_set()
+
+
+def run_comment_worker(worker_id: int, poll_interval: float = 2.0, stop_event: Any = None) -> None:
     """
     评论审核 Worker 进程入口：循环抢占 pending 评论任务并处理。
     """
     print(f"[comment-worker-{worker_id}] 启动，处理评论审核任务", flush=True)
+    wakeup = TaskWakeup("comment_tasks", poll_interval=poll_interval)
     
     # 指数退避计数器
     backoff_count = 0
     max_backoff = 30  # 最大退避 30 秒
     
-    while True:
+    while not _should_stop(stop_event):
         try:
             task = claim_next_pending_comment_task_sync()
             if task:
@@ -4526,7 +4526,7 @@ def run_comment_worker(worker_id: int, poll_interval: float = 2.0) -> None:
                 backoff_count = 0  # 成功处理任务后重置退避
             else:
                 backoff_count = 0  # 正常无任务也重置
-                time.sleep(poll_interval)
+                wakeup.wait()
         except KeyboardInterrupt:
             print(f"[comment-worker-{worker_id}] 退出", flush=True)
             break
@@ -4539,13 +4539,14 @@ def run_comment_worker(worker_id: int, poll_interval: float = 2.0) -> None:
             time.sleep(sleep_time)
 
 
-def run_food_expiry_notification_worker(worker_id: int, poll_interval: float = 2.0) -> None:
+def run_food_expiry_notification_worker(worker_id: int, poll_interval: float = 2.0, stop_event: Any = None) -> None:
     """保质期提醒 Worker 进程入口。"""
     print(f"[expiry-notify-worker-{worker_id}] 启动，处理保质期通知任务", flush=True)
+    wakeup = TaskWakeup("food_expiry_notification_jobs", poll_interval=poll_interval)
     backoff_count = 0
     max_backoff = 30
 
-    while True:
+    while not _should_stop(stop_event):
         try:
             job = claim_next_pending_food_expiry_notification_job_sync()
             if job:
@@ -4555,7 +4556,9 @@ def run_food_expiry_notification_worker(worker_id: int, poll_interval: float = 2
                 backoff_count = 0
             else:
                 backoff_count = 0
-                time.sleep(poll_interval)
+                # 通知在 scheduled_at 到点时才可发送，入库时的 NOTIFY 不足以唤醒：睡到最早一条到点为止（不超过兜底轮询间隔）
+                due_at = get_next_food_expiry_notification_due_at_sync()
+                wakeup.wait(timeout=(due_at - datetime.now(timezone.utc)).total_seconds() if due_at else None)
         except KeyboardInterrupt:
             print(f"[expiry-notify-worker-{worker_id}] 退出", flush=True)
             break
@@ -4567,6 +4570,26 @@ def run_food_expiry_notification_worker(worker_id: int, poll_interval: float = 2
             time.sleep(sleep_time)
 
 
+def run_feed_score_decay_worker(worker_id: int, interval: float = 600.0, stop_event: Any = None) -> None:
+    """圈子排序得分衰减 Worker：定期衰减近 72 小时饮食记录的新鲜度得分。"""
+    print(f"[feed-score-worker-{worker_id}] 启动，每 {interval:.0f}s 衰减一次新鲜度得分", flush=True)
+    while not _should_stop(stop_event):
+        try:
+            updated = decay_feed_record_fresh_scores_sync()
+            print(f"[feed-score-worker-{worker_id}] 已衰减 {updated} 条记录", flush=True)
+            if stop_event is not None:
+                stop_event.wait(interval)
+            else:
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print(f"[feed-score-worker-{worker_id}] 退出", flush=True)
+            break
+        except Exception as e:
+            error_msg = str(e)[:100]
+            print(f"[feed-score-worker-{worker_id}] 错误: {error_msg}，{interval:.0f}s 后重试", flush=True)
+            time.sleep(interval)
+
+
 def _stringify_exception_for_task(e: BaseException) -> str:
     """将 Supabase/PostgREST 等异常转成可存入 analysis_tasks.error_message 的短字符串。"""
     import json
@@ -4595,7 +4618,7 @@ def process_one_exercise_task(task: Dict[str, Any]) -> None:
     recorded_on = payload.get("recorded_on")
 
     if not text:
-        update_analysis_task_result_sync(task_id, "failed", error_message="运动描述为空")
+        update_analysis_task_result_sync(task_id, "failed", error_message="运动描述为空", lease_owner=task_lease_owner())
         return
 
     try:
@@ -4619,28 +4642,76 @@ def process_one_exercise_task(task: Dict[str, Any]) -> None:
             "profile_snapshot": profile_snapshot,
             "today_total": total,
         }
-        update_analysis_task_result_sync(task_id, "done", result=result)
+        update_analysis_task_result_sync(task_id, "done", result=result, lease_owner=task_lease_owner())
         print(
             f"[process_one_exercise_task] done task_id={task_id} calories={calories} today_total={total}",
             flush=True,
         )
     except ExerciseLlmError as e:
         print(f"[process_one_exercise_task] llm_error task_id={task_id} error={e}", flush=True)
-        update_analysis_task_result_sync(task_id, "failed", error_message=str(e))
+        update_analysis_task_result_sync(task_id, "failed", error_message=str(e), lease_owner=task_lease_owner())
     except Exception as e:
         err = _stringify_exception_for_task(e)
         print(f"[process_one_exercise_task] {err}", flush=True)
-        update_analysis_task_result_sync(task_id, "failed", error_message=err)
+        update_analysis_task_result_sync(task_id, "failed", error_message=err, lease_owner=task_lease_owner())
 
 
-def run_worker(worker_id: int, task_type: str = "food", poll_interval: float = 2.0) -> None:
+class _TaskLeaseKeeper:
     """
-    单 Worker 进程入口：循环抢占 pending 任务并处理。
-    task_type: food | food_text | health_report | exercise
+    本进程持有的任务租约续约：后台线程每 TASK_LEASE_SECONDS/3 秒为已抢占、未完成的任务心跳一次。
+    进程崩溃或被杀后心跳停止，租约到期由 Supervisor 重新排队。
     """
-    print(f"[worker-{worker_id}] 启动，任务类型: {task_type}", flush=True)
-    
-    # 根据任务类型选择处理函数
+
+    def __init__(self, interval: Optional[float] = None) -> None:
+        self.interval = interval or max(TASK_LEASE_SECONDS / 3.0, 5.0)
+        self._task_ids: set = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, task_ids: List[Any]) -> None:
+        with self._lock:
+            self._task_ids.update(str(t) for t in task_ids if t)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="task-lease-heartbeat", daemon=True)
+                self._thread.start()
+
+    def release(self, task_ids: List[Any]) -> None:
+        with self._lock:
+            self._task_ids.difference_update(str(t) for t in task_ids if t)
+
+    def heartbeat(self) -> None:
+        with self._lock:
+            ids = list(self._task_ids)
+        if not ids:
+            return
+        renewed = set(heartbeat_task_leases_sync(ids))
+        lost = [t for t in ids if t not in renewed]
+        if lost:
+            # 已被取消/完成，或租约过期后被别的 Worker 重新抢占：不再续约
+            print(f"[task-lease] {len(lost)} 个任务租约已不归本进程: {','.join(lost[:5])}", flush=True)
+            self.release(lost)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"[task-lease] 心跳失败: {str(e)[:100]}", flush=True)
+
+
+_task_lease_keeper: Optional[_TaskLeaseKeeper] = None
+
+
+def _get_task_lease_keeper() -> _TaskLeaseKeeper:
+    global _task_lease_keeper
+    if _task_lease_keeper is None:
+        _task_lease_keeper = _TaskLeaseKeeper()
+    return _task_lease_keeper
+
+
+def _get_task_processor(task_type: str):
+    """按任务类型返回 process_one_* 处理函数；不支持的类型返回 None。"""
     processor_map = {
         "food": process_one_food_task,
         "food_debug": process_one_food_task,
@@ -4661,22 +4732,60 @@ def run_worker(worker_id: int, task_type: str = "food", poll_interval: float = 2
         "public_food_library_text": process_one_public_library_moderation_task,
         "exercise": process_one_exercise_task,
     }
-    processor = processor_map.get(task_type)
+    return processor_map.get(task_type)
+
+
+def _uses_food_nutrition_index(processor) -> bool:
+    return processor in (
+        process_one_food_task,
+        process_one_text_food_task,
+        process_one_precision_plan_task,
+        process_one_precision_item_estimate_task,
+    )
+
+
+def run_worker(worker_id: int, task_type: str = "food", poll_interval: float = 2.0, stop_event: Any = None) -> None:
+    """
+    单 Worker 进程入口：循环抢占 pending 任务并处理。
+    task_type: food | food_text | health_report | exercise
+    """
+    print(f"[worker-{worker_id}] 启动，任务类型: {task_type}", flush=True)
+    
+    # 根据任务类型选择处理函数
+    processor = _get_task_processor(task_type)
     if not processor:
         raise ValueError(f"不支持的任务类型: {task_type}")
-    
+
+    # 食物分析类 Worker 启动时预热食物营养索引，首个任务即可走内存查表
+    if _uses_food_nutrition_index(processor):
+        ensure_food_nutrition_index_sync()
+
+    # 新任务入库时由 LISTEN/NOTIFY 立即唤醒，轮询仅作兜底
+    wakeup = TaskWakeup("analysis_tasks", payload=task_type, poll_interval=poll_interval)
+
+    # 一次抢占的任务数：>1 时单次 RPC 取回一批并在本进程内依次处理
+    claim_batch_size = max(1, _safe_int(os.getenv("WORKER_CLAIM_BATCH_SIZE"), 1) or 1)
+
     # 指数退避计数器
     backoff_count = 0
     max_backoff = 30  # 最大退避 30 秒
     
     poll_count = 0
-    while True:
+    claimed: List[Dict[str, Any]] = []
+    lease_keeper = _get_task_lease_keeper()
+    while not _should_stop(stop_event):
         try:
             poll_count += 1
-            task = claim_next_pending_task_sync(task_type)
-            if task:
+            if not claimed:
+                claimed = claim_pending_tasks_sync(task_type, limit=claim_batch_size)
+                lease_keeper.track([t.get("id") for t in claimed])
+            if claimed:
+                task = claimed.pop(0)
                 print(f"[worker-{worker_id}] 处理任务 {task['id']}", flush=True)
-                processor(task)
+                try:
+                    processor(task)
+                finally:
+                    lease_keeper.release([task.get("id")])
                 print(f"[worker-{worker_id}] 任务 {task['id']} 完成", flush=True)
                 backoff_count = 0  # 成功处理任务后重置退避
                 poll_count = 0
@@ -4684,10 +4793,13 @@ def run_worker(worker_id: int, task_type: str = "food", poll_interval: float = 2
                 backoff_count = 0  # 正常无任务也重置
                 if poll_count % 5 == 0:
                     print(f"[worker-{worker_id}] 轮询中... task_type={task_type}, 无pending任务", flush=True)
-                time.sleep(poll_interval)
+                wakeup.wait()
         except KeyboardInterrupt:
+            if claimed:
+                lease_keeper.release([t.get("id") for t in claimed])
+                requeue_claimed_tasks_sync([t.get("id") for t in claimed])
             print(f"[worker-{worker_id}] 退出", flush=True)
-            break
+            return
         except Exception as e:
             # 使用指数退避，避免网络故障时频繁重试
             backoff_count = min(backoff_count + 1, max_backoff)
@@ -4696,6 +4808,141 @@ def run_worker(worker_id: int, task_type: str = "food", poll_interval: float = 2
             print(f"[worker-{worker_id}] 错误: {error_msg}，{sleep_time}s 后重试", flush=True)
             time.sleep(sleep_time)
 
+    if claimed:
+        lease_keeper.release([t.get("id") for t in claimed])
+        requeue_claimed_tasks_sync([t.get("id") for t in claimed])
+    print(f"[worker-{worker_id}] 收到停止请求，退出", flush=True)
+
+
+def _task_type_concurrency(task_type: str, default: int) -> int:
+    """单进程内某任务类型的并发上限：WORKER_CONCURRENCY_<TASK_TYPE>，未配置时用 default。"""
+    env_name = "WORKER_CONCURRENCY_" + re.sub(r"[^A-Za-z0-9]", "_", task_type).upper()
+    return max(1, _safe_int(os.getenv(env_name), default) or default)
+
+
+def _forward_task_wakeups(wakeup: TaskWakeup, loop: asyncio.AbstractEventLoop, event: asyncio.Event) -> None:
+    """后台线程：阻塞等待 LISTEN 通知（或兜底轮询到期），转成事件循环里的 Event。"""
+    while not loop.is_closed():
+        wakeup.wait()
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            break
+
+
+async def _run_task_lane(
+    worker_id: int,
+    task_type: str,
+    concurrency: int,
+    poll_interval: float,
+    stop_event: Any = None,
+) -> None:
+    """
+    单个任务类型的调度循环：空闲槽位数即一次抢占的上限，处理函数在专用线程池中执行，
+    同时在途的任务数不超过 concurrency；任务完成或收到新任务通知时立即补位。
+    """
+    processor = _get_task_processor(task_type)
+    if not processor:
+        raise ValueError(f"不支持的任务类型: {task_type}")
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"worker-{task_type}")
+    wake = asyncio.Event()
+    wakeup = TaskWakeup("analysis_tasks", payload=task_type, poll_interval=poll_interval)
+    threading.Thread(target=_forward_task_wakeups, args=(wakeup, loop, wake), daemon=True).start()
+    in_flight: set = set()
+    lease_keeper = _get_task_lease_keeper()
+    tag = f"async-worker-{worker_id}/{task_type}"
+
+    async def _run_one(task: Dict[str, Any]) -> None:
+        try:
+            print(f"[{tag}] 处理任务 {task['id']}（在途 {len(in_flight)}/{concurrency}）", flush=True)
+            await loop.run_in_executor(executor, processor, task)
+            print(f"[{tag}] 任务 {task['id']} 完成", flush=True)
+        except Exception as e:
+            print(f"[{tag}] 任务 {task.get('id')} 异常: {str(e)[:100]}", flush=True)
+        finally:
+            lease_keeper.release([task.get("id")])
+            # 先腾出槽位再唤醒：done 回调在 wake.set() 之后才执行，调度循环醒来时会误以为槽位仍被占用
+            in_flight.discard(asyncio.current_task())
+            wake.set()
+
+    print(f"[{tag}] 启动，并发上限 {concurrency}", flush=True)
+    backoff_count = 0
+    max_backoff = 30
+    try:
+        while not _should_stop(stop_event):
+            wake.clear()
+            free = concurrency - len(in_flight)
+            if free > 0:
+                try:
+                    tasks = await asyncio.to_thread(claim_pending_tasks_sync, task_type, free)
+                    backoff_count = 0
+                except Exception as e:
+                    backoff_count = min(backoff_count + 1, max_backoff)
+                    sleep_time = min(poll_interval + backoff_count, max_backoff)
+                    print(f"[{tag}] 错误: {str(e)[:100]}，{sleep_time}s 后重试", flush=True)
+                    await asyncio.sleep(sleep_time)
+                    continue
+                lease_keeper.track([t.get("id") for t in tasks])
+                for task in tasks:
+                    job = asyncio.create_task(_run_one(task))
+                    in_flight.add(job)
+                    job.add_done_callback(in_flight.discard)
+                # 抢满了空闲槽位，队列里可能还有任务，继续抢
+                if tasks and len(tasks) >= free and len(in_flight) < concurrency:
+                    continue
+            if stop_event is None:
+                await wake.wait()
+            else:
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+        # 收到停止请求：不再抢占，等在途任务处理完
+        if in_flight:
+            await asyncio.gather(*list(in_flight), return_exceptions=True)
+        print(f"[{tag}] 收到停止请求，退出", flush=True)
+    finally:
+        executor.shutdown(wait=False)
+
+
+async def _run_async_worker(worker_id: int, lanes: Dict[str, int], poll_interval: float, stop_event: Any = None) -> None:
+    processors = [_get_task_processor(t) for t in lanes]
+    if any(_uses_food_nutrition_index(p) for p in processors if p):
+        await asyncio.to_thread(ensure_food_nutrition_index_sync)
+    try:
+        await asyncio.gather(*[
+            _run_task_lane(worker_id, task_type, concurrency, poll_interval, stop_event=stop_event)
+            for task_type, concurrency in lanes.items()
+        ])
+    finally:
+        await close_async_llm_http_clients()
+
+
+def run_async_worker(
+    worker_id: int,
+    task_types: List[str],
+    default_concurrency: int = 16,
+    poll_interval: float = 2.0,
+    stop_event: Any = None,
+) -> None:
+    """
+    asyncio Worker 进程入口：一个进程同时服务多个任务类型，每个类型的在途任务数受并发上限约束
+    （WORKER_CONCURRENCY_<TASK_TYPE>，默认 default_concurrency）。
+    分析任务的耗时几乎都在等待大模型响应，单进程即可保持数十个分析并发，无需按 WORKER_COUNT 复制整个解释器。
+    process_one_* 仍为同步实现，在各任务类型专用的线程池中执行。
+    """
+    lanes = {t: _task_type_concurrency(t, default_concurrency) for t in dict.fromkeys(task_types) if t}
+    for task_type in lanes:
+        if not _get_task_processor(task_type):
+            raise ValueError(f"不支持的任务类型: {task_type}")
+    print(f"[async-worker-{worker_id}] 启动，任务类型与并发上限: {lanes}", flush=True)
+    try:
+        asyncio.run(_run_async_worker(worker_id, lanes, poll_interval, stop_event=stop_event))
+    except KeyboardInterrupt:
+        print(f"[async-worker-{worker_id}] 退出", flush=True)
+
 
 if __name__ == "__main__":
     # 单独运行本文件时：单进程 Worker（用于调试）
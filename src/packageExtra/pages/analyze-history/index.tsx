@@ -12,6 +12,7 @@ import CustomNavBar, { getNavBarHeight } from '../../../components/CustomNavBar'
 const STATUS_MAP: Record<string, string> = {
   pending: '排队中',
   processing: '识别中',
+  waiting: '识别中',
   done: '已完成',
   failed: '识别失败',
   violated: '内容违规',
@@ -19,9 +20,14 @@ const STATUS_MAP: Record<string, string> = {
   cancelled: '已取消'
 }
 
+/** 任务仍在识别中（排队 / 处理中 / 精准模式等待子任务） */
+const isTaskInProgress = (task: AnalysisTask): boolean => (
+  task.status === 'pending' || task.status === 'processing' || task.status === 'waiting'
+)
+
 /** 根据后端返回的 status + is_recorded 决定列表中展示的状态文案和样式类名 */
 const pickDisplayStatus = (task: AnalysisTask): { text: string; className: string } => {
-  if (task.status === 'pending' || task.status === 'processing') {
+  if (isTaskInProgress(task)) {
     return { text: '正在识别', className: 'status-recognizing' }
   }
   if (task.status === 'done') {
@@ -383,7 +389,7 @@ function AnalyzeHistoryPage() {
 
   const handleDiscardUnrecorded = () => {
     const discardableTasks = tasks.filter(
-      t => t.status === 'pending' || t.status === 'processing' || t.status === 'failed' ||
+      t => isTaskInProgress(t) || t.status === 'failed' ||
         (t.status === 'done' && t.is_recorded === false)
     )
     if (discardableTasks.length === 0) {
@@ -577,7 +583,7 @@ function AnalyzeHistoryPage() {
       Taro.navigateTo({ url: extraPkgUrl('/pages/result/index') })
       return
     }
-    if (task.status === 'pending' || task.status === 'processing') {
+    if (isTaskInProgress(task)) {
       const mode = pickExecutionMode(task)
       const tt = task.task_type || ''
       const isTextTask = tt === 'food_text' || tt.startsWith('food_text')
@@ -444,8 +444,9 @@ function AnalyzeLoadingPage() {
     const poll = async () => {
       try {
         const task: AnalysisTask = await getAnalyzeTask(taskId)
-        setLastTaskStatusText(task.status === 'processing' ? '处理中' : task.status === 'pending' ? '排队中' : '收尾中')
-        if (task.status === 'processing') {
+        const isRunning = task.status === 'processing' || task.status === 'waiting'
+        setLastTaskStatusText(isRunning ? '处理中' : task.status === 'pending' ? '排队中' : '收尾中')
+        if (isRunning) {
           setCurrentStep(prev => Math.max(prev, 1))
         }
         const taskMode = pickExecutionModeFromTask(task)
@@ -1791,7 +1791,7 @@ export interface AnalysisTask {
   image_url?: string | null  // 图片分析时有值，文字分析时为空
   image_paths?: string[] | null // 多图分析时有值
   text_input?: string | null  // 文字分析时有值，图片分析时为空
-  status: 'pending' | 'processing' | 'done' | 'failed' | 'violated' | 'timed_out' | 'cancelled'
+  status: 'pending' | 'processing' | 'waiting' | 'done' | 'failed' | 'violated' | 'timed_out' | 'cancelled'  // waiting：精准模式主任务等待子任务完成
   payload?: Record<string, unknown>
   result?: AnalyzeResponse
   error_message?: string